@@ -1,28 +1,94 @@
 import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+import json
+import asyncio
+import hashlib
+from app.core.model_client import get_model_client, response_text
+from app.core.cache import response_cache, make_cache_key
+from app.core.routing import model_router
+from app.core.templates import template_registry
+from app.core.vector_index import get_knowledge_index
+from app.core.sessions import IN_CONTEXT
 
-load_dotenv()
+class ActionEngine:
+    # Bump whenever the prompt below changes so cached answers are invalidated
+    PROMPT_VERSION = "generate-v1"
+    NARRATIVE_PROMPT_VERSION = "narrative-v1"
 
-api_key = os.getenv("GOOGLE_API_KEY")
-if api_key:
-    genai.configure(api_key=api_key)
+    def __init__(self, model_name="gemini-3-flash-preview", cache=response_cache, templates=template_registry,
+                 router=model_router, retriever=None):
+        self.model_name = model_name
+        self.cache = cache
+        self.templates = templates
+        self.router = router
+        self._retriever = retriever
+        self.client = get_model_client(model_name)
+        self._model = None
 
-class ActionEngine:
-    def __init__(self, model_name="gemini-3-flash-preview"):
-        self.model = genai.GenerativeModel(model_name)
-    
-    def generate_document(self, template_path: str, case_details: dict, region: str = "Global") -> str:
-        """
-        Fills a legal template with specific case details using Gemini.
-        """
-        try:
-            with open(template_path, 'r') as f:
-                template_content = f.read()
-        except FileNotFoundError:
-            return f"Error: Template not found at {template_path}"
+    @property
+    def retriever(self):
+        # Shared local vector index (loaded on first use) unless one was set on this instance
+        return self._retriever if self._retriever is not None else get_knowledge_index()
+
+    @property
+    def model(self):
+        # Shared, lazily created model unless one was set on this instance
+        return self._model if self._model is not None else self.client.model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+
+    def _load_template(self, template_path: str) -> str:
+        # Templates in app/templates come pre-loaded from the registry
+        template = self.templates.get_by_path(template_path)
+        if template is not None:
+            return template.content
+        with open(template_path, 'r') as f:
+            return f.read()
+
+    def _cache_key(self, template_content: str, case_details: dict, region: str, document: str = None,
+                   precedents: list = ()) -> str:
+        # The template text itself is part of the key, so editing a template invalidates its entries
+        return make_cache_key("generate", self.router.cache_scope(self.model_name), self.PROMPT_VERSION,
+                              text=template_content, region=region,
+                              case_details=json.dumps(case_details, sort_keys=True, default=str),
+                              document=self._document_digest(document),
+                              precedents=self._precedents_digest(precedents))
+
+    @staticmethod
+    def _document_digest(document: str = None):
+        return hashlib.sha256(document.encode("utf-8")).hexdigest() if document else None
+
+    @staticmethod
+    def _precedents_digest(precedents: list):
+        return hashlib.sha256("\n".join(p["snippet"] for p in precedents).encode("utf-8")).hexdigest() if precedents else None
+
+    def _precedents(self, template_name: str, case_details: dict, document: str = None) -> list:
+        # Snippets of similar precedents from the local vector index (none unless a precedent corpus is set up).
+        # May re-embed changed files first, so async callers run it in a thread
+        query = " ".join([os.path.splitext(os.path.basename(template_name))[0].replace("_", " "),
+                          *(str(v) for v in case_details.values()), (document or "")[:4000]])
+        return self.retriever.precedents(query)
 
-        prompt = f"""
+    @staticmethod
+    def _precedent_section(precedents: list) -> str:
+        if not precedents:
+            return ""
+        body = "\n\n".join(f"[{p['source']}]\n{p['snippet']}" for p in precedents)
+        return f"\n        Relevant Precedents (follow or cite them where they apply to this case):\n{body}\n"
+
+    @staticmethod
+    def _source_section(document: str = None, context=None) -> str:
+        # Supporting document from a session: inline, or already in the model's cached context
+        if context is not None:
+            return f"\n        Source {IN_CONTEXT}\n        Use it for facts the case details do not cover.\n"
+        if document:
+            return f"\n        Source Document (use it for facts the case details do not cover):\n        {document}\n"
+        return ""
+
+    def _build_prompt(self, template_content: str, case_details: dict, region: str,
+                      document: str = None, context=None, precedents: list = ()) -> str:
+        return f"""
         You are 'The Equalizer', a legal assistant.
         Fill in the following template with the provided case details.
         
@@ -37,14 +103,155 @@ class ActionEngine:
 
         Case Details:
         {case_details}
+        """ + self._source_section(document, context) + self._precedent_section(precedents)
+
+    def generate_document(self, template_path: str, case_details: dict, region: str = "Global") -> str:
         """
+        Fills a legal template with specific case details using Gemini.
+        """
+        try:
+            template_content = self._load_template(template_path)
+        except FileNotFoundError:
+            return f"Error: Template not found at {template_path}"
+
+        precedents = self._precedents(template_path, case_details)
+        key = self._cache_key(template_content, case_details, region, precedents=precedents)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
 
+        prompt = self._build_prompt(template_content, case_details, region, precedents=precedents)
         try:
             response = self.model.generate_content(prompt)
-            return response.text
+            self.cache.set(key, response_text(response))
+            return response_text(response)
         except Exception as e:
             return f"Error during document generation: {str(e)}"
 
+    async def generate_document_async(self, template_path: str, case_details: dict, region: str = "Global",
+                                      document: str = None, context=None) -> str:
+        """
+        Async version of generate_document. The template read runs in a thread so the loop stays free.
+        Model failures (after retries) raise ModelError instead of returning an error string.
+        Identical concurrent requests share one model call.
+        `document` is an optional source document (a session's text); with `context`, a model
+        bound to a cached context holding it, the text itself is not sent.
+        """
+        try:
+            template_content = await asyncio.to_thread(self._load_template, template_path)
+        except FileNotFoundError:
+            return f"Error: Template not found at {template_path}"
+
+        precedents = await asyncio.to_thread(self._precedents, template_path, case_details, document)
+
+        async def generate():
+            prompt = self._build_prompt(template_content, case_details, region, document, context, precedents)
+            response = await self.router.generate("generate", prompt, self.client, model=context)
+            return response_text(response)
+
+        key = self._cache_key(template_content, case_details, region, document, precedents)
+        return await self.cache.get_or_generate(key, generate)
+
+    async def generate_document_stream(self, template_path: str, case_details: dict, region: str = "Global"):
+        """
+        Streams the filled document as partial chunks (used by the SSE endpoints).
+        Blocked prompts and model errors are raised to the caller instead of returned as strings.
+        """
+        template_content = await asyncio.to_thread(self._load_template, template_path)
+        precedents = await asyncio.to_thread(self._precedents, template_path, case_details)
+        key = self._cache_key(template_content, case_details, region, precedents=precedents)
+        cached = await self.cache.get_async(key)
+        if cached is not None:
+            yield cached
+            return
+
+        content = self._build_prompt(template_content, case_details, region, precedents=precedents)
+        parts = []
+        async for text in self.router.generate_stream("generate", content, self.client):
+            parts.append(text)
+            yield text
+        await self.cache.set_async(key, "".join(parts))
+
+    # --- Registry templates with a local fast path ---
+    def _build_narrative_prompt(self, template, placeholder: str, case_details: dict, region: str,
+                                document: str = None, context=None, precedents: list = ()) -> str:
+        return f"""
+        You are 'The Equalizer', a legal assistant.
+        Write the text that replaces one placeholder in a formal letter ({template.name}).
+
+        Rules:
+        - The user is located in: {region}. Adjust legal terminology, laws referenced, and tone to match the legal standards of this region.
+        - Make it professional and persuasive based on the 'User's Story' and the other case details.
+        - Plain text only: no markdown, no greeting, no signature. Return only the replacement text.
+
+        Placeholder:
+        [{placeholder}]
+
+        Case Details:
+        {case_details}
+        """ + self._source_section(document, context) + self._precedent_section(precedents)
+
+    async def _write_narrative(self, template, placeholder: str, case_details: dict, region: str,
+                               document: str = None, context=None, precedents: list = ()) -> str:
+        key = make_cache_key("generate_narrative", self.router.cache_scope(self.model_name),
+                             self.NARRATIVE_PROMPT_VERSION, text=placeholder, template=template.name, region=region,
+                             case_details=json.dumps(case_details, sort_keys=True, default=str),
+                             document=self._document_digest(document),
+                             precedents=self._precedents_digest(precedents))
+
+        async def generate():
+            prompt = self._build_narrative_prompt(template, placeholder, case_details, region, document, context,
+                                                  precedents)
+            response = await self.router.generate("generate_narrative", prompt, self.client, model=context)
+            return response_text(response).strip()
+
+        return await self.cache.get_or_generate(key, generate)
+
+    def plan(self, template, case_details: dict, rewrite: bool = True):
+        """
+        Returns (values, narratives_to_write), or None when fields are missing and the whole
+        template has to go through the model.
+        """
+        values = template.resolve(case_details)
+        if template.missing(values, include_narratives=False):
+            return None
+        to_write = [p for p in template.narratives if rewrite or p not in values]
+        return values, to_write
+
+    async def generate_from_template_async(self, template, case_details: dict, region: str = "Global",
+                                           rewrite: bool = True, document: str = None, context=None) -> str:
+        """
+        Fills a registry template, skipping the model where it can:
+        - all placeholders supplied and rewrite=False: deterministic local fill, no model call
+        - all fields supplied: fields filled locally, only narrative placeholders ([Explanation], ...) go to the model
+        - otherwise: the whole template is filled by the model, as in generate_document
+        `document` / `context`: optional source document, as in generate_document_async.
+        """
+        plan = self.plan(template, case_details, rewrite)
+        if plan is None:
+            return await self.generate_document_async(template.path, case_details, region, document, context)
+
+        values, to_write = plan
+        precedents = await asyncio.to_thread(self._precedents, template.name, case_details, document) if to_write else []
+        written = await asyncio.gather(*[
+            self._write_narrative(template, placeholder, case_details, region, document, context, precedents)
+            for placeholder in to_write
+        ])
+        values.update(zip(to_write, written))
+        return template.fill(values)
+
+    async def generate_from_template_stream(self, template, case_details: dict, region: str = "Global",
+                                            rewrite: bool = True):
+        """
+        Streaming counterpart of generate_from_template_async. The local paths are fast enough
+        to send as a single chunk; the full model fill streams as usual.
+        """
+        if self.plan(template, case_details, rewrite) is None:
+            async for text in self.generate_document_stream(template.path, case_details, region):
+                yield text
+            return
+        yield await self.generate_from_template_async(template, case_details, region, rewrite)
+
 # Example Usage
 if __name__ == "__main__":
     engine = ActionEngine()
@@ -0,0 +1,113 @@
+import os
+import time
+import asyncio
+import zipfile
+import tempfile
+from dataclasses import dataclass
+from fastapi import HTTPException
+from app.core.model_client import ModelError, DEFAULT_REQUEST_TIMEOUT, separate_deadline
+from app.core.uploads import SpooledUpload, UploadTooLarge, MAX_UPLOAD_BYTES, SPOOL_CHUNK_BYTES
+
+# Items processed at once per batch request. Model calls are still bounded by the shared
+# client's rate and concurrency limits, so this mostly caps memory per batch.
+BATCH_CONCURRENCY = int(os.getenv("EQUALIZER_BATCH_CONCURRENCY", "16"))
+BATCH_MAX_ITEMS = int(os.getenv("EQUALIZER_BATCH_MAX_ITEMS", "1000"))
+# Whole batch request body (multipart files or zip), instead of EQUALIZER_MAX_UPLOAD_MB
+BATCH_MAX_BYTES = int(float(os.getenv("EQUALIZER_MAX_BATCH_MB", "200")) * 1024 * 1024)
+
+
+@dataclass
+class BatchItem:
+    id: str
+    load: object  # async () -> keyword arguments for the core classes
+    cleanup: object = None  # optional () -> None, called once the item is finished
+
+
+def item_error(error: Exception) -> dict:
+    if isinstance(error, ModelError):
+        return {"message": str(error), "status": error.status_code, "error": error.kind}
+    if isinstance(error, HTTPException):
+        return {"message": error.detail, "status": error.status_code}
+    return {"message": str(error), "status": 500}
+
+
+async def run_batch(items: list, process, concurrency: int = BATCH_CONCURRENCY,
+                    item_timeout: float = DEFAULT_REQUEST_TIMEOUT):
+    """
+    Runs `process(await item.load())` for every item with at most `concurrency` in progress and
+    yields one result per item in completion order:
+    {"index", "id", "ok": True, "result", "seconds"} or {"index", "id", "ok": False, "error", "seconds"}.
+    A failing item is reported and the batch carries on. Each item gets its own `item_timeout`
+    budget rather than sharing the request's. Closing the generator cancels the rest.
+    """
+    results = asyncio.Queue()
+    pending = iter(enumerate(items))
+
+    async def worker():
+        # Workers share one iterator, so each item is taken exactly once
+        for index, item in pending:
+            start = time.perf_counter()
+            out = {"index": index, "id": item.id}
+            try:
+                with separate_deadline(item_timeout):
+                    out.update(ok=True, result=await process(await item.load()))
+            except Exception as e:
+                out.update(ok=False, error=item_error(e))
+            finally:
+                if item.cleanup:
+                    item.cleanup()
+            out["seconds"] = round(time.perf_counter() - start, 3)
+            results.put_nowait(out)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(min(concurrency, len(items)))]
+    try:
+        for _ in range(len(items)):
+            yield await results.get()
+    finally:
+        for task in workers:
+            task.cancel()
+        # Items that never started still own files
+        for _, item in pending:
+            if item.cleanup:
+                item.cleanup()
+
+
+def zip_members(path: str) -> list:
+    """
+    Document entries of a zip file (directories and macOS resource forks skipped).
+    """
+    with zipfile.ZipFile(path) as archive:
+        return [info for info in archive.infolist()
+                if not info.is_dir() and not info.filename.startswith("__MACOSX/")]
+
+
+def _extract(path: str, info: zipfile.ZipInfo, max_bytes: int) -> SpooledUpload:
+    if info.file_size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+    fd, out_path = tempfile.mkstemp(prefix="equalizer-upload-")
+    size = 0
+    try:
+        with zipfile.ZipFile(path) as archive, archive.open(info) as member, os.fdopen(fd, "wb") as out:
+            while True:
+                block = member.read(SPOOL_CHUNK_BYTES)
+                if not block:
+                    break
+                # Count what is actually inflated; the header size can lie (zip bombs)
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                out.write(block)
+    except BaseException:
+        try:
+            os.remove(out_path)
+        except OSError:
+            pass
+        raise
+    return SpooledUpload(out_path, size, os.path.basename(info.filename))
+
+
+async def extract_member(path: str, info: zipfile.ZipInfo, max_bytes: int = MAX_UPLOAD_BYTES) -> SpooledUpload:
+    """
+    Inflates one zip entry to its own temp file, off the event loop, with the per-file upload limit.
+    """
+    return await asyncio.to_thread(_extract, path, info, max_bytes)
@@ -0,0 +1,485 @@
+import os
+import re
+import time
+import json
+import math
+import asyncio
+import sqlite3
+import hashlib
+import weakref
+import threading
+from collections import OrderedDict
+from app.core import metrics
+
+
+def normalize_text(text: str) -> str:
+    """
+    Collapses whitespace so trivially different copies of the same document share a key.
+    """
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def make_cache_key(operation: str, model_name: str, prompt_version: str, text: str = None,
+                   image_data: bytes = None, **params) -> str:
+    """
+    Content-addressed key: hash of the normalized input plus everything that changes the output.
+    """
+    h = hashlib.sha256()
+    header = {
+        "operation": operation,
+        "model": model_name,
+        "prompt_version": prompt_version,
+        "params": {k: v for k, v in sorted(params.items()) if v is not None},
+    }
+    h.update(json.dumps(header, sort_keys=True, default=str).encode('utf-8'))
+    h.update(b'\x00text\x00')
+    if text:
+        h.update(normalize_text(text).encode('utf-8'))
+    h.update(b'\x00image\x00')
+    if image_data:
+        h.update(hashlib.sha256(image_data).digest())
+    return h.hexdigest()
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller for a key starts the call, later
+    callers await the same result instead of making their own. A caller that goes away (e.g.
+    the client disconnected) only cancels the shared call if nobody else is still waiting.
+    One table per event loop, like the ConcurrencyLimiter.
+    """
+    def __init__(self):
+        self._flights = weakref.WeakKeyDictionary()
+        self.calls = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def _table(self) -> dict:
+        loop = asyncio.get_running_loop()
+        table = self._flights.get(loop)
+        if table is None:
+            table = {}
+            self._flights[loop] = table
+        return table
+
+    @property
+    def in_flight(self) -> int:
+        return sum(len(table) for table in self._flights.values())
+
+    @staticmethod
+    def _landed(table: dict, key: str, flight: _Flight):
+        if table.get(key) is flight:
+            del table[key]
+        if not flight.task.cancelled():
+            # Mark the error as retrieved even if every waiter has already gone
+            flight.task.exception()
+
+    async def do(self, key: str, call):
+        """
+        Returns the result of `call()` (a coroutine function), shared by everyone asking for `key` meanwhile.
+        """
+        result, _ = await self.do_led(key, call)
+        return result
+
+    async def do_led(self, key: str, call) -> tuple:
+        """
+        Like do(), but returns (result, led): `led` is True if this caller started the call,
+        False if it joined one already in flight (so it should not count the call as its own).
+        """
+        table = self._table()
+        flight = table.get(key)
+        led = flight is None
+        if led:
+            flight = _Flight(asyncio.ensure_future(call()))
+            table[key] = flight
+            flight.task.add_done_callback(lambda task: self._landed(table, key, flight))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            # shield: one waiter being cancelled must not cancel the call for the others
+            return await asyncio.shield(flight.task), led
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                self.cancelled += 1
+
+
+class TieredCache:
+    """
+    Two-tier cache: an in-process LRU, plus an optional SQLite file shared by all uvicorn
+    workers on the host (survives restarts). Subclasses own the SQLite table (_init_db,
+    _disk_get, _disk_set, TABLE) and may bound the memory tier differently (_remember).
+    On the event loop use get_async/set_async, which do the SQLite reads and writes in a thread.
+    """
+    TABLE = None
+
+    def __init__(self, ttl_seconds: float = math.inf, db_path: str = None):
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.flights = SingleFlight()
+        if db_path:
+            self._init_db()
+
+    # --- SQLite tier ---
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        raise NotImplementedError
+
+    def _disk_get(self, key: str):
+        raise NotImplementedError
+
+    def _disk_set(self, key: str, value, expires_at: float):
+        raise NotImplementedError
+
+    def _disk_clear(self, conn: sqlite3.Connection):
+        conn.execute(f"DELETE FROM {self.TABLE}")
+        conn.commit()
+
+    # --- Memory tier ---
+    def _memory_get(self, key: str, now: float):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._forget(key)
+        return None
+
+    def _remember(self, key: str, value, expires_at: float):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+
+    def _forget(self, key: str):
+        # Caller holds the lock
+        del self._entries[key]
+
+    def _disk_lookup(self, key: str, now: float):
+        value = self._disk_get(key)
+        if value is not None:
+            self._remember(key, value, now + self.ttl_seconds)
+            with self._lock:
+                self.hits += 1
+                self.disk_hits += 1
+        return value
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def _prepare(self, value):
+        # Expiry for a value, or None for an empty one (counted and skipped; failures raise instead)
+        if not value:
+            with self._lock:
+                self.skipped += 1
+            return None
+        return time.time() + self.ttl_seconds
+
+    # --- Public API ---
+    def get(self, key: str):
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is None and self.db_path:
+            value = self._disk_lookup(key, now)
+        if value is None:
+            self._miss()
+        return value
+
+    def set(self, key: str, value):
+        expires_at = self._prepare(value)
+        if expires_at is None:
+            return
+        self._remember(key, value, expires_at)
+        if self.db_path:
+            self._disk_set(key, value, expires_at)
+
+    async def get_async(self, key: str):
+        """
+        get() for the event loop: the SQLite tier is read in a worker thread.
+        """
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is None and self.db_path:
+            value = await metrics.to_thread("cache_disk", self._disk_lookup, key, now)
+        if value is None:
+            self._miss()
+        return value
+
+    async def set_async(self, key: str, value):
+        """
+        set() for the event loop: the SQLite tier is written in a worker thread.
+        """
+        expires_at = self._prepare(value)
+        if expires_at is None:
+            return
+        self._remember(key, value, expires_at)
+        if self.db_path:
+            await metrics.to_thread("cache_disk", self._disk_set, key, value, expires_at)
+
+    async def get_or_generate(self, key: str, generate):
+        """
+        Returns the cached result for `key`, or awaits `generate()` and caches what it returns.
+        Concurrent misses on the same key share one `generate()` call (single flight), so a burst
+        of identical requests makes one upstream call before the cache is filled.
+        """
+        cached = await self.get_async(key)
+        if cached is not None:
+            return cached
+
+        async def generate_and_store():
+            result = await generate()
+            await self.set_async(key, result)
+            return result
+
+        return await self.flights.do(key, generate_and_store)
+
+    def clear(self):
+        with self._lock:
+            while self._entries:
+                self._forget(next(iter(self._entries)))
+        if self.db_path:
+            try:
+                self._disk_clear(self._connection())
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "skipped": self.skipped,
+                "entries": len(self._entries),
+                "disk_tier": bool(self.db_path),
+                # Upstream calls made on a miss, and identical concurrent calls saved by coalescing
+                "upstream_calls": self.flights.calls,
+                "coalesced": self.flights.coalesced,
+                "in_flight": self.flights.in_flight,
+            }
+
+
+class ResponseCache(TieredCache):
+    """
+    Model responses: an LRU of at most `max_entries` with a TTL, over an optional SQLite
+    file whose expired rows are purged.
+    """
+    TABLE = "responses"
+    # Expired rows are deleted at startup and then at most this often, on a write
+    PURGE_INTERVAL = 3600
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 86400, db_path: str = None):
+        self.max_entries = max_entries
+        self._purge_at = 0.0
+        super().__init__(ttl_seconds, db_path)
+
+    def _init_db(self):
+        conn = self._connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)")
+        conn.commit()
+        self._disk_purge(conn)
+
+    def _disk_purge(self, conn: sqlite3.Connection):
+        now = time.time()
+        conn.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+        conn.commit()
+        self._purge_at = now + self.PURGE_INTERVAL
+
+    def _disk_get(self, key: str):
+        try:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def _disk_set(self, key: str, value: str, expires_at: float):
+        try:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                         (key, value, expires_at))
+            conn.commit()
+            if time.time() >= self._purge_at:
+                self._disk_purge(conn)
+        except sqlite3.Error:
+            pass
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update(max_entries=self.max_entries, ttl_seconds=self.ttl_seconds)
+        return stats
+
+
+class AudioCache(TieredCache):
+    """
+    Synthesized audio by key: an LRU bounded by total bytes, over an optional SQLite file
+    with its own byte budget and least-recently-used eviction. Audio does not go stale, so
+    there is no TTL.
+    """
+    TABLE = "audio"
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, db_path: str = None, max_disk_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._bytes = 0
+        self._disk_bytes = None
+        super().__init__(db_path=db_path)
+
+    def _init_db(self):
+        conn = self._connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS audio (key TEXT PRIMARY KEY, data BLOB NOT NULL, used_at REAL NOT NULL)")
+        conn.commit()
+
+    def _disk_get(self, key: str):
+        try:
+            conn = self._connection()
+            row = conn.execute("SELECT data FROM audio WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE audio SET used_at = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+        except sqlite3.Error:
+            return None
+        return bytes(row[0]) if row is not None else None
+
+    def _disk_set(self, key: str, data: bytes, expires_at: float):
+        try:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO audio (key, data, used_at) VALUES (?, ?, ?)", (key, data, time.time()))
+            conn.commit()
+            # Running estimate of the file's audio; other workers' writes are only seen when it is recounted
+            if self._disk_bytes is None:
+                self._disk_bytes = self._disk_total(conn)
+            else:
+                self._disk_bytes += len(data)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._disk_bytes = self._disk_evict(conn)
+        except sqlite3.Error:
+            pass
+
+    def _disk_clear(self, conn: sqlite3.Connection):
+        super()._disk_clear(conn)
+        self._disk_bytes = 0
+
+    @staticmethod
+    def _disk_total(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM audio").fetchone()[0]
+
+    def _disk_evict(self, conn: sqlite3.Connection) -> int:
+        # Least recently used first, until the file's audio fits the budget again
+        total = self._disk_total(conn)
+        stale = []
+        for key, size in conn.execute("SELECT key, LENGTH(data) FROM audio ORDER BY used_at, rowid"):
+            if total <= self.max_disk_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM audio WHERE key = ?", stale)
+        conn.commit()
+        return total
+
+    def _remember(self, key: str, data: bytes, expires_at: float):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._forget(key)
+            self._entries[key] = (data, expires_at)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                self._forget(next(iter(self._entries)))
+
+    def _forget(self, key: str):
+        data, _ = self._entries.pop(key)
+        self._bytes -= len(data)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update(bytes=self._bytes, max_bytes=self.max_bytes)
+        return stats
+
+
+# Shared per-worker cache. Set EQUALIZER_CACHE_DB to enable the on-disk tier.
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("EQUALIZER_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("EQUALIZER_CACHE_TTL", "86400")),
+    db_path=os.getenv("EQUALIZER_CACHE_DB") or None,
+)
+
+metrics.registry.counter("equalizer_cache_lookups_total", "Response cache lookups by result", ("result",),
+                         collect=lambda: {("hit",): response_cache.hits - response_cache.disk_hits,
+                                          ("disk_hit",): response_cache.disk_hits,
+                                          ("miss",): response_cache.misses})
+metrics.registry.counter("equalizer_cache_coalesced_total", "Identical concurrent model calls served by one call",
+                         collect=lambda: {(): response_cache.flights.coalesced})
+metrics.registry.gauge("equalizer_cache_entries", "Entries in the in-memory response cache",
+                       collect=lambda: {(): len(response_cache._entries)})
+
+# Translated advice, by sentence and language (/voice/translate). Long-lived: recurring lines
+# (disclaimers, deadlines, "you have the right to...") are translated once. Set
+# EQUALIZER_TRANSLATION_MEMORY_DB to keep it on disk, shared by workers and restarts.
+translation_memory = ResponseCache(
+    max_entries=int(os.getenv("EQUALIZER_TRANSLATION_MEMORY_SIZE", "20000")),
+    ttl_seconds=float(os.getenv("EQUALIZER_TRANSLATION_MEMORY_TTL", str(30 * 86400))),
+    db_path=os.getenv("EQUALIZER_TRANSLATION_MEMORY_DB") or None,
+)
+
+metrics.registry.counter("equalizer_translation_memory_lookups_total", "Translation memory lookups (segment, language) by result",
+                         ("result",),
+                         collect=lambda: {("hit",): translation_memory.hits - translation_memory.disk_hits,
+                                          ("disk_hit",): translation_memory.disk_hits,
+                                          ("miss",): translation_memory.misses})
+metrics.registry.gauge("equalizer_translation_memory_entries", "Segments in the in-memory translation memory",
+                       collect=lambda: {(): len(translation_memory._entries)})
+
+# Synthesized speech, by sentence. Set EQUALIZER_AUDIO_CACHE_DB to enable the on-disk tier.
+audio_cache = AudioCache(
+    max_bytes=int(float(os.getenv("EQUALIZER_AUDIO_CACHE_MB", "64")) * 1024 * 1024),
+    db_path=os.getenv("EQUALIZER_AUDIO_CACHE_DB") or None,
+    max_disk_bytes=int(float(os.getenv("EQUALIZER_AUDIO_CACHE_DISK_MB", "512")) * 1024 * 1024),
+)
+
+metrics.registry.counter("equalizer_audio_cache_lookups_total", "Synthesized audio cache lookups by result", ("result",),
+                         collect=lambda: {("hit",): audio_cache.hits - audio_cache.disk_hits,
+                                          ("disk_hit",): audio_cache.disk_hits,
+                                          ("miss",): audio_cache.misses})
+metrics.registry.gauge("equalizer_audio_cache_bytes", "Bytes of audio in the in-memory audio cache",
+                       collect=lambda: {(): audio_cache._bytes})
@@ -0,0 +1,149 @@
+import os
+import re
+import math
+from dataclasses import dataclass
+
+# Conservative estimate for legal English; real tokenizers average ~4 chars per token,
+# so this over-counts slightly and chunks never exceed the model's budget.
+CHARS_PER_TOKEN = 3.5
+
+# Token budget per chunk and number of chunk calls in flight per document
+DEFAULT_CHUNK_TOKENS = int(os.getenv("EQUALIZER_CHUNK_TOKENS", "8000"))
+DEFAULT_CHUNK_CONCURRENCY = int(os.getenv("EQUALIZER_CHUNK_CONCURRENCY", "8"))
+
+# Lines that start a new section: "ARTICLE 4", "Section 12.", "7.", "7.3", "IV."
+SECTION_RE = re.compile(
+    r'^\s*(?:(?:ARTICLE|Article|SECTION|Section|CLAUSE|Clause|PART|Part)\s+[\dIVXLC]+|\d+(?:\.\d+)*\.?\s|[IVXLC]+\.\s)',
+    re.MULTILINE,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+@dataclass
+class Chunk:
+    index: int
+    text: str
+    first_page: int
+    last_page: int
+    tokens: int
+
+    @property
+    def page_label(self) -> str:
+        if self.first_page == self.last_page:
+            return f"page {self.first_page}"
+        return f"pages {self.first_page}-{self.last_page}"
+
+
+def split_sections(text: str) -> list:
+    """
+    Splits text at section headings, falling back to paragraphs.
+    """
+    starts = [m.start() for m in SECTION_RE.finditer(text)]
+    if starts and starts[0] != 0:
+        starts.insert(0, 0)
+    if len(starts) > 1:
+        return [text[a:b] for a, b in zip(starts, starts[1:] + [len(text)]) if text[a:b].strip()]
+    return [p for p in re.split(r'(\n\s*\n)', text) if p.strip()]
+
+
+def _split_oversized(text: str, max_tokens: int) -> list:
+    """
+    Breaks a single piece that is over budget: sections, then sentences, then hard character cuts.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    pieces = split_sections(text)
+    if len(pieces) <= 1:
+        pieces = re.split(r'(?<=[.;:!?])\s+', text)
+    if len(pieces) <= 1:
+        step = int(max_tokens * CHARS_PER_TOKEN)
+        return [text[i:i + step] for i in range(0, len(text), step)]
+
+    out = []
+    for piece in pieces:
+        out.extend(_split_oversized(piece, max_tokens))
+    return out
+
+
+class ChunkPacker:
+    """
+    Packs pages (1-based numbering) into chunks of at most `max_tokens` estimated tokens.
+    Pages are kept whole where possible; oversized pages are split on section boundaries.
+    Works incrementally so chunks can be dispatched while later pages are still being parsed.
+    """
+    def __init__(self, max_tokens: int = DEFAULT_CHUNK_TOKENS):
+        self.max_tokens = max_tokens
+        self.chunk_count = 0
+        self.page_count = 0
+        self._buffer = []
+        self._buffer_tokens = 0
+        self._first_page = None
+        self._last_page = None
+
+    def _flush(self) -> list:
+        if not self._buffer:
+            return []
+        text = "\n".join(self._buffer)
+        chunk = Chunk(self.chunk_count, text, self._first_page, self._last_page, estimate_tokens(text))
+        self.chunk_count += 1
+        self._buffer, self._buffer_tokens, self._first_page = [], 0, None
+        return [chunk]
+
+    def add(self, page_text: str) -> list:
+        """
+        Adds the next page and returns any chunks that are now complete.
+        """
+        self.page_count += 1
+        page_number = self.page_count
+        if not page_text or not page_text.strip():
+            return []
+        ready = []
+        for piece in _split_oversized(page_text, self.max_tokens):
+            # Count the joining newline too so the packed chunk never exceeds the budget
+            piece_tokens = estimate_tokens(piece + "\n")
+            if self._buffer and self._buffer_tokens + piece_tokens > self.max_tokens:
+                ready.extend(self._flush())
+            if self._first_page is None:
+                self._first_page = page_number
+            self._buffer.append(piece)
+            self._buffer_tokens += piece_tokens
+            self._last_page = page_number
+        return ready
+
+    def finish(self) -> list:
+        return self._flush()
+
+
+def chunk_pages(pages: list, max_tokens: int = DEFAULT_CHUNK_TOKENS) -> list:
+    packer = ChunkPacker(max_tokens)
+    chunks = []
+    for page_text in pages:
+        chunks.extend(packer.add(page_text))
+    chunks.extend(packer.finish())
+    return chunks
+
+
+async def iter_chunks(pages, max_tokens: int = DEFAULT_CHUNK_TOKENS):
+    """
+    Async version of chunk_pages; `pages` may be a list or an async iterator of page texts
+    (e.g. PdfExtraction.pages()), and chunks are yielded as soon as they fill up.
+    """
+    packer = ChunkPacker(max_tokens)
+    if hasattr(pages, "__aiter__"):
+        async for page_text in pages:
+            for chunk in packer.add(page_text):
+                yield chunk
+    else:
+        for page_text in pages:
+            for chunk in packer.add(page_text):
+                yield chunk
+    for chunk in packer.finish():
+        yield chunk
+
+
+def needs_chunking(pages: list, max_tokens: int = DEFAULT_CHUNK_TOKENS) -> bool:
+    return sum(estimate_tokens(p) for p in pages if p) > max_tokens
@@ -0,0 +1,132 @@
+import os
+import re
+import hashlib
+import difflib
+from dataclasses import dataclass
+from app.core.cache import normalize_text
+from app.core.chunking import split_sections, estimate_tokens
+
+# Token budget of one structured-analysis call; uncached clauses are packed into calls up to this size
+CLAUSE_BATCH_TOKENS = int(os.getenv("EQUALIZER_CLAUSE_BATCH_TOKENS", "4000"))
+
+# "Section 7", "ARTICLE IV", "7.3", "IV." at the start of a clause
+CLAUSE_LABEL_RE = re.compile(
+    r'^\s*((?:ARTICLE|Article|SECTION|Section|CLAUSE|Clause|PART|Part)\s+[\dIVXLC]+(?:\.\d+)*|\d+(?:\.\d+)*|[IVXLC]+)(?=[.\s])'
+)
+SEVERITIES = ("HIGH", "MEDIUM", "LOW")
+
+
+@dataclass
+class Clause:
+    index: int
+    label: str
+    text: str
+    fingerprint: str
+    tokens: int
+
+    def entry(self) -> dict:
+        # What a stored report keeps per clause, enough to diff a later revision against it
+        return {"label": self.label, "fingerprint": self.fingerprint}
+
+
+def fingerprint(text: str) -> str:
+    # Whitespace-insensitive, like the response cache keys
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()[:32]
+
+
+def segment_clauses(text: str) -> list:
+    """
+    Splits a document into clauses at section headings (paragraphs if it has none).
+    """
+    clauses = []
+    for piece in split_sections(text or ""):
+        piece = piece.strip()
+        match = CLAUSE_LABEL_RE.match(piece)
+        label = match.group(1) if match else f"Paragraph {len(clauses) + 1}"
+        clauses.append(Clause(len(clauses), label, piece, fingerprint(piece), estimate_tokens(piece)))
+    return clauses
+
+
+def report_id(clauses: list) -> str:
+    return hashlib.sha256("\n".join(c.fingerprint for c in clauses).encode("utf-8")).hexdigest()[:32]
+
+
+def batch_clauses(clauses: list, max_tokens: int = CLAUSE_BATCH_TOKENS) -> list:
+    """
+    Packs clauses into consecutive batches of at most `max_tokens` (a longer clause goes alone).
+    """
+    batches, current, size = [], [], 0
+    for clause in clauses:
+        if current and size + clause.tokens > max_tokens:
+            batches.append(current)
+            current, size = [], 0
+        current.append(clause)
+        size += clause.tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def diff_clauses(previous: list, clauses: list) -> tuple:
+    """
+    Aligns a revision with the previous version's clause entries ({"label", "fingerprint"}).
+    Returns (status per current clause: "unchanged" | "changed" | "added", removed previous entries).
+    A replaced run of clauses counts as changed pairwise; any surplus is added or removed.
+    """
+    statuses = ["added"] * len(clauses)
+    removed = []
+    matcher = difflib.SequenceMatcher(None, [p["fingerprint"] for p in previous],
+                                      [c.fingerprint for c in clauses], autojunk=False)
+    for op, a1, a2, b1, b2 in matcher.get_opcodes():
+        if op == "equal":
+            statuses[b1:b2] = ["unchanged"] * (b2 - b1)
+        elif op == "replace":
+            paired = min(a2 - a1, b2 - b1)
+            statuses[b1:b1 + paired] = ["changed"] * paired
+            removed.extend(previous[a1 + paired:a2])
+        elif op == "delete":
+            removed.extend(previous[a1:a2])
+    return statuses, removed
+
+
+def _risk_lines(risks: list) -> list:
+    return [f"  - [{r['severity']}] **{r['title']}**: {r['explanation']}" for r in risks]
+
+
+def render_clause_report(result: dict) -> str:
+    """
+    Markdown for a structured analysis: what changed since the previous version (if any),
+    then every risk by severity with its clause.
+    """
+    clauses = result["clauses"]
+    summary = result["summary"]
+    lines = [f"## Clause Risk Report ({summary['clauses']} clauses, {summary['analyzed']} analyzed, "
+             f"{summary['cached']} from cache)", ""]
+
+    if result.get("removed") is not None:
+        changes = [c for c in clauses if c.get("status") in ("changed", "added")]
+        lines.append("### Changes Since the Previous Version")
+        if not changes and not result["removed"]:
+            lines.append("No clauses changed.")
+        for clause in changes:
+            lines.append(f"- {clause['label']} ({clause['status']})")
+            lines.extend(_risk_lines(clause["risks"]) or ["  - No risks found."])
+        for clause in result["removed"]:
+            lines.append(f"- {clause['label']} (removed)")
+            lines.extend(_risk_lines(clause.get("risks") or []))
+        lines.append("")
+
+    for severity in SEVERITIES:
+        group = [(c, r) for c in clauses for r in c["risks"] if r["severity"] == severity]
+        if not group:
+            continue
+        lines.append(f"### {severity.capitalize()} Risk")
+        for clause, risk in group:
+            lines.append(f"- **{risk['title']}** ({clause['label']}): {risk['explanation']}")
+        lines.append("")
+    failed = [c for c in clauses if c.get("error")]
+    for clause in failed:
+        lines.append(f"_Note: {clause['label']} could not be analyzed ({clause['error']})._")
+    if not any(c["risks"] for c in clauses) and not failed:
+        lines.append("No risks were found.")
+    return "\n".join(lines).strip()
@@ -0,0 +1,245 @@
+import os
+import time
+import asyncio
+import tempfile
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from app.core import metrics, images
+
+# Keep this module light: it is imported by the extraction worker processes.
+
+# Worker processes for PDF parsing (0 = parse in a thread of the main process instead)
+EXTRACTION_WORKERS = int(os.getenv("EQUALIZER_EXTRACTION_WORKERS", str(min(os.cpu_count() or 1, 8))))
+# Pages parsed per task; big PDFs are split into ranges of this size across the workers
+PAGES_PER_TASK = int(os.getenv("EQUALIZER_PAGES_PER_TASK", "25"))
+
+_pool = None
+
+
+def get_extraction_pool():
+    """
+    Lazily starts the shared process pool (spawn, so it is safe next to uvicorn's threads).
+    """
+    global _pool
+    if _pool is None and EXTRACTION_WORKERS > 0:
+        _pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS,
+                                    mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_extraction_pool(wait: bool = False):
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
+
+
+# --- Functions that run inside the worker processes ---
+def _open(source):
+    import fitz  # PyMuPDF
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
+def _page_count(source) -> int:
+    with _open(source) as doc:
+        return doc.page_count
+
+
+def _extract_range(source, start: int, end: int) -> list:
+    """
+    Returns (text, image xrefs, skipped image count) for pages [start, end). Images are not
+    decoded here, and pages whose text layer already has the content (TEXT_LAYER_MIN_CHARS)
+    contribute no images.
+    """
+    pages = []
+    with _open(source) as doc:
+        for number in range(start, end):
+            page = doc[number]
+            text = page.get_text()
+            xrefs = [img[0] for img in page.get_images(full=True)]
+            if images.TEXT_LAYER_MIN_CHARS and len(text.strip()) >= images.TEXT_LAYER_MIN_CHARS:
+                pages.append((text, [], len(xrefs)))
+            else:
+                pages.append((text, xrefs, 0))
+    return pages
+
+
+def _extract_images(source, xrefs: list) -> tuple:
+    """
+    Decodes and optimizes the images at `xrefs`, dropping byte-identical duplicates.
+    Returns (images, bytes of the images as embedded).
+    """
+    found, seen, original_bytes = [], set(), 0
+    with _open(source) as doc:
+        for xref in xrefs:
+            base_image = doc.extract_image(xref)
+            key = images.digest(base_image["image"]) if base_image else None
+            if key is None or key in seen:
+                continue
+            seen.add(key)
+            original_bytes += len(base_image["image"])
+            found.append(images.optimize_image(base_image["image"], f"image/{base_image['ext']}"))
+    return found, original_bytes
+
+
+def _timed(func, *args):
+    # Runs in the worker: start time (wall clock, comparable across processes) and duration
+    started = time.time()
+    t0 = time.perf_counter()
+    result = func(*args)
+    return started, time.perf_counter() - t0, result
+
+
+async def run_off_loop(func, *args):
+    """
+    Runs `func` in the extraction pool (a thread if there is none), timing the queue wait
+    and the call into the metrics.
+    """
+    pool = get_extraction_pool()
+    if not metrics.registry.enabled:
+        if pool is None:
+            return await asyncio.to_thread(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+    submitted = time.time()
+    if pool is None:
+        started, elapsed, result = await asyncio.to_thread(_timed, func, *args)
+    else:
+        started, elapsed, result = await asyncio.get_running_loop().run_in_executor(pool, _timed, func, *args)
+    stage = func.__name__.lstrip("_")
+    metrics.pool_wait.observe(max(0.0, started - submitted), pool="extraction" if pool else "thread", stage=stage)
+    metrics.stage_duration.observe(elapsed, stage=stage)
+    metrics.add_span("extraction", elapsed, stage=stage)
+    if func is _extract_range and result:
+        for _ in result:
+            metrics.extraction_page.observe(elapsed / len(result))
+        metrics.extraction_pages.inc(len(result))
+    return result
+
+
+# Optimized uploads by hash of the original bytes, so a re-sent photo is processed once per worker
+_prepared = OrderedDict()
+PREPARED_IMAGES = 32
+
+
+async def prepare_image(data: bytes, mime_type: str) -> dict:
+    """
+    Optimizes an uploaded image for the model off the event loop (see images.optimize_image).
+    Returns {"mime_type", "data"}.
+    """
+    if not images.IMAGE_OPTIMIZE or not data:
+        return {"mime_type": mime_type, "data": data}
+    key = await asyncio.to_thread(images.digest, data)
+    image = _prepared.get(key)
+    if image is None:
+        image = await run_off_loop(images.optimize_image, data, mime_type)
+        _prepared[key] = image
+        while len(_prepared) > PREPARED_IMAGES:
+            _prepared.popitem(last=False)
+    else:
+        _prepared.move_to_end(key)
+    metrics.image_bytes.inc(len(data), stage="original")
+    metrics.image_bytes.inc(len(image["data"]), stage="sent")
+    return image
+
+
+class PdfExtraction:
+    """
+    Off-loop PDF extraction for one document.
+
+    pages() yields page texts in order while later page ranges are still being parsed in
+    other processes, so analysis can start before the whole file is read. Image xrefs are
+    collected (deduplicated) along the way from pages without a usable text layer, and only
+    the images that will actually be sent are decoded and optimized, on demand, by images().
+    """
+    def __init__(self, source, delete_source: bool = False, redactor=None):
+        # source: a file path (preferred, e.g. a spooled upload), or the raw PDF bytes.
+        # delete_source: remove the file at `source` on close().
+        # redactor: optional StreamingRedactor (ComplianceManager.redactor()) the pages are
+        # PII-redacted through, so PII split across a page break is still caught
+        self.source = source
+        self.redactor = redactor
+        self.page_count = None
+        self.image_xrefs = []
+        self.skipped_images = 0  # images on pages read from their text layer instead
+        self._seen_xrefs = set()
+        self._texts = []
+        self._temp_path = source if delete_source else None
+
+    async def _shared_source(self):
+        # Ship a path to the workers rather than pickling the bytes into every task
+        if isinstance(self.source, (bytes, bytearray)) and get_extraction_pool() is not None:
+            def write():
+                fd, path = tempfile.mkstemp(suffix=".pdf")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(self.source)
+                return path
+            self._temp_path = await asyncio.to_thread(write)
+            self.source = self._temp_path
+        return self.source
+
+    async def pages(self):
+        source = await self._shared_source()
+        self.page_count = await run_off_loop(_page_count, source)
+        ranges = [(a, min(a + PAGES_PER_TASK, self.page_count)) for a in range(0, self.page_count, PAGES_PER_TASK)]
+        tasks = [asyncio.ensure_future(run_off_loop(_extract_range, source, a, b)) for a, b in ranges]
+        try:
+            read = 0
+            for task in tasks:
+                for text, xrefs, skipped in await task:
+                    self.skipped_images += skipped
+                    metrics.pdf_images_skipped.inc(skipped)
+                    for xref in xrefs:
+                        if xref not in self._seen_xrefs:
+                            self._seen_xrefs.add(xref)
+                            self.image_xrefs.append(xref)
+                    read += 1
+                    if self.redactor:
+                        # Redacted a page behind: each page is released once the next one is read
+                        text = self.redactor.split(text)
+                        if read == 1:
+                            continue
+                    self._texts.append(text)
+                    yield text
+            if self.redactor and read:
+                text = self.redactor.finish()
+                self._texts.append(text)
+                yield text
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def text(self) -> str:
+        """
+        Whole-document text (consumes pages() if it has not been consumed yet).
+        """
+        if self.page_count is None:
+            async for _ in self.pages():
+                pass
+        return "".join(self._texts)
+
+    async def images(self, limit: int = 1) -> list:
+        """
+        Decodes and optimizes the first `limit` unique images found in the pages parsed so far.
+        """
+        if not self.image_xrefs or limit <= 0:
+            return []
+        found, original_bytes = await run_off_loop(_extract_images, self.source, self.image_xrefs[:limit])
+        metrics.image_bytes.inc(original_bytes, stage="original")
+        metrics.image_bytes.inc(sum(len(image["data"]) for image in found), stage="sent")
+        return found
+
+    async def first_image(self):
+        images = await self.images(limit=1)
+        return images[0] if images else None
+
+    def close(self):
+        if self._temp_path:
+            try:
+                os.remove(self._temp_path)
+            except OSError:
+                pass
+            self._temp_path = None
@@ -0,0 +1,229 @@
+"""
+Offline stand-ins for the Gemini model and the speech backends, for tests, benchmarks and
+load tests of a running server (EQUALIZER_MODEL_FACTORY=app.core.fakes:load_test_model,
+EQUALIZER_STT_BACKEND / EQUALIZER_TTS_BACKEND). Nothing here calls the network.
+"""
+import os
+import math
+import time
+import random
+import asyncio
+import hashlib
+
+
+class FakeFeedback:
+    def __init__(self, block_reason=None):
+        self.block_reason = block_reason
+
+
+class FakeResponse:
+    """
+    With a `finish_reason` (e.g. "SAFETY") the candidate was stopped and .text raises ValueError,
+    as it does in google.generativeai.
+    """
+    def __init__(self, text: str, block_reason=None, finish_reason=None):
+        self._text = text
+        self.finish_reason = finish_reason
+        self.prompt_feedback = FakeFeedback(block_reason) if block_reason else None
+
+    @property
+    def text(self) -> str:
+        if self.finish_reason:
+            raise ValueError(f"Invalid operation: the candidate's finish_reason is {self.finish_reason}")
+        return self._text
+
+
+class FakeAPIError(Exception):
+    """
+    Like a google.api_core error: carries the HTTP status as `code` (429, 503, ...).
+    """
+    def __init__(self, code: int, message: str = "injected error"):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+def lognormal_latency(median: float, p99: float = None, seed: int = 0):
+    """
+    Latency callable for FakeModel: log-normal around `median` seconds with the given p99,
+    i.e. the long tail of a real API. Seeded, so every run draws the same latencies.
+    """
+    if median <= 0:
+        return lambda call: 0.0
+    rng = random.Random(seed)
+    # 2.326 = z-score of the 99th percentile
+    sigma = math.log(p99 / median) / 2.326 if p99 and p99 > median else 0.0
+    return lambda call: rng.lognormvariate(math.log(median), sigma)
+
+
+VOCABULARY = ("the tenant landlord deposit notice fee rent clause party agreement may shall within days "
+              "written consent refund penalty terminate payment late charge repair premises lease term").split()
+
+
+def digest_reply(words: int = 80):
+    """
+    Reply callable for FakeModel: `words` words chosen by a hash of the prompt, so the same
+    prompt always gets the same answer and different prompts get different ones.
+    """
+    def reply(content) -> str:
+        rng = random.Random(hashlib.sha256(repr(content).encode("utf-8")).digest())
+        return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+    return reply
+
+
+class FakeStream:
+    """
+    Async iterable mimicking a streamed Gemini response: yields one FakeResponse per chunk.
+    """
+    def __init__(self, model, chunks):
+        self.model = model
+        self.chunks = chunks
+
+    async def __aiter__(self):
+        if self.model.block_reason:
+            yield FakeResponse("", block_reason=self.model.block_reason)
+            return
+        for i, text in enumerate(self.chunks):
+            if self.model.fail_after is not None and i >= self.model.fail_after:
+                raise RuntimeError("stream interrupted")
+            await asyncio.sleep(self.model.chunk_delay)
+            yield FakeResponse(text)
+
+
+class FakeModel:
+    """
+    Offline stand-in for genai.GenerativeModel.
+    Sleeps for `latency` seconds and echoes a deterministic answer, counting calls.
+    Streaming splits the reply into chunks of `chunk_words` words, one every `chunk_delay` seconds.
+    `reply` may be a callable taking the prompt content (see digest_reply); if it raises, the call fails.
+
+    Fault injection: `faults` is a list consumed one entry per call; an exception entry is
+    raised after the latency, None lets the call through. Past the list, `error_rate` fails
+    that fraction of calls at random (seeded) with a 429 or 503 FakeAPIError. `latency` may be
+    a callable taking the call number (1-based) to vary it per call (see lognormal_latency).
+    """
+    def __init__(self, latency: float = 0.0, reply: str = "Fake analysis", chunk_delay: float = 0.0,
+                 block_reason=None, fail_after: int = None, faults: list = None, error_rate: float = 0.0,
+                 chunk_words: int = 1, seed: int = 0, finish_reason=None):
+        self.latency = latency
+        self.faults = list(faults or [])
+        self.error_rate = error_rate
+        self.chunk_words = chunk_words
+        self._rng = random.Random(seed)
+        self.reply = reply
+        self.chunk_delay = chunk_delay
+        self.block_reason = block_reason
+        self.finish_reason = finish_reason
+        self.fail_after = fail_after
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def _reply_for(self, content) -> str:
+        return self.reply(content) if callable(self.reply) else self.reply
+
+    def _latency_for(self, call: int) -> float:
+        return self.latency(call) if callable(self.latency) else self.latency
+
+    def _fault(self):
+        fault = self.faults.pop(0) if self.faults else None
+        if fault is None and self.error_rate and self._rng.random() < self.error_rate:
+            fault = FakeAPIError(self._rng.choice((429, 503)))
+        if fault is not None:
+            raise fault
+
+    def _chunks(self, reply: str) -> list:
+        words = reply.split(" ")
+        return [" ".join(words[i:i + self.chunk_words]) + " " for i in range(0, len(words), self.chunk_words)]
+
+    def generate_content(self, content, **kwargs):
+        self.calls += 1
+        time.sleep(self._latency_for(self.calls))
+        self._fault()
+        return FakeResponse(self._reply_for(content), block_reason=self.block_reason,
+                            finish_reason=self.finish_reason)
+
+    async def generate_content_async(self, content, stream: bool = False, **kwargs):
+        self.calls += 1
+        call = self.calls
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self._latency_for(call))
+        finally:
+            self.in_flight -= 1
+        self._fault()
+        reply = self._reply_for(content)
+        if stream:
+            return FakeStream(self, self._chunks(reply))
+        return FakeResponse(reply, block_reason=self.block_reason, finish_reason=self.finish_reason)
+
+
+def load_test_model(model_name: str) -> FakeModel:
+    """
+    Model factory for offline load tests of a running server:
+
+        EQUALIZER_MODEL_FACTORY=app.core.fakes:load_test_model uvicorn app.main:app
+
+    Configured with EQUALIZER_FAKE_LATENCY_MS (median, default 200), EQUALIZER_FAKE_P99_MS
+    (default 3x the median), EQUALIZER_FAKE_ERROR_RATE, EQUALIZER_FAKE_CHUNK_MS,
+    EQUALIZER_FAKE_REPLY_WORDS and EQUALIZER_FAKE_SEED.
+    """
+    median = float(os.getenv("EQUALIZER_FAKE_LATENCY_MS", "200")) / 1000
+    p99 = float(os.getenv("EQUALIZER_FAKE_P99_MS", str(median * 3000))) / 1000
+    seed = int(os.getenv("EQUALIZER_FAKE_SEED", "0"))
+    return FakeModel(latency=lognormal_latency(median, p99, seed),
+                     reply=digest_reply(int(os.getenv("EQUALIZER_FAKE_REPLY_WORDS", "80"))),
+                     chunk_delay=float(os.getenv("EQUALIZER_FAKE_CHUNK_MS", "20")) / 1000,
+                     chunk_words=4, error_rate=float(os.getenv("EQUALIZER_FAKE_ERROR_RATE", "0")), seed=seed)
+
+
+class FakeSpeechToText:
+    """
+    Offline speech-to-text backend (EQUALIZER_STT_BACKEND=app.core.fakes:FakeSpeechToText).
+    Each audio frame is UTF-8 text standing for one spoken word: a partial transcript follows
+    every word and an empty frame ends the utterance with a final transcript. Takes `latency`
+    seconds per frame.
+    """
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.frames = 0
+
+    async def transcribe(self, frames):
+        from app.core.voice_stream import Transcript
+        words = []
+        async for frame in frames:
+            if not isinstance(frame, (bytes, bytearray)):
+                continue
+            self.frames += 1
+            await asyncio.sleep(self.latency)
+            if frame:
+                words.append(frame.decode())
+                yield Transcript(" ".join(words))
+            elif words:
+                yield Transcript(" ".join(words), final=True)
+                words = []
+
+
+class FakeTextToSpeech:
+    """
+    Offline text-to-speech backend (EQUALIZER_TTS_BACKEND=app.core.fakes:FakeTextToSpeech).
+    The "audio" of a sentence is its UTF-8 bytes, in `chunk_bytes` pieces, the first one after
+    `latency` plus `per_char` seconds per character (synthesis time grows with the text).
+    Records the sentences it was given.
+    """
+    name = "fake"
+    voice = "fake-voice"
+    media_type = "application/octet-stream"
+
+    def __init__(self, latency: float = 0.0, chunk_bytes: int = 16, per_char: float = 0.0):
+        self.latency = latency
+        self.chunk_bytes = chunk_bytes
+        self.per_char = per_char
+        self.sentences = []
+
+    async def synthesize(self, text: str, language: str):
+        self.sentences.append(text)
+        await asyncio.sleep(self.latency + self.per_char * len(text))
+        data = text.encode()
+        for i in range(0, len(data), self.chunk_bytes):
+            yield data[i:i + self.chunk_bytes]
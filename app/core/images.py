@@ -0,0 +1,122 @@
+import os
+import hashlib
+
+# Keep this module light: it is imported by the extraction worker processes.
+
+# Shrink and recompress images before they are sent to the model (0 = send the original bytes)
+IMAGE_OPTIMIZE = os.getenv("EQUALIZER_IMAGE_OPTIMIZE", "1") != "0"
+# Longest side in pixels after downscaling: document text stays legible, anything larger
+# is only resampled by the model anyway
+IMAGE_MAX_SIDE = int(os.getenv("EQUALIZER_IMAGE_MAX_SIDE", "1536"))
+IMAGE_JPEG_QUALITY = int(os.getenv("EQUALIZER_IMAGE_JPEG_QUALITY", "80"))
+# Convert images that are nearly colorless (scans, photos of paper) to grayscale
+IMAGE_GRAYSCALE = os.getenv("EQUALIZER_IMAGE_GRAYSCALE", "1") != "0"
+# Mean per-pixel channel spread (0-255) below which an image counts as a grayscale document
+GRAYSCALE_MAX_SPREAD = 12
+# PDF pages with at least this many characters of text are read from their text layer only;
+# their images are not sent (0 = always send images)
+TEXT_LAYER_MIN_CHARS = int(os.getenv("EQUALIZER_TEXT_LAYER_MIN_CHARS", "200"))
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _jpeg_segments(data: bytes):
+    """
+    Yields (marker, payload) for the JPEG header segments up to the image data.
+    """
+    i = 2
+    while i + 4 <= len(data) and data[i] == 0xFF:
+        marker = data[i + 1]
+        if marker in (0xDA, 0xD9):  # start of scan / end of image
+            return
+        length = int.from_bytes(data[i + 2:i + 4], "big")
+        yield marker, data[i + 4:i + 2 + length]
+        i += 2 + length
+
+
+def _has_metadata(data: bytes) -> bool:
+    # EXIF/XMP (APP1-APP15) or comment segments
+    if data[:2] != b"\xff\xd8":
+        return False
+    return any(0xE1 <= marker <= 0xEF or marker == 0xFE for marker, _ in _jpeg_segments(data))
+
+
+def exif_orientation(data: bytes) -> int:
+    """
+    The EXIF orientation tag (1-8) of a JPEG, 1 if there is none.
+    """
+    if data[:2] != b"\xff\xd8":
+        return 1
+    try:
+        for marker, payload in _jpeg_segments(data):
+            if marker != 0xE1 or payload[:6] != b"Exif\x00\x00":
+                continue
+            tiff = payload[6:]
+            order = "little" if tiff[:2] == b"II" else "big"
+            ifd = int.from_bytes(tiff[4:8], order)
+            for n in range(int.from_bytes(tiff[ifd:ifd + 2], order)):
+                entry = tiff[ifd + 2 + 12 * n:ifd + 14 + 12 * n]
+                if int.from_bytes(entry[:2], order) == 0x0112:
+                    orientation = int.from_bytes(entry[8:10], order)
+                    return orientation if 1 <= orientation <= 8 else 1
+    except (IndexError, ValueError):
+        pass
+    return 1
+
+
+def _orientation_segment(orientation: int) -> bytes:
+    # Minimal APP1 segment that carries nothing but the orientation tag
+    tiff = (b"MM\x00\x2a\x00\x00\x00\x08" + b"\x00\x01" + b"\x01\x12\x00\x03\x00\x00\x00\x01"
+            + orientation.to_bytes(2, "big") + b"\x00\x00" + b"\x00\x00\x00\x00")
+    payload = b"Exif\x00\x00" + tiff
+    return b"\xff\xe1" + (len(payload) + 2).to_bytes(2, "big") + payload
+
+
+def _is_grayscale(pixmap) -> bool:
+    # Samples ~20k pixels; enough to tell a photo of paper from a color photo
+    if pixmap.n - pixmap.alpha < 3:
+        return True
+    samples = pixmap.samples
+    n = pixmap.n
+    step = max(1, pixmap.width * pixmap.height // 20000) * n
+    reds, greens, blues = samples[0::step], samples[1::step], samples[2::step]
+    spread = sum(max(r, g, b) - min(r, g, b) for r, g, b in zip(reds, greens, blues))
+    return spread / max(1, len(blues)) <= GRAYSCALE_MAX_SPREAD
+
+
+def optimize_image(data: bytes, mime_type: str) -> dict:
+    """
+    Prepares an image for a multimodal call: downscaled to IMAGE_MAX_SIDE, converted to
+    grayscale if it is a document, recompressed as JPEG and stripped of metadata (EXIF GPS,
+    camera details), keeping only its orientation. Returns {"mime_type", "data"}; formats
+    PyMuPDF cannot decode (e.g. WEBP) come back unchanged, as does an image that would not
+    get smaller and has no metadata to strip.
+    """
+    original = {"mime_type": mime_type, "data": data}
+    if not IMAGE_OPTIMIZE or not data:
+        return original
+    try:
+        import fitz  # PyMuPDF
+        pixmap = fitz.Pixmap(data)
+        if pixmap.alpha:
+            pixmap = fitz.Pixmap(pixmap, 0)
+        if pixmap.colorspace is None or pixmap.colorspace.n not in (1, 3):
+            pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+        longest = max(pixmap.width, pixmap.height)
+        if longest > IMAGE_MAX_SIDE:
+            scale = IMAGE_MAX_SIDE / longest
+            pixmap = fitz.Pixmap(pixmap, max(1, round(pixmap.width * scale)), max(1, round(pixmap.height * scale)), None)
+        if IMAGE_GRAYSCALE and pixmap.n == 3 and _is_grayscale(pixmap):
+            pixmap = fitz.Pixmap(fitz.csGRAY, pixmap)
+        optimized = pixmap.tobytes("jpeg", jpg_quality=IMAGE_JPEG_QUALITY)
+    except Exception:
+        return original
+
+    orientation = exif_orientation(data)
+    if orientation != 1:
+        optimized = optimized[:2] + _orientation_segment(orientation) + optimized[2:]
+    if len(optimized) >= len(data) and not _has_metadata(data):
+        return original
+    return {"mime_type": "image/jpeg", "data": optimized}
@@ -0,0 +1,478 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import socket
+import asyncio
+import sqlite3
+import ipaddress
+import threading
+from urllib.parse import urlsplit
+from dataclasses import dataclass, field
+from app.core.model_client import ModelError, RetryPolicy, deadline_after
+
+# Queue database and job input files (must be on persistent storage for jobs to survive restarts)
+JOBS_DIR = os.getenv("EQUALIZER_JOBS_DIR", os.path.join("data", "jobs"))
+# Worker slots per process: general slots take interactive jobs first, then bulk ones;
+# interactive slots only take interactive jobs, so small requests never queue behind bulk work
+JOB_WORKERS = int(os.getenv("EQUALIZER_JOB_WORKERS", "2"))
+INTERACTIVE_WORKERS = int(os.getenv("EQUALIZER_INTERACTIVE_WORKERS", "1"))
+# Uploads up to this size go to the interactive lane unless the client asks otherwise
+INTERACTIVE_MAX_BYTES = int(float(os.getenv("EQUALIZER_INTERACTIVE_MAX_MB", "1")) * 1024 * 1024)
+JOB_MAX_ATTEMPTS = int(os.getenv("EQUALIZER_JOB_MAX_ATTEMPTS", "3"))
+# A running job whose worker stops renewing its lease (crash, restart) is picked up again
+JOB_LEASE_SECONDS = float(os.getenv("EQUALIZER_JOB_LEASE", "120"))
+# Time budget for one attempt, shared by all its model calls
+JOB_TIMEOUT = float(os.getenv("EQUALIZER_JOB_TIMEOUT", "1800"))
+# Finished jobs (and their results) are kept this long
+JOB_RETENTION_SECONDS = float(os.getenv("EQUALIZER_JOB_RETENTION", str(7 * 86400)))
+# Comma-separated hosts callbacks may go to ("*.example.com" for subdomains). Unset: any host
+# whose addresses are all public, never loopback, private, link-local or metadata addresses
+CALLBACK_HOSTS = tuple(h.strip().lower() for h in os.getenv("EQUALIZER_CALLBACK_HOSTS", "").split(",") if h.strip())
+
+class JobInputError(ValueError):
+    """
+    A job that cannot succeed as submitted (e.g. its template was removed since): recorded
+    as failed with `status_code`, not retried.
+    """
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _host_allowed(host: str, allowed_hosts: tuple) -> bool:
+    return any(host == pattern or (pattern.startswith("*.") and host.endswith(pattern[1:]))
+               for pattern in allowed_hosts)
+
+
+def check_callback_url(url: str, allowed_hosts: tuple = CALLBACK_HOSTS):
+    """
+    Raises ValueError unless `url` is an http(s) URL the server may POST to: a host on the
+    allow-list, or without one, a host that resolves only to public addresses (so a callback
+    cannot reach localhost, the private network or the cloud metadata endpoint).
+    Resolves the host, so it blocks: call it in a thread.
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not host:
+        raise ValueError("callback_url must be an http(s) URL")
+    if allowed_hosts:
+        if not _host_allowed(host, allowed_hosts):
+            raise ValueError("callback_url host is not allowed")
+        return
+    try:
+        infos = socket.getaddrinfo(host, parts.port or (443 if parts.scheme == "https" else 80),
+                                   type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError, ValueError):
+        raise ValueError("callback_url host cannot be resolved")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if not address.is_global:
+            raise ValueError("callback_url must not point to a private, loopback or link-local address")
+
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+FINISHED = ("done", "failed")
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    lane: str
+    status: str  # queued | running | done | failed
+    params: dict
+    input_path: str = None
+    callback_url: str = None
+    idempotency_key: str = None
+    attempts: int = 0
+    max_attempts: int = JOB_MAX_ATTEMPTS
+    progress: dict = field(default_factory=dict)
+    result: str = None
+    error: str = None
+    error_status: int = None
+    callback_status: str = None
+    created_at: float = 0.0
+    updated_at: float = 0.0
+
+    @classmethod
+    def from_row(cls, row) -> "Job":
+        data = dict(row)
+        data["params"] = json.loads(data["params"] or "{}")
+        data["progress"] = json.loads(data["progress"] or "{}")
+        data.pop("lease_until", None)
+        data.pop("not_before", None)
+        return cls(**data)
+
+    def to_dict(self) -> dict:
+        """
+        Public view of the job (what /jobs/{id} and callbacks return).
+        """
+        out = {"job_id": self.id, "kind": self.kind, "lane": self.lane, "status": self.status,
+               "attempts": self.attempts, "progress": self.progress,
+               "created_at": self.created_at, "updated_at": self.updated_at}
+        if self.status == "done":
+            out["result"] = self.result
+        if self.status == "failed" or self.error:
+            out["error"] = {"message": self.error, "status": self.error_status}
+        if self.callback_url:
+            out["callback_status"] = self.callback_status
+        return out
+
+
+class JobStore:
+    """
+    Durable job queue in SQLite (WAL), safe to share between uvicorn workers on one host.
+    Claims are a single UPDATE ... RETURNING, so two workers never take the same job, and every
+    update after a claim is tied to its attempt number, so a worker whose lease expired cannot
+    overwrite the attempt that replaced it.
+    """
+    def __init__(self, directory: str = JOBS_DIR):
+        self.directory = directory
+        self.db_path = os.path.join(directory, "jobs.db")
+        self.inputs_dir = os.path.join(directory, "inputs")
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.inputs_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            with self._init_lock:
+                if not self._initialized:
+                    self._init_db(conn)
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    @classmethod
+    def _init_db(cls, conn: sqlite3.Connection):
+        cls._create_table(conn)
+        schema = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'jobs'").fetchone()[0]
+        if "idempotency_key TEXT UNIQUE" in schema:
+            # Files from before keys were per kind: rebuild the table with the new constraint
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("ALTER TABLE jobs RENAME TO jobs_old")
+                cls._create_table(conn)
+                conn.execute("INSERT INTO jobs SELECT * FROM jobs_old")
+                conn.execute("DROP TABLE jobs_old")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, lane, created_at)")
+
+    @staticmethod
+    def _create_table(conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                lane TEXT NOT NULL,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                input_path TEXT,
+                callback_url TEXT,
+                idempotency_key TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                progress TEXT NOT NULL DEFAULT '{}',
+                result TEXT,
+                error TEXT,
+                error_status INTEGER,
+                callback_status TEXT,
+                lease_until REAL,
+                not_before REAL NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                -- A client's key names one job per kind
+                UNIQUE (kind, idempotency_key)
+            )""")
+
+    def new_input_path(self) -> str:
+        self._connection()
+        return os.path.join(self.inputs_dir, uuid.uuid4().hex)
+
+    def submit(self, kind: str, params: dict, input_path: str = None, lane: str = BULK,
+               callback_url: str = None, idempotency_key: str = None,
+               max_attempts: int = JOB_MAX_ATTEMPTS) -> Job:
+        """
+        Queues a job. With an idempotency key, resubmitting the same kind of job returns the
+        existing one instead (the caller should then discard its own copy of the input).
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT INTO jobs (id, kind, lane, status, params, input_path, callback_url, idempotency_key,"
+            " max_attempts, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(kind, idempotency_key) DO NOTHING",
+            (uuid.uuid4().hex, kind, lane, json.dumps(params), input_path, callback_url, idempotency_key,
+             max_attempts, now, now))
+        if idempotency_key:
+            row = conn.execute("SELECT * FROM jobs WHERE kind = ? AND idempotency_key = ?",
+                               (kind, idempotency_key)).fetchone()
+        else:
+            row = conn.execute("SELECT * FROM jobs WHERE rowid = last_insert_rowid()").fetchone()
+        return Job.from_row(row)
+
+    def get(self, job_id: str):
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def claim(self, lanes=LANES, lease_seconds: float = JOB_LEASE_SECONDS):
+        """
+        Takes the next runnable job: queued (and due), or running with an expired lease.
+        Interactive jobs go first, then oldest first.
+        """
+        now = time.time()
+        placeholders = ",".join("?" for _ in lanes)
+        row = self._connection().execute(f"""
+            UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ?
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE lane IN ({placeholders})
+                  AND ((status = 'queued' AND not_before <= ?) OR (status = 'running' AND lease_until < ?))
+                ORDER BY CASE lane WHEN 'interactive' THEN 0 ELSE 1 END, created_at
+                LIMIT 1)
+            RETURNING *""", (now + lease_seconds, now, *lanes, now, now)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def _update(self, job: Job, assignments: str, values: tuple) -> bool:
+        cursor = self._connection().execute(
+            f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ? AND attempts = ? AND status = 'running'",
+            (*values, time.time(), job.id, job.attempts))
+        return cursor.rowcount == 1
+
+    def heartbeat(self, job: Job, lease_seconds: float = JOB_LEASE_SECONDS) -> bool:
+        return self._update(job, "lease_until = ?", (time.time() + lease_seconds,))
+
+    def set_progress(self, job: Job, progress: dict) -> bool:
+        return self._update(job, "progress = ?", (json.dumps(progress),))
+
+    def complete(self, job: Job, result: str) -> bool:
+        return self._update(job, "status = 'done', result = ?, error = NULL, error_status = NULL, lease_until = NULL",
+                            (result,))
+
+    def fail(self, job: Job, error: str, status_code: int = 500, retry_at: float = None) -> bool:
+        """
+        Records a failed attempt: requeued for `retry_at`, or failed for good if None.
+        """
+        if retry_at is not None:
+            return self._update(job, "status = 'queued', error = ?, error_status = ?, not_before = ?, lease_until = NULL",
+                                (error, status_code, retry_at))
+        return self._update(job, "status = 'failed', error = ?, error_status = ?, lease_until = NULL",
+                            (error, status_code))
+
+    def release(self, job: Job) -> bool:
+        """
+        Puts a job back without counting the attempt (graceful shutdown).
+        """
+        return self._update(job, "status = 'queued', attempts = attempts - 1, lease_until = NULL", ())
+
+    def set_callback_status(self, job_id: str, status: str):
+        self._connection().execute("UPDATE jobs SET callback_status = ? WHERE id = ?", (status, job_id))
+
+    def remove_input(self, job: Job):
+        if job.input_path:
+            try:
+                os.remove(job.input_path)
+            except OSError:
+                pass
+
+    def purge(self, older_than: float = JOB_RETENTION_SECONDS) -> int:
+        """
+        Deletes finished jobs last updated more than `older_than` seconds ago.
+        """
+        conn = self._connection()
+        cutoff = time.time() - older_than
+        rows = conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ? RETURNING input_path",
+                            (cutoff,)).fetchall()
+        for row in rows:
+            if row["input_path"]:
+                try:
+                    os.remove(row["input_path"])
+                except OSError:
+                    pass
+        return len(rows)
+
+    def stats(self) -> dict:
+        rows = self._connection().execute("SELECT lane, status, COUNT(*) AS n FROM jobs GROUP BY lane, status").fetchall()
+        out = {lane: {} for lane in LANES}
+        for row in rows:
+            out.setdefault(row["lane"], {})[row["status"]] = row["n"]
+        return out
+
+
+def keep_input(source_path: str, store: JobStore) -> str:
+    """
+    Moves a spooled upload into the store's inputs directory, where it survives restarts.
+    """
+    path = store.new_input_path()
+    shutil.move(source_path, path)
+    return path
+
+
+async def track_pages(pages, progress, every: int = 10):
+    """
+    Passes page texts through, reporting {"pages_read": n} every `every` pages and at the end.
+    """
+    count = 0
+    async for page in pages:
+        count += 1
+        if count % every == 0:
+            await progress(pages_read=count)
+        yield page
+    await progress(pages_read=count)
+
+
+class JobWorker:
+    """
+    Runs queued jobs in this process. `runners` maps a job kind to
+    `async def runner(job, progress) -> str`, where `progress(**fields)` records progress.
+
+    Failures with a retryable ModelError (429/503) or an unexpected exception are retried with
+    backoff until the job's max_attempts; the model-call cache makes a retried job reuse the
+    chunk results that already succeeded. Finished jobs are POSTed to their callback URL.
+    """
+    def __init__(self, store: JobStore, runners: dict, workers: int = JOB_WORKERS,
+                 interactive_workers: int = INTERACTIVE_WORKERS, poll_interval: float = 1.0,
+                 lease_seconds: float = JOB_LEASE_SECONDS, timeout: float = JOB_TIMEOUT,
+                 retry: RetryPolicy = None, callback_transport=None, callback_hosts: tuple = CALLBACK_HOSTS):
+        self.store = store
+        self.runners = runners
+        self.workers = workers
+        self.interactive_workers = interactive_workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy(max_retries=JOB_MAX_ATTEMPTS, base_delay=5.0, max_delay=300.0)
+        self.callback_transport = callback_transport  # httpx transport override (tests)
+        self.callback_hosts = callback_hosts
+        self._tasks = []
+        self._wakeup = None
+
+    def start(self):
+        if self._tasks or self.workers + self.interactive_workers <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        asyncio.ensure_future(asyncio.to_thread(self.store.purge))
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.ensure_future(self._slot(LANES)))
+        for _ in range(self.interactive_workers):
+            self._tasks.append(asyncio.ensure_future(self._slot((INTERACTIVE,))))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """
+        Wakes idle slots right away (called after a submit in this process).
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _slot(self, lanes):
+        while True:
+            job = await asyncio.to_thread(self.store.claim, lanes, self.lease_seconds)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run(job)
+
+    async def _heartbeat(self, job: Job):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await asyncio.to_thread(self.store.heartbeat, job, self.lease_seconds)
+
+    async def run(self, job: Job):
+        """
+        Runs one claimed job to a recorded outcome.
+        """
+        if job.attempts > job.max_attempts:
+            # Its worker died on every attempt (e.g. the process kept crashing on this input)
+            if await asyncio.to_thread(self.store.fail, job, job.error or "Gave up after repeated attempts",
+                                       job.error_status or 500):
+                await self._finish(job)
+            return
+
+        progress_state = dict(job.progress)
+
+        async def progress(**fields):
+            progress_state.update(fields)
+            await asyncio.to_thread(self.store.set_progress, job, dict(progress_state))
+
+        heartbeat = asyncio.ensure_future(self._heartbeat(job))
+        try:
+            runner = self.runners.get(job.kind)
+            if runner is None:
+                raise ValueError(f"Unknown job kind: {job.kind}")
+            with deadline_after(self.timeout):
+                result = await runner(job, progress)
+            recorded = await asyncio.to_thread(self.store.complete, job, result)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back for the next worker
+            await asyncio.shield(asyncio.to_thread(self.store.release, job))
+            raise
+        except Exception as e:
+            # ModelErrors say whether they are worth retrying; otherwise client errors (4xx, e.g. a
+            # bad input file) are final and anything else is retried
+            status = getattr(e, "status_code", 500)
+            retryable = e.retryable if isinstance(e, ModelError) else status >= 500
+            retry_at = None
+            if retryable and job.attempts < job.max_attempts:
+                retry_at = time.time() + self.retry.delay(job.attempts - 1, getattr(e, "retry_after", None))
+            message = getattr(e, "detail", None) or str(e)
+            recorded = await asyncio.to_thread(self.store.fail, job, message, status, retry_at)
+            if retry_at is not None:
+                return
+        finally:
+            heartbeat.cancel()
+        # recorded is False if the lease expired and another attempt took over this job
+        if recorded:
+            await self._finish(job)
+
+    async def _finish(self, job: Job):
+        finished = await asyncio.to_thread(self.store.get, job.id)
+        if finished is None or finished.status not in FINISHED:
+            return
+        await asyncio.to_thread(self.store.remove_input, finished)
+        if finished.callback_url:
+            await self._deliver_callback(finished)
+
+    async def _deliver_callback(self, job: Job, attempts: int = 3):
+        import httpx
+        # Checked again: the host may resolve to another address than when the job was submitted
+        try:
+            await asyncio.to_thread(check_callback_url, job.callback_url, self.callback_hosts)
+        except ValueError as e:
+            await asyncio.to_thread(self.store.set_callback_status, job.id, f"failed: {e}")
+            return
+        status = "failed"
+        async with httpx.AsyncClient(transport=self.callback_transport, timeout=10) as client:
+            for attempt in range(attempts):
+                try:
+                    response = await client.post(job.callback_url, json=job.to_dict())
+                    if response.status_code < 400:
+                        status = "delivered"
+                        break
+                    status = f"failed: HTTP {response.status_code}"
+                except httpx.HTTPError as e:
+                    status = f"failed: {e}"
+                if attempt + 1 < attempts:
+                    await asyncio.sleep(min(30.0, 2 ** attempt))
+        await asyncio.to_thread(self.store.set_callback_status, job.id, status)
@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+import contextlib
+
+# Collect metrics for /metrics (0 turns every instrument into an early return)
+METRICS_ENABLED = os.getenv("EQUALIZER_METRICS", "1") != "0"
+# Record per-request trace spans, returned in a Server-Timing header and logged as one JSON line
+TRACE_ENABLED = os.getenv("EQUALIZER_TRACE", "0") == "1"
+
+# Trace lines are logged at INFO
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+SIZE_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    """
+    Updated directly, or read at scrape time from `collect() -> {label value tuple: value}`
+    for numbers another object already keeps (cache hit counts, limiter state).
+    """
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = (), collect=None):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.collect = collect
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = dict(self.collect()) if self.collect is not None else dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, value: float = 1, **labels):
+        if not registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, value: float = 1, **labels):
+        if not registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def dec(self, value: float = 1, **labels):
+        self.inc(-value, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        if not registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = {key: ([*counts], total, count) for key, (counts, total, count) in self._values.items()}
+        inf = 'le="+Inf"'
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = _labels(self.label_names, key, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, key, inf)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self, enabled: bool = METRICS_ENABLED, trace: bool = TRACE_ENABLED):
+        self.enabled = enabled
+        self.trace = trace
+        self._metrics = {}
+
+    def _add(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = (), collect=None) -> Counter:
+        return self._add(Counter(name, help, labels, collect))
+
+    def gauge(self, name: str, help: str, labels: tuple = (), collect=None) -> Gauge:
+        return self._add(Gauge(name, help, labels, collect))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- The app's metrics ---
+http_requests = registry.counter("equalizer_http_requests_total", "HTTP requests by route and status",
+                                 ("method", "route", "status"))
+http_duration = registry.histogram("equalizer_http_request_duration_seconds",
+                                   "Time until the response was fully sent", ("method", "route"))
+http_in_flight = registry.gauge("equalizer_http_requests_in_flight", "HTTP requests being handled")
+
+model_latency = registry.histogram("equalizer_model_call_seconds", "Gemini call latency per attempt",
+                                   ("model", "outcome"))
+model_ttfb = registry.histogram("equalizer_model_stream_ttfb_seconds", "Time to the first streamed chunk",
+                                ("model",))
+model_retries = registry.counter("equalizer_model_retries_total", "Model calls retried after 429/5xx", ("model",))
+model_hedges = registry.counter("equalizer_model_hedges_total", "Duplicate (hedged) model requests sent", ("model",))
+prompt_chars = registry.histogram("equalizer_prompt_chars", "Prompt size in characters", ("model",), SIZE_BUCKETS)
+prompt_tokens = registry.histogram("equalizer_prompt_tokens", "Estimated prompt size in tokens", ("model",),
+                                   SIZE_BUCKETS)
+
+stage_duration = registry.histogram("equalizer_stage_seconds", "Time spent in a processing stage", ("stage",),
+                                    FAST_BUCKETS + LATENCY_BUCKETS[8:])
+pool_wait = registry.histogram("equalizer_pool_queue_seconds", "Time a task waited for a worker",
+                               ("pool", "stage"), FAST_BUCKETS + LATENCY_BUCKETS[8:])
+extraction_page = registry.histogram("equalizer_extraction_page_seconds", "PDF text extraction time per page",
+                                     buckets=FAST_BUCKETS)
+extraction_pages = registry.counter("equalizer_extraction_pages_total", "PDF pages extracted")
+image_bytes = registry.counter("equalizer_image_bytes_total", "Image bytes received and sent to the model after optimization",
+                               ("stage",))
+pdf_images_skipped = registry.counter("equalizer_pdf_images_skipped_total",
+                                      "PDF images not sent because their page has a text layer")
+
+route_calls = registry.counter("equalizer_route_calls_total", "Routed model calls by route, model and outcome",
+                               ("route", "model", "outcome"))
+route_latency = registry.histogram("equalizer_route_call_seconds", "Successful routed call latency, retries included",
+                                   ("route", "model"))
+route_fallbacks = registry.counter("equalizer_route_fallbacks_total", "Routed calls passed on to the next model",
+                                   ("route", "model", "reason"))
+voice_sessions = registry.gauge("equalizer_voice_sessions", "Open Guardian Mode voice sessions")
+voice_speculations = registry.counter("equalizer_voice_speculations_total",
+                                      "Replies started on a partial transcript, by whether the final one matched",
+                                      ("outcome",))
+route_cost = registry.counter("equalizer_route_cost_usd_total", "Estimated model spend from the routing policy prices",
+                              ("route", "model"))
+
+
+# --- Trace spans ---
+_trace = contextvars.ContextVar("equalizer_trace", default=None)
+
+
+def add_span(name: str, seconds: float, **attributes):
+    spans = _trace.get()
+    if spans is not None:
+        spans.append({"name": name, "ms": round(seconds * 1000, 2), **attributes})
+
+
+def server_timing(spans: list) -> str:
+    # Server-Timing header value: "model;dur=812.4, extraction;dur=35.1"
+    totals = {}
+    for span in spans:
+        totals[span["name"]] = totals.get(span["name"], 0) + span["ms"]
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in totals.items())
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """
+    Times a block into equalizer_stage_seconds{stage=name} (and the request trace, if any).
+    """
+    if not registry.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, stage=name)
+        add_span(name, elapsed)
+
+
+async def to_thread(name: str, func, *args):
+    """
+    asyncio.to_thread that records how long the call waited for a thread and how long it ran.
+    """
+    if not registry.enabled:
+        return await asyncio.to_thread(func, *args)
+    submitted = time.perf_counter()
+    started = []
+
+    def run():
+        started.append(time.perf_counter())
+        return func(*args)
+
+    try:
+        return await asyncio.to_thread(run)
+    finally:
+        if started:
+            pool_wait.observe(started[0] - submitted, pool="thread", stage=name)
+            elapsed = time.perf_counter() - started[0]
+            stage_duration.observe(elapsed, stage=name)
+            add_span(name, elapsed)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests per route template (so /jobs/{job_id} is one series),
+    timing them until the last byte is sent, and, with EQUALIZER_TRACE=1, collecting trace
+    spans that are returned in a Server-Timing header (when the handler finished before
+    the response started) and logged as JSON.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not registry.enabled:
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        spans = [] if registry.trace else None
+        token = _trace.set(spans)
+        status = [500]
+
+        async def measured_send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if spans:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", server_timing(spans).encode())]
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, measured_send)
+        finally:
+            _trace.reset(token)
+            http_in_flight.dec()
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_requests.inc(method=method, route=route, status=str(status[0]))
+            http_duration.observe(elapsed, method=method, route=route)
+            if spans is not None:
+                logger.info(json.dumps({"trace": {"method": method, "route": route, "status": status[0],
+                                                  "ms": round(elapsed * 1000, 2), "spans": spans}}))
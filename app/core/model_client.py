@@ -0,0 +1,529 @@
+import os
+import math
+import time
+import random
+import asyncio
+import weakref
+import contextlib
+import contextvars
+import collections
+from app.core.settings import create_model
+from app.core import metrics
+from app.core.chunking import CHARS_PER_TOKEN
+
+# Max number of in-flight Gemini calls per worker process (shared by every core class)
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("EQUALIZER_MAX_CONCURRENCY", "256"))
+# Requests per minute allowed by the Gemini quota, per worker (0 = no rate limiting)
+DEFAULT_RATE_LIMIT_RPM = float(os.getenv("EQUALIZER_RATE_LIMIT_RPM", "0"))
+# Retries after a 429/5xx, with capped exponential backoff and full jitter
+DEFAULT_MAX_RETRIES = int(os.getenv("EQUALIZER_MAX_RETRIES", "3"))
+DEFAULT_RETRY_BASE_DELAY = float(os.getenv("EQUALIZER_RETRY_BASE_DELAY", "0.5"))
+DEFAULT_RETRY_MAX_DELAY = float(os.getenv("EQUALIZER_RETRY_MAX_DELAY", "8"))
+# Send a duplicate request once a call is slower than this latency percentile (0 = no hedging)
+DEFAULT_HEDGE_PERCENTILE = float(os.getenv("EQUALIZER_HEDGE_PERCENTILE", "95"))
+# Never hedge earlier than this, and never hedge more than this share of calls
+DEFAULT_HEDGE_MIN_DELAY = float(os.getenv("EQUALIZER_HEDGE_MIN_DELAY", "1.0"))
+DEFAULT_HEDGE_BUDGET = float(os.getenv("EQUALIZER_HEDGE_BUDGET", "0.1"))
+# Time budget for one HTTP request, shared by every model call it makes (0 = none)
+DEFAULT_REQUEST_TIMEOUT = float(os.getenv("EQUALIZER_REQUEST_TIMEOUT", "120"))
+
+
+# --- Structured errors ---
+class ModelError(Exception):
+    """
+    A model call that failed for good (after retries). `status_code` is the HTTP status the
+    API answers with; `kind` is a stable machine-readable name.
+    """
+    status_code = 502
+    kind = "model_error"
+    retryable = False
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimited(ModelError):
+    status_code = 429
+    kind = "rate_limited"
+    retryable = True
+
+
+class ModelUnavailable(ModelError):
+    status_code = 503
+    kind = "model_unavailable"
+    retryable = True
+
+
+class DeadlineExceeded(ModelError):
+    status_code = 504
+    kind = "deadline_exceeded"
+
+
+class BlockedPromptError(ModelError):
+    """
+    Raised when Gemini blocks the prompt or the response.
+    """
+    status_code = 422
+    kind = "blocked"
+
+    def __init__(self, reason):
+        super().__init__(f"Blocked: {reason}")
+        self.reason = str(reason)
+
+
+def response_text(response) -> str:
+    """
+    The text of a whole (non-streamed) answer. A blocked prompt, or an answer stopped by the
+    safety filters, raises BlockedPromptError, as it does while streaming.
+    """
+    feedback = getattr(response, "prompt_feedback", None)
+    if feedback and feedback.block_reason:
+        raise BlockedPromptError(feedback.block_reason)
+    try:
+        return response.text
+    except ValueError:
+        # .text raises when the candidate was stopped (e.g. SAFETY or RECITATION) and has no parts
+        raise BlockedPromptError("response stopped by safety filters")
+
+
+def classify_error(error: Exception) -> ModelError:
+    """
+    Maps an exception from the Gemini SDK (google.api_core errors carry an HTTP `code`) to a ModelError.
+    """
+    if isinstance(error, ModelError):
+        return error
+    code = getattr(error, "code", None)
+    if code == 429:
+        return RateLimited(f"Model rate limit exceeded: {error}")
+    if code in (500, 502, 503, 504):
+        return ModelUnavailable(f"Model temporarily unavailable: {error}")
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return DeadlineExceeded("Model call timed out")
+    return ModelError(str(error))
+
+
+# --- Deadlines ---
+_deadline = contextvars.ContextVar("equalizer_deadline", default=None)
+
+
+@contextlib.contextmanager
+def deadline_after(seconds: float):
+    """
+    Sets the deadline (monotonic time) for every model call made in this context, including
+    tasks it spawns. Nested deadlines can only shorten the budget.
+    """
+    if not seconds or seconds <= 0:
+        yield _deadline.get()
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def separate_deadline(seconds: float):
+    """
+    Like deadline_after, but replaces the enclosing deadline instead of shortening it: for
+    independent units of work started by one request (batch items).
+    """
+    token = _deadline.set(None)
+    try:
+        with deadline_after(seconds) as deadline:
+            yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline():
+    return _deadline.get()
+
+
+def _remaining(deadline) -> float:
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return remaining
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware giving each HTTP request a time budget that all its model calls share.
+    Clients may ask for a shorter one with an `X-Request-Timeout: <seconds>` header.
+    """
+    def __init__(self, app, timeout: float = DEFAULT_REQUEST_TIMEOUT):
+        self.app = app
+        self.timeout = timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timeout = self.timeout
+        header = dict(scope.get("headers") or []).get(b"x-request-timeout")
+        if header:
+            try:
+                requested = float(header)
+                if requested > 0:
+                    timeout = min(timeout, requested) if timeout else requested
+            except ValueError:
+                pass
+        with deadline_after(timeout):
+            await self.app(scope, receive, send)
+
+
+# --- Flow control ---
+class ConcurrencyLimiter:
+    """
+    Per-worker cap on in-flight model calls, adapted AIMD-style: the limit is halved when the
+    API signals overload (at most once per `backoff_interval`) and grows back by about one slot
+    per `limit` successful calls, up to `max_concurrency`.
+    Keeps one condition per event loop so the limiter is safe to share
+    between uvicorn's loop and test clients that spin up their own loops.
+    """
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, min_concurrency: int = 1,
+                 backoff_interval: float = 1.0):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.backoff_interval = backoff_interval
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._last_backoff = float("-inf")
+        self._conditions = weakref.WeakKeyDictionary()
+
+    def _condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        condition = self._conditions.get(loop)
+        if condition is None:
+            condition = asyncio.Condition()
+            self._conditions[loop] = condition
+        return condition
+
+    @property
+    def current_limit(self) -> int:
+        return max(int(self.limit), self.min_concurrency)
+
+    def on_success(self):
+        self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+
+    def on_overload(self):
+        now = time.monotonic()
+        if now - self._last_backoff >= self.backoff_interval:
+            self._last_backoff = now
+            self.limit = max(float(self.min_concurrency), self.limit / 2)
+
+    async def __aenter__(self):
+        condition = self._condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < self.current_limit)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        condition = self._condition()
+        async with condition:
+            self.in_flight -= 1
+            # Wake one waiter per free slot (more than one if the limit has grown)
+            condition.notify(max(1, self.current_limit - self.in_flight))
+        return False
+
+
+limiter = ConcurrencyLimiter()
+metrics.registry.gauge("equalizer_model_in_flight", "Model calls in flight (all models)",
+                       collect=lambda: {(): limiter.in_flight})
+metrics.registry.gauge("equalizer_model_concurrency_limit", "Current adaptive limit on model calls in flight",
+                       collect=lambda: {(): limiter.current_limit})
+
+
+class TokenBucket:
+    """
+    Requests-per-minute limiter matched to the Gemini quota. Callers reserve a token and sleep
+    until it is due, so waiting callers are served in order. A rate of 0 disables it.
+    """
+    def __init__(self, rate_per_minute: float = DEFAULT_RATE_LIMIT_RPM, burst: int = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1, math.ceil(self.rate))
+        self.tokens = float(self.capacity)
+        self._updated = time.monotonic()
+
+    async def acquire(self, deadline: float = None):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self.tokens = min(float(self.capacity), self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        if deadline is not None and now + wait >= deadline:
+            raise RateLimited("Rate limit would be exceeded before the request deadline", retry_after=wait)
+        self.tokens -= 1
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+rate_limiter = TokenBucket()
+
+
+class RetryPolicy:
+    """
+    Capped exponential backoff with full jitter: attempt n waits uniform(0, min(max_delay, base * 2**n)).
+    """
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES, base_delay: float = DEFAULT_RETRY_BASE_DELAY,
+                 max_delay: float = DEFAULT_RETRY_MAX_DELAY):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, retry: int, retry_after: float = None) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry)))
+        return max(delay, retry_after or 0.0)
+
+
+class LatencyTracker:
+    """
+    Recent successful call latencies, used to pick the hedging delay.
+    """
+    def __init__(self, percentile: float = DEFAULT_HEDGE_PERCENTILE, min_delay: float = DEFAULT_HEDGE_MIN_DELAY,
+                 budget: float = DEFAULT_HEDGE_BUDGET, window: int = 256, min_samples: int = 20):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.budget = budget
+        self.min_samples = min_samples
+        self.samples = collections.deque(maxlen=window)
+        self.calls = 0
+        self.hedges = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def hedge_delay(self):
+        """
+        Seconds to wait before hedging the next call, or None if it should not be hedged.
+        """
+        self.calls += 1
+        if self.percentile <= 0 or len(self.samples) < self.min_samples:
+            return None
+        if self.hedges >= self.budget * self.calls:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(ordered[index], self.min_delay)
+
+
+class ModelClient:
+    """
+    Async wrapper around a Gemini model, shared by all the core classes.
+    Uses generate_content_async so calls never block the event loop.
+
+    Every call goes through the rate limiter and the adaptive concurrency limiter, is retried
+    on 429/5xx with jittered backoff, is hedged with a duplicate request when it runs past the
+    recent p95 latency, and is bounded by the current request deadline. Failures that remain
+    are raised as ModelError subclasses.
+    """
+    def __init__(self, model_name: str, model=None, limiter: ConcurrencyLimiter = limiter,
+                 rate_limiter: TokenBucket = rate_limiter, retry: RetryPolicy = None, latency: LatencyTracker = None):
+        self.model_name = model_name
+        self._model = model
+        self.limiter = limiter
+        self.rate_limiter = rate_limiter
+        self.retry = retry or RetryPolicy()
+        self.latency = latency or LatencyTracker()
+        self.retries = 0
+
+    @property
+    def model(self):
+        # The Gemini model (and SDK) is only created when the first call is made
+        if self._model is None:
+            self._model = create_model(self.model_name)
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+
+    def _record_prompt(self, content):
+        if not metrics.registry.enabled:
+            return
+        parts = content if isinstance(content, (list, tuple)) else [content]
+        chars = sum(len(part) for part in parts if isinstance(part, str))
+        metrics.prompt_chars.observe(chars, model=self.model_name)
+        metrics.prompt_tokens.observe(math.ceil(chars / CHARS_PER_TOKEN), model=self.model_name)
+
+    def _observe(self, start: float, outcome: str):
+        elapsed = time.monotonic() - start
+        metrics.model_latency.observe(elapsed, model=self.model_name, outcome=outcome)
+        metrics.add_span("model", elapsed, model=self.model_name, outcome=outcome)
+
+    def _failed(self, error: Exception) -> ModelError:
+        error = classify_error(error)
+        if isinstance(error, (RateLimited, ModelUnavailable)):
+            self.limiter.on_overload()
+        return error
+
+    async def _with_retries(self, call):
+        deadline = current_deadline()
+        retry = 0
+        while True:
+            try:
+                return await call(deadline)
+            except ModelError as e:
+                if not e.retryable or retry >= self.retry.max_retries:
+                    raise
+                delay = self.retry.delay(retry, e.retry_after)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise
+                retry += 1
+                self.retries += 1
+                metrics.model_retries.inc(model=self.model_name)
+                await asyncio.sleep(delay)
+
+    async def _attempt(self, content, deadline, model=None, **kwargs):
+        await self.rate_limiter.acquire(deadline)
+        async with self.limiter:
+            start = time.monotonic()
+            try:
+                call = (model or self.model).generate_content_async(content, **kwargs)
+                response = await asyncio.wait_for(call, _remaining(deadline)) if deadline else await call
+            except asyncio.CancelledError:
+                # The losing side of a hedge, or the client went away
+                self._observe(start, "cancelled")
+                raise
+            except Exception as e:
+                error = self._failed(e)
+                self._observe(start, error.kind)
+                raise error from e
+            self.limiter.on_success()
+            self.latency.record(time.monotonic() - start)
+            self._observe(start, "ok")
+            return response
+
+    async def _hedged(self, content, deadline, **kwargs):
+        hedge_after = self.latency.hedge_delay()
+        primary = asyncio.ensure_future(self._attempt(content, deadline, **kwargs))
+        if hedge_after is None:
+            return await primary
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                self.latency.hedges += 1
+                metrics.model_hedges.inc(model=self.model_name)
+                tasks.append(asyncio.ensure_future(self._attempt(content, deadline, **kwargs)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def generate(self, content, model=None, **kwargs):
+        """
+        `model` overrides the client's model for this call (e.g. one bound to a cached context);
+        it shares the client's limits.
+        """
+        if model is not None:
+            kwargs["model"] = model
+        self._record_prompt(content)
+        return await self._with_retries(lambda deadline: self._hedged(content, deadline, **kwargs))
+
+    async def generate_stream(self, content, model=None, **kwargs):
+        """
+        Yields partial text as Gemini produces it (generate_content_async with stream=True).
+        The concurrency slot is held until the stream is exhausted or closed. Failures before
+        the first chunk are retried like generate(); streams are not hedged.
+        """
+        deadline = current_deadline()
+        self._record_prompt(content)
+        retry = 0
+        while True:
+            started = False
+            try:
+                await self.rate_limiter.acquire(deadline)
+                async with self.limiter:
+                    start = time.monotonic()
+                    try:
+                        call = (model or self.model).generate_content_async(content, stream=True, **kwargs)
+                        response = await asyncio.wait_for(call, _remaining(deadline)) if deadline else await call
+                        chunks = response.__aiter__()
+                        while True:
+                            try:
+                                next_chunk = chunks.__anext__()
+                                chunk = await asyncio.wait_for(next_chunk, _remaining(deadline)) if deadline else await next_chunk
+                            except StopAsyncIteration:
+                                break
+                            feedback = getattr(chunk, 'prompt_feedback', None)
+                            if feedback and feedback.block_reason:
+                                raise BlockedPromptError(feedback.block_reason)
+                            try:
+                                text = chunk.text
+                            except ValueError:
+                                # .text raises when the candidate was stopped (e.g. SAFETY) and has no parts
+                                raise BlockedPromptError("response stopped by safety filters")
+                            if text:
+                                if not started:
+                                    metrics.model_ttfb.observe(time.monotonic() - start, model=self.model_name)
+                                started = True
+                                yield text
+                    except ModelError as e:
+                        self._observe(start, e.kind)
+                        raise
+                    except Exception as e:
+                        error = self._failed(e)
+                        self._observe(start, error.kind)
+                        raise error from e
+                self.limiter.on_success()
+                self._observe(start, "ok")
+                return
+            except ModelError as e:
+                if started or not e.retryable or retry >= self.retry.max_retries:
+                    raise
+                delay = self.retry.delay(retry, e.retry_after)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise
+                retry += 1
+                self.retries += 1
+                metrics.model_retries.inc(model=self.model_name)
+                await asyncio.sleep(delay)
+
+
+_clients = {}
+
+
+def get_model_client(model_name: str) -> ModelClient:
+    """
+    Returns the shared client for a model name (one per worker process).
+    """
+    client = _clients.get(model_name)
+    if client is None:
+        client = ModelClient(model_name)
+        _clients[model_name] = client
+    return client
+
+
+def preload_models():
+    """
+    Creates the models behind every shared client now rather than on the first request.
+    """
+    for client in list(_clients.values()):
+        client.model
+
+
+def set_model_client(model_name: str, client: ModelClient):
+    """
+    Overrides the shared client for a model name (used by tests and load tests).
+    """
+    _clients[model_name] = client
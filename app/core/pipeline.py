@@ -0,0 +1,161 @@
+import asyncio
+from app.core.chunking import needs_chunking
+
+# Most translations one pipeline request may ask for
+MAX_PIPELINE_LANGUAGES = 10
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+async def _nothing_to_close():
+    pass
+
+
+def tee_pages(pages, n: int = 2) -> tuple:
+    """
+    Splits one page source into `n` independent ones, so a single extraction can feed several
+    consumers. Async iterators are pumped once, in the background, on the first read; pages are
+    held only until every consumer has taken them. Lists are simply shared.
+
+    Returns (readers, close): awaiting close() stops the pump and closes the source, for when
+    the consumers go away before the source is exhausted.
+    """
+    if not hasattr(pages, "__aiter__"):
+        pages = list(pages)
+        return [pages] * n, _nothing_to_close
+
+    queues = [asyncio.Queue() for _ in range(n)]
+    done = object()
+    pump_task = None
+
+    async def pump():
+        try:
+            async for page in pages:
+                for queue in queues:
+                    queue.put_nowait(page)
+        except BaseException as e:
+            for queue in queues:
+                queue.put_nowait(_Failure(e))
+            return
+        for queue in queues:
+            queue.put_nowait(done)
+
+    async def reader(queue):
+        nonlocal pump_task
+        if pump_task is None:
+            pump_task = asyncio.ensure_future(pump())
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+
+    async def close():
+        if pump_task is not None:
+            pump_task.cancel()
+            await asyncio.wait([pump_task])
+        aclose = getattr(pages, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+    return [reader(queue) for queue in queues], close
+
+
+class DocumentPipeline:
+    """
+    One-shot processing of a document: it is extracted once, risk analysis and simplification
+    run concurrently, and the simplified text is translated into every requested language in
+    parallel. Translations start as soon as simplification finishes, so end-to-end latency is
+    about max(analyze, simplify + translate) rather than the sum of every call.
+    """
+    def __init__(self, detector, simplifier, voice):
+        self.detector = detector
+        self.simplifier = simplifier
+        self.voice = voice
+
+    async def _analyze(self, pages=None, text_content=None, image_data=None, mime_type=None, image_loader=None):
+        if pages is not None:
+            return await self.detector.analyze_long_document_async(pages, image_data, mime_type, image_loader=image_loader)
+        if needs_chunking([text_content or ""]):
+            return await self.detector.analyze_long_document_async([text_content], image_data, mime_type)
+        return await self.detector.analyze_document_async(text_content, image_data, mime_type)
+
+    async def _simplify(self, pages=None, text_content=None, image_data=None, mime_type=None):
+        if pages is not None:
+            return await self.simplifier.simplify_long_document_async(pages)
+        if needs_chunking([text_content or ""]):
+            return await self.simplifier.simplify_long_document_async([text_content])
+        return await self.simplifier.simplify_text_async(text_content, image_data, mime_type)
+
+    async def stream(self, languages=(), pages=None, text_content: str = None, image_data: bytes = None,
+                     mime_type: str = None, image_loader=None):
+        """
+        Yields each part of the result as soon as it is ready, in completion order:
+        {"section": "analysis" | "simplified", "text": ...} and
+        {"section": "translation", "language": ..., "text": ...}. A stage that fails yields
+        its part with "error" (the exception) instead of "text"; the other stages carry on.
+
+        `pages` (a list or async iterator of page texts, e.g. PdfExtraction.pages()) is shared by
+        both stages; otherwise pass `text_content` and/or `image_data` as for the core classes.
+        """
+        languages = list(dict.fromkeys(l.strip() for l in languages if l and l.strip()))
+        analysis_pages, simplify_pages, close_pages = None, None, _nothing_to_close
+        if pages is not None:
+            (analysis_pages, simplify_pages), close_pages = tee_pages(pages, 2)
+
+        queue = asyncio.Queue()
+        tasks = []
+
+        def spawn(part: dict, coro):
+            task = asyncio.ensure_future(coro)
+            task.add_done_callback(lambda t: queue.put_nowait((part, t)))
+            tasks.append(task)
+
+        spawn({"section": "analysis"},
+              self._analyze(analysis_pages, text_content, image_data, mime_type, image_loader))
+        spawn({"section": "simplified"},
+              self._simplify(simplify_pages, text_content, image_data, mime_type))
+        pending = 2
+        try:
+            while pending:
+                part, task = await queue.get()
+                pending -= 1
+                error = task.exception()
+                if error is not None:
+                    yield {**part, "error": error}
+                    continue
+                text = task.result()
+                yield {**part, "text": text}
+                if part["section"] == "simplified":
+                    for language in languages:
+                        spawn({"section": "translation", "language": language},
+                              self.voice.translate_to_mother_tongue_async(text, language))
+                        pending += 1
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Stop reading the document nobody is waiting for any more
+            await close_pages()
+
+    async def run(self, languages=(), **document) -> dict:
+        """
+        Collects stream() into {"analysis": ..., "simplified": ..., "translations": {language: ...},
+        "errors": [...]}, where each failed stage is its stream() part ({"section", "error"} plus
+        "language" for translations) and its own entry stays None. Raises only if nothing succeeded.
+        """
+        result = {"analysis": None, "simplified": None, "translations": {}, "errors": []}
+        async for part in self.stream(languages, **document):
+            if "error" in part:
+                result["errors"].append(part)
+            elif part["section"] == "translation":
+                result["translations"][part["language"]] = part["text"]
+            else:
+                result[part["section"]] = part["text"]
+        if result["analysis"] is None and result["simplified"] is None:
+            raise result["errors"][0]["error"]
+        return result
@@ -1,24 +1,42 @@
-import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+import re
+import json
+import asyncio
+from app.core.model_client import get_model_client, ModelError, response_text
+from app.core.cache import response_cache, make_cache_key
+from app.core.routing import model_router
+from app.core.chunking import iter_chunks, estimate_tokens, DEFAULT_CHUNK_TOKENS, DEFAULT_CHUNK_CONCURRENCY
+from app.core.clauses import (segment_clauses, batch_clauses, diff_clauses, report_id, render_clause_report,
+                              CLAUSE_BATCH_TOKENS)
+from app.core.sessions import IN_CONTEXT
 
-load_dotenv()
-
-# Configure Gemini
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    print("Warning: GOOGLE_API_KEY not found in environment variables.")
-else:
-    genai.configure(api_key=api_key)
+# "- [HIGH] Title: explanation" lines produced by the per-chunk prompt
+RISK_LINE_RE = re.compile(r'^\s*[-*\u2022]\s*\[(HIGH|MEDIUM|LOW)\]\s*(.+)$', re.IGNORECASE | re.MULTILINE)
+SEVERITY_ORDER = {"HIGH": 0, "MEDIUM": 1, "LOW": 2}
+SEVERITY_HEADINGS = {"HIGH": "High Risk Clauses", "MEDIUM": "Hidden Fees & Medium Risks", "LOW": "Unfair or Ambiguous Terms"}
 
 class RiskDetector:
-    def __init__(self, model_name="gemini-3-flash-preview"):
-        self.model = genai.GenerativeModel(model_name)
+    # Bump whenever the instruction below changes so cached answers are invalidated
+    PROMPT_VERSION = "risk-v1"
+    CHUNK_PROMPT_VERSION = "risk-chunk-v2"
+    CLAUSE_PROMPT_VERSION = "risk-clause-v1"
 
-    def analyze_document(self, text_content: str = None, image_data: bytes = None, mime_type: str = None) -> str:
-        """
-        Analyzes the provided text or image for legal risks, hidden fees, and unfair clauses.
-        """
+    def __init__(self, model_name="gemini-3-flash-preview", cache=response_cache, router=model_router):
+        self.model_name = model_name
+        self.cache = cache
+        self.router = router
+        self.client = get_model_client(model_name)
+        self._model = None
+
+    @property
+    def model(self):
+        # Shared, lazily created model unless one was set on this instance
+        return self._model if self._model is not None else self.client.model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+
+    def _build_content(self, text_content: str = None, image_data: bytes = None, mime_type: str = None) -> list:
         instruction = """
         You are 'The Equalizer', an expert rights advocate and legal analyst.
         Analyze the following document (provided as text or image). 
@@ -40,17 +58,368 @@ class RiskDetector:
                 "mime_type": mime_type,
                 "data": image_data
             })
+        return content
+
+    def _cache_key(self, text_content: str = None, image_data: bytes = None, mime_type: str = None) -> str:
+        return make_cache_key("analyze", self.router.cache_scope(self.model_name), self.PROMPT_VERSION,
+                              text=text_content, image_data=image_data, mime_type=mime_type)
+
+    def _handle_response(self, response) -> str:
+        # Blocked prompts and safety-stopped answers raise BlockedPromptError (422), not an error string
+        return response_text(response)
 
+    def analyze_document(self, text_content: str = None, image_data: bytes = None, mime_type: str = None) -> str:
+        """
+        Analyzes the provided text or image for legal risks, hidden fees, and unfair clauses.
+        """
+        key = self._cache_key(text_content, image_data, mime_type)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        content = self._build_content(text_content, image_data, mime_type)
         try:
             response = self.model.generate_content(content)
-            # Gemini response might be blocked if safety settings are triggered, handle gracefully
-            if hasattr(response, 'prompt_feedback') and response.prompt_feedback and response.prompt_feedback.block_reason:
-                 return f"Error: Analysis blocked due to safety reason: {response.prompt_feedback.block_reason}"
-            
-            return response.text
+            result = self._handle_response(response)
+            self.cache.set(key, result)
+            return result
         except Exception as e:
             return f"Error during analysis: {str(e)}"
 
+    async def analyze_document_async(self, text_content: str = None, image_data: bytes = None, mime_type: str = None,
+                                     context=None) -> str:
+        """
+        Async version of analyze_document, runs on the shared model client without blocking the event loop.
+        Model failures (after retries) raise ModelError instead of returning an error string.
+        Identical concurrent requests share one model call.
+        `context` is a model bound to a cached context that already holds this document; only
+        the instruction is sent then (the document still keys the response cache).
+        """
+        async def generate():
+            if context is not None:
+                content = self._build_content() + [IN_CONTEXT]
+            else:
+                content = self._build_content(text_content, image_data, mime_type)
+            response = await self.router.generate("analyze", content, self.client, model=context)
+            return self._handle_response(response)
+
+        return await self.cache.get_or_generate(self._cache_key(text_content, image_data, mime_type), generate)
+
+    # --- Long-document mode (map-reduce over chunks) ---
+    def _build_chunk_content(self, chunk, image_data: bytes = None, mime_type: str = None) -> list:
+        instruction = f"""
+        You are 'The Equalizer', an expert rights advocate and legal analyst.
+        You are reviewing {chunk.page_label} of a longer document.
+        Identify high risk clauses, hidden fees or overcharges, and unfair or ambiguous terms in this part.
+
+        Output one risk per line in exactly this format and nothing else:
+        - [HIGH|MEDIUM|LOW] Short title: why it is a risk, in simple terms (5th grade reading level)
+
+        If this part has no risks, output: NONE
+        """
+        content = [instruction, f"Document Text ({chunk.page_label}):\n{chunk.text}"]
+        if image_data:
+            content.append({
+                "mime_type": mime_type,
+                "data": image_data
+            })
+        return content
+
+    async def _analyze_chunk(self, chunk, semaphore: asyncio.Semaphore,
+                             image_data: bytes = None, mime_type: str = None) -> str:
+        key = make_cache_key("analyze_chunk", self.router.cache_scope(self.model_name), self.CHUNK_PROMPT_VERSION,
+                             text=chunk.text, image_data=image_data, pages=chunk.page_label)
+
+        async def generate():
+            content = self._build_chunk_content(chunk, image_data, mime_type)
+            async with semaphore:
+                response = await self.router.generate("analyze_chunk", content, self.client)
+            return self._handle_response(response)
+
+        return await self.cache.get_or_generate(key, generate)
+
+    def _merge_risks(self, chunk_results: list) -> list:
+        """
+        Reduce step: dedupes risks reported by several chunks (same title wording)
+        and ranks them by severity, then by how often they came up.
+        """
+        merged = []
+        for chunk, text in chunk_results:
+            for match in RISK_LINE_RE.finditer(text):
+                severity = match.group(1).upper()
+                title, _, explanation = match.group(2).strip().partition(":")
+                title = title.strip(" *")
+                words = frozenset(w for w in re.findall(r'[a-z0-9]+', title.lower()) if len(w) > 2)
+
+                for risk in merged:
+                    union = words | risk["words"]
+                    if union and len(words & risk["words"]) / len(union) >= 0.6:
+                        if SEVERITY_ORDER[severity] < SEVERITY_ORDER[risk["severity"]]:
+                            risk["severity"] = severity
+                        if len(explanation) > len(risk["explanation"]):
+                            risk["explanation"] = explanation.strip()
+                        risk["pages"].update(range(chunk.first_page, chunk.last_page + 1))
+                        risk["count"] += 1
+                        break
+                else:
+                    merged.append({
+                        "severity": severity,
+                        "title": title,
+                        "explanation": explanation.strip(),
+                        "words": words,
+                        "pages": set(range(chunk.first_page, chunk.last_page + 1)),
+                        "first_chunk": chunk.index,
+                        "count": 1,
+                    })
+
+        merged.sort(key=lambda r: (SEVERITY_ORDER[r["severity"]], -r["count"], r["first_chunk"]))
+        return merged
+
+    @staticmethod
+    def _page_ranges(pages: set) -> str:
+        # {1, 2, 3, 7} -> "pages 1-3, 7"
+        ranges = []
+        for page in sorted(pages):
+            if ranges and page == ranges[-1][1] + 1:
+                ranges[-1][1] = page
+            else:
+                ranges.append([page, page])
+        parts = [str(a) if a == b else f"{a}-{b}" for a, b in ranges]
+        return ("page " if len(pages) == 1 else "pages ") + ", ".join(parts)
+
+    def _render_report(self, risks: list, total_pages: int, chunk_count: int, failures: list) -> str:
+        lines = [f"## Risk Report ({total_pages} pages, analyzed in {chunk_count} parts)", ""]
+        if not risks:
+            lines.append("No risks were found in the analyzed parts.")
+        for severity in ("HIGH", "MEDIUM", "LOW"):
+            group = [r for r in risks if r["severity"] == severity]
+            if not group:
+                continue
+            lines.append(f"### {SEVERITY_HEADINGS[severity]}")
+            for risk in group:
+                lines.append(f"- **{risk['title']}** ({self._page_ranges(risk['pages'])}): {risk['explanation']}")
+            lines.append("")
+        for chunk, error in failures:
+            lines.append(f"_Note: {chunk.page_label} could not be analyzed ({error})._")
+        return "\n".join(lines).strip()
+
+    async def analyze_long_document_async(self, pages, image_data: bytes = None, mime_type: str = None,
+                                          image_loader=None,
+                                          max_chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+                                          max_concurrency: int = DEFAULT_CHUNK_CONCURRENCY) -> str:
+        """
+        Long-document mode: splits pages into token-budgeted chunks, analyzes them concurrently
+        and merges the risks into one ranked report. A failing chunk is reported, not fatal.
+
+        `pages` may be a list or an async iterator of page texts (PdfExtraction.pages()); chunks
+        are dispatched as soon as they fill up, so analysis overlaps with extraction.
+        `image_loader` is an optional coroutine function returning the first embedded image
+        ({"data", "mime_type"}) found so far; it is only called if an image will be sent.
+        """
+        async def first_image():
+            if image_data:
+                return image_data, mime_type
+            if image_loader:
+                image = await image_loader()
+                if image:
+                    return image["data"], image["mime_type"]
+            return None, None
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def analyze(chunk):
+            # Embedded images travel with the first chunk only
+            chunk_image, chunk_mime = await first_image() if chunk.index == 0 else (None, None)
+            return await self._analyze_chunk(chunk, semaphore, chunk_image, chunk_mime)
+
+        chunks, tasks = [], []
+        try:
+            async for chunk in iter_chunks(pages, max_chunk_tokens):
+                chunks.append(chunk)
+                # Hold the first chunk until we know the document needs more than one call
+                if chunk.index == 1:
+                    tasks.append(asyncio.ensure_future(analyze(chunks[0])))
+                if chunk.index >= 1:
+                    tasks.append(asyncio.ensure_future(analyze(chunk)))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        if len(chunks) <= 1:
+            single_image, single_mime = await first_image()
+            return await self.analyze_document_async(chunks[0].text if chunks else "", single_image, single_mime)
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        successes = [(c, r) for c, r in zip(chunks, results) if not isinstance(r, BaseException)]
+        failures = [(c, str(r)) for c, r in zip(chunks, results) if isinstance(r, BaseException)]
+        if not successes:
+            error = next(r for r in results if isinstance(r, BaseException))
+            if isinstance(error, ModelError):
+                raise error
+            raise ModelError(f"Analysis failed: {error}") from error
+        return self._render_report(self._merge_risks(successes), chunks[-1].last_page, len(chunks), failures)
+
+    # --- Structured mode (clause-level JSON, cached per clause) ---
+    def _build_clause_content(self, clauses: list) -> list:
+        instruction = """
+        You are 'The Equalizer', an expert rights advocate and legal analyst.
+        Review each numbered clause below for high risk terms, hidden fees or overcharges, and unfair or ambiguous terms.
+
+        Return JSON only: a list with one object per clause, in the given order:
+        {"clause": <number>, "risks": [{"severity": "HIGH" | "MEDIUM" | "LOW", "title": "<short title>", "explanation": "<why it is a risk, in simple terms (5th grade reading level)>"}]}
+        Use an empty "risks" list for a clause without risks.
+        """
+        body = "\n\n".join(f"[Clause {number}]\n{clause.text}" for number, clause in enumerate(clauses, 1))
+        return [instruction, f"Clauses:\n{body}"]
+
+    def _clause_key(self, clause_fingerprint: str) -> str:
+        return make_cache_key("analyze_clause", self.router.cache_scope(self.model_name), self.CLAUSE_PROMPT_VERSION,
+                              fingerprint=clause_fingerprint)
+
+    def _report_key(self, clause_report_id: str) -> str:
+        return make_cache_key("clause_report", self.model_name, self.CLAUSE_PROMPT_VERSION, report=clause_report_id)
+
+    @staticmethod
+    def _parse_clause_risks(text: str, count: int) -> list:
+        """
+        Risks per clause, in order, from the model's JSON. Raises ValueError if it is malformed.
+        """
+        text = re.sub(r'^```(?:json)?\s*|\s*```$', '', text.strip())
+        try:
+            data = json.loads(text)
+            if isinstance(data, dict):
+                data = data.get("clauses", [])
+            by_number = {}
+            for item in data:
+                risks = []
+                for risk in item.get("risks") or []:
+                    severity = str(risk.get("severity", "")).upper()
+                    risks.append({
+                        "severity": severity if severity in SEVERITY_ORDER else "MEDIUM",
+                        "title": str(risk.get("title", "")).strip(),
+                        "explanation": str(risk.get("explanation", "")).strip(),
+                    })
+                by_number[int(item["clause"])] = risks
+        except (TypeError, KeyError, AttributeError) as e:
+            raise ValueError(f"Unexpected structured output: {e}")
+        missing = [n for n in range(1, count + 1) if n not in by_number]
+        if missing:
+            raise ValueError(f"No result for clause(s) {missing}")
+        return [by_number[n] for n in range(1, count + 1)]
+
+    async def _analyze_clause_batch(self, batch: list, semaphore: asyncio.Semaphore) -> dict:
+        async with semaphore:
+            response = await self.router.generate("analyze_clause", self._build_clause_content(batch), self.client,
+                                                  generation_config={"response_mime_type": "application/json"})
+        result = self._handle_response(response)
+        found = {}
+        for clause, risks in zip(batch, self._parse_clause_risks(result, len(batch))):
+            found[clause.fingerprint] = risks
+            await self.cache.set_async(self._clause_key(clause.fingerprint), json.dumps(risks))
+        return found
+
+    def load_clause_report(self, clause_report_id: str):
+        """
+        Clause entries ({"label", "fingerprint"}) of an earlier structured analysis, or None if unknown.
+        """
+        stored = self.cache.get(self._report_key(clause_report_id))
+        return json.loads(stored) if stored is not None else None
+
+    async def load_clause_report_async(self, clause_report_id: str):
+        stored = await self.cache.get_async(self._report_key(clause_report_id))
+        return json.loads(stored) if stored is not None else None
+
+    async def analyze_clauses_async(self, text: str, previous: list = None,
+                                    max_batch_tokens: int = CLAUSE_BATCH_TOKENS,
+                                    max_concurrency: int = DEFAULT_CHUNK_CONCURRENCY) -> dict:
+        """
+        Structured mode: segments the document into clauses and returns each clause's risks as
+        {"severity", "title", "explanation"}. Results are cached per clause fingerprint, so only
+        new or changed clauses go to the model (packed into calls of `max_batch_tokens`); cost
+        scales with the size of the change, not the document.
+
+        `previous` is the clause list of an earlier version (load_clause_report() or
+        segment_clauses(...) entries); each clause then gets a status and removed clauses are listed.
+        A failing batch marks its clauses with an error instead of failing the report.
+        """
+        clauses = segment_clauses(text)
+        found = {}
+        for clause in clauses:
+            if clause.fingerprint not in found:
+                cached = await self.cache.get_async(self._clause_key(clause.fingerprint))
+                if cached is not None:
+                    found[clause.fingerprint] = json.loads(cached)
+        from_cache = set(found)
+
+        # Identical clauses (repeated boilerplate) are sent once
+        to_send = list({c.fingerprint: c for c in clauses if c.fingerprint not in found}.values())
+        batches = batch_clauses(to_send, max_batch_tokens)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        results = await asyncio.gather(*[self._analyze_clause_batch(batch, semaphore) for batch in batches],
+                                       return_exceptions=True)
+        errors = {}
+        for batch, result in zip(batches, results):
+            if isinstance(result, BaseException):
+                errors.update((clause.fingerprint, str(result)) for clause in batch)
+            else:
+                found.update(result)
+        if batches and all(isinstance(r, BaseException) for r in results):
+            if isinstance(results[0], ModelError):
+                raise results[0]
+
+        statuses, removed = diff_clauses(previous, clauses) if previous is not None else (None, None)
+        entries = []
+        for clause in clauses:
+            entry = {"index": clause.index, "label": clause.label, "fingerprint": clause.fingerprint,
+                     "cached": clause.fingerprint in from_cache, "risks": found.get(clause.fingerprint, [])}
+            if statuses:
+                entry["status"] = statuses[clause.index]
+            if clause.fingerprint in errors:
+                entry["error"] = errors[clause.fingerprint]
+            entries.append(entry)
+        if removed is not None:
+            removed = [{**r, "risks": json.loads(await self.cache.get_async(self._clause_key(r["fingerprint"])) or "[]")}
+                       for r in removed]
+
+        clause_report_id = report_id(clauses)
+        await self.cache.set_async(self._report_key(clause_report_id), json.dumps([c.entry() for c in clauses]))
+        risks = [risk for entry in entries for risk in entry["risks"]]
+        result = {
+            "report_id": clause_report_id,
+            "clauses": entries,
+            "removed": removed,
+            "summary": {
+                "clauses": len(clauses),
+                "analyzed": len(to_send) - len(errors),
+                "cached": sum(1 for c in clauses if c.fingerprint in from_cache),
+                "failed": len(errors),
+                "model_calls": len(batches),
+                "tokens_sent": sum(estimate_tokens("".join(self._build_clause_content(b))) for b in batches),
+                **{severity.lower(): sum(1 for r in risks if r["severity"] == severity) for severity in SEVERITY_ORDER},
+            },
+        }
+        result["report"] = render_clause_report(result)
+        return result
+
+    async def analyze_document_stream(self, text_content: str = None, image_data: bytes = None, mime_type: str = None):
+        """
+        Streams the analysis as partial text chunks (used by the SSE endpoints).
+        Blocked prompts and model errors are raised to the caller instead of returned as strings.
+        """
+        key = self._cache_key(text_content, image_data, mime_type)
+        cached = await self.cache.get_async(key)
+        if cached is not None:
+            yield cached
+            return
+
+        content = self._build_content(text_content, image_data, mime_type)
+        parts = []
+        async for text in self.router.generate_stream("analyze", content, self.client):
+            parts.append(text)
+            yield text
+        await self.cache.set_async(key, "".join(parts))
+
 # Example Usage
 if __name__ == "__main__":
     detector = RiskDetector()
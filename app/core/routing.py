@@ -0,0 +1,384 @@
+import os
+import json
+import math
+import hashlib
+import time
+import asyncio
+import threading
+import collections
+from app.core import metrics
+from app.core.chunking import estimate_tokens, CHARS_PER_TOKEN
+from app.core.model_client import (get_model_client, current_deadline, deadline_after, ModelError, RateLimited,
+                                   ModelUnavailable, DeadlineExceeded, BlockedPromptError)
+
+# Routing policy: inline JSON or the path of a JSON file, or "tiered" for TIERED_POLICY
+# (unset or "single" = every engine uses only its own model)
+ROUTING_POLICY = os.getenv("EQUALIZER_ROUTING_POLICY")
+
+# Placeholder in a tier for the model the calling engine was created with
+DEFAULT_MODEL = "$default"
+
+# Failures another model may not have: overload, a block, a timeout
+FALLBACK_ERRORS = (RateLimited, ModelUnavailable, DeadlineExceeded, BlockedPromptError)
+
+SINGLE_MODEL_POLICY = {
+    "tiers": {"default": [DEFAULT_MODEL]},
+    "routes": [{"name": "default", "tier": "default"}],
+}
+
+# Opt-in (EQUALIZER_ROUTING_POLICY=tiered): short text-only translations and live Guardian Mode
+# advice go to a cheaper, faster model; everything else to the engine's own model. Each tier
+# falls back to another model.
+TIERED_POLICY = {
+    "tiers": {
+        "fast": ["gemini-2.5-flash-lite", DEFAULT_MODEL],
+        "standard": [DEFAULT_MODEL, "gemini-2.5-flash"],
+    },
+    "routes": [
+        {"name": "short-text", "operations": ["translate", "guardian"], "max_tokens": 2000, "image": False,
+         "tier": "fast"},
+        {"name": "default", "tier": "standard"},
+    ],
+    "prices": {"gemini-2.5-flash-lite": [0.1, 0.4], "gemini-2.5-flash": [0.3, 2.5],
+               "gemini-3-flash-preview": [0.5, 3.0]},
+}
+
+
+class RoutingPolicy:
+    """
+    Which models serve which calls.
+
+    `tiers` maps a tier name to its candidate models, preferred first; the others are the
+    fallbacks. `routes` are tried in order and the first match picks the tier; a route matches
+    on `operations` (analyze, analyze_chunk, analyze_clause, simplify, translate, guardian,
+    generate, generate_narrative), `min_tokens`/`max_tokens` (estimated prompt size) and `image`
+    (true/false). Optional per route: `max_latency`, the p90 in seconds above which a model
+    is moved behind the others, and `attempt_timeout`, the seconds a model gets before the
+    call falls back (the request deadline still bounds the whole call). `prices` maps a model
+    to [input, output] USD per million tokens, for the cost estimate in the stats.
+    """
+    def __init__(self, tiers: dict, routes: list, prices: dict = None, cooldown: float = 30.0,
+                 latency_window: float = 300.0, min_samples: int = 10):
+        for route in routes:
+            if route.get("tier") not in tiers:
+                raise ValueError(f"Route {route.get('name')!r} uses unknown tier {route.get('tier')!r}")
+        # Calls no route matches go to the engine's own model
+        if not routes or any(key in routes[-1] for key in ("operations", "min_tokens", "max_tokens", "image")):
+            routes = list(routes) + SINGLE_MODEL_POLICY["routes"]
+            tiers = {"default": [DEFAULT_MODEL], **tiers}
+        self.tiers = tiers
+        self.routes = routes
+        # Which models answer which calls; part of every cache key (see ModelRouter.cache_scope)
+        self.single_model = all(models == [DEFAULT_MODEL] for models in tiers.values())
+        self.fingerprint = hashlib.sha256(json.dumps({"tiers": tiers, "routes": routes}, sort_keys=True)
+                                          .encode("utf-8")).hexdigest()[:12]
+        self.prices = prices or {}
+        # Seconds a model stays behind the others after a 429/503 (Retry-After if longer)
+        self.cooldown = cooldown
+        # Only latencies observed this recently count, so a demoted model gets tried again
+        self.latency_window = latency_window
+        self.min_samples = min_samples
+
+    @classmethod
+    def from_dict(cls, config: dict) -> "RoutingPolicy":
+        return cls(config.get("tiers", {}), config.get("routes", []), config.get("prices"),
+                   cooldown=float(config.get("cooldown", 30.0)),
+                   latency_window=float(config.get("latency_window", 300.0)),
+                   min_samples=int(config.get("min_samples", 10)))
+
+    @classmethod
+    def load(cls, spec: str = None) -> "RoutingPolicy":
+        """
+        Reads a policy from inline JSON or a JSON file; the single-model policy if `spec` is
+        empty or "single", TIERED_POLICY if it is "tiered".
+        """
+        if not spec or spec.strip() == "single":
+            return cls.from_dict(SINGLE_MODEL_POLICY)
+        if spec.strip() == "tiered":
+            return cls.from_dict(TIERED_POLICY)
+        if not spec.lstrip().startswith("{"):
+            with open(spec, encoding="utf-8") as f:
+                spec = f.read()
+        return cls.from_dict(json.loads(spec))
+
+    def match(self, operation: str, tokens: int, image: bool) -> dict:
+        for route in self.routes:
+            if route.get("operations") and operation not in route["operations"]:
+                continue
+            if "min_tokens" in route and tokens < route["min_tokens"]:
+                continue
+            if "max_tokens" in route and tokens > route["max_tokens"]:
+                continue
+            if "image" in route and bool(route["image"]) != image:
+                continue
+            return route
+        return self.routes[-1]
+
+    def cost(self, model_name: str, input_tokens: int, output_tokens: int) -> float:
+        price = self.prices.get(model_name)
+        if not price:
+            return 0.0
+        return (input_tokens * price[0] + output_tokens * price[1]) / 1_000_000
+
+    def describe(self) -> dict:
+        return {"tiers": self.tiers, "routes": self.routes, "prices": self.prices, "cooldown": self.cooldown}
+
+
+class Route:
+    """
+    The decision for one call: the matched route and its models in the order they will be tried.
+    """
+    def __init__(self, name: str, operation: str, models: list, tokens: int, attempt_timeout: float = None):
+        self.name = name
+        self.operation = operation
+        self.models = models
+        self.tokens = tokens
+        self.attempt_timeout = attempt_timeout
+
+
+def _size(content) -> tuple:
+    # (estimated prompt tokens, has an image part)
+    parts = content if isinstance(content, (list, tuple)) else [content]
+    text = sum(estimate_tokens(part) for part in parts if isinstance(part, str))
+    return text, any(isinstance(part, dict) for part in parts)
+
+
+def _usage(response) -> tuple:
+    # (input, output) tokens as reported by the API; the input falls back to the route's
+    # estimate (None) and the output to an estimate from the answer
+    usage = getattr(response, "usage_metadata", None)
+    input_tokens = getattr(usage, "prompt_token_count", None) if usage else None
+    output_tokens = getattr(usage, "candidates_token_count", None) if usage else None
+    if output_tokens is None:
+        try:
+            output_tokens = estimate_tokens(response.text or "")
+        except (AttributeError, ValueError):
+            output_tokens = 0
+    return input_tokens, output_tokens
+
+
+def _blocked(response) -> bool:
+    feedback = getattr(response, "prompt_feedback", None)
+    return bool(feedback and feedback.block_reason)
+
+
+class ModelRouter:
+    """
+    Routes the engines' model calls.
+
+    Each call is matched to a route by operation, estimated prompt size and modality; the
+    route's tier lists candidate models. Models that recently answered 429/503 or whose recent
+    p90 latency is over the route's `max_latency` are moved to the back. If a model is
+    overloaded, blocks the prompt or runs out of its `attempt_timeout`, the call falls back
+    to the next one. The shared client of each model still applies its own retries, hedging
+    and limits, so a fallback only happens once those are spent.
+
+    Calls bound to a cached context (`model=`) are not routed: the context lives on one model.
+    """
+    def __init__(self, policy: RoutingPolicy = None):
+        self.policy = policy or RoutingPolicy.load()
+        self._latency = collections.defaultdict(lambda: collections.deque(maxlen=256))
+        self._cooling = {}  # model name -> monotonic time until which it is demoted
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    # --- Decisions ---
+    def _p90(self, model_name: str):
+        horizon = time.monotonic() - self.policy.latency_window
+        samples = sorted(s for t, s in self._latency[model_name] if t >= horizon)
+        if len(samples) < self.policy.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.9))]
+
+    def _healthy(self, model_name: str, max_latency: float = None) -> bool:
+        if self._cooling.get(model_name, 0) > time.monotonic():
+            return False
+        if max_latency:
+            p90 = self._p90(model_name)
+            if p90 is not None and p90 > max_latency:
+                return False
+        return True
+
+    def route(self, operation: str, default_model: str, content) -> Route:
+        tokens, image = _size(content)
+        rule = self.policy.match(operation, tokens, image)
+        models = []
+        for name in self.policy.tiers[rule["tier"]]:
+            name = default_model if name == DEFAULT_MODEL else name
+            if name not in models:
+                models.append(name)
+        # Stable: healthy models first, in the order the tier lists them
+        models.sort(key=lambda name: not self._healthy(name, rule.get("max_latency")))
+        return Route(rule.get("name", rule["tier"]), operation, models, tokens, rule.get("attempt_timeout"))
+
+    def cache_scope(self, default_model: str) -> str:
+        """
+        The model part of the cache keys of an engine created with `default_model`. Under a
+        policy that routes calls to other models it also names the policy, so answers are keyed
+        on the route that produced them (the route follows from the operation and the input,
+        which are in the key too) and a policy change does not serve answers from the old routes.
+        """
+        if self.policy.single_model:
+            return default_model
+        return f"{default_model}@{self.policy.fingerprint}"
+
+    # --- Bookkeeping ---
+    def _entry(self, route: Route, model_name: str) -> dict:
+        totals = self._stats.setdefault(route.name, {"calls": 0, "fallbacks": 0, "failures": 0, "models": {}})
+        return totals, totals["models"].setdefault(model_name, {
+            "calls": 0, "ok": 0, "errors": collections.Counter(), "latency": collections.deque(maxlen=512),
+            "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+
+    def _succeeded(self, route: Route, model_name: str, elapsed: float, position: int,
+                   input_tokens: int = None, output_tokens: int = 0):
+        input_tokens = route.tokens if input_tokens is None else input_tokens
+        cost = self.policy.cost(model_name, input_tokens, output_tokens)
+        with self._lock:
+            self._latency[model_name].append((time.monotonic(), elapsed))
+            totals, entry = self._entry(route, model_name)
+            totals["calls"] += 1
+            totals["fallbacks"] += position > 0
+            entry["calls"] += 1
+            entry["ok"] += 1
+            entry["latency"].append(elapsed)
+            entry["input_tokens"] += input_tokens
+            entry["output_tokens"] += output_tokens
+            entry["cost_usd"] += cost
+        metrics.route_calls.inc(route=route.name, model=model_name, outcome="ok")
+        metrics.route_latency.observe(elapsed, route=route.name, model=model_name)
+        if cost:
+            metrics.route_cost.inc(cost, route=route.name, model=model_name)
+
+    def _fall_back(self, route: Route, model_name: str, error: ModelError, last: bool, elapsed: float) -> bool:
+        """
+        Records a failed attempt; True if the call should move on to the next model.
+        """
+        fall_back = not last and isinstance(error, FALLBACK_ERRORS)
+        if fall_back and error.kind != BlockedPromptError.kind:
+            # Once the request's own deadline is gone, another model cannot help
+            deadline = current_deadline()
+            fall_back = deadline is None or deadline > time.monotonic()
+        with self._lock:
+            totals, entry = self._entry(route, model_name)
+            entry["calls"] += 1
+            entry["errors"][error.kind] += 1
+            if not fall_back:
+                totals["calls"] += 1
+                totals["failures"] += 1
+            if isinstance(error, DeadlineExceeded):
+                # A lower bound, but enough to keep a model that times out behind the others
+                self._latency[model_name].append((time.monotonic(), elapsed))
+            if isinstance(error, (RateLimited, ModelUnavailable)):
+                cooldown = max(self.policy.cooldown, error.retry_after or 0.0)
+                self._cooling[model_name] = time.monotonic() + cooldown
+        metrics.route_calls.inc(route=route.name, model=model_name, outcome=error.kind)
+        if fall_back:
+            metrics.route_fallbacks.inc(route=route.name, model=model_name, reason=error.kind)
+        return fall_back
+
+    def _candidates(self, route: Route, client):
+        for position, name in enumerate(route.models):
+            last = position == len(route.models) - 1
+            yield position, last, name, client if name == client.model_name else get_model_client(name)
+
+    # --- Calls ---
+    async def generate(self, operation: str, content, client, model=None, **kwargs):
+        """
+        Like client.generate(content, **kwargs), on the model(s) the policy picks for this
+        call. `client` is the engine's own shared client (the policy's "$default").
+        A blocked answer from the last model is returned as it is, for the caller to report.
+        """
+        if model is not None:
+            return await client.generate(content, model=model, **kwargs)
+        route = self.route(operation, client.model_name, content)
+        for position, last, name, candidate in self._candidates(route, client):
+            start = time.monotonic()
+            try:
+                with deadline_after(None if last else route.attempt_timeout):
+                    response = await candidate.generate(content, **kwargs)
+            except ModelError as e:
+                if self._fall_back(route, name, e, last, time.monotonic() - start):
+                    continue
+                raise
+            if _blocked(response):
+                blocked = BlockedPromptError(response.prompt_feedback.block_reason)
+                if self._fall_back(route, name, blocked, last, time.monotonic() - start):
+                    continue
+                return response
+            self._succeeded(route, name, time.monotonic() - start, position, *_usage(response))
+            return response
+
+    async def generate_stream(self, operation: str, content, client, **kwargs):
+        """
+        Like client.generate_stream(content, **kwargs) with fallback. A stream can only fall
+        back before its first chunk; `attempt_timeout` bounds the wait for that chunk.
+        """
+        route = self.route(operation, client.model_name, content)
+        for position, last, name, candidate in self._candidates(route, client):
+            start = time.monotonic()
+            stream = candidate.generate_stream(content, **kwargs)
+            try:
+                timeout = None if last else route.attempt_timeout
+                try:
+                    first = await asyncio.wait_for(stream.__anext__(), timeout) if timeout else await stream.__anext__()
+                except StopAsyncIteration:
+                    first = None
+                except asyncio.TimeoutError:
+                    error = DeadlineExceeded(f"No answer from {name} within {timeout}s")
+                    if self._fall_back(route, name, error, last, time.monotonic() - start):
+                        continue
+                    raise error
+                except ModelError as e:
+                    if self._fall_back(route, name, e, last, time.monotonic() - start):
+                        continue
+                    raise
+                chars = 0
+                if first is not None:
+                    chars += len(first)
+                    yield first
+                    try:
+                        async for text in stream:
+                            chars += len(text)
+                            yield text
+                    except ModelError as e:
+                        self._fall_back(route, name, e, True, time.monotonic() - start)
+                        raise
+            finally:
+                await stream.aclose()
+            self._succeeded(route, name, time.monotonic() - start, position, None, math.ceil(chars / CHARS_PER_TOKEN))
+            return
+
+    # --- Stats ---
+    def stats(self) -> dict:
+        """
+        Per route and model: calls, errors, latency percentiles, tokens and estimated cost.
+        """
+        def percentile(ordered: list, p: float):
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 4) if ordered else None
+
+        now = time.monotonic()
+        with self._lock:
+            routes = {}
+            for route_name, route in self._stats.items():
+                models = {}
+                for name, entry in route["models"].items():
+                    ordered = sorted(entry["latency"])
+                    models[name] = {
+                        "calls": entry["calls"],
+                        "ok": entry["ok"],
+                        "errors": dict(entry["errors"]),
+                        "latency_p50": percentile(ordered, 0.5),
+                        "latency_p90": percentile(ordered, 0.9),
+                        "input_tokens": entry["input_tokens"],
+                        "output_tokens": entry["output_tokens"],
+                        "cost_usd": round(entry["cost_usd"], 6),
+                        "cost_per_call_usd": round(entry["cost_usd"] / entry["ok"], 6) if entry["ok"] else None,
+                    }
+                routes[route_name] = {"calls": route["calls"], "fallbacks": route["fallbacks"],
+                                      "failures": route["failures"], "models": models}
+            cooling = {name: round(until - now, 1) for name, until in self._cooling.items() if until > now}
+        return {"routes": routes, "cooling_down": cooling, "policy": self.policy.describe()}
+
+
+# Shared by every engine in the worker. Set EQUALIZER_ROUTING_POLICY to change the tiers.
+model_router = ModelRouter(RoutingPolicy.load(ROUTING_POLICY))
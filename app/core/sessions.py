@@ -0,0 +1,257 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from app.core.cache import SingleFlight
+from app.core.chunking import estimate_tokens
+from app.core.settings import get_genai
+
+logger = logging.getLogger(__name__)
+
+# Idle time after which an uploaded document is forgotten (each use extends it)
+SESSION_TTL = float(os.getenv("EQUALIZER_SESSION_TTL", "3600"))
+# Memory budget for all sessions of a worker; least recently used documents are evicted first
+SESSION_MAX_BYTES = int(float(os.getenv("EQUALIZER_SESSION_MAX_MB", "256")) * 1024 * 1024)
+# Documents at least this long get a model-side context cache (Gemini has a minimum size
+# for cached content). 0 disables context caching.
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("EQUALIZER_CONTEXT_CACHE_MIN_TOKENS", "32768"))
+
+# Replaces the document text in prompts that run against a cached context
+IN_CONTEXT = "Document: the document provided earlier in this conversation."
+
+
+@dataclass
+class DocumentSession:
+    """
+    An uploaded document kept for follow-up requests: extracted page texts and the first
+    embedded image (or the uploaded image itself).
+    """
+    id: str
+    filename: str
+    pages: list
+    image: dict = None  # {"data", "mime_type"}
+    created: float = 0.0
+    expires_at: float = 0.0
+    # model name -> ContextEntry, or None when creating the cached context failed
+    contexts: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.text = "\n\n".join(self.pages)
+        self.tokens = estimate_tokens(self.text)
+        self.nbytes = len(self.text.encode("utf-8")) + (len(self.image["data"]) if self.image else 0)
+
+    def payload(self) -> dict:
+        # Keyword arguments for the core classes' single-call methods
+        return {
+            "text_content": self.text or None,
+            "image_data": self.image["data"] if self.image else None,
+            "mime_type": self.image["mime_type"] if self.image else None,
+        }
+
+    def describe(self) -> dict:
+        return {
+            "doc_id": self.id,
+            "filename": self.filename,
+            "pages": len(self.pages),
+            "tokens": self.tokens,
+            "bytes": self.nbytes,
+            "has_image": self.image is not None,
+            "expires_in": max(0, round(self.expires_at - time.time())),
+            "context_cached": sorted(name for name, entry in self.contexts.items() if entry is not None),
+        }
+
+
+class SessionStore:
+    """
+    In-process store of document sessions with a sliding TTL and a memory budget (LRU eviction).
+    `on_evict(session)` is called for every session that is evicted, expires or is deleted.
+    """
+    def __init__(self, max_bytes: int = SESSION_MAX_BYTES, ttl: float = SESSION_TTL, on_evict=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.evictions = 0
+
+    def _remove(self, doc_id: str) -> DocumentSession:
+        session = self._sessions.pop(doc_id)
+        self.bytes -= session.nbytes
+        return session
+
+    def _released(self, sessions: list):
+        # Called outside the lock: releasing a context cache may do I/O
+        if self.on_evict:
+            for session in sessions:
+                self.on_evict(session)
+
+    def create(self, pages: list, image: dict = None, filename: str = "") -> DocumentSession:
+        now = time.time()
+        session = DocumentSession(uuid.uuid4().hex, filename, pages, image, now, now + self.ttl)
+        if session.nbytes > self.max_bytes:
+            raise ValueError(f"Document is larger than the session store ({self.max_bytes / (1024 * 1024):g} MB)")
+        evicted = []
+        with self._lock:
+            for doc_id in [d for d, s in self._sessions.items() if s.expires_at <= now]:
+                evicted.append(self._remove(doc_id))
+            while self.bytes + session.nbytes > self.max_bytes:
+                evicted.append(self._remove(next(iter(self._sessions))))
+                self.evictions += 1
+            self._sessions[session.id] = session
+            self.bytes += session.nbytes
+        self._released(evicted)
+        return session
+
+    def get(self, doc_id: str):
+        """
+        Returns the session and extends its TTL, or None if it is unknown or expired.
+        """
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(doc_id)
+            if session is None:
+                return None
+            if session.expires_at <= now:
+                self._remove(doc_id)
+                expired = session
+            else:
+                session.expires_at = now + self.ttl
+                self._sessions.move_to_end(doc_id)
+                return session
+        self._released([expired])
+        return None
+
+    def delete(self, doc_id: str) -> bool:
+        with self._lock:
+            session = self._remove(doc_id) if doc_id in self._sessions else None
+        if session is None:
+            return False
+        self._released([session])
+        return True
+
+    def clear(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            self.bytes = 0
+        self._released(sessions)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sessions": len(self._sessions), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "evictions": self.evictions}
+
+
+# --- Model-side context caching ---
+@dataclass
+class ContextEntry:
+    handle: object  # backend handle (a genai CachedContent)
+    model: object  # model bound to the cached context
+    expires_at: float
+
+
+class GeminiContextBackend:
+    """
+    Gemini cached content (google.generativeai.caching). Creating the cache pays for the
+    document's input tokens once; calls through the bound model only send the instruction.
+    """
+    def create(self, model_name: str, contents: list, ttl: float):
+        genai = get_genai()
+        name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        return genai.caching.CachedContent.create(model=name, contents=contents,
+                                                  ttl=datetime.timedelta(seconds=ttl))
+
+    def model(self, handle):
+        return get_genai().GenerativeModel.from_cached_content(cached_content=handle)
+
+    def delete(self, handle):
+        handle.delete()
+
+
+class ContextCache:
+    """
+    Creates one cached context per (session, model) for long documents, on first use, and
+    deletes it when the session goes away. The remote cache lives a little longer than the
+    session's idle TTL and is recreated if it would expire while still in use.
+    Failures are not fatal: model_for() returns None and callers send the text inline.
+    """
+    def __init__(self, backend=None, min_tokens: int = CONTEXT_CACHE_MIN_TOKENS, ttl: float = SESSION_TTL):
+        self.backend = backend or GeminiContextBackend()
+        self.min_tokens = min_tokens
+        self.ttl = ttl
+        self.flights = SingleFlight()
+        self.created = 0
+        self.reused = 0
+        self.failed = 0
+
+    def wants(self, session: DocumentSession) -> bool:
+        return self.min_tokens > 0 and session.tokens >= self.min_tokens
+
+    @staticmethod
+    def _contents(session: DocumentSession) -> list:
+        parts = [f"Document Text:\n{session.text}"] if session.text else []
+        if session.image:
+            parts.append({"mime_type": session.image["mime_type"], "data": session.image["data"]})
+        return [{"role": "user", "parts": parts}]
+
+    async def model_for(self, session: DocumentSession, model_name: str):
+        """
+        Model bound to the session's cached context for `model_name`, or None to send the text inline.
+        """
+        if not self.wants(session):
+            return None
+        entry = session.contexts.get(model_name, False)
+        if entry is None:
+            return None
+        # Leave a margin so a call never starts against a context that is about to expire
+        if entry and entry.expires_at - 60 > time.time():
+            self.reused += 1
+            return entry.model
+        entry = await self.flights.do(f"{session.id}:{model_name}", lambda: self._create(session, model_name))
+        return entry.model if entry else None
+
+    async def _create(self, session: DocumentSession, model_name: str):
+        ttl = self.ttl + 300
+        try:
+            handle = await asyncio.to_thread(self.backend.create, model_name, self._contents(session), ttl)
+            entry = ContextEntry(handle, self.backend.model(handle), time.time() + ttl)
+            self.created += 1
+        except Exception as e:
+            logger.warning("Context cache for %s (%s) failed, sending text inline: %s", session.id, model_name, e)
+            entry = None
+            self.failed += 1
+        previous = session.contexts.get(model_name)
+        session.contexts[model_name] = entry
+        if previous:
+            self._delete([previous.handle])
+        return entry
+
+    def _delete(self, handles: list):
+        def delete_all():
+            for handle in handles:
+                try:
+                    self.backend.delete(handle)
+                except Exception:
+                    pass  # expires on its own
+        # Deleting is a network call; keep it off the request path
+        threading.Thread(target=delete_all, daemon=True).start()
+
+    def release(self, session: DocumentSession):
+        handles = [entry.handle for entry in session.contexts.values() if entry]
+        session.contexts.clear()
+        if handles:
+            self._delete(handles)
+
+    def stats(self) -> dict:
+        return {"created": self.created, "reused": self.reused, "failed": self.failed,
+                "min_tokens": self.min_tokens}
+
+
+context_cache = ContextCache()
+session_store = SessionStore(on_evict=context_cache.release)
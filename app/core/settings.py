@@ -0,0 +1,49 @@
+import os
+import importlib
+import threading
+from dotenv import load_dotenv
+
+# Read .env once, before any module reads its EQUALIZER_* settings
+load_dotenv()
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Create the Gemini models during startup instead of on the first request (1 = warm the worker first)
+PRELOAD_MODELS = os.getenv("EQUALIZER_PRELOAD_MODELS", "0") == "1"
+# "module:function" called with a model name instead of creating a Gemini model, e.g.
+# app.core.fakes:load_test_model to load-test a server offline
+MODEL_FACTORY = os.getenv("EQUALIZER_MODEL_FACTORY")
+
+_genai = None
+_lock = threading.Lock()
+
+
+def get_genai():
+    """
+    Imports and configures the Gemini SDK on first use. The import alone is most of the
+    app's cold start, so workers that only serve cached or local endpoints never pay for it.
+    """
+    global _genai
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                import google.generativeai as genai
+                if GOOGLE_API_KEY:
+                    genai.configure(api_key=GOOGLE_API_KEY)
+                else:
+                    print("Warning: GOOGLE_API_KEY not found in environment variables.")
+                _genai = genai
+    return _genai
+
+
+def load_factory(spec: str):
+    """
+    The callable named by a "module:function" setting.
+    """
+    module, _, factory = spec.partition(":")
+    return getattr(importlib.import_module(module), factory)
+
+
+def create_model(model_name: str):
+    if MODEL_FACTORY:
+        return load_factory(MODEL_FACTORY)(model_name)
+    return get_genai().GenerativeModel(model_name)
@@ -1,22 +1,31 @@
-import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+import asyncio
+from app.core.model_client import get_model_client, ModelError, response_text
+from app.core.cache import response_cache, make_cache_key
+from app.core.routing import model_router
+from app.core.chunking import iter_chunks, DEFAULT_CHUNK_TOKENS, DEFAULT_CHUNK_CONCURRENCY
+from app.core.sessions import IN_CONTEXT
 
-load_dotenv()
+class DocumentSimplifier:
+    # Bump whenever the instruction below changes so cached answers are invalidated
+    PROMPT_VERSION = "simplify-v1"
 
-# Configure Gemini (Ensure this is handled centrally in a real app, but fine here for modularity)
-api_key = os.getenv("GOOGLE_API_KEY")
-if api_key:
-    genai.configure(api_key=api_key)
+    def __init__(self, model_name="gemini-3-flash-preview", cache=response_cache, router=model_router):
+        self.model_name = model_name
+        self.cache = cache
+        self.router = router
+        self.client = get_model_client(model_name)
+        self._model = None
 
-class DocumentSimplifier:
-    def __init__(self, model_name="gemini-3-flash-preview"):
-        self.model = genai.GenerativeModel(model_name)
+    @property
+    def model(self):
+        # Shared, lazily created model unless one was set on this instance
+        return self._model if self._model is not None else self.client.model
 
-    def simplify_text(self, text_content: str = None, image_data: bytes = None, mime_type: str = None) -> str:
-        """
-        Simplifies complex legal jargon into plain language from text or images.
-        """
+    @model.setter
+    def model(self, model):
+        self._model = model
+
+    def _build_content(self, text_content: str = None, image_data: bytes = None, mime_type: str = None) -> list:
         instruction = """
         You are 'The Equalizer', a helpful interpreter.
         Rewrite the following text from the document (provided as text or image) so that a 5th grader can understand it.
@@ -37,17 +46,113 @@ class DocumentSimplifier:
                 "mime_type": mime_type,
                 "data": image_data
             })
+        return content
+
+    def _cache_key(self, text_content: str = None, image_data: bytes = None, mime_type: str = None) -> str:
+        return make_cache_key("simplify", self.router.cache_scope(self.model_name), self.PROMPT_VERSION,
+                              text=text_content, image_data=image_data, mime_type=mime_type)
 
+    def _handle_response(self, response) -> str:
+        # Blocked prompts and safety-stopped answers raise BlockedPromptError (422), not an error string
+        return response_text(response)
+
+    def simplify_text(self, text_content: str = None, image_data: bytes = None, mime_type: str = None) -> str:
+        """
+        Simplifies complex legal jargon into plain language from text or images.
+        """
+        key = self._cache_key(text_content, image_data, mime_type)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        content = self._build_content(text_content, image_data, mime_type)
         try:
             response = self.model.generate_content(content)
-             # Handle blocked content
-            if hasattr(response, 'prompt_feedback') and response.prompt_feedback and response.prompt_feedback.block_reason:
-                 return f"Error: Simplification blocked due to: {response.prompt_feedback.block_reason}"
-
-            return response.text
+            result = self._handle_response(response)
+            self.cache.set(key, result)
+            return result
         except Exception as e:
             return f"Error during simplification: {str(e)}"
 
+    async def simplify_text_async(self, text_content: str = None, image_data: bytes = None, mime_type: str = None,
+                                  context=None) -> str:
+        """
+        Async version of simplify_text, runs on the shared model client without blocking the event loop.
+        Model failures (after retries) raise ModelError instead of returning an error string.
+        Identical concurrent requests share one model call.
+        `context`: model bound to a cached context holding this document (see RiskDetector).
+        """
+        async def generate():
+            if context is not None:
+                content = self._build_content() + [IN_CONTEXT]
+            else:
+                content = self._build_content(text_content, image_data, mime_type)
+            response = await self.router.generate("simplify", content, self.client, model=context)
+            return self._handle_response(response)
+
+        return await self.cache.get_or_generate(self._cache_key(text_content, image_data, mime_type), generate)
+
+    async def simplify_long_document_async(self, pages, max_chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+                                           max_concurrency: int = DEFAULT_CHUNK_CONCURRENCY) -> str:
+        """
+        Long-document mode: simplifies token-budgeted chunks concurrently and stitches them back in order.
+        `pages` may be a list or an async iterator of page texts; chunks start as soon as they fill up.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def simplify_chunk(chunk):
+            async with semaphore:
+                return await self.simplify_text_async(chunk.text)
+
+        chunks, tasks = [], []
+        try:
+            async for chunk in iter_chunks(pages, max_chunk_tokens):
+                chunks.append(chunk)
+                # Hold the first chunk until we know the document needs more than one call
+                if chunk.index == 1:
+                    tasks.append(asyncio.ensure_future(simplify_chunk(chunks[0])))
+                if chunk.index >= 1:
+                    tasks.append(asyncio.ensure_future(simplify_chunk(chunk)))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        if len(chunks) <= 1:
+            return await self.simplify_text_async(chunks[0].text if chunks else "")
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        if all(isinstance(r, BaseException) for r in results):
+            error = results[0]
+            if isinstance(error, ModelError):
+                raise error
+            raise ModelError(f"Simplification failed: {error}") from error
+
+        sections = []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                result = f"_({chunk.page_label} could not be simplified: {result})_"
+            sections.append(f"### {chunk.page_label.capitalize()}\n{result.strip()}")
+        return "\n\n".join(sections)
+
+    async def simplify_text_stream(self, text_content: str = None, image_data: bytes = None, mime_type: str = None):
+        """
+        Streams the simplified text as partial chunks (used by the SSE endpoints).
+        Blocked prompts and model errors are raised to the caller instead of returned as strings.
+        """
+        key = self._cache_key(text_content, image_data, mime_type)
+        cached = await self.cache.get_async(key)
+        if cached is not None:
+            yield cached
+            return
+
+        content = self._build_content(text_content, image_data, mime_type)
+        parts = []
+        async for text in self.router.generate_stream("simplify", content, self.client):
+            parts.append(text)
+            yield text
+        await self.cache.set_async(key, "".join(parts))
+
 # Example Usage
 if __name__ == "__main__":
     simplifier = DocumentSimplifier()
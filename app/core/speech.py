@@ -0,0 +1,163 @@
+import io
+import os
+import re
+import asyncio
+import collections
+from app.core.settings import load_factory
+from app.core.model_client import ModelError
+from app.core.cache import audio_cache, make_cache_key
+
+# "module:function" returning the text-to-speech backend (unset = gTTS, if it is installed).
+# Used by /voice/speak, and by /voice/ws when set (otherwise the browser speaks there).
+TTS_BACKEND = os.getenv("EQUALIZER_TTS_BACKEND")
+# Sentences of one text synthesized at the same time, ahead of the one being sent
+TTS_CONCURRENCY = int(os.getenv("EQUALIZER_TTS_CONCURRENCY", "4"))
+
+# Language names the UI offers -> gTTS language codes
+LANGUAGE_CODES = {
+    'English': 'en', 'Spanish': 'es', 'French': 'fr', 'Hindi': 'hi',
+    'Tamil': 'ta', 'Telugu': 'te', 'Kannada': 'kn', 'Malayalam': 'ml',
+    'Marathi': 'mr', 'Bengali': 'bn', 'Gujarati': 'gu', 'Punjabi': 'pa',
+    'Chinese': 'zh-CN', 'Arabic': 'ar',
+}
+
+
+class SpeechUnavailable(ModelError):
+    status_code = 503
+    kind = "tts_unavailable"
+
+
+# --- Sentences ---
+_SENTENCE_END = re.compile(r'(?<=[.!?。！？])\s+|(?<=[।])\s*')
+_CLAUSE_END = re.compile(r'(?<=[,;:])\s+')
+
+
+class SentenceBuffer:
+    """
+    Cuts streamed text into speakable pieces: whole sentences, or a clause once more than
+    `max_chars` are waiting, so speech can start before the reply is complete.
+    """
+    def __init__(self, max_chars: int = 160):
+        self.max_chars = max_chars
+        self.text = ""
+
+    def feed(self, text: str) -> list:
+        self.text += text
+        pieces = _SENTENCE_END.split(self.text)
+        self.text = pieces.pop()
+        if len(self.text) > self.max_chars:
+            clauses = _CLAUSE_END.split(self.text)
+            self.text = clauses.pop()
+            pieces.extend(clauses)
+        return [piece.strip() for piece in pieces if piece.strip()]
+
+    def flush(self) -> str:
+        text, self.text = self.text.strip(), ""
+        return text
+
+
+def split_sentences(text: str, max_chars: int = 160) -> list:
+    buffer = SentenceBuffer(max_chars)
+    sentences = buffer.feed(text)
+    rest = buffer.flush()
+    return sentences + [rest] if rest else sentences
+
+
+# --- Backends ---
+# A text-to-speech backend has `synthesize(text, language)`, an async generator yielding the
+# audio of one sentence in chunks, plus `name`, `voice` and `media_type` attributes (the
+# first two are part of the audio cache key).
+class GTTSBackend:
+    """
+    Google Translate's speech through gTTS (optional dependency: pip install gTTS). MP3;
+    `voice` is the accent's Google domain (com, co.uk, co.in, ...).
+    """
+    name = "gtts"
+    media_type = "audio/mpeg"
+
+    def __init__(self, voice: str = os.getenv("EQUALIZER_TTS_VOICE", "com")):
+        self.voice = voice
+
+    def _synthesize(self, text: str, language: str) -> bytes:
+        try:
+            from gtts import gTTS
+        except ImportError:
+            raise SpeechUnavailable("Text-to-speech is not available: install gTTS or set EQUALIZER_TTS_BACKEND")
+        buffer = io.BytesIO()
+        try:
+            gTTS(text=text, lang=LANGUAGE_CODES.get(language, 'en'), tld=self.voice).write_to_fp(buffer)
+        except Exception as e:
+            raise SpeechUnavailable(f"Text-to-speech failed: {e}") from e
+        return buffer.getvalue()
+
+    async def synthesize(self, text: str, language: str):
+        # gTTS is a blocking HTTP client
+        yield await asyncio.to_thread(self._synthesize, text, language)
+
+
+def create_tts_backend():
+    return load_factory(TTS_BACKEND)() if TTS_BACKEND else GTTSBackend()
+
+
+class SpeechSynthesizer:
+    """
+    Text-to-speech for whole texts on top of a backend. The text is split into sentences,
+    up to `concurrency` of them are synthesized at once, and their audio is streamed back
+    in order as soon as each is ready, so playback starts after the first sentence instead
+    of the whole text. Each sentence's audio is cached by (normalized text, language, voice):
+    canned advice is synthesized once.
+
+    It is a backend itself (`synthesize` speaks one sentence through the cache), so the
+    voice pipeline can use it too.
+    """
+    def __init__(self, backend=None, cache=audio_cache, concurrency: int = TTS_CONCURRENCY):
+        self.backend = backend if backend is not None else create_tts_backend()
+        self.cache = cache
+        self.concurrency = max(1, concurrency)
+
+    @property
+    def media_type(self) -> str:
+        return getattr(self.backend, "media_type", "application/octet-stream")
+
+    def _cache_key(self, sentence: str, language: str) -> str:
+        return make_cache_key("tts", getattr(self.backend, "name", type(self.backend).__name__), "",
+                              text=sentence, language=language, voice=getattr(self.backend, "voice", None))
+
+    async def sentence_audio(self, sentence: str, language: str) -> bytes:
+        async def generate():
+            return b"".join([bytes(chunk) async for chunk in self.backend.synthesize(sentence, language)])
+
+        return await self.cache.get_or_generate(self._cache_key(sentence, language), generate)
+
+    async def synthesize(self, text: str, language: str):
+        yield await self.sentence_audio(text, language)
+
+    async def stream(self, text: str, language: str):
+        """
+        Yields the audio of `text`, one sentence at a time, in order.
+        """
+        sentences = split_sentences(text)
+        pending = collections.deque()
+        try:
+            for sentence in sentences:
+                pending.append(asyncio.ensure_future(self.sentence_audio(sentence, language)))
+                if len(pending) >= self.concurrency:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+_synthesizer = None
+
+
+def get_speech_synthesizer() -> SpeechSynthesizer:
+    """
+    The shared synthesizer of the worker, created on first use.
+    """
+    global _synthesizer
+    if _synthesizer is None:
+        _synthesizer = SpeechSynthesizer()
+    return _synthesizer
@@ -0,0 +1,134 @@
+import os
+import re
+import time
+import datetime
+import threading
+from dataclasses import dataclass, field
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+
+PLACEHOLDER_RE = re.compile(r'\[([^\[\]\n]+)\]')
+# Placeholders that ask for prose rather than a value, e.g. "[Explanation]",
+# "[Describe what went wrong: ...]", "[mention photos or receipts if applicable]"
+NARRATIVE_RE = re.compile(r'^(?:explanation|explain|describe|description|provide|list|quote|mention|state|cite|specific)\b',
+                          re.IGNORECASE)
+# Filled locally when the user leaves them out
+AUTO_FIELDS = {"date": lambda: datetime.date.today().strftime("%B %d, %Y")}
+
+
+def normalize_key(key: str) -> str:
+    """
+    "Your Name", "your-name" and "YOUR NAME:" all map to "your name".
+    """
+    return " ".join(re.findall(r'[a-z0-9]+', key.lower()))
+
+
+def is_narrative(placeholder: str) -> bool:
+    return (bool(NARRATIVE_RE.match(placeholder)) or placeholder[:1].islower()
+            or bool(re.search(r'\b(?:explanation|description)\b', placeholder, re.IGNORECASE))
+            or ":" in placeholder or len(placeholder) > 40)
+
+
+@dataclass
+class Template:
+    name: str
+    path: str
+    content: str
+    mtime: float
+    placeholders: list = field(default_factory=list)  # unique, in order of appearance
+    # Pre-parsed once at load time
+    fields: list = field(init=False)
+    narratives: list = field(init=False)
+    required_fields: list = field(init=False)
+
+    def __post_init__(self):
+        self.fields = [p for p in self.placeholders if not is_narrative(p)]
+        self.narratives = [p for p in self.placeholders if is_narrative(p)]
+        self.required_fields = [p for p in self.fields if normalize_key(p) not in AUTO_FIELDS]
+
+    def resolve(self, case_details: dict) -> dict:
+        """
+        Maps each placeholder to a supplied value (matched on normalized keys), or auto-fills it.
+        """
+        supplied = {normalize_key(k): str(v) for k, v in case_details.items() if v not in (None, "")}
+        values = {}
+        for placeholder in self.placeholders:
+            key = normalize_key(placeholder)
+            if key in supplied:
+                values[placeholder] = supplied[key]
+            elif key in AUTO_FIELDS:
+                values[placeholder] = AUTO_FIELDS[key]()
+        return values
+
+    def missing(self, values: dict, include_narratives: bool = True) -> list:
+        wanted = self.placeholders if include_narratives else self.fields
+        return [p for p in wanted if p not in values]
+
+    def fill(self, values: dict) -> str:
+        """
+        Deterministic local fill; placeholders without a value are left as they are.
+        """
+        return PLACEHOLDER_RE.sub(lambda m: values.get(m.group(1), m.group(0)), self.content)
+
+    def describe(self) -> dict:
+        return {"name": self.name, "required_fields": self.required_fields,
+                "optional_fields": [p for p in self.fields if p not in self.required_fields],
+                "narrative_fields": self.narratives}
+
+
+def parse_placeholders(content: str) -> list:
+    return list(dict.fromkeys(PLACEHOLDER_RE.findall(content)))
+
+
+class TemplateRegistry:
+    """
+    Loads every template in app/templates once, pre-parsed, and reloads files that change.
+    The directory is re-scanned at most every `check_interval` seconds, so lookups are
+    normally a dict access.
+    """
+    def __init__(self, directory: str = TEMPLATES_DIR, check_interval: float = 2.0):
+        self.directory = os.path.abspath(directory)
+        self.check_interval = check_interval
+        self._templates = {}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        with self._lock:
+            found = {}
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if not entry.is_file() or not entry.name.endswith(".txt"):
+                        continue
+                    mtime = entry.stat().st_mtime
+                    current = self._templates.get(entry.name)
+                    if current and current.mtime == mtime:
+                        found[entry.name] = current
+                        continue
+                    with open(entry.path, "r") as f:
+                        content = f.read()
+                    found[entry.name] = Template(entry.name, entry.path, content, mtime, parse_placeholders(content))
+            self._templates = found
+            self._last_check = time.monotonic()
+
+    def _maybe_reload(self):
+        if time.monotonic() - self._last_check >= self.check_interval:
+            self.reload()
+
+    def get(self, name: str):
+        self._maybe_reload()
+        # basename() keeps lookups inside the templates directory
+        return self._templates.get(os.path.basename(name))
+
+    def get_by_path(self, path: str):
+        if os.path.dirname(os.path.abspath(path)) != self.directory:
+            return None
+        return self.get(path)
+
+    def list(self) -> list:
+        self._maybe_reload()
+        return sorted(self._templates.values(), key=lambda t: t.name)
+
+
+template_registry = TemplateRegistry()
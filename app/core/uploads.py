@@ -0,0 +1,142 @@
+import os
+import codecs
+import asyncio
+import tempfile
+from fastapi import HTTPException, UploadFile
+
+# Largest accepted upload; bigger requests are rejected with 413 before the body is read
+MAX_UPLOAD_BYTES = int(float(os.getenv("EQUALIZER_MAX_UPLOAD_MB", "25")) * 1024 * 1024)
+# Copy/decode granularity, i.e. roughly the per-request memory used while spooling
+SPOOL_CHUNK_BYTES = 1024 * 1024
+# Room for multipart boundaries and headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(HTTPException):
+    # An HTTPException so FastAPI's body parsing re-raises it as a 413 instead of a generic 400
+    def __init__(self, max_bytes: int = MAX_UPLOAD_BYTES):
+        super().__init__(status_code=413, detail=f"Upload too large (limit {max_bytes / (1024 * 1024):g} MB)")
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware that enforces the upload cap before FastAPI parses the multipart body.
+    Requests announcing a larger Content-Length get an immediate 413; chunked requests are
+    counted as they arrive and cut off once they pass the limit. `path_limits` maps path
+    prefixes to their own cap (batch endpoints take many files per request).
+    """
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES, path_limits: dict = None):
+        self.app = app
+        self.max_bytes = max_bytes + MULTIPART_OVERHEAD
+        self.path_limits = {prefix: limit + MULTIPART_OVERHEAD for prefix, limit in (path_limits or {}).items()}
+
+    def _limit(self, path: str) -> int:
+        for prefix, limit in self.path_limits.items():
+            if path.startswith(prefix):
+                return limit
+        return self.max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") not in ("POST", "PUT"):
+            return await self.app(scope, receive, send)
+
+        max_bytes = self._limit(scope.get("path", ""))
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+            return await self._reject(send, max_bytes)
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise UploadTooLarge(max_bytes - MULTIPART_OVERHEAD)
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except UploadTooLarge:
+            if not response_started:
+                await self._reject(send, max_bytes)
+
+    async def _reject(self, send, max_bytes: int):
+        limit_mb = (max_bytes - MULTIPART_OVERHEAD) / (1024 * 1024)
+        body = f'{{"detail":"Upload too large (limit {limit_mb:g} MB)"}}'.encode()
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+
+class SpooledUpload:
+    """
+    An upload copied to a private temp file in fixed-size chunks, so the request never
+    holds the whole file in memory. PDFs are opened straight from `path`.
+    """
+    def __init__(self, path: str, size: int, filename: str, content_type: str = None):
+        self.path = path
+        self.size = size
+        self.filename = filename
+        self.content_type = content_type
+
+    def read_bytes(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def read_text(self, encoding: str = "utf-8") -> str:
+        """
+        Decodes incrementally, chunk by chunk, so multi-byte characters split across
+        chunk boundaries are handled without loading the raw bytes first.
+        """
+        decoder = codecs.getincrementaldecoder(encoding)()
+        parts = []
+        with open(self.path, "rb") as f:
+            while True:
+                block = f.read(SPOOL_CHUNK_BYTES)
+                if not block:
+                    break
+                parts.append(decoder.decode(block))
+        parts.append(decoder.decode(b"", final=True))
+        return "".join(parts)
+
+    def close(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+async def spool_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> SpooledUpload:
+    """
+    Streams an UploadFile to disk, raising 413 as soon as it passes `max_bytes`.
+    """
+    fd, path = tempfile.mkstemp(prefix="equalizer-upload-")
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = await file.read(SPOOL_CHUNK_BYTES)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                await asyncio.to_thread(out.write, block)
+    except BaseException:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+    return SpooledUpload(path, size, file.filename, file.content_type)
@@ -0,0 +1,392 @@
+import os
+import re
+import json
+import math
+import time
+import zlib
+import threading
+from collections import Counter
+from app.core.settings import load_factory, get_genai
+from app.core.chunking import split_sections
+from app.core.templates import template_registry
+
+# "module:function" returning the embedder (unset = the local hashing embedder: no model, no network)
+EMBEDDING_BACKEND = os.getenv("EQUALIZER_EMBEDDING_BACKEND")
+EMBEDDING_DIM = int(os.getenv("EQUALIZER_EMBEDDING_DIM", "256"))
+# Directory holding the index on disk, memory-mapped at startup (unset = in memory, built at startup)
+VECTOR_INDEX_PATH = os.getenv("EQUALIZER_VECTOR_INDEX_PATH") or None
+# Directory of precedents (.txt / .md), indexed by section or paragraph (unset = templates only)
+PRECEDENTS_DIR = os.getenv("EQUALIZER_PRECEDENTS_DIR") or None
+# Precedent snippets added to /action/generate prompts, and how similar they must be to the case
+PRECEDENT_SNIPPETS = int(os.getenv("EQUALIZER_PRECEDENT_SNIPPETS", "3"))
+PRECEDENT_MIN_SCORE = float(os.getenv("EQUALIZER_PRECEDENT_MIN_SCORE", "0.2"))
+
+_WORD_RE = re.compile(r"[^\W\d_]{3,}")
+# Letter boilerplate every template shares, besides the usual function words
+STOPWORDS = frozenset("""
+    the and for are but not you your yours our ours this that these those with from into have has had was were
+    will shall would should could can may must been being its they them their there here which what when where
+    who whom whose why how all any each other such than then also only very about above after before below
+    between under over again further once per via upon within without dear sincerely regards name address
+    city state zip code date phone email signature
+""".split())
+
+
+# numpy is imported where the vectors are built and searched, not at import: the app (and
+# every script that imports it) only loads it once the index is first used.
+
+# --- Embedders ---
+# An embedder has `embed(texts)` returning a float32 array of shape (len(texts), dim) with
+# L2-normalized rows, plus `name` and `dim` (an index built by another embedder is rebuilt).
+class HashingEmbedder:
+    """
+    Local embedding stand-in: words and word pairs hashed into `dim` signed buckets, weighted
+    by log term frequency. No model and no network, and it costs microseconds per document;
+    similar wording gets similar vectors, which is enough to match a notice with its letter.
+    """
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    @staticmethod
+    def features(text: str) -> list:
+        words = []
+        for word in _WORD_RE.findall(text.lower()):
+            if word in STOPWORDS:
+                continue
+            # "fees" and "fee", "deposits" and "deposit"
+            words.append(word[:-1] if len(word) > 4 and word.endswith("s") and not word.endswith("ss") else word)
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: list) -> "np.ndarray":
+        import numpy as np
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in Counter(self.features(text)).items():
+                h = zlib.crc32(feature.encode("utf-8"))
+                vectors[row, h % self.dim] += (1.0 if h & 0x80000000 else -1.0) * (1.0 + math.log(count))
+        return _normalized(vectors)
+
+
+class GeminiEmbedder:
+    """
+    Gemini text embeddings (EQUALIZER_EMBEDDING_BACKEND=app.core.vector_index:GeminiEmbedder).
+    Better matches than the hashing embedder, but every query is a network call.
+    """
+    def __init__(self, model: str = os.getenv("EQUALIZER_EMBEDDING_MODEL", "models/text-embedding-004")):
+        self.model = model
+        self.name = model
+        self.dim = None  # known after the first call
+
+    def embed(self, texts: list) -> "np.ndarray":
+        import numpy as np
+        result = get_genai().embed_content(model=self.model, content=list(texts), task_type="retrieval_document")
+        vectors = np.asarray(result["embedding"], dtype=np.float32).reshape(len(texts), -1)
+        self.dim = vectors.shape[1]
+        return _normalized(vectors)
+
+
+def _normalized(vectors: "np.ndarray") -> "np.ndarray":
+    import numpy as np
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def create_embedder():
+    return load_factory(EMBEDDING_BACKEND)() if EMBEDDING_BACKEND else HashingEmbedder()
+
+
+# --- Index ---
+class VectorIndex:
+    """
+    In-process vector index: one float32 matrix of normalized embeddings, searched by
+    brute-force cosine similarity (a matrix-vector product), which takes milliseconds up to a
+    few hundred thousand rows. Each row has an entry: {"id", "kind", "version", ...metadata}.
+
+    With `path`, save() writes the matrix as .npy plus a JSON file of entries, and the next
+    start maps the matrix from disk (np.load mmap_mode="r") instead of embedding everything
+    again; it is copied into memory on the first change.
+    """
+    def __init__(self, embedder=None, path: str = None):
+        self.embedder = embedder if embedder is not None else create_embedder()
+        self.path = path
+        self._lock = threading.Lock()
+        self._vectors = None  # capacity x dim; the first `_size` rows are in use
+        self._kinds = None  # kind code per row, like _vectors
+        self._size = 0
+        self._entries = []
+        self._rows = {}
+        self._kind_codes = {}
+        self.mapped = False
+        if path:
+            self._load()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def version(self, id: str):
+        with self._lock:
+            row = self._rows.get(id)
+            return self._entries[row]["version"] if row is not None else None
+
+    def ids(self, kind: str = None) -> set:
+        with self._lock:
+            return {e["id"] for e in self._entries if kind is None or e["kind"] == kind}
+
+    def _kind_code(self, kind: str) -> int:
+        return self._kind_codes.setdefault(kind, len(self._kind_codes))
+
+    def _reserve(self, rows: int, dim: int):
+        # Grows by doubling; also copies a memory-mapped matrix into memory before it changes
+        capacity = 0 if self._vectors is None else len(self._vectors)
+        if capacity >= rows and not self.mapped:
+            return
+        capacity = max(rows, capacity * 2 if capacity < rows else capacity, 64)
+        import numpy as np
+        vectors = np.zeros((capacity, dim), dtype=np.float32)
+        kinds = np.zeros(capacity, dtype=np.int16)
+        if self._size:
+            vectors[:self._size] = self._vectors[:self._size]
+            kinds[:self._size] = self._kinds[:self._size]
+        self._vectors, self._kinds, self.mapped = vectors, kinds, False
+
+    def upsert(self, documents: list):
+        """
+        Adds or replaces documents: dicts with "id", "kind", "version" and "text", plus any
+        metadata to return with search results ("text" is embedded, not stored).
+        """
+        if not documents:
+            return
+        vectors = self.embedder.embed([d["text"] for d in documents])
+        with self._lock:
+            self._reserve(self._size + len(documents), vectors.shape[1])
+            for document, vector in zip(documents, vectors):
+                entry = {k: v for k, v in document.items() if k != "text"}
+                row = self._rows.get(entry["id"])
+                if row is None:
+                    row = self._size
+                    self._size += 1
+                    self._entries.append(entry)
+                    self._rows[entry["id"]] = row
+                else:
+                    self._entries[row] = entry
+                self._vectors[row] = vector
+                self._kinds[row] = self._kind_code(entry["kind"])
+
+    def remove(self, ids):
+        with self._lock:
+            ids = [id for id in ids if id in self._rows]
+            if ids:
+                self._reserve(self._size, self._vectors.shape[1])
+            for id in ids:
+                # The last row moves into the gap
+                row, last = self._rows.pop(id), self._size - 1
+                if row != last:
+                    moved = self._entries[last]
+                    self._vectors[row], self._kinds[row] = self._vectors[last], self._kinds[last]
+                    self._entries[row] = moved
+                    self._rows[moved["id"]] = row
+                self._entries.pop()
+                self._size -= 1
+
+    def search(self, text: str, k: int = 5, kind: str = None, min_score: float = None) -> list:
+        """
+        The `k` entries most similar to `text` (optionally of one kind), best first, each with its "score".
+        """
+        import numpy as np
+        query = self.embedder.embed([text])[0]
+        with self._lock:
+            if not self._size or (kind is not None and kind not in self._kind_codes):
+                return []
+            scores = self._vectors[:self._size] @ query
+            if kind is not None:
+                scores = np.where(self._kinds[:self._size] == self._kind_codes[kind], scores, -np.inf)
+            k = min(k, self._size)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            floor = -np.inf if min_score is None else min_score
+            return [{**self._entries[row], "score": round(float(scores[row]), 4)}
+                    for row in top if scores[row] > -np.inf and scores[row] >= floor]
+
+    # --- On disk ---
+    def _files(self) -> tuple:
+        return os.path.join(self.path, "vectors.npy"), os.path.join(self.path, "entries.json")
+
+    def save(self):
+        import numpy as np
+        vectors_path, entries_path = self._files()
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            vectors = self._vectors[:self._size] if self._size else np.zeros((0, 0), dtype=np.float32)
+            meta = {"embedder": self.embedder.name, "kinds": list(self._kind_codes), "entries": self._entries,
+                    "row_kinds": self._kinds[:self._size].tolist() if self._size else []}
+            # Written aside and renamed: a worker mapping the old file keeps reading it
+            with open(vectors_path + ".tmp", "wb") as f:
+                np.save(f, vectors)
+            with open(entries_path + ".tmp", "w") as f:
+                json.dump(meta, f)
+        os.replace(vectors_path + ".tmp", vectors_path)
+        os.replace(entries_path + ".tmp", entries_path)
+
+    def _load(self):
+        import numpy as np
+        vectors_path, entries_path = self._files()
+        try:
+            with open(entries_path) as f:
+                meta = json.load(f)
+            vectors = np.load(vectors_path, mmap_mode="r")
+            entries, kinds, row_kinds = meta["entries"], meta["kinds"], meta["row_kinds"]
+        except (OSError, ValueError, KeyError):
+            return
+        if meta.get("embedder") != self.embedder.name or not len(vectors) == len(entries) == len(row_kinds):
+            return  # built by another embedder: start over
+        self._kind_codes = {kind: code for code, kind in enumerate(kinds)}
+        self._entries = entries
+        self._rows = {entry["id"]: row for row, entry in enumerate(entries)}
+        self._kinds = np.asarray(row_kinds, dtype=np.int16)
+        self._vectors, self._size = vectors, len(vectors)
+        self.mapped = True
+
+
+# --- Corpora ---
+# A corpus has a `kind` and `documents()`, the documents to index (see VectorIndex.upsert).
+# Versions (file modification times) let a sync re-embed only what changed.
+class TemplateCorpus:
+    kind = "template"
+
+    def __init__(self, registry=template_registry):
+        self.registry = registry
+
+    def documents(self) -> list:
+        documents = []
+        for template in self.registry.list():
+            title = os.path.splitext(template.name)[0].replace("_", " ")
+            # The title counts a few times over: it says what the letter is for
+            text = f"{title}. {title}. {title}.\n{template.content}"
+            documents.append({"id": f"template:{template.name}", "kind": self.kind, "version": template.mtime,
+                              "template": template.name, "text": text})
+        return documents
+
+
+class DirectoryCorpus:
+    """
+    Text files in a directory (precedents, guides), one document per section or paragraph.
+    Files are only re-read when they change.
+    """
+    def __init__(self, directory: str, kind: str = "precedent", extensions: tuple = (".txt", ".md")):
+        self.directory = os.path.abspath(directory)
+        self.kind = kind
+        self.extensions = extensions
+        self._files = {}  # name -> (mtime, documents)
+
+    def _read(self, name: str, path: str, mtime: float) -> list:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            content = f.read()
+        return [{"id": f"{self.kind}:{name}#{i}", "kind": self.kind, "version": mtime, "source": name,
+                 "snippet": section.strip(), "text": section}
+                for i, section in enumerate(split_sections(content))]
+
+    def documents(self) -> list:
+        files = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            entries = []
+        for entry in entries:
+            if not entry.is_file() or not entry.name.endswith(self.extensions):
+                continue
+            mtime = entry.stat().st_mtime
+            current = self._files.get(entry.name)
+            files[entry.name] = current if current and current[0] == mtime else (mtime, self._read(entry.name, entry.path, mtime))
+        self._files = files
+        return [document for _, documents in files.values() for document in documents]
+
+
+class Retriever:
+    """
+    A vector index over the templates and any other corpora (precedents), kept in sync with
+    their files: the first query (or startup) builds it, and afterwards the corpora are
+    re-checked at most every `check_interval` seconds and only new or changed documents are
+    embedded. Template suggestions and precedent snippets need no model call.
+    """
+    def __init__(self, index: VectorIndex = None, corpora: list = None, check_interval: float = 2.0):
+        self.index = index if index is not None else VectorIndex()
+        self.corpora = corpora if corpora is not None else [TemplateCorpus()]
+        self.check_interval = check_interval
+        self._last_sync = None
+        self._sync_lock = threading.Lock()
+        self.last_changes = {}
+
+    def sync(self) -> dict:
+        """
+        Embeds new and changed documents and drops removed ones. Returns the counts.
+        """
+        with self._sync_lock:
+            changes = {"added": 0, "updated": 0, "removed": 0}
+            for corpus in self.corpora:
+                documents = corpus.documents()
+                changed = []
+                for document in documents:
+                    version = self.index.version(document["id"])
+                    if version != document["version"]:
+                        changed.append(document)
+                        changes["added" if version is None else "updated"] += 1
+                stale = self.index.ids(corpus.kind) - {d["id"] for d in documents}
+                self.index.upsert(changed)
+                self.index.remove(stale)
+                changes["removed"] += len(stale)
+            if self.index.path and (any(changes.values()) or not os.path.exists(self.index.path)):
+                self.index.save()
+            self._last_sync = time.monotonic()
+            self.last_changes = changes
+            return changes
+
+    def _maybe_sync(self):
+        if self._last_sync is None or time.monotonic() - self._last_sync >= self.check_interval:
+            self.sync()
+
+    def suggest_templates(self, text: str, k: int = 3) -> list:
+        """
+        The `k` templates that best fit a document, best first: [{"template", "score"}].
+        """
+        self._maybe_sync()
+        return [{"template": hit["template"], "score": hit["score"]}
+                for hit in self.index.search(text, k, kind=TemplateCorpus.kind)]
+
+    def precedents(self, text: str, k: int = PRECEDENT_SNIPPETS, min_score: float = PRECEDENT_MIN_SCORE) -> list:
+        """
+        Up to `k` snippets from the other corpora similar to `text`: [{"source", "snippet", "score"}].
+        """
+        self._maybe_sync()
+        hits = []
+        for corpus in self.corpora:
+            if corpus.kind != TemplateCorpus.kind:
+                hits.extend(self.index.search(text, k, kind=corpus.kind, min_score=min_score))
+        hits.sort(key=lambda hit: -hit["score"])
+        return [{"source": hit["source"], "snippet": hit["snippet"], "score": hit["score"]} for hit in hits[:k]]
+
+    def stats(self) -> dict:
+        with self.index._lock:
+            kinds = Counter(entry["kind"] for entry in self.index._entries)
+        return {"documents": len(self.index), "by_kind": dict(kinds), "embedder": self.index.embedder.name,
+                "memory_mapped": self.index.mapped, "path": self.index.path, "last_sync": self.last_changes}
+
+
+_knowledge_index = None
+_knowledge_index_lock = threading.Lock()
+
+
+def get_knowledge_index() -> Retriever:
+    """
+    The shared retriever of the worker, created on first use: templates, plus precedents
+    when EQUALIZER_PRECEDENTS_DIR is set.
+    """
+    global _knowledge_index
+    with _knowledge_index_lock:
+        if _knowledge_index is None:
+            _knowledge_index = Retriever(
+                VectorIndex(path=VECTOR_INDEX_PATH),
+                [TemplateCorpus()] + ([DirectoryCorpus(PRECEDENTS_DIR)] if PRECEDENTS_DIR else []),
+            )
+        return _knowledge_index
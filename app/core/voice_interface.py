@@ -1,23 +1,66 @@
-import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+import re
+import json
+import asyncio
+from app.core.model_client import get_model_client, response_text
+from app.core.cache import response_cache, translation_memory, make_cache_key
+from app.core.chunking import estimate_tokens
+from app.core.routing import model_router
+from app.core.sessions import IN_CONTEXT
+from app.core.speech import get_speech_synthesizer
 
-load_dotenv()
+# Line breaks, and whitespace after a sentence end; kept, so a translation keeps the layout
+_SEGMENT_BREAK = re.compile(r'(\s*\n\s*|(?<=[.!?。！？।])[ \t]+)')
+
+
+def segment_text(text: str) -> tuple:
+    """
+    Splits advice into translation memory segments (sentences and lines).
+    Returns (segments, separators); separators[i] follows segments[i].
+    """
+    parts = _SEGMENT_BREAK.split(text.strip())
+    return parts[0::2], parts[1::2] + [""]
 
-# Configure Gemini
-api_key = os.getenv("GOOGLE_API_KEY")
-if api_key:
-    genai.configure(api_key=api_key)
 
 class VoiceInterface:
-    def __init__(self, model_name="gemini-3-flash-preview"):
-        self.model = genai.GenerativeModel(model_name)
+    # Bump whenever the prompt below changes so cached answers are invalidated
+    PROMPT_VERSION = "translate-v1"
+    # Both prompts that fill the translation memory (a single segment uses the one above)
+    SEGMENT_PROMPT_VERSION = "translate-segment-v1"
 
-    def translate_to_mother_tongue(self, text: str, target_language: str) -> str:
-        """
-        Translates the simple advice into the user's mother tongue, maintaining empathy.
-        """
-        prompt = f"""
+    def __init__(self, model_name="gemini-3-flash-preview", cache=response_cache, router=model_router, speech=None,
+                 memory=translation_memory):
+        self.model_name = model_name
+        self.cache = cache
+        self.memory = memory
+        self.router = router
+        self.client = get_model_client(model_name)
+        self._model = None
+        self._speech = speech
+
+    @property
+    def speech(self):
+        # Shared text-to-speech (EQUALIZER_TTS_BACKEND, gTTS by default) unless one was set on this instance
+        return self._speech if self._speech is not None else get_speech_synthesizer()
+
+    @speech.setter
+    def speech(self, speech):
+        self._speech = speech
+
+    @property
+    def model(self):
+        # Shared, lazily created model unless one was set on this instance
+        return self._model if self._model is not None else self.client.model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+
+    def _cache_key(self, text: str, target_language: str) -> str:
+        return make_cache_key("translate", self.router.cache_scope(self.model_name), self.PROMPT_VERSION,
+                              text=text, target_language=target_language)
+
+    def _build_prompt(self, text: str, target_language: str) -> str:
+        return f"""
         You are 'The Equalizer', an empathetic rights advocate.
         Translate the following advice into {target_language}.
         
@@ -31,12 +74,222 @@ class VoiceInterface:
         Advice to Translate:
         {text}
         """
+
+    def translate_to_mother_tongue(self, text: str, target_language: str) -> str:
+        """
+        Translates the simple advice into the user's mother tongue, maintaining empathy.
+        """
+        key = self._cache_key(text, target_language)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        prompt = self._build_prompt(text, target_language)
         try:
             response = self.model.generate_content(prompt)
-            return response.text
+            self.cache.set(key, response_text(response))
+            return response_text(response)
         except Exception as e:
             return f"Error during translation: {str(e)}"
 
+    async def translate_to_mother_tongue_async(self, text: str, target_language: str, context=None) -> str:
+        """
+        Async version of translate_to_mother_tongue.
+        Model failures (after retries) raise ModelError instead of returning an error string.
+        Goes through the translation memory (see translate_many_async), so only sentences not
+        translated before are sent to the model.
+        `context`: model bound to a cached context holding `text` (see RiskDetector); the whole
+        text is then translated in one call and cached as a whole.
+        """
+        if context is None:
+            result = await self.translate_many_async(text, [target_language])
+            return result["translations"][target_language]
+        return await self._translate_whole(text, target_language, context)
+
+    async def _translate_whole(self, text: str, target_language: str, context=None) -> str:
+        # Identical concurrent requests share one model call
+        async def generate():
+            prompt = self._build_prompt(IN_CONTEXT if context is not None else text, target_language)
+            response = await self.router.generate("translate", prompt, self.client, model=context)
+            return response_text(response)
+
+        return await self.cache.get_or_generate(self._cache_key(text, target_language), generate)
+
+    # --- Translation memory (segment-level, cached per sentence and language) ---
+    def _segment_key(self, segment: str, target_language: str) -> str:
+        return make_cache_key("translate_segment", self.router.cache_scope(self.model_name),
+                              self.SEGMENT_PROMPT_VERSION, text=segment, target_language=target_language)
+
+    def _build_segments_prompt(self, segments: list, target_language: str) -> str:
+        body = "\n".join(f"[{number}] {segment}" for number, segment in enumerate(segments, 1))
+        return f"""
+        You are 'The Equalizer', an empathetic rights advocate.
+        Translate each numbered segment of the advice below into {target_language}.
+        The segments are consecutive sentences of the same advice: keep their wording consistent.
+
+        Rules:
+        - Keep the tone helpful, clear, and reassuring.
+        - Ensure legal terms are explained or translated accurately for a layperson.
+        - Do not lose the meaning of the advice.
+        - STRICTLY NO MARKDOWN or formatting (no bold **, no italics *). Plain text only.
+
+        Return JSON only: a list with one object per segment, in the given order:
+        {{"segment": <number>, "translation": "<the segment in {target_language}>"}}
+
+        Segments:
+        {body}
+        """
+
+    @staticmethod
+    def _parse_segments(text: str, count: int) -> list:
+        """
+        Translations per segment, in order, from the model's JSON. Raises ValueError if it is malformed.
+        """
+        text = re.sub(r'^```(?:json)?\s*|\s*```$', '', text.strip())
+        try:
+            data = json.loads(text)
+            if isinstance(data, dict):
+                data = data.get("segments", [])
+            by_number = {int(item["segment"]): str(item["translation"]).strip() for item in data}
+        except (TypeError, KeyError, AttributeError) as e:
+            raise ValueError(f"Unexpected structured output: {e}")
+        missing = [n for n in range(1, count + 1) if not by_number.get(n)]
+        if missing:
+            raise ValueError(f"No translation for segment(s) {missing}")
+        return [by_number[n] for n in range(1, count + 1)]
+
+    async def _translate_segments(self, segments: list, target_language: str) -> list:
+        # One call for all the segments the memory does not have; a lone one needs no JSON
+        if len(segments) == 1:
+            response = await self.router.generate("translate", self._build_prompt(segments[0], target_language),
+                                                  self.client)
+            translations = [response_text(response).strip()]
+        else:
+            response = await self.router.generate("translate", self._build_segments_prompt(segments, target_language),
+                                                  self.client, generation_config={"response_mime_type": "application/json"})
+            translations = self._parse_segments(response_text(response), len(segments))
+        for segment, translation in zip(segments, translations):
+            await self.memory.set_async(self._segment_key(segment, target_language), translation)
+        return translations
+
+    async def _translate_language(self, text: str, segments: list, separators: list, target_language: str) -> dict:
+        keys = [self._segment_key(segment, target_language) for segment in segments]
+        found = {}
+        for key in keys:
+            if key not in found:
+                cached = await self.memory.get_async(key)
+                if cached is not None:
+                    found[key] = cached
+        from_memory = len(found)
+
+        # Repeated sentences are sent once; concurrent requests missing the same ones share the call
+        missing = {key: segment for key, segment in zip(keys, segments) if key not in found}
+        summary = {"segments": len(dict.fromkeys(keys)), "from_memory": from_memory, "translated": len(missing),
+                   "model_calls": 0, "tokens_sent": 0}
+        if not missing:
+            return {"text": "".join(found[key] + sep for key, sep in zip(keys, separators)), "summary": summary}
+
+        batch = list(missing.values())
+        prompt = (self._build_prompt(batch[0], target_language) if len(batch) == 1
+                  else self._build_segments_prompt(batch, target_language))
+        flight = make_cache_key("translate_segments", self.router.cache_scope(self.model_name),
+                                self.SEGMENT_PROMPT_VERSION, target_language=target_language, segments=list(missing))
+
+        async def translate_batch():
+            try:
+                return await self._translate_segments(batch, target_language)
+            except ValueError:
+                return None
+
+        translations, led = await self.memory.flights.do_led(flight, translate_batch)
+        # A request that joined another's in-flight call made no batch call of its own
+        if led:
+            summary.update(model_calls=1, tokens_sent=estimate_tokens(prompt))
+        if translations is None:
+            # Malformed batch output: the whole text the usual way, not remembered per segment
+            summary.update(model_calls=summary["model_calls"] + 1, translated=0)
+            return {"text": await self._translate_whole(text, target_language), "summary": summary}
+        found.update(zip(missing, translations))
+        return {"text": "".join(found[key] + sep for key, sep in zip(keys, separators)), "summary": summary}
+
+    async def translate_many_async(self, text: str, target_languages: list) -> dict:
+        """
+        Translates `text` into every language in `target_languages` at once, through the
+        translation memory: the text is split into sentences (and lines), each looked up by
+        (normalized sentence, language), and only the missing ones go to the model, in one
+        batched call per language. The translations are put back together in order, keeping
+        the original line breaks. Recurring advice costs fewer tokens, and less time, as the
+        memory warms up.
+
+        Returns {"translations": {language: text}, "memory": {"segments", "from_memory",
+        "translated", "model_calls", "tokens_sent"}}, the counts summed over the languages.
+        """
+        languages = list(dict.fromkeys(target_languages))
+        if not text.strip():
+            return {"translations": {language: "" for language in languages},
+                    "memory": {"segments": 0, "from_memory": 0, "translated": 0, "model_calls": 0, "tokens_sent": 0}}
+        segments, separators = segment_text(text)
+        results = await asyncio.gather(*[self._translate_language(text, segments, separators, language)
+                                         for language in languages])
+        memory = {name: sum(result["summary"][name] for result in results)
+                  for name in ("segments", "from_memory", "translated", "model_calls", "tokens_sent")}
+        return {"translations": {language: result["text"] for language, result in zip(languages, results)},
+                "memory": memory}
+
+    async def translate_to_mother_tongue_stream(self, text: str, target_language: str):
+        """
+        Streams the translation as partial chunks (used by the SSE endpoints).
+        Blocked prompts and model errors are raised to the caller instead of returned as strings.
+        """
+        key = self._cache_key(text, target_language)
+        cached = await self.cache.get_async(key)
+        if cached is not None:
+            yield cached
+            return
+
+        content = self._build_prompt(text, target_language)
+        parts = []
+        async for text in self.router.generate_stream("translate", content, self.client):
+            parts.append(text)
+            yield text
+        await self.cache.set_async(key, "".join(parts))
+
+    def _build_guardian_prompt(self, utterance: str, target_language: str, history=()) -> str:
+        conversation = "\n".join(f"Heard: {heard}\nYou advised: {advice}" for heard, advice in history)
+        return f"""
+        You are 'The Equalizer' in Guardian Mode, an empathetic rights advocate listening in on a live
+        call (a landlord, debt collector, employer or official) and quietly advising the user in real time.
+
+        Rules:
+        - Answer in {target_language}.
+        - At most three short sentences: what is happening, and what to say or do next.
+        - Warn clearly about pressure tactics, false claims, or requests to pay or sign right away.
+        - STRICTLY NO MARKDOWN or formatting. Plain text only, suitable for listening.
+
+        Conversation so far:
+        {conversation or "(none)"}
+
+        Just heard:
+        {utterance}
+        """
+
+    async def guardian_reply_stream(self, utterance: str, target_language: str, history=()):
+        """
+        Streams spoken advice about the latest utterance of a live call (Guardian Mode, /voice/ws).
+        `history` is the recent (utterance, advice) pairs of the call. Not cached: every call differs.
+        """
+        content = self._build_guardian_prompt(utterance, target_language, history)
+        async for text in self.router.generate_stream("guardian", content, self.client):
+            yield text
+
+    async def speak_stream(self, text: str, target_language: str):
+        """
+        Streams spoken `text` (/voice/speak): audio chunks in order, one per sentence, each
+        yielded as soon as it is synthesized. Synthesized sentences are cached.
+        """
+        async for audio in self.speech.stream(text, target_language):
+            yield audio
+
     def simulate_audio_input(self, audio_file_path: str) -> str:
         """
         Mock function for STT (Speech-to-Text).
@@ -0,0 +1,340 @@
+import os
+import re
+import time
+import asyncio
+from dataclasses import dataclass
+from app.core import metrics
+from app.core.settings import load_factory
+from app.core.model_client import ModelError, BlockedPromptError, separate_deadline, DEFAULT_REQUEST_TIMEOUT
+from app.core.speech import SentenceBuffer, TTS_BACKEND, get_speech_synthesizer
+
+# "module:function" returning the speech-to-text backend of a voice session. Unset: the browser
+# transcribes and sends its transcripts as text messages. Without EQUALIZER_TTS_BACKEND (see
+# app/core/speech.py) the browser also speaks the "sentence" events itself.
+STT_BACKEND = os.getenv("EQUALIZER_STT_BACKEND")
+# Items buffered between two stages; a stage that falls behind makes the ones before it wait,
+# down to the socket, which then stops being read
+VOICE_QUEUE_SIZE = int(os.getenv("EQUALIZER_VOICE_QUEUE_SIZE", "32"))
+# Pause in the partial transcript after which the reply is started speculatively, before the
+# final transcript (0 = wait for the final transcript)
+VOICE_SPECULATE_AFTER = float(os.getenv("EQUALIZER_VOICE_SPECULATE_MS", "300")) / 1000
+VOICE_MAX_FRAME_BYTES = int(os.getenv("EQUALIZER_VOICE_MAX_FRAME_KB", "64")) * 1024
+# Earlier (utterance, advice) pairs sent with each reply
+VOICE_HISTORY_TURNS = 6
+
+_END = object()
+
+
+@dataclass
+class Transcript:
+    text: str
+    final: bool = False
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+# --- Backends ---
+# A speech-to-text backend has `transcribe(frames)`: an async generator taking the session's
+# incoming frames (bytes for audio, dicts for client messages) and yielding Transcripts, partial
+# ones while the user is talking and a final one per utterance.
+# A text-to-speech backend has `synthesize(text, language)`: an async generator yielding audio
+# chunks (bytes) for one sentence (see app/core/speech.py).
+class BrowserSpeechToText:
+    """
+    Transcripts made by the client (Web Speech API) and sent as
+    {"type": "transcript", "text": ..., "final": true|false} messages.
+    """
+    async def transcribe(self, frames):
+        async for frame in frames:
+            if isinstance(frame, (bytes, bytearray)):
+                raise ValueError("Audio frames need a speech-to-text backend (EQUALIZER_STT_BACKEND)")
+            if frame.get("type") == "transcript" and isinstance(frame.get("text"), str):
+                yield Transcript(frame["text"], bool(frame.get("final")))
+
+
+class BrowserTextToSpeech:
+    """
+    Sends no audio: the client speaks the "sentence" events itself (speechSynthesis).
+    """
+    async def synthesize(self, text: str, language: str):
+        return
+        yield
+
+
+def create_speech_backends() -> tuple:
+    """
+    (speech-to-text, text-to-speech) backends for a new session, as configured.
+    """
+    stt = load_factory(STT_BACKEND)() if STT_BACKEND else BrowserSpeechToText()
+    # The configured backend goes through the shared synthesizer, and so its audio cache
+    tts = get_speech_synthesizer() if TTS_BACKEND else BrowserTextToSpeech()
+    return stt, tts
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+class _Reply:
+    """
+    A reply being generated for one utterance; its text chunks wait in a bounded queue until
+    the turn is spoken (a speculative reply may never be).
+    """
+    def __init__(self, utterance: str, queue_size: int):
+        self.utterance = utterance
+        self.chunks = asyncio.Queue(queue_size)
+        self.task = None
+
+
+class VoiceSession:
+    """
+    One full-duplex Guardian Mode conversation (/voice/ws), run as stages joined by bounded
+    queues, so each stage works while the next one is still busy:
+
+        socket -> frames -> speech-to-text -> reply (streamed model call) -> sentences
+               -> text-to-speech -> outbox -> socket
+
+    Partial transcripts reach the model while the user is still talking: once a partial has
+    been stable for `speculate_after` seconds, its reply starts generating. If the final
+    transcript says the same, that reply is used; otherwise it is dropped and a new one starts.
+    A sentence is synthesized as soon as it is complete, so the first audio goes out while the
+    rest of the reply is generated. A new utterance interrupts a reply that is still playing.
+    Every turn reports its stage latencies (a "turn_done" event and the stage metrics).
+    """
+    def __init__(self, voice, language: str = "English", stt=None, tts=None,
+                 queue_size: int = VOICE_QUEUE_SIZE, speculate_after: float = VOICE_SPECULATE_AFTER):
+        self.voice = voice
+        self.language = language
+        if stt is None or tts is None:
+            default_stt, default_tts = create_speech_backends()
+            stt, tts = stt or default_stt, tts or default_tts
+        self.stt = stt
+        self.tts = tts
+        self.queue_size = queue_size
+        self.speculate_after = speculate_after
+        self.history = []
+        self.frames = asyncio.Queue(queue_size)
+        self.outbox = asyncio.Queue(queue_size)
+        self.closed = False  # the client went away
+        self.turns = 0
+        self.speculation_hits = 0
+        self._last_frame = None
+        self._speculation = None
+        self._timer = None
+        self._turn = None
+
+    # --- Stages ---
+    async def _receive(self, receive):
+        try:
+            while True:
+                frame = await receive()
+                if frame is None:
+                    self.closed = True
+                    break
+                if isinstance(frame, dict) and frame.get("type") == "end":
+                    break
+                if isinstance(frame, (bytes, bytearray)) and len(frame) > VOICE_MAX_FRAME_BYTES:
+                    await self.outbox.put({"type": "error", "message": "Audio frame too large"})
+                    break
+                await self.frames.put(frame)
+        except Exception:
+            self.closed = True
+        finally:
+            await self.frames.put(_END)
+
+    async def _incoming(self):
+        while True:
+            frame = await self.frames.get()
+            if frame is _END:
+                return
+            self._last_frame = time.monotonic()
+            yield frame
+
+    async def _transcribe(self):
+        async for transcript in self.stt.transcribe(self._incoming()):
+            if not transcript.text.strip():
+                continue
+            await self.outbox.put({"type": "transcript", "text": transcript.text, "final": transcript.final})
+            if transcript.final:
+                self._on_final(transcript.text)
+            else:
+                await self._on_partial(transcript.text)
+
+    async def _generate(self, reply: _Reply):
+        history = self.history[-VOICE_HISTORY_TURNS:]
+        try:
+            # Each reply gets the time budget of one request; the socket itself has none
+            with separate_deadline(DEFAULT_REQUEST_TIMEOUT):
+                async for text in self.voice.guardian_reply_stream(reply.utterance, self.language, history):
+                    await reply.chunks.put(text)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await reply.chunks.put(_Failure(e))
+            return
+        await reply.chunks.put(_END)
+
+    def _start_reply(self, utterance: str) -> _Reply:
+        reply = _Reply(utterance, self.queue_size)
+        reply.task = asyncio.ensure_future(self._generate(reply))
+        return reply
+
+    async def _speak(self, reply: _Reply, final_at: float, speculative: bool):
+        timing = {"speculative": speculative,
+                  "stt_ms": round((final_at - self._last_frame) * 1000, 1) if self._last_frame else None}
+        sentences = asyncio.Queue(self.queue_size)
+        synthesis = asyncio.ensure_future(self._synthesize(sentences, final_at, timing))
+        buffer = SentenceBuffer()
+        parts = []
+        try:
+            while True:
+                item = await reply.chunks.get()
+                if item is _END:
+                    break
+                if isinstance(item, _Failure):
+                    await self.outbox.put(_error_event(item.error))
+                    break
+                if not parts:
+                    timing["first_text_ms"] = _ms_since(final_at)
+                parts.append(item)
+                await self.outbox.put({"type": "reply", "text": item})
+                for sentence in buffer.feed(item):
+                    await sentences.put(sentence)
+            rest = buffer.flush()
+            if rest:
+                await sentences.put(rest)
+            await sentences.put(_END)
+            await synthesis
+        finally:
+            synthesis.cancel()
+            reply.task.cancel()
+
+        advice = "".join(parts).strip()
+        if advice:
+            self.history.append((reply.utterance, advice))
+        timing["turn_ms"] = _ms_since(final_at)
+        self.turns += 1
+        for stage in ("stt", "first_text", "first_sentence", "first_audio", "turn"):
+            if timing.get(f"{stage}_ms") is not None:
+                metrics.stage_duration.observe(timing[f"{stage}_ms"] / 1000, stage=f"voice_{stage}")
+        await self.outbox.put({"type": "turn_done", "metrics": timing})
+
+    async def _synthesize(self, sentences: asyncio.Queue, final_at: float, timing: dict):
+        index = 0
+        while True:
+            sentence = await sentences.get()
+            if sentence is _END:
+                return
+            if index == 0:
+                timing["first_sentence_ms"] = _ms_since(final_at)
+            await self.outbox.put({"type": "sentence", "index": index, "text": sentence})
+            started = time.monotonic()
+            first = True
+            async for audio in self.tts.synthesize(sentence, self.language):
+                if first and index == 0:
+                    timing["tts_ms"] = _ms_since(started)
+                    timing["first_audio_ms"] = _ms_since(final_at)
+                first = False
+                await self.outbox.put(bytes(audio))
+            index += 1
+
+    async def _send(self, send):
+        while True:
+            item = await self.outbox.get()
+            if item is _END:
+                return
+            await send(item)
+
+    # --- Turn taking ---
+    async def _on_partial(self, text: str):
+        if self._turn is not None and not self._turn.done():
+            # The user talks over the reply: stop it
+            self._turn.cancel()
+            self._turn = None
+            await self.outbox.put({"type": "interrupted"})
+        if self.speculate_after <= 0:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.ensure_future(self._speculate(text))
+
+    async def _speculate(self, text: str):
+        await asyncio.sleep(self.speculate_after)
+        if self._speculation is not None:
+            if _normalize(self._speculation.utterance) == _normalize(text):
+                return
+            self._speculation.task.cancel()
+        self._speculation = self._start_reply(text)
+
+    def _on_final(self, text: str):
+        final_at = time.monotonic()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        reply, self._speculation = self._speculation, None
+        speculative = reply is not None and _normalize(reply.utterance) == _normalize(text)
+        if reply is not None:
+            metrics.voice_speculations.inc(outcome="hit" if speculative else "miss")
+        if speculative:
+            self.speculation_hits += 1
+        else:
+            if reply is not None:
+                reply.task.cancel()
+            reply = self._start_reply(text)
+        if self._turn is not None and not self._turn.done():
+            self._turn.cancel()
+        self._turn = asyncio.ensure_future(self._speak(reply, final_at, speculative))
+
+    # --- Session ---
+    async def _until(self, task, sender):
+        # Waits for `task` unless the sender fails first (the socket is gone)
+        done, _ = await asyncio.wait({task, sender}, return_when=asyncio.FIRST_COMPLETED)
+        if sender in done and task not in done:
+            sender.result()
+            raise ConnectionError("voice socket closed")
+        if not task.cancelled():
+            task.result()
+
+    async def run(self, receive, send):
+        """
+        Runs the session until the client sends {"type": "end"} or disconnects.
+        `receive()` returns the next frame (bytes, a dict, or None when the client is gone);
+        `send(item)` delivers an event dict or an audio chunk.
+        """
+        metrics.voice_sessions.inc()
+        receiver = asyncio.ensure_future(self._receive(receive))
+        sender = asyncio.ensure_future(self._send(send))
+        transcriber = asyncio.ensure_future(self._transcribe())
+        try:
+            await self.outbox.put({"type": "ready", "language": self.language})
+            try:
+                await self._until(transcriber, sender)
+            except (ValueError, ModelError) as e:
+                await self.outbox.put(_error_event(e))
+            if self._turn is not None and not self.closed:
+                await self._until(self._turn, sender)
+            await self.outbox.put({"type": "done", "turns": self.turns})
+            await self.outbox.put(_END)
+            await sender
+        finally:
+            metrics.voice_sessions.dec()
+            for task in (receiver, transcriber, self._turn, self._timer,
+                         self._speculation.task if self._speculation else None):
+                if task is not None:
+                    task.cancel()
+            sender.cancel()
+
+
+def _ms_since(start: float) -> float:
+    return round((time.monotonic() - start) * 1000, 1)
+
+
+def _error_event(error: Exception) -> dict:
+    if isinstance(error, BlockedPromptError):
+        return {"type": "blocked", "reason": error.reason}
+    if isinstance(error, ModelError):
+        return {"type": "error", "message": str(error), "status": error.status_code, "error": error.kind}
+    return {"type": "error", "message": str(error)}
@@ -1,10 +1,48 @@
-from fastapi import FastAPI, HTTPException, Request, UploadFile, File
+from app.core import settings  # loads .env before anything reads EQUALIZER_* settings
+import os
+import json
+import time
+import asyncio
+import zipfile
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, PlainTextResponse
+from pydantic import BaseModel, ValidationError
+from typing import Optional, List, Dict
 from app.core.risk_detector import RiskDetector
+from app.core.chunking import needs_chunking
+from app.core.compliance import ComplianceManager, load_known_terms
+from app.core.pipeline import DocumentPipeline, MAX_PIPELINE_LANGUAGES
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing heavy happens at import: the Gemini SDK and models are created on first use,
+    # PyMuPDF is only imported by the extraction workers. EQUALIZER_PRELOAD_MODELS=1 warms
+    # the worker here instead, before it takes traffic.
+    if settings.PRELOAD_MODELS:
+        await asyncio.to_thread(preload_models)
+    # Template / precedent embeddings: mapped from disk if saved, only changed files are embedded
+    await asyncio.to_thread(lambda: get_knowledge_index().sync())
+    job_worker.start()
+    yield
+    await job_worker.stop()
+    shutdown_extraction_pool()
+
+app = FastAPI(title="The Equalizer API", version="0.1.0", lifespan=lifespan)
+
+# Model failures that survive the client's retries become proper HTTP errors (429/503/504/502)
+# instead of a 200 whose body is an error message.
+from app.core.model_client import ModelError, DeadlineMiddleware, preload_models
+
+@app.exception_handler(ModelError)
+async def model_error_handler(request: Request, exc: ModelError):
+    headers = {"Retry-After": str(max(1, round(exc.retry_after)))} if exc.retry_after else None
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc), "error": exc.kind}, headers=headers)
 
-app = FastAPI(title="The Equalizer API", version="0.1.0")
+# Every request gets a time budget (EQUALIZER_REQUEST_TIMEOUT, or a shorter X-Request-Timeout header)
+# shared by all the model calls it makes
+app.add_middleware(DeadlineMiddleware)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
@@ -15,34 +53,85 @@ def read_root():
 
 # Core Models
 detector = RiskDetector()
+# Known names, addresses, etc. to redact besides the built-in patterns: a JSON file of
+# {"pii type": ["term", ...]}
+compliance = ComplianceManager(known_terms=load_known_terms(os.getenv("EQUALIZER_PII_TERMS")))
+
+# Redact PII before sending text to the external API (Privacy by design). Set to 0 to disable.
+# Applies to every document the model sees: request text, uploads, sessions, batches and jobs.
+REDACT_PII = os.getenv("EQUALIZER_REDACT_PII", "1") != "0"
+
+def _redact(text: str) -> str:
+    return compliance.redact_pii(text) if REDACT_PII and text else text
 
 class AnalysisRequest(BaseModel):
-    text: str
+    text: str = ""
+    doc_id: Optional[str] = None # a document uploaded to /documents, instead of text
 
 class AnalysisResponse(BaseModel):
     analysis: str
 
 @app.post("/analyze", response_model=AnalysisResponse)
-def analyze_document(request: AnalysisRequest):
+async def analyze_document(request: AnalysisRequest):
+    if request.doc_id:
+        return AnalysisResponse(analysis=await _analyze_session(_get_session(request.doc_id)))
     if not request.text:
         raise HTTPException(status_code=400, detail="Text content is required")
     
-    # Optional: Redact PII before sending to external API (Privacy by design)
-    # clean_text = compliance.redact_pii(request.text) 
-    
-    result = detector.analyze_document(request.text)
+    # Redact PII before sending to external API (Privacy by design)
+    clean_text = _redact(request.text)
+
+    if needs_chunking([clean_text]):
+        result = await detector.analyze_long_document_async([clean_text])
+    else:
+        result = await detector.analyze_document_async(clean_text)
     return AnalysisResponse(analysis=result)
 
+# Structured, clause-level analysis: JSON risks per clause, cached per clause, so a revised
+# document only sends its new or changed clauses to the model
+from app.core.clauses import segment_clauses
+
+class ClauseAnalysisRequest(BaseModel):
+    text: str = ""
+    doc_id: Optional[str] = None
+    previous_report_id: Optional[str] = None # report_id of the previous version's analysis
+    previous_text: Optional[str] = None # or the previous version itself
+
+@app.post("/analyze/clauses")
+async def analyze_clauses(request: ClauseAnalysisRequest):
+    if request.doc_id:
+        text = _get_session(request.doc_id).text
+    else:
+        text = _redact(request.text)
+    if not text:
+        raise HTTPException(status_code=400, detail="Text content is required")
+
+    previous = None
+    if request.previous_report_id:
+        previous = await detector.load_clause_report_async(request.previous_report_id)
+        if previous is None:
+            raise HTTPException(status_code=404, detail="Previous report not found or expired")
+    elif request.previous_text is not None:
+        previous_text = _redact(request.previous_text)
+        previous = [clause.entry() for clause in segment_clauses(previous_text)]
+    return await detector.analyze_clauses_async(text, previous)
+
 # Simplifier Endpoint
 from app.core.simplifier import DocumentSimplifier
 simplifier = DocumentSimplifier()
 
 @app.post("/simplify", response_model=AnalysisResponse)
-def simplify_document(request: AnalysisRequest):
+async def simplify_document(request: AnalysisRequest):
+    if request.doc_id:
+        return AnalysisResponse(analysis=await _simplify_session(_get_session(request.doc_id)))
     if not request.text:
         raise HTTPException(status_code=400, detail="Text content is required")
-    
-    result = simplifier.simplify_text(request.text)
+
+    clean_text = _redact(request.text)
+    if needs_chunking([clean_text]):
+        result = await simplifier.simplify_long_document_async([clean_text])
+    else:
+        result = await simplifier.simplify_text_async(clean_text)
     return AnalysisResponse(analysis=result)
 
 # --- Phase 2: Voice & Translation ---
@@ -50,156 +139,788 @@ from app.core.voice_interface import VoiceInterface
 voice = VoiceInterface()
 
 class TranslationRequest(BaseModel):
-    text: str
-    target_language: str
+    text: str = ""
+    target_language: str = ""
+    target_languages: List[str] = [] # several at once (/voice/translate only), e.g. ["Hindi", "Tamil"]
+    doc_id: Optional[str] = None
 
-@app.post("/voice/translate", response_model=AnalysisResponse)
-def translate_advice(request: TranslationRequest):
-    if not request.text or not request.target_language:
+class TranslationResponse(BaseModel):
+    analysis: str # the first language's translation
+    translations: Optional[Dict[str, str]] = None # every language, when several were asked for
+    memory: Optional[dict] = None # translation memory use: segments from memory, translated, model calls, tokens
+
+# Advice is translated sentence by sentence through a translation memory (see VoiceInterface.translate_many_async):
+# recurring sentences are translated once per language, and only new ones go to the model
+@app.post("/voice/translate", response_model=TranslationResponse, response_model_exclude_none=True)
+async def translate_advice(request: TranslationRequest):
+    languages = list(dict.fromkeys(l.strip() for l in [request.target_language, *request.target_languages] if l.strip()))
+    if len(languages) > MAX_PIPELINE_LANGUAGES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PIPELINE_LANGUAGES} languages per request")
+    several = len(languages) > 1 or bool(request.target_languages)
+    if request.doc_id and languages:
+        session = _get_session(request.doc_id)
+        results = await asyncio.gather(*[_translate_session(session, language) for language in languages])
+        return TranslationResponse(analysis=results[0], translations=dict(zip(languages, results)) if several else None)
+    if not request.text or not languages:
          raise HTTPException(status_code=400, detail="Text and target language are required")
-    
-    result = voice.translate_to_mother_tongue(request.text, request.target_language)
-    return AnalysisResponse(analysis=result)
 
-import fitz  # PyMuPDF
-import io
+    result = await voice.translate_many_async(request.text, languages)
+    translations = result["translations"]
+    return TranslationResponse(analysis=translations[languages[0]], translations=translations if several else None,
+                               memory=result["memory"])
 
-@app.post("/analyze/file")
-async def analyze_file(file: UploadFile = File(...)):
-    allowed_docs = ('.pdf', '.txt')
-    allowed_images = ('.jpg', '.jpeg', '.png', '.webp')
-    
-    filename_lc = file.filename.lower()
-    if not filename_lc.endswith(allowed_docs + allowed_images):
+from app.core import metrics
+from app.core.extraction import PdfExtraction, shutdown_extraction_pool, prepare_image
+from app.core.uploads import spool_upload, SpooledUpload, UploadLimitMiddleware
+
+from app.core.batch import BATCH_MAX_BYTES
+
+# Reject oversized request bodies (413) before the multipart parser buffers them
+app.add_middleware(UploadLimitMiddleware, path_limits={"/batch/": BATCH_MAX_BYTES})
+
+ALLOWED_DOCS = ('.pdf', '.txt')
+ALLOWED_IMAGES = ('.jpg', '.jpeg', '.png', '.webp')
+
+def _check_upload_type(filename: str):
+    if not filename.lower().endswith(ALLOWED_DOCS + ALLOWED_IMAGES):
         raise HTTPException(status_code=400, detail="Only PDF, TXT, and images (JPG, PNG, WEBP) are supported")
-    
+
+async def _read_upload(file: UploadFile) -> dict:
+    """
+    Validates an upload and turns it into the keyword arguments the core classes take.
+    The upload is spooled to a temp file in bounded chunks (413 past EQUALIZER_MAX_UPLOAD_MB).
+    PDFs come back as {"pdf": PdfExtraction} reading from that file; parsing happens off the
+    event loop when it is consumed.
+    """
+    _check_upload_type(file.filename)
+    with metrics.stage("upload_spool"):
+        upload = await spool_upload(file)
+    return await _upload_payload(upload)
+
+async def _upload_payload(upload: SpooledUpload, keep_source: bool = False) -> dict:
+    """
+    Reads a spooled upload into core-class keyword arguments, with text (and PDF pages, as
+    they are extracted) PII-redacted. The file is deleted once read (for PDFs, when the
+    extraction is closed) unless keep_source is set.
+    """
+    filename_lc = upload.filename.lower()
     if filename_lc.endswith('.pdf'):
-        pdf_content = await file.read()
-        doc = fitz.open(stream=pdf_content, filetype="pdf")
-        text_content = ""
-        image_parts = []
-        
-        for page in doc:
-            text_content += page.get_text()
-            # Extract images from page
-            image_list = page.get_images(full=True)
-            for img_index, img in enumerate(image_list):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                image_parts.append({
-                    "mime_type": f"image/{base_image['ext']}",
-                    "data": image_bytes
-                })
-        
-        # Send text and found images for analysis
-        # Limit images to avoid hitting limits (Gemini handles many but let's be safe)
-        if len(image_parts) > 10:
-            image_parts = image_parts[:10]
-            
-        # We need a way to pass multiple images to RiskDetector. 
-        # For now, let's just use the first page's text if there are too many images, 
-        # or combine them. RiskDetector handles one image. 
-        # Let's update RiskDetector to handle list of parts.
-        
-        result = detector.analyze_document(text_content=text_content, image_data=image_parts[0]['data'] if image_parts else None, mime_type=image_parts[0]['mime_type'] if image_parts else None)
-    elif filename_lc.endswith(allowed_images):
-        image_data = await file.read()
-        mime_type = file.content_type or "image/jpeg"
-        result = detector.analyze_document(image_data=image_data, mime_type=mime_type)
-    else:
-        content = (await file.read()).decode('utf-8')
-        result = detector.analyze_document(text_content=content)
+        return {"pdf": PdfExtraction(upload.path, delete_source=not keep_source,
+                                     redactor=compliance.redactor() if REDACT_PII else None)}
+    try:
+        if filename_lc.endswith(ALLOWED_IMAGES):
+            image_data = await metrics.to_thread("upload_read", upload.read_bytes)
+            # Downscaled, recompressed and stripped of EXIF before it goes anywhere near the model
+            image = await prepare_image(image_data, upload.content_type or "image/jpeg")
+            return {"image_data": image["data"], "mime_type": image["mime_type"]}
+        else:
+            content = await metrics.to_thread("upload_read", upload.read_text)
+            return {"text_content": _redact(content)}
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="TXT files must be UTF-8 encoded")
+    finally:
+        if not keep_source:
+            upload.close()
+
+async def _flatten_upload(payload: dict, include_pdf_images: bool = True) -> dict:
+    """
+    Single-call form of an upload: whole PDF text plus its first embedded image.
+    """
+    extraction = payload.pop("pdf", None)
+    if extraction is None:
+        return payload
+    try:
+        text_content = await extraction.text()
+        image = await extraction.first_image() if include_pdf_images else None
+    finally:
+        extraction.close()
+    return {
+        "text_content": text_content,
+        "image_data": image["data"] if image else None,
+        "mime_type": image["mime_type"] if image else None,
+    }
 
+async def _analyze_payload(payload: dict, wrap_pages=None) -> str:
+    # wrap_pages: optional async-generator wrapper around the PDF page stream (job progress)
+    extraction = payload.get("pdf")
+    if extraction:
+        # Pages stream out of the extraction pool straight into chunk analysis
+        pages = wrap_pages(extraction.pages()) if wrap_pages else extraction.pages()
+        try:
+            return await detector.analyze_long_document_async(pages, image_loader=extraction.first_image)
+        finally:
+            extraction.close()
+    if needs_chunking([payload.get("text_content") or ""]):
+        return await detector.analyze_long_document_async([payload["text_content"]])
+    return await detector.analyze_document_async(**payload)
+
+async def _simplify_payload(payload: dict, wrap_pages=None) -> str:
+    extraction = payload.get("pdf")
+    if extraction:
+        pages = wrap_pages(extraction.pages()) if wrap_pages else extraction.pages()
+        try:
+            return await simplifier.simplify_long_document_async(pages)
+        finally:
+            extraction.close()
+    if needs_chunking([payload.get("text_content") or ""]):
+        return await simplifier.simplify_long_document_async([payload["text_content"]])
+    return await simplifier.simplify_text_async(**payload)
+
+@app.post("/analyze/file")
+async def analyze_file(file: UploadFile = File(...)):
+    result = await _analyze_payload(await _read_upload(file))
     return AnalysisResponse(analysis=result)
 
 @app.post("/simplify/file")
 async def simplify_file(file: UploadFile = File(...)):
-    allowed_docs = ('.pdf', '.txt')
-    allowed_images = ('.jpg', '.jpeg', '.png', '.webp')
+    result = await _simplify_payload(await _read_upload(file))
+    return AnalysisResponse(analysis=result)
 
-    filename_lc = file.filename.lower()
-    if not filename_lc.endswith(allowed_docs + allowed_images):
-        raise HTTPException(status_code=400, detail="Only PDF, TXT, and images (JPG, PNG, WEBP) are supported")
-    
-    if filename_lc.endswith('.pdf'):
-        pdf_content = await file.read()
-        doc = fitz.open(stream=pdf_content, filetype="pdf")
-        text_content = ""
-        for page in doc:
-            text_content += page.get_text()
-        result = simplifier.simplify_text(text_content=text_content)
-    elif filename_lc.endswith(allowed_images):
-        image_data = await file.read()
-        mime_type = file.content_type or "image/jpeg"
-        result = simplifier.simplify_text(image_data=image_data, mime_type=mime_type)
-    else:
-        content = (await file.read()).decode('utf-8')
-        result = simplifier.simplify_text(text_content=content)
+# --- Document sessions ---
+# Upload once (POST /documents) and refer to the returned doc_id in /analyze, /simplify,
+# /voice/translate and /action/generate instead of sending the document again. Long documents
+# also get a model-side context cache, so follow-up calls only send the instruction.
+from app.core.sessions import session_store, context_cache
 
-    return AnalysisResponse(analysis=result)
+def _get_session(doc_id: str):
+    session = session_store.get(doc_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Document not found or expired")
+    return session
+
+async def _session_content(payload: dict) -> tuple:
+    # (pages, first image) of an upload, extracted once for the session
+    extraction = payload.get("pdf")
+    if extraction:
+        try:
+            pages = [page async for page in extraction.pages()]
+            return pages, await extraction.first_image()
+        finally:
+            extraction.close()
+    if payload.get("image_data"):
+        return [], {"data": payload["image_data"], "mime_type": payload["mime_type"]}
+    return [payload["text_content"]], None
+
+async def _analyze_session(session) -> str:
+    context = await context_cache.model_for(session, detector.model_name)
+    payload = session.payload()
+    if context is None and needs_chunking(session.pages):
+        return await detector.analyze_long_document_async(session.pages, payload["image_data"], payload["mime_type"])
+    return await detector.analyze_document_async(**payload, context=context)
+
+async def _simplify_session(session) -> str:
+    context = await context_cache.model_for(session, simplifier.model_name)
+    if context is None and needs_chunking(session.pages):
+        return await simplifier.simplify_long_document_async(session.pages)
+    return await simplifier.simplify_text_async(**session.payload(), context=context)
+
+async def _translate_session(session, target_language: str) -> str:
+    if not session.text:
+        raise HTTPException(status_code=400, detail="Document has no text to translate")
+    context = await context_cache.model_for(session, voice.model_name)
+    return await voice.translate_to_mother_tongue_async(session.text, target_language, context=context)
+
+async def _once(call):
+    # A session result as a one-chunk stream for the /stream endpoints
+    yield await call()
+
+@app.post("/documents", status_code=201)
+async def create_document(file: UploadFile = File(...)):
+    pages, image = await _session_content(await _read_upload(file))
+    try:
+        session = session_store.create(pages, image, file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return session.describe()
+
+@app.get("/documents/{doc_id}")
+async def get_document(doc_id: str):
+    return _get_session(doc_id).describe()
+
+@app.delete("/documents/{doc_id}", status_code=204)
+async def delete_document(doc_id: str):
+    if not session_store.delete(doc_id):
+        raise HTTPException(status_code=404, detail="Document not found or expired")
+
+@app.get("/documents")
+async def document_stats():
+    return {**session_store.stats(), "context_cache": context_cache.stats()}
+
+# --- Streaming (Server-Sent Events) ---
+# Every LLM endpoint has a /stream twin that sends partial text as it is generated.
+# Events: "chunk" {"text": ...} repeated, then exactly one terminal event:
+#   "done" {} | "blocked" {"reason": ...} | "error" {"message": ...}
+from app.core.model_client import BlockedPromptError
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _sse_events(chunks):
+    try:
+        async for text in chunks:
+            yield _sse("chunk", {"text": text})
+        yield _sse("done", {})
+    except BlockedPromptError as e:
+        yield _sse("blocked", {"reason": e.reason})
+    except Exception as e:
+        yield _sse("error", _sse_error(e))
+
+def _sse_error(error: Exception) -> dict:
+    if isinstance(error, ModelError):
+        return {"message": str(error), "status": error.status_code, "error": error.kind}
+    return {"message": str(error)}
+
+def _sse_response(chunks) -> StreamingResponse:
+    return StreamingResponse(
+        _sse_events(chunks),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/analyze/stream")
+async def analyze_document_stream(request: AnalysisRequest):
+    if request.doc_id:
+        session = _get_session(request.doc_id)
+        return _sse_response(_once(lambda: _analyze_session(session)))
+    if not request.text:
+        raise HTTPException(status_code=400, detail="Text content is required")
+    return _sse_response(detector.analyze_document_stream(_redact(request.text)))
+
+@app.post("/simplify/stream")
+async def simplify_document_stream(request: AnalysisRequest):
+    if request.doc_id:
+        session = _get_session(request.doc_id)
+        return _sse_response(_once(lambda: _simplify_session(session)))
+    if not request.text:
+        raise HTTPException(status_code=400, detail="Text content is required")
+    return _sse_response(simplifier.simplify_text_stream(_redact(request.text)))
+
+@app.post("/voice/translate/stream")
+async def translate_advice_stream(request: TranslationRequest):
+    if request.doc_id and request.target_language:
+        session = _get_session(request.doc_id)
+        return _sse_response(_once(lambda: _translate_session(session, request.target_language)))
+    if not request.text or not request.target_language:
+         raise HTTPException(status_code=400, detail="Text and target language are required")
+    return _sse_response(voice.translate_to_mother_tongue_stream(request.text, request.target_language))
+
+# --- Guardian Mode: live voice over a WebSocket ---
+# Binary frames are audio for the speech-to-text backend; text frames are JSON messages
+# ({"type": "transcript", "text", "final"} from a browser recognizer, {"type": "end"}).
+# The server sends JSON events (ready, transcript, reply, sentence, turn_done, interrupted,
+# blocked, error, done) and binary frames with synthesized audio. See app/core/voice_stream.py.
+from app.core.voice_stream import VoiceSession
+
+@app.websocket("/voice/ws")
+async def voice_socket(websocket: WebSocket, language: str = "English"):
+    await websocket.accept()
+    session = VoiceSession(voice, language)
+
+    async def receive():
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return None
+        if message.get("bytes") is not None:
+            return message["bytes"]
+        try:
+            frame = json.loads(message.get("text") or "")
+        except ValueError:
+            return {"type": "invalid"}
+        return frame if isinstance(frame, dict) else {"type": "invalid"}
 
-# TTS Endpoint using gTTS - TEMPORARILY DISABLED DUE TO VENV ISSUE
-# from gTTS import gTTS
-# from fastapi.responses import StreamingResponse
-# import io
-# 
-# class SpeakRequest(BaseModel):
-#     text: str
-#     language: str
-# 
-# @app.post("/voice/speak")
-# def speak_text(request: SpeakRequest):
-#     if not request.text:
-#        raise HTTPException(status_code=400, detail="Text is required")
-#     
-#     # Map full language names to gTTS codes
-#     lang_map = {
-#         'Spanish': 'es', 'French': 'fr', 'Hindi': 'hi',
-#         'Tamil': 'ta', 'Telugu': 'te', 'Kannada': 'kn', 'Malayalam': 'ml',
-#         'Marathi': 'mr', 'Bengali': 'bn', 'Gujarati': 'gu', 'Punjabi': 'pa',
-#         'Chinese': 'zh-cn', 'Arabic': 'ar'
-#     }
-#     lang_code = lang_map.get(request.language, 'en')
-# 
-#     # Generate MP3 in memory
-#     tts = gTTS(text=request.text, lang=lang_code)
-#     mp3_fp = io.BytesIO()
-#     tts.write_to_fp(mp3_fp)
-#     mp3_fp.seek(0)
-#     
-#     return StreamingResponse(mp3_fp, media_type="audio/mpeg")
+    async def send(item):
+        if isinstance(item, bytes):
+            await websocket.send_bytes(item)
+        else:
+            await websocket.send_json(item)
+
+    try:
+        await session.run(receive, send)
+        await websocket.close()
+    except (WebSocketDisconnect, ConnectionError, RuntimeError):
+        # The client went away mid-session; nothing left to tell it
+        pass
+
+@app.post("/analyze/file/stream")
+async def analyze_file_stream(file: UploadFile = File(...)):
+    # Read the upload before responding; the file is closed once the handler returns
+    payload = await _flatten_upload(await _read_upload(file))
+    return _sse_response(detector.analyze_document_stream(**payload))
+
+@app.post("/simplify/file/stream")
+async def simplify_file_stream(file: UploadFile = File(...)):
+    payload = await _flatten_upload(await _read_upload(file), include_pdf_images=False)
+    return _sse_response(simplifier.simplify_text_stream(**payload))
+
+# --- One-shot pipeline ---
+# Extract once, analyze and simplify concurrently, then translate into every requested language in parallel.
+pipeline = DocumentPipeline(detector, simplifier, voice)
+
+class PipelineResponse(BaseModel):
+    analysis: Optional[str] = None
+    simplified: Optional[str] = None
+    translations: dict
+    errors: list[dict] = [] # one per failed part: {"section", "message", ...} as in /pipeline/stream
+
+def _parse_languages(languages: str) -> list:
+    parsed = list(dict.fromkeys(l.strip() for l in languages.split(",") if l.strip()))
+    if len(parsed) > MAX_PIPELINE_LANGUAGES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PIPELINE_LANGUAGES} languages per request")
+    return parsed
+
+def _pipeline_document(payload: dict) -> dict:
+    extraction = payload.get("pdf")
+    if extraction is None:
+        return payload
+    return {"pages": extraction.pages(), "image_loader": extraction.first_image}
+
+def _stage_error(part: dict) -> dict:
+    # A failed pipeline part: its section (and language) plus the error, as the SSE error events carry it
+    return {**{k: v for k, v in part.items() if k != "error"}, **_sse_error(part["error"])}
+
+@app.post("/pipeline", response_model=PipelineResponse)
+async def run_pipeline(file: UploadFile = File(...), languages: str = Form("")):
+    # languages: comma-separated, e.g. "Hindi, Tamil"
+    target_languages = _parse_languages(languages)
+    payload = await _read_upload(file)
+    extraction = payload.get("pdf")
+    try:
+        result = await pipeline.run(target_languages, **_pipeline_document(payload))
+    finally:
+        if extraction:
+            extraction.close()
+    result["errors"] = [_stage_error(part) for part in result["errors"]]
+    return PipelineResponse(**result)
+
+@app.post("/pipeline/stream")
+async def run_pipeline_stream(file: UploadFile = File(...), languages: str = Form("")):
+    """
+    Sends one "section" event per finished part ({"section", "text"} plus "language" for
+    translations) as soon as it is ready, or an "error" event for a part that failed
+    ({"section", "message", ...}), then "done".
+    """
+    target_languages = _parse_languages(languages)
+    payload = await _read_upload(file)
+    extraction = payload.get("pdf")
+
+    async def events():
+        try:
+            async for part in pipeline.stream(target_languages, **_pipeline_document(payload)):
+                if "error" in part:
+                    yield _sse("error", _stage_error(part))
+                else:
+                    yield _sse("section", part)
+            yield _sse("done", {})
+        except Exception as e:
+            yield _sse("error", _sse_error(e))
+        finally:
+            if extraction:
+                extraction.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Text-to-speech ---
+# Sentences are synthesized concurrently and streamed back in order, so playback starts after
+# the first one; each sentence's audio is cached. Backend: EQUALIZER_TTS_BACKEND, gTTS by default.
+class SpeakRequest(BaseModel):
+    text: str
+    language: str = "English"
+
+@app.post("/voice/speak")
+async def speak_text(request: SpeakRequest):
+    if not request.text.strip():
+        raise HTTPException(status_code=400, detail="Text is required")
+    audio = voice.speak_stream(request.text, request.language)
+    # Synthesize the first sentence before answering, so a missing or failing backend is an
+    # HTTP error rather than a truncated stream
+    try:
+        first = await audio.__anext__()
+    except StopAsyncIteration:
+        raise HTTPException(status_code=400, detail="Nothing to say")
+
+    async def chunks():
+        try:
+            yield first
+            async for chunk in audio:
+                yield chunk
+        finally:
+            await audio.aclose()
+
+    return StreamingResponse(chunks(), media_type=voice.speech.media_type, headers={"X-Accel-Buffering": "no"})
 
 # --- Phase 3: Action Engine ---
 from app.core.action_engine import ActionEngine
-import os
 action_engine = ActionEngine()
 
 class DocumentGenerationRequest(BaseModel):
     template_name: str # e.g., "parking_appeal_template.txt"
     region: str
     case_details: dict
+    rewrite: bool = True # False: use supplied narrative text verbatim (no model call if everything is filled in)
+    doc_id: Optional[str] = None # source document from /documents for facts the case details leave out
 
-@app.post("/action/generate", response_model=AnalysisResponse)
-def generate_document(request: DocumentGenerationRequest):
-    # Sanitize path to prevent directory traversal
-    template_path = os.path.join("app", "templates", os.path.basename(request.template_name))
-    
-    if not os.path.exists(template_path):
+def _get_template(name: str):
+    # Registry lookups are by file name only, which also prevents directory traversal
+    template = action_engine.templates.get(name)
+    if template is None:
         raise HTTPException(status_code=404, detail="Template not found")
+    return template
+
+@app.get("/action/templates")
+def list_templates():
+    return [template.describe() for template in action_engine.templates.list()]
+
+# Template suggestions from a local vector index over the templates (and precedents, with
+# EQUALIZER_PRECEDENTS_DIR): no model call, so a client can pick a template_name in milliseconds
+from app.core.vector_index import get_knowledge_index
+
+class SuggestRequest(BaseModel):
+    text: str = ""
+    doc_id: Optional[str] = None # a document uploaded to /documents, instead of text
+    k: int = 3
+
+@app.post("/action/suggest")
+def suggest_templates(request: SuggestRequest):
+    text = _get_session(request.doc_id).text if request.doc_id else request.text
+    if not text or not text.strip():
+        raise HTTPException(status_code=400, detail="Text content is required")
+    k = max(1, min(request.k, 20))
+    start = time.perf_counter()
+    knowledge_index = get_knowledge_index()
+    templates = []
+    for hit in knowledge_index.suggest_templates(text, k):
+        template = action_engine.templates.get(hit["template"])
+        if template is not None:
+            templates.append({**template.describe(), "score": hit["score"]})
+    precedents = knowledge_index.precedents(text, k)
+    return {"templates": templates, "precedents": precedents,
+            "query_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+@app.get("/action/index")
+def knowledge_index_stats():
+    return get_knowledge_index().stats()
+
+async def _generation_source(doc_id: Optional[str]) -> dict:
+    if not doc_id:
+        return {}
+    session = _get_session(doc_id)
+    return {"document": session.text, "context": await context_cache.model_for(session, action_engine.model_name)}
 
-    result = action_engine.generate_document(template_path, request.case_details, request.region)
+@app.post("/action/generate", response_model=AnalysisResponse)
+async def generate_document(request: DocumentGenerationRequest):
+    template = _get_template(request.template_name)
+    source = await _generation_source(request.doc_id)
+    result = await action_engine.generate_from_template_async(template, request.case_details, request.region,
+                                                              request.rewrite, **source)
     return AnalysisResponse(analysis=result)
 
-# --- Phase 4: Compliance ---
-from app.core.compliance import ComplianceManager
-compliance = ComplianceManager()
+@app.post("/action/generate/stream")
+async def generate_document_stream(request: DocumentGenerationRequest):
+    template = _get_template(request.template_name)
+    if request.doc_id:
+        source = await _generation_source(request.doc_id)
+        return _sse_response(_once(lambda: action_engine.generate_from_template_async(
+            template, request.case_details, request.region, request.rewrite, **source)))
+    return _sse_response(action_engine.generate_from_template_stream(template, request.case_details, request.region, request.rewrite))
+
+# --- Background jobs ---
+# Large documents can be queued instead of holding the connection open: submit returns 202 with
+# a job id, a local worker pool runs the job from a durable SQLite queue, and clients poll
+# /jobs/{id}, follow /jobs/{id}/events, or get a POST to their callback_url when it finishes.
+from app.core.jobs import (JobStore, JobWorker, JobInputError, track_pages, keep_input, check_callback_url, LANES,
+                           INTERACTIVE, BULK, INTERACTIVE_MAX_BYTES)
+
+job_store = JobStore()
+
+async def _run_file_job(job, progress, run_payload) -> str:
+    await progress(stage="extracting")
+    upload = SpooledUpload(job.input_path, job.params["size"], job.params["filename"], job.params.get("content_type"))
+    # Keep the input: a failed attempt is retried from the same file
+    payload = await _upload_payload(upload, keep_source=True)
+    await progress(stage="analyzing")
+    result = await run_payload(payload, wrap_pages=lambda pages: track_pages(pages, progress))
+    await progress(stage="done")
+    return result
+
+async def _run_generate_job(job, progress) -> str:
+    params = job.params
+    template = action_engine.templates.get(params["template_name"])
+    if template is None:
+        raise JobInputError("Template not found", status_code=404)
+    await progress(stage="generating")
+    return await action_engine.generate_from_template_async(template, params["case_details"], params["region"],
+                                                            params.get("rewrite", True))
+
+job_worker = JobWorker(job_store, {
+    "analyze": lambda job, progress: _run_file_job(job, progress, _analyze_payload),
+    "simplify": lambda job, progress: _run_file_job(job, progress, _simplify_payload),
+    "generate": _run_generate_job,
+})
+
+async def _check_job_options(callback_url: Optional[str], priority: Optional[str]):
+    if callback_url:
+        # Only public hosts (or EQUALIZER_CALLBACK_HOSTS): the server must not POST into its own network
+        try:
+            await asyncio.to_thread(check_callback_url, callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if priority and priority not in LANES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of: {', '.join(LANES)}")
+
+def _job_accepted(job) -> JSONResponse:
+    job_worker.notify()
+    body = job.to_dict()
+    body["status_url"] = f"/jobs/{job.id}"
+    return JSONResponse(status_code=202, content=body, headers={"Location": body["status_url"]})
 
+async def _submit_file_job(kind: str, request: Request, file: UploadFile, callback_url: Optional[str],
+                           priority: Optional[str]) -> JSONResponse:
+    _check_upload_type(file.filename)
+    await _check_job_options(callback_url, priority)
+    upload = await spool_upload(file)
+    try:
+        input_path = await asyncio.to_thread(keep_input, upload.path, job_store)
+    finally:
+        upload.close()
+    lane = priority or (INTERACTIVE if upload.size <= INTERACTIVE_MAX_BYTES else BULK)
+    params = {"filename": file.filename, "content_type": file.content_type, "size": upload.size}
+    job = await asyncio.to_thread(job_store.submit, kind, params, input_path, lane, callback_url,
+                                  request.headers.get("Idempotency-Key"))
+    if job.input_path != input_path:
+        # Idempotent resubmission: the job already has its own copy of the file
+        await asyncio.to_thread(os.remove, input_path)
+    return _job_accepted(job)
+
+@app.post("/jobs/analyze", status_code=202)
+async def submit_analyze_job(request: Request, file: UploadFile = File(...), callback_url: Optional[str] = Form(None),
+                             priority: Optional[str] = Form(None)):
+    return await _submit_file_job("analyze", request, file, callback_url, priority)
+
+@app.post("/jobs/simplify", status_code=202)
+async def submit_simplify_job(request: Request, file: UploadFile = File(...), callback_url: Optional[str] = Form(None),
+                              priority: Optional[str] = Form(None)):
+    return await _submit_file_job("simplify", request, file, callback_url, priority)
+
+class GenerationJobRequest(DocumentGenerationRequest):
+    callback_url: Optional[str] = None
+    priority: Optional[str] = None
+
+@app.post("/jobs/generate", status_code=202)
+async def submit_generate_job(request: Request, body: GenerationJobRequest):
+    _get_template(body.template_name)
+    if body.doc_id:
+        # Sessions live in one worker's memory; queued jobs must be self-contained
+        raise HTTPException(status_code=400, detail="doc_id is not supported for background jobs")
+    await _check_job_options(body.callback_url, body.priority)
+    params = {"template_name": body.template_name, "region": body.region, "case_details": body.case_details,
+              "rewrite": body.rewrite}
+    job = await asyncio.to_thread(job_store.submit, "generate", params, None, body.priority or INTERACTIVE,
+                                  body.callback_url, request.headers.get("Idempotency-Key"))
+    return _job_accepted(job)
+
+async def _get_job(job_id: str):
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return (await _get_job(job_id)).to_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-Sent Events: "progress" {status, progress} whenever either changes, then one
+    terminal "done" {result} or "failed" {error}.
+    """
+    await _get_job(job_id)
+
+    async def events():
+        last = None
+        while True:
+            job = await _get_job(job_id)
+            state = (job.status, job.progress)
+            if state != last:
+                last = state
+                yield _sse("progress", {"status": job.status, "progress": job.progress})
+            if job.status == "done":
+                yield _sse("done", {"result": job.result})
+                return
+            if job.status == "failed":
+                yield _sse("failed", {"error": {"message": job.error, "status": job.error_status}})
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/jobs")
+async def job_stats():
+    return await asyncio.to_thread(job_store.stats)
+
+# --- Batch ---
+# Many documents per request: JSON {"texts": [...], "ids": [...]} or multipart "files" (a .zip
+# among them is expanded to its documents). Items run concurrently through the shared model
+# client and extraction pool, and results stream back as NDJSON, one line per item in
+# completion order, then a final {"summary": ...} line. A failed item is reported in its
+# line; the rest of the batch carries on.
+from app.core.batch import BatchItem, run_batch, zip_members, extract_member, BATCH_MAX_ITEMS
+
+class BatchTextRequest(BaseModel):
+    texts: list[str]
+    ids: Optional[list[str]] = None
+
+def _text_item(item_id: str, text: str) -> BatchItem:
+    async def load():
+        return {"text_content": _redact(text)}
+    return BatchItem(item_id, load)
+
+def _file_item(upload: SpooledUpload) -> BatchItem:
+    async def load():
+        _check_upload_type(upload.filename)
+        return await _upload_payload(upload)
+    return BatchItem(upload.filename, load, cleanup=upload.close)
+
+def _zip_item(archive: SpooledUpload, info: zipfile.ZipInfo) -> BatchItem:
+    async def load():
+        _check_upload_type(info.filename)
+        return await _upload_payload(await extract_member(archive.path, info))
+    return BatchItem(f"{archive.filename}/{info.filename}", load)
+
+def _check_batch_size(items: list):
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_ITEMS} documents per batch")
+
+async def _batch_files(request: Request) -> tuple:
+    """
+    Spools the multipart files before the response starts (the form is closed once the handler
+    returns). Returns (items, archives); zip files stay on disk until the batch is finished.
+    """
+    items, archives = [], []
+    try:
+        async with request.form(max_files=BATCH_MAX_ITEMS, max_fields=BATCH_MAX_ITEMS) as form:
+            for file in form.getlist("files"):
+                if isinstance(file, str):
+                    raise HTTPException(status_code=400, detail="'files' must be file uploads")
+                if file.filename.lower().endswith(".zip"):
+                    archive = await spool_upload(file, BATCH_MAX_BYTES)
+                    archives.append(archive)
+                    try:
+                        members = await asyncio.to_thread(zip_members, archive.path)
+                    except zipfile.BadZipFile:
+                        raise HTTPException(status_code=400, detail=f"{file.filename} is not a valid zip file")
+                    items.extend(_zip_item(archive, info) for info in members)
+                else:
+                    items.append(_file_item(await spool_upload(file)))
+                if len(items) > BATCH_MAX_ITEMS:
+                    break
+        _check_batch_size(items)
+    except BaseException:
+        for upload in archives:
+            upload.close()
+        for item in items:
+            if item.cleanup:
+                item.cleanup()
+        raise
+    return items, archives
+
+async def _batch_items(request: Request) -> tuple:
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        return await _batch_files(request)
+    try:
+        body = BatchTextRequest(**await request.json())
+    except ValueError as e:
+        # JSONDecodeError and pydantic's ValidationError are both ValueErrors
+        detail = e.errors() if isinstance(e, ValidationError) else "Body must be JSON or multipart/form-data"
+        raise HTTPException(status_code=422, detail=detail)
+    if body.ids is not None and len(body.ids) != len(body.texts):
+        raise HTTPException(status_code=422, detail="ids must match texts one to one")
+    ids = body.ids or [str(i) for i in range(len(body.texts))]
+    items = [_text_item(item_id, text) for item_id, text in zip(ids, body.texts)]
+    _check_batch_size(items)
+    return items, []
+
+def _batch_response(items: list, archives: list, process) -> StreamingResponse:
+    async def lines():
+        start = time.perf_counter()
+        failed = 0
+        try:
+            async for out in run_batch(items, process):
+                failed += not out["ok"]
+                yield json.dumps(out) + "\n"
+            seconds = time.perf_counter() - start
+            yield json.dumps({"summary": {"items": len(items), "failed": failed, "seconds": round(seconds, 3)}}) + "\n"
+        finally:
+            for upload in archives:
+                upload.close()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+@app.post("/batch/analyze")
+async def batch_analyze(request: Request):
+    items, archives = await _batch_items(request)
+    return _batch_response(items, archives, _analyze_payload)
+
+@app.post("/batch/simplify")
+async def batch_simplify(request: Request):
+    items, archives = await _batch_items(request)
+    return _batch_response(items, archives, _simplify_payload)
+
+# --- Response Cache ---
+from app.core.cache import response_cache
+
+@app.get("/cache/stats")
+def cache_stats():
+    return response_cache.stats()
+
+# --- Model Routing ---
+# Per route and model: calls, fallbacks, latency percentiles, tokens and estimated cost
+# (EQUALIZER_ROUTING_POLICY sets the tiers, rules and prices)
+from app.core.routing import model_router
+
+@app.get("/routing/stats")
+def routing_stats():
+    return model_router.stats()
+
+# --- Translation Memory ---
+from app.core.cache import translation_memory
+
+@app.get("/voice/translate/memory")
+def translation_memory_stats():
+    return translation_memory.stats()
+
+# --- Phase 4: Compliance ---
 @app.post("/compliance/redact", response_model=AnalysisResponse)
 def redact_pii(request: AnalysisRequest):
      result = compliance.redact_pii(request.text)
      return AnalysisResponse(analysis=result)
 
+class BatchRedactionRequest(BaseModel):
+    texts: list[str]
+
+class BatchRedactionResponse(BaseModel):
+    redacted: list[str]
+
+@app.post("/compliance/redact/batch", response_model=BatchRedactionResponse)
+def redact_pii_batch(request: BatchRedactionRequest):
+     return BatchRedactionResponse(redacted=compliance.redact_batch(request.texts))
+
+# --- Metrics ---
+# Prometheus text format. Model latency, prompt sizes, stream TTFB, retries and hedges,
+# cache lookups, extraction time per page, pool queueing and redaction time, plus per-route
+# request counts and durations. EQUALIZER_METRICS=0 turns collection off.
+
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+# Added last so it wraps every other middleware (413s and deadline errors are counted too)
+app.add_middleware(metrics.MetricsMiddleware)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -21,6 +21,85 @@ function openTab(tabId) {
     }
 }
 
+// Streaming Helper (Server-Sent Events over fetch, since EventSource only supports GET)
+// Calls onText(fullTextSoFar) after every chunk and resolves with the final text.
+async function streamPost(url, body, onText) {
+    const options = { method: 'POST', body: body };
+    if (!(body instanceof FormData)) {
+        options.headers = { 'Content-Type': 'application/json' };
+        options.body = JSON.stringify(body);
+    }
+
+    const response = await fetch(url, options);
+    if (!response.ok) {
+        const error = await response.json().catch(() => ({}));
+        return "Error: " + (error.detail || response.statusText);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            const payload = data ? JSON.parse(data) : {};
+
+            if (event === 'chunk') {
+                text += payload.text;
+                onText(text);
+            } else if (event === 'blocked') {
+                return text + "\n\nError: Response blocked due to safety reason: " + payload.reason;
+            } else if (event === 'error') {
+                return text + "\n\nError: " + payload.message;
+            } else if (event === 'done') {
+                return text;
+            }
+        }
+    }
+    return text;
+}
+
+// Renders a streamed response into a result box as it arrives
+async function streamInto(url, body, resultBox, render = formatOutput) {
+    setLoading(true);
+    let started = false;
+    try {
+        const text = await streamPost(url, body, partial => {
+            if (!started) {
+                started = true;
+                setLoading(false);
+                resultBox.classList.remove('hidden');
+            }
+            resultBox.innerHTML = render(partial);
+        });
+        if (!started) setLoading(false);
+        resultBox.classList.remove('hidden');
+        resultBox.innerHTML = render(text);
+        return text;
+    } catch (error) {
+        setLoading(false);
+        resultBox.classList.remove('hidden');
+        resultBox.innerHTML = "Error: Could not connect to the server.";
+        return null;
+    }
+}
+
 // New File Upload Logic
 async function uploadFile(url, fileInputId, resultBoxId) {
     const fileInput = document.getElementById(fileInputId);
@@ -32,31 +111,19 @@ async function uploadFile(url, fileInputId, resultBoxId) {
     const formData = new FormData();
     formData.append("file", fileInput.files[0]);
 
-    setLoading(true);
     const resultBox = document.getElementById(resultBoxId);
-
-    try {
-        const response = await fetch(url, {
-            method: 'POST',
-            body: formData
-        });
-        const result = await response.json();
-        setLoading(false);
-        resultBox.classList.remove('hidden');
-        resultBox.innerHTML = formatOutput(result.analysis);
-    } catch (error) {
-        setLoading(false);
-        resultBox.classList.remove('hidden');
+    const text = await streamInto(url, formData, resultBox);
+    if (text === null) {
         resultBox.innerHTML = "Error: Could not upload or process file.";
     }
 }
 
 async function analyzeFile() {
-    await uploadFile('/analyze/file', 'analyze-file', 'analyze-result');
+    await uploadFile('/analyze/file/stream', 'analyze-file', 'analyze-result');
 }
 
 async function simplifyFile() {
-    await uploadFile('/simplify/file', 'simplify-file', 'simplify-result');
+    await uploadFile('/simplify/file/stream', 'simplify-file', 'simplify-result');
 }
 
 // API Helper
@@ -121,11 +188,8 @@ async function analyzeDocument() {
 
     if (!text) { alert("Please enter text!"); return; }
 
-    const response = await postData('/analyze', { text: text });
-    resultBox.classList.remove('hidden');
-    // Convert markdown (simple) to HTML ideally, but for now text
-    // We replace newlines with <br> for basic formatting
-    resultBox.innerHTML = formatOutput(response.analysis);
+    // Output is rendered incrementally as the model streams it
+    await streamInto('/analyze/stream', { text: text }, resultBox);
 }
 
 // 2. Simplify
@@ -135,9 +199,7 @@ async function simplifyDocument() {
 
     if (!text) { alert("Please enter text!"); return; }
 
-    const response = await postData('/simplify', { text: text });
-    resultBox.classList.remove('hidden');
-    resultBox.innerHTML = formatOutput(response.analysis);
+    await streamInto('/simplify/stream', { text: text }, resultBox);
 }
 
 // 3. Voice
@@ -148,41 +210,157 @@ async function translateVoice() {
 
     if (!text) { alert("Please enter text!"); return; }
 
-    const response = await postData('/voice/translate', { text: text, target_language: lang });
+    // Display Text (streamed)
+    const header = `<p><strong>Translation (${lang}):</strong> <button class="icon-btn" onclick="speakText('${lang}')"><i class="fa-solid fa-volume-high"></i> Listen</button></p>`;
+    const translation = await streamInto('/voice/translate/stream', { text: text, target_language: lang }, resultBox,
+        partial => header + formatOutput(partial));
 
-    // Display Text
-    resultBox.classList.remove('hidden');
-    resultBox.innerHTML = `<p><strong>Translation (${lang}):</strong> <button class="icon-btn" onclick="speakText('${lang}')"><i class="fa-solid fa-volume-high"></i> Listen</button></p>` + formatOutput(response.analysis);
-
-    // Speak Audio
-    // We store the text to speak in a global variable or pass it, but simpler to just read from the response
-    window.currentTranslation = response.analysis;
+    // Speak Audio once the full translation has arrived
+    window.currentTranslation = translation;
     speakText(lang);
 }
 
-function speakText(language) {
+let currentAudio = null;
+
+async function speakText(language) {
     if (!window.currentTranslation) return;
 
-    // Using browser's built-in TTS (temporary - gTTS integration pending)
     window.speechSynthesis.cancel();
+    if (currentAudio) { currentAudio.pause(); currentAudio = null; }
+
+    // Server voice (/voice/speak streams it sentence by sentence); the browser's voice if it is unavailable
+    try {
+        const response = await fetch('/voice/speak', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ text: window.currentTranslation, language: language })
+        });
+        if (response.ok) {
+            currentAudio = await playAudioStream(response);
+            return;
+        }
+    } catch (e) {
+        console.warn("Server speech unavailable:", e);
+    }
 
     const utterance = new SpeechSynthesisUtterance(window.currentTranslation);
 
-    const langMap = {
-        'Spanish': 'es-ES', 'French': 'fr-FR', 'Hindi': 'hi-IN',
-        'Tamil': 'ta-IN', 'Telugu': 'te-IN', 'Kannada': 'kn-IN',
-        'Malayalam': 'ml-IN', 'Marathi': 'mr-IN', 'Bengali': 'bn-IN',
-        'Gujarati': 'gu-IN', 'Punjabi': 'pa-IN',
-        'Chinese': 'zh-CN', 'Arabic': 'ar-SA'
-    };
+    setVoice(utterance, language);
+    window.speechSynthesis.speak(utterance);
+}
+
+async function playAudioStream(response) {
+    const type = response.headers.get('Content-Type');
+    const audio = new Audio();
+    if (!window.MediaSource || !MediaSource.isTypeSupported(type)) {
+        // Plays once everything has arrived
+        audio.src = URL.createObjectURL(await response.blob());
+        audio.play();
+        return audio;
+    }
+
+    // Starts playing with the first sentence's audio while the rest is still arriving
+    const source = new MediaSource();
+    audio.src = URL.createObjectURL(source);
+    await new Promise(resolve => source.addEventListener('sourceopen', resolve, { once: true }));
+    const buffer = source.addSourceBuffer(type);
+    const reader = response.body.getReader();
+    audio.play();
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer.appendBuffer(value);
+        await new Promise(resolve => buffer.addEventListener('updateend', resolve, { once: true }));
+    }
+    source.endOfStream();
+    return audio;
+}
+
+const LANG_CODES = {
+    'Spanish': 'es-ES', 'French': 'fr-FR', 'Hindi': 'hi-IN',
+    'Tamil': 'ta-IN', 'Telugu': 'te-IN', 'Kannada': 'kn-IN',
+    'Malayalam': 'ml-IN', 'Marathi': 'mr-IN', 'Bengali': 'bn-IN',
+    'Gujarati': 'gu-IN', 'Punjabi': 'pa-IN',
+    'Chinese': 'zh-CN', 'Arabic': 'ar-SA'
+};
 
-    utterance.lang = langMap[language] || 'en-US';
+function setVoice(utterance, language) {
+    utterance.lang = LANG_CODES[language] || 'en-US';
 
     const voices = window.speechSynthesis.getVoices();
     const specificVoice = voices.find(v => v.lang.includes(utterance.lang));
     if (specificVoice) utterance.voice = specificVoice;
+}
 
-    window.speechSynthesis.speak(utterance);
+// Guardian Mode: live advice during a call over /voice/ws. The browser transcribes what it
+// hears (Web Speech API) and streams the transcripts; advice comes back sentence by sentence
+// and is spoken as soon as each sentence is complete. Talking again interrupts the advice.
+let guardian = null;
+
+function toggleGuardian() {
+    if (guardian) { stopGuardian(); return; }
+
+    const Recognition = window.SpeechRecognition || window.webkitSpeechRecognition;
+    if (!Recognition) { alert("Live speech recognition is not supported in this browser."); return; }
+
+    const lang = document.getElementById('voice-lang').value;
+    const resultBox = document.getElementById('guardian-result');
+    const button = document.getElementById('guardian-btn');
+    const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    const socket = new WebSocket(`${protocol}://${window.location.host}/voice/ws?language=${encodeURIComponent(lang)}`);
+    const recognition = new Recognition();
+    recognition.continuous = true;
+    recognition.interimResults = true;
+    guardian = { socket, recognition };
+
+    let heard = '';
+    let advice = '';
+    const render = () => {
+        resultBox.innerHTML = `<p><strong>Heard:</strong> ${heard}</p><p><strong>Advice (${lang}):</strong> ${formatOutput(advice)}</p>`;
+    };
+    resultBox.classList.remove('hidden');
+    button.innerHTML = '<i class="fa-solid fa-stop"></i> Stop Guardian Mode';
+
+    recognition.onresult = event => {
+        const result = event.results[event.results.length - 1];
+        socket.send(JSON.stringify({ type: 'transcript', text: result[0].transcript, final: result.isFinal }));
+    };
+    // Recognition stops on its own after a silence; keep listening while the mode is on
+    recognition.onend = () => { if (guardian && guardian.recognition === recognition) recognition.start(); };
+
+    socket.onopen = () => recognition.start();
+    socket.onmessage = message => {
+        if (typeof message.data !== 'string') return;  // audio frames, when a server TTS is configured
+        const event = JSON.parse(message.data);
+        if (event.type === 'transcript') {
+            heard = event.text;
+        } else if (event.type === 'reply') {
+            advice += event.text;
+        } else if (event.type === 'sentence') {
+            const utterance = new SpeechSynthesisUtterance(event.text);
+            setVoice(utterance, lang);
+            window.speechSynthesis.speak(utterance);
+        } else if (event.type === 'interrupted') {
+            window.speechSynthesis.cancel();
+        } else if (event.type === 'turn_done') {
+            advice += '\n\n';
+        } else if (event.type === 'blocked') {
+            advice += "\n\nError: Response blocked due to safety reason: " + event.reason;
+        } else if (event.type === 'error') {
+            advice += "\n\nError: " + event.message;
+        }
+        render();
+    };
+    socket.onclose = () => stopGuardian();
+}
+
+function stopGuardian() {
+    if (!guardian) return;
+    const { socket, recognition } = guardian;
+    guardian = null;
+    recognition.stop();
+    if (socket.readyState === WebSocket.OPEN) socket.send(JSON.stringify({ type: 'end' }));
+    document.getElementById('guardian-btn').innerHTML = '<i class="fa-solid fa-shield-halved"></i> Start Guardian Mode (live call)';
 }
 
 // 4. Action
@@ -288,14 +466,11 @@ async function generateDocument() {
         details[placeholder] = input.value;
     });
 
-    const response = await postData('/action/generate', {
+    await streamInto('/action/generate/stream', {
         template_name: template,
         region: region,
         case_details: details
-    });
-
-    resultBox.classList.remove('hidden');
-    resultBox.innerHTML = `<pre>${response.analysis}</pre>`;
+    }, resultBox, partial => `<pre>${partial}</pre>`);
 }
 
 function formatOutput(text) {
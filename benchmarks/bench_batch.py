@@ -0,0 +1,85 @@
+"""
+Batch throughput: documents per minute through /batch/analyze against a mock model, compared
+with a client posting the same documents one at a time to /analyze.
+
+The mock answers after a fixed latency (default 200 ms), so the numbers show how much of the
+model wait the batch overlaps, not Gemini's speed. Every document is distinct, so the response
+cache never short-circuits a call.
+
+    python benchmarks/bench_batch.py                 # 200 documents, 200 ms per model call
+    python benchmarks/bench_batch.py 1000 0.5
+"""
+import sys
+import os
+import io
+import json
+import time
+import asyncio
+import zipfile
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from app import main
+from app.core.batch import BATCH_CONCURRENCY
+from app.core.cache import ResponseCache
+from app.core.model_client import ModelClient
+from app.core.fakes import FakeModel
+
+
+def documents(count: int, offset: int) -> list:
+    return [f"Lease {offset + i}: the deposit of ${500 + i} is non-refundable and rent rises 10% yearly."
+            for i in range(count)]
+
+
+async def sequential(http, texts) -> int:
+    for text in texts:
+        response = await http.post("/analyze", json={"text": text})
+        response.raise_for_status()
+    return len(texts)
+
+
+async def batch_texts(http, texts) -> int:
+    response = await http.post("/batch/analyze", json={"texts": texts})
+    return sum(1 for line in response.text.splitlines() if json.loads(line).get("ok"))
+
+
+async def batch_zip(http, texts) -> int:
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as z:
+        for i, text in enumerate(texts):
+            z.writestr(f"lease-{i}.txt", text)
+    files = {"files": ("leases.zip", archive.getvalue(), "application/zip")}
+    response = await http.post("/batch/analyze", files=files)
+    return sum(1 for line in response.text.splitlines() if json.loads(line).get("ok"))
+
+
+async def run(count: int, latency: float):
+    fake = FakeModel(latency=latency, reply="- Red flag: deposit is non-refundable")
+    main.detector.client = ModelClient("fake-model", model=fake)
+    rows = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        # The sequential client is slow by design; a smaller sample gives the same rate
+        modes = [("one /analyze per document", sequential, min(count, 50)),
+                 ("/batch/analyze, JSON texts", batch_texts, count),
+                 ("/batch/analyze, zip upload", batch_zip, count)]
+        for offset, (name, call, n) in enumerate(modes):
+            main.detector.cache = ResponseCache()
+            fake.peak_in_flight = 0
+            start = time.perf_counter()
+            done = await call(http, documents(n, offset * count))
+            seconds = time.perf_counter() - start
+            rows.append({"case": name, "documents": done, "docs_per_min": round(done / seconds * 60),
+                         "peak_in_flight": fake.peak_in_flight})
+            print(f"{name:<28} {done:>5} docs  {seconds:7.2f}s  {done / seconds * 60:9.0f} docs/min  "
+                  f"peak model calls in flight {fake.peak_in_flight}")
+    return rows
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    print(f"mock model latency {latency * 1000:.0f} ms, batch concurrency {BATCH_CONCURRENCY}\n")
+    asyncio.run(run(count, latency))
@@ -0,0 +1,266 @@
+"""
+Concurrent-request throughput of every endpoint against a fake Gemini backend (no network).
+
+Each endpoint gets `requests` distinct requests from `concurrency` concurrent clients over the
+in-process ASGI transport, with an empty response cache, so every request pays for its model
+calls. The fake answers after a log-normal latency (median and p99 below, seeded) with text
+derived from the prompt, streaming 4 words every 20 ms. Reported per endpoint: requests/s,
+latency percentiles, server-side time to the first streamed byte, failures, and peak Python memory
+(tracemalloc) over a smaller second pass.
+
+    python benchmarks/bench_endpoints.py                     # 200 requests, 50 concurrent, 50 ms median
+    python benchmarks/bench_endpoints.py 1000 200 0.2        # requests, concurrency, median latency (s)
+    python benchmarks/bench_endpoints.py 200 50 0.05 analyze # only endpoints whose name contains "analyze"
+"""
+import sys
+import os
+import re
+import json
+import time
+import asyncio
+import tempfile
+import statistics
+import tracemalloc
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from app import main
+from app.core.cache import ResponseCache
+from app.core.jobs import JobStore
+from app.core.model_client import ModelClient
+from app.core.fakes import FakeModel, lognormal_latency, digest_reply
+
+ENGINES = (main.detector, main.simplifier, main.voice, main.action_engine)
+CLAUSES = "\n\n".join(f"Section {n}. The tenant shall pay a fee of ${n * 25} if rent is late by {n} days."
+                      for n in range(1, 7))
+
+
+def document(i: int) -> str:
+    return f"Lease {i}. {CLAUSES}\n\nContact the landlord at landlord{i}@example.com or 555-010-{i % 10000:04d}."
+
+
+def pdf_bytes(i: int, pages: int = 3) -> bytes:
+    try:
+        import fitz  # PyMuPDF
+    except ImportError:
+        return None
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(40, 40, 560, 800), f"Page {page_number + 1}. {document(i)}", fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def upload(i: int, field: str = "file") -> dict:
+    # A distinct PDF per request (plain text if PyMuPDF is missing), so the cache never answers
+    data = pdf_bytes(i)
+    if data is None:
+        return {field: (f"lease-{i}.txt", document(i).encode(), "text/plain")}
+    return {field: (f"lease-{i}.pdf", data, "application/pdf")}
+
+
+def case_details(i: int) -> dict:
+    template = main.action_engine.templates.get("parking_appeal_template.txt")
+    return {field: f"{field} {i}" for field in template.fields}
+
+
+async def create_session(http, i: int) -> str:
+    response = await http.post("/documents", files=upload(i))
+    return response.json()["doc_id"]
+
+
+async def analyze_session(http, i: int) -> httpx.Response:
+    return await http.post("/analyze", json={"doc_id": await create_session(http, i)})
+
+
+async def run_job(http, i: int) -> httpx.Response:
+    # Submission to finished job, polling like a client would
+    response = await http.post("/jobs/analyze", files=upload(i))
+    status_url = response.json()["status_url"]
+    while True:
+        response = await http.get(status_url)
+        if response.json()["status"] in ("done", "failed"):
+            return response
+        await asyncio.sleep(0.01)
+
+
+# Request specs: i -> (method, path, httpx keyword arguments)
+def post(path: str, body):
+    return lambda i: ("POST", path, {"json": body(i)})
+
+
+def post_file(path: str, **form):
+    return lambda i: ("POST", path, {"files": upload(i), "data": form})
+
+
+def get(path: str):
+    return lambda i: ("GET", path, {})
+
+
+def texts(i: int) -> dict:
+    return {"texts": [document(i * 10 + n) for n in range(10)]}
+
+
+def generation(i: int) -> dict:
+    return {"template_name": "parking_appeal_template.txt", "region": "Global", "case_details": case_details(i)}
+
+
+# (name, request spec or async flow(http, i) -> last response, streamed)
+ENDPOINTS = [
+    ("POST /analyze", post("/analyze", lambda i: {"text": document(i)}), False),
+    ("POST /analyze/stream", post("/analyze/stream", lambda i: {"text": document(i)}), True),
+    ("POST /analyze/clauses", post("/analyze/clauses", lambda i: {"text": document(i)}), False),
+    ("POST /analyze/file", post_file("/analyze/file"), False),
+    ("POST /analyze/file/stream", post_file("/analyze/file/stream"), True),
+    ("POST /simplify", post("/simplify", lambda i: {"text": document(i)}), False),
+    ("POST /simplify/stream", post("/simplify/stream", lambda i: {"text": document(i)}), True),
+    ("POST /simplify/file", post_file("/simplify/file"), False),
+    ("POST /voice/translate", post("/voice/translate", lambda i: {"text": document(i), "target_language": "Hindi"}),
+     False),
+    ("POST /voice/translate/stream",
+     post("/voice/translate/stream", lambda i: {"text": document(i), "target_language": "Hindi"}), True),
+    ("POST /pipeline", post_file("/pipeline", languages="Hindi, Tamil"), False),
+    ("POST /pipeline/stream", post_file("/pipeline/stream", languages="Hindi, Tamil"), True),
+    ("POST /action/generate", post("/action/generate", generation), False),
+    ("POST /action/generate/stream", post("/action/generate/stream", generation), True),
+    ("POST /documents", post_file("/documents"), False),
+    ("POST /documents + /analyze doc_id", analyze_session, False),
+    ("POST /batch/analyze (10 texts)", post("/batch/analyze", texts), False),
+    ("POST /batch/simplify (10 texts)", post("/batch/simplify", texts), False),
+    ("POST /jobs/analyze until done", run_job, False),
+    ("POST /compliance/redact", post("/compliance/redact", lambda i: {"text": document(i)}), False),
+    ("POST /compliance/redact/batch", post("/compliance/redact/batch", texts), False),
+    ("GET /action/templates", get("/action/templates"), False),
+    ("GET /cache/stats", get("/cache/stats"), False),
+    ("GET /metrics", get("/metrics"), False),
+]
+
+# Failures reported inside a 200: an SSE error event, an NDJSON batch item, a failed job
+FAILED_BODY = re.compile(rb'event: error|"ok":\s*false|"status":\s*"failed"')
+
+
+class FirstByteTimer:
+    """
+    ASGI wrapper timing each request's first non-empty body message. httpx's ASGI transport
+    hands the client the whole body at once, so time to first byte is taken server-side.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.samples = []
+
+    async def __call__(self, scope, receive, send):
+        start = time.perf_counter()
+        pending = [True]
+
+        async def timed_send(message):
+            if pending[0] and message["type"] == "http.response.body" and message.get("body"):
+                pending[0] = False
+                self.samples.append(time.perf_counter() - start)
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+
+async def timed(http, request, i: int) -> tuple:
+    """
+    Returns (seconds, succeeded) for one request (or flow of requests).
+    """
+    start = time.perf_counter()
+    if asyncio.iscoroutinefunction(request):
+        response = await request(http, i)
+    else:
+        method, path, kwargs = request(i)
+        response = await http.request(method, path, **kwargs)
+    ok = response.status_code < 400 and not FAILED_BODY.search(response.content)
+    return time.perf_counter() - start, ok
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+async def load(http, timer: FirstByteTimer, request, streamed: bool, count: int, concurrency: int,
+               offset: int) -> dict:
+    indexes = iter(range(offset, offset + count))
+    samples = []
+
+    async def client():
+        for i in indexes:
+            samples.append(await timed(http, request, i))
+
+    timer.samples = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(min(concurrency, count))))
+    wall = time.perf_counter() - start
+    latencies = [s[0] * 1000 for s in samples]
+    row = {
+        "requests": count,
+        "failed": sum(1 for s in samples if not s[1]),
+        "requests_per_s": round(count / wall, 1),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+    }
+    if streamed:
+        row["ttfb_p50_ms"] = round(statistics.median(timer.samples) * 1000, 1)
+    return row
+
+
+async def run(count: int, concurrency: int, latency: float, only: str = None) -> list:
+    fake = FakeModel(latency=lognormal_latency(latency, latency * 4), reply=digest_reply(60),
+                     chunk_delay=0.02, chunk_words=4)
+    originals = [(engine.client, engine.cache) for engine in ENGINES]
+    store = (main.job_store, main.job_worker.store)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        main.job_store = main.job_worker.store = JobStore(tmp)
+        timer = FirstByteTimer(main.app)
+        transport = httpx.ASGITransport(app=timer)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+            main.job_worker.start()
+            try:
+                for number, (name, request, streamed) in enumerate(ENDPOINTS):
+                    if only and only not in name:
+                        continue
+                    for engine in ENGINES:
+                        engine.client = ModelClient(engine.client.model_name, model=fake)
+                        engine.cache = ResponseCache()
+                    fake.calls = fake.peak_in_flight = 0
+                    row = {"case": name, **await load(http, timer, request, streamed, count, concurrency,
+                                                      offset=number * 1_000_000)}
+                    row["model_calls"] = fake.calls
+
+                    # Second, smaller pass under tracemalloc (it slows everything down)
+                    tracemalloc.start()
+                    await load(http, timer, request, streamed, max(1, count // 5), concurrency,
+                               offset=number * 1_000_000 + 500_000)
+                    row["peak_alloc_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+                    tracemalloc.stop()
+                    rows.append(row)
+                    print(f"{name:<36} {row['requests_per_s']:>8.1f} req/s  p50 {row['p50_ms']:>7.1f} ms  "
+                          f"p99 {row['p99_ms']:>7.1f} ms  failed {row['failed']:>3}  "
+                          f"peak alloc {row['peak_alloc_mb']:>6.2f} MB")
+            finally:
+                await main.job_worker.stop()
+                main.job_store, main.job_worker.store = store
+                for engine, (client, cache) in zip(ENGINES, originals):
+                    engine.client, engine.cache = client, cache
+    return rows
+
+
+def benchmark(count: int = 200, concurrency: int = 50, latency: float = 0.05, only: str = None) -> list:
+    print(f"fake model: median {latency * 1000:.0f} ms, p99 {latency * 4000:.0f} ms; "
+          f"{count} requests per endpoint, {concurrency} concurrent\n")
+    return asyncio.run(run(count, concurrency, latency, only))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    rows = benchmark(int(args[0]) if len(args) > 0 else 200, int(args[1]) if len(args) > 1 else 50,
+                   float(args[2]) if len(args) > 2 else 0.05, args[3] if len(args) > 3 else None)
+    print(json.dumps(rows, indent=2))
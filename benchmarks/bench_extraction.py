@@ -0,0 +1,110 @@
+"""
+PDF extraction benchmark: the old inline loop from main.py vs the PdfExtraction pipeline.
+
+Each measurement runs in a fresh subprocess so CPU time and peak RSS are not polluted by
+earlier runs. CPU time includes the extraction worker processes.
+
+    python benchmarks/bench_extraction.py            # 10, 100 and 1000 pages
+    python benchmarks/bench_extraction.py 50 500
+"""
+import sys
+import os
+import json
+import time
+import asyncio
+import resource
+import subprocess
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def make_pdf(path: str, pages: int):
+    import fitz  # PyMuPDF
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 600, 800), False)
+    pixmap.set_rect(pixmap.irect, (240, 240, 240))
+    logo = pixmap.tobytes("png")
+    doc = fitz.open()
+    paragraph = "The insured shall notify the insurer of any change in circumstances within 30 days. " * 25
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(40, 120, 560, 800), f"Section {i + 1}. {paragraph}", fontsize=9)
+        # Letterhead logo repeated on every page (one shared xref)
+        page.insert_image(fitz.Rect(40, 30, 160, 110), stream=logo)
+    doc.save(path, garbage=4, deflate=True)
+    doc.close()
+
+
+def legacy(pdf_content: bytes):
+    # The original analyze_file loop
+    import fitz  # PyMuPDF
+    doc = fitz.open(stream=pdf_content, filetype="pdf")
+    text_content = ""
+    image_parts = []
+    for page in doc:
+        text_content += page.get_text()
+        for img in page.get_images(full=True):
+            base_image = doc.extract_image(img[0])
+            image_parts.append({"mime_type": f"image/{base_image['ext']}", "data": base_image["image"]})
+    return len(text_content), len(image_parts)
+
+
+def pipeline(pdf_content: bytes):
+    from app.core.extraction import PdfExtraction, shutdown_extraction_pool
+
+    async def run():
+        extraction = PdfExtraction(pdf_content)
+        try:
+            text = await extraction.text()
+            images = await extraction.images(limit=1)
+            return len(text), len(images)
+        finally:
+            extraction.close()
+    try:
+        return asyncio.run(run())
+    finally:
+        # Wait for the workers so their CPU time shows up in RUSAGE_CHILDREN
+        shutdown_extraction_pool(wait=True)
+
+
+def measure(mode: str, path: str) -> dict:
+    with open(path, "rb") as f:
+        pdf_content = f.read()
+    start = time.perf_counter()
+    chars, images = (legacy if mode == "legacy" else pipeline)(pdf_content)
+    wall = time.perf_counter() - start
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "mode": mode,
+        "wall_s": round(wall, 3),
+        "cpu_s": round(own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime, 3),
+        "peak_rss_mb": round(max(own.ru_maxrss, children.ru_maxrss) / 1024, 1),
+        "chars": chars,
+        "images_decoded": images,
+    }
+
+
+def main(sizes):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in sizes:
+            path = os.path.join(tmp, f"{pages}.pdf")
+            make_pdf(path, pages)
+            for mode in ("legacy", "pipeline"):
+                out = subprocess.run([sys.executable, __file__, "--measure", mode, path],
+                                     capture_output=True, text=True, check=True)
+                row = {"case": f"{mode} {pages} pages", **json.loads(out.stdout.strip().splitlines()[-1])}
+                row["pages"] = pages
+                results.append(row)
+                print(f"{pages:>5} pages  {mode:<8}  wall {row['wall_s']:>7.3f}s  cpu {row['cpu_s']:>7.3f}s  "
+                      f"peak RSS {row['peak_rss_mb']:>7.1f} MB  images decoded {row['images_decoded']}")
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--measure":
+        print(json.dumps(measure(sys.argv[2], sys.argv[3])))
+    else:
+        main([int(a) for a in sys.argv[1:]] or [10, 100, 1000])
@@ -0,0 +1,142 @@
+"""
+Image bytes sent to the model before and after optimization (downscale, grayscale for
+documents, JPEG recompression, metadata stripped), and the time it takes per image.
+
+Cases: a 12 MP phone photo of a lease, a color phone photo, a phone screenshot (PNG), and a
+mixed PDF (text pages with a letterhead photo, plus scanned pages) where only the scanned
+pages' images are candidates once the text layer is used.
+
+    python benchmarks/bench_images.py           # 5 runs per case
+    python benchmarks/bench_images.py 20
+"""
+import sys
+import os
+import json
+import time
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core import images
+from app.core.extraction import PdfExtraction, shutdown_extraction_pool
+
+LEASE = ("The tenant shall pay a late fee of $75 for any rent received after the fifth day of the month, "
+         "and the security deposit is non-refundable. ") * 30
+
+
+def render(page_width: float, page_height: float, dpi: int, draw, output: str = "jpeg") -> bytes:
+    import fitz  # PyMuPDF
+    doc = fitz.open()
+    page = doc.new_page(width=page_width, height=page_height)
+    draw(fitz, page)
+    pixmap = page.get_pixmap(dpi=dpi)
+    data = pixmap.tobytes("png") if output == "png" else pixmap.tobytes("jpeg", jpg_quality=92)
+    doc.close()
+    return data
+
+
+def with_exif(jpeg: bytes, size: int = 24 * 1024) -> bytes:
+    # Phone JPEGs carry tens of KB of EXIF (camera, GPS, thumbnail); a comment segment stands in for it
+    comment = b"GPS 37.7749,-122.4194 " + bytes(size)
+    return jpeg[:2] + images._orientation_segment(6) + b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment + jpeg[2:]
+
+
+def document_photo() -> bytes:
+    # A4 page at 340 dpi, about 2800 x 4000 (12 MP)
+    def draw(fitz, page):
+        page.draw_rect(page.rect, color=None, fill=(0.96, 0.95, 0.93))
+        page.insert_textbox(fitz.Rect(40, 40, 560, 800), LEASE, fontsize=10)
+    return with_exif(render(595, 842, 340, draw))
+
+
+def color_photo() -> bytes:
+    def draw(fitz, page):
+        for i in range(12):
+            page.draw_circle(fitz.Point(60 + i * 45, 80 + (i % 4) * 80), 70,
+                             color=None, fill=((i * 0.08) % 1, 0.5, 1 - (i * 0.07) % 1))
+    return with_exif(render(600, 450, 480, draw))
+
+
+def screenshot() -> bytes:
+    # 1170 x 2532 phone screenshot of a text message thread
+    def draw(fitz, page):
+        for i in range(14):
+            page.draw_rect(fitz.Rect(20, 20 + i * 60, 400, 70 + i * 60), color=None,
+                           fill=(0.85, 0.9, 1) if i % 2 else (0.92, 0.92, 0.92))
+            page.insert_text((30, 50 + i * 60), f"Landlord: rent goes up ${50 * i} next month", fontsize=11)
+    return render(390, 844, 216, draw, output="png")
+
+
+def mixed_pdf() -> bytes:
+    import fitz  # PyMuPDF
+    doc = fitz.open()
+    letterhead = color_photo()
+    for i in range(20):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(40, 140, 560, 800), f"Section {i + 1}. {LEASE}", fontsize=9)
+        page.insert_image(fitz.Rect(40, 30, 200, 130), stream=letterhead)
+    for i in range(5):
+        scanned = fitz.open()
+        scanned.new_page().insert_image(fitz.Rect(0, 0, 595, 842), stream=document_photo())
+        doc.insert_pdf(scanned)
+        scanned.close()
+    return doc.tobytes(garbage=4, deflate=True)
+
+
+def legacy_pdf_images(pdf: bytes) -> int:
+    # Every distinct embedded image at full resolution, as the previous extraction sent them
+    import fitz  # PyMuPDF
+    total, seen = 0, set()
+    with fitz.open(stream=pdf, filetype="pdf") as doc:
+        for page in doc:
+            for img in page.get_images(full=True):
+                if img[0] not in seen:
+                    seen.add(img[0])
+                    total += len(doc.extract_image(img[0])["image"])
+    return total
+
+
+def optimized_pdf_images(pdf: bytes) -> int:
+    async def run():
+        extraction = PdfExtraction(pdf)
+        try:
+            async for _ in extraction.pages():
+                pass
+            return await extraction.images(limit=len(extraction.image_xrefs))
+        finally:
+            extraction.close()
+    return sum(len(image["data"]) for image in asyncio.run(run()))
+
+
+def measure(label: str, runs: int, before: int, optimize) -> dict:
+    start = time.perf_counter()
+    for _ in range(runs):
+        after = optimize()
+    seconds = (time.perf_counter() - start) / runs
+    row = {"case": label, "bytes_before": before, "bytes_after": after,
+           "reduction": round(1 - after / before, 3), "optimize_ms": round(seconds * 1000, 1)}
+    print(f"{label:<34} {before / 1024:>9.0f} KB -> {after / 1024:>7.0f} KB  ({row['reduction']:.0%} less)  "
+          f"{row['optimize_ms']:>7.1f} ms")
+    return row
+
+
+def main(runs: int = 5) -> list:
+    print(f"max side {images.IMAGE_MAX_SIDE}px, JPEG quality {images.IMAGE_JPEG_QUALITY}, "
+          f"text layer threshold {images.TEXT_LAYER_MIN_CHARS} chars\n")
+    rows = []
+    for label, data, mime_type in [("phone photo of a document (JPEG)", document_photo(), "image/jpeg"),
+                                   ("color phone photo (JPEG)", color_photo(), "image/jpeg"),
+                                   ("phone screenshot (PNG)", screenshot(), "image/png")]:
+        rows.append(measure(label, runs, len(data), lambda: len(images.optimize_image(data, mime_type)["data"])))
+    pdf = mixed_pdf()
+    try:
+        rows.append(measure("PDF: 20 text + 5 scanned pages", max(1, runs // 5), legacy_pdf_images(pdf),
+                            lambda: optimized_pdf_images(pdf)))
+    finally:
+        shutdown_extraction_pool()
+    return rows
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5), indent=2))
@@ -0,0 +1,91 @@
+"""
+Worker cold start: time for a fresh interpreter to import app.main and finish the FastAPI
+startup (lifespan), and time until the first request is answered.
+
+Each sample runs in a new process, like a scale-from-zero worker. The slowest imports
+come from `python -X importtime`.
+
+    python benchmarks/bench_startup.py            # 5 runs
+    python benchmarks/bench_startup.py 10
+"""
+import sys
+import os
+import json
+import statistics
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Runs inside the child process; prints JSON timings
+CHILD = r"""
+import time, json, asyncio
+start = time.perf_counter()
+import app.main as main
+imported = time.perf_counter()
+
+async def serve_first_request():
+    messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+    async def receive():
+        return messages.pop(0) if messages else await asyncio.sleep(3600)
+    async def send(message):
+        sent.append(message["type"])
+    lifespan = asyncio.ensure_future(main.app({"type": "lifespan", "asgi": {"version": "3.0"}}, receive, send))
+    while "lifespan.startup.complete" not in sent:
+        await asyncio.sleep(0)
+    started = time.perf_counter()
+
+    # A request that needs no model call: the template listing
+    body = []
+    scope = {"type": "http", "method": "GET", "path": "/action/templates", "raw_path": b"/action/templates",
+             "query_string": b"", "headers": [], "http_version": "1.1", "scheme": "http",
+             "server": ("bench", 80), "client": ("bench", 1)}
+    async def request_receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def request_send(message):
+        body.append(message)
+    await main.app(scope, request_receive, request_send)
+    answered = time.perf_counter()
+    await lifespan
+    return started, answered
+
+started, answered = asyncio.run(serve_first_request())
+print(json.dumps({"import": imported - start, "startup": started - start, "first_request": answered - start,
+                  "genai_loaded": "google.generativeai" in __import__("sys").modules}))
+"""
+
+
+def sample() -> dict:
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(limit: int = 8) -> list:
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=ROOT,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Direct imports of app.main only (nesting is shown as two spaces per level)
+        if (len(name) - len(name.lstrip()) - 1) // 2 != 1:
+            continue
+        rows.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    samples = [sample() for _ in range(runs)]
+    for key in ("import", "startup", "first_request"):
+        values = [s[key] for s in samples]
+        print(f"{key:>14}: median {statistics.median(values) * 1000:7.1f} ms   (min {min(values) * 1000:.1f}, max {max(values) * 1000:.1f})")
+    print(f"Gemini SDK imported before the first model call: {any(s['genai_loaded'] for s in samples)}")
+    print("\nSlowest imports of app.main (python -X importtime):")
+    for seconds, name in slowest_imports():
+        print(f"  {seconds * 1000:7.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Template fill throughput for every template in app/templates:
+- local: every placeholder supplied, rewrite=False (no model call)
+- narratives: fields supplied, narrative placeholders written by a zero-latency fake model
+- registry get + describe, as /action/templates does per request
+
+    python benchmarks/bench_templates.py          # 2000 fills per case
+    python benchmarks/bench_templates.py 10000
+"""
+import sys
+import os
+import json
+import time
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.action_engine import ActionEngine
+from app.core.cache import ResponseCache
+from app.core.model_client import ModelClient
+from app.core.templates import TemplateRegistry
+from app.core.fakes import FakeModel, digest_reply
+
+
+def details(template, i: int, narratives: bool) -> dict:
+    placeholders = template.placeholders if narratives else template.fields
+    return {p: f"{p} value {i}" for p in placeholders}
+
+
+def timed(label: str, count: int, func) -> dict:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    row = {"case": label, "fills": count, "seconds": round(elapsed, 4), "fills_per_s": round(count / elapsed, 1),
+           "us_per_fill": round(elapsed / count * 1e6, 1)}
+    print(f"{label:<34} {row['fills_per_s']:>11.1f} fills/s  {row['us_per_fill']:>8.1f} us/fill")
+    return row
+
+
+def benchmark(count: int = 2000) -> list:
+    registry = TemplateRegistry()
+    templates = registry.list()
+    engine = ActionEngine(templates=registry)
+    engine.client = ModelClient("fake-model", model=FakeModel(reply=digest_reply(40)))
+    print(f"{len(templates)} templates, {count} fills per case\n")
+
+    def local():
+        for i in range(count):
+            template = templates[i % len(templates)]
+            template.fill(template.resolve(details(template, i, narratives=True)))
+
+    def narratives():
+        async def run():
+            # Distinct details each time, so every narrative is a model call (no cache hits)
+            for i in range(count):
+                template = templates[i % len(templates)]
+                await engine.generate_from_template_async(template, details(template, i, narratives=False))
+        engine.cache = ResponseCache(max_entries=count)
+        asyncio.run(run())
+
+    def listing():
+        for i in range(count):
+            registry.get(templates[i % len(templates)].name).describe()
+
+    return [
+        timed("local fill (no model)", count, local),
+        timed("fields local, narratives via model", count, narratives),
+        timed("registry get + describe", count, listing),
+    ]
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000), indent=2))
@@ -0,0 +1,82 @@
+"""
+Time to first audio for spoken advice (/voice/speak), against the offline text-to-speech
+fake whose synthesis time grows with the text (fixed latency plus time per character).
+
+Cases: the whole text in one call (the previous gTTS path), sentence by sentence one after
+another, sentences synthesized concurrently and streamed in order, and the same advice again
+from the audio cache.
+
+    python benchmarks/bench_tts.py              # 6 sentences, 100 ms + 2 ms/char
+    python benchmarks/bench_tts.py 12 0.2
+"""
+import sys
+import os
+import json
+import time
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.cache import AudioCache
+from app.core.speech import SpeechSynthesizer, split_sentences
+from app.core.fakes import FakeTextToSpeech
+
+SENTENCES = [
+    "You have the right to dispute this fee within 30 days.",
+    "Ask the landlord to put the charge in writing.",
+    "Do not pay until you get it.",
+    "Keep a copy of every letter and message you send.",
+    "If they threaten to evict you, contact your local tenant union.",
+    "You can also file a complaint with the housing authority.",
+]
+
+
+def advice(sentences: int) -> str:
+    return " ".join(SENTENCES[i % len(SENTENCES)].replace(".", f" ({i + 1}).") for i in range(sentences))
+
+
+async def timed(chunks) -> tuple:
+    start = time.perf_counter()
+    first = None
+    async for _ in chunks:
+        first = first if first is not None else time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+async def run(sentences: int, latency: float, per_char: float = 0.002) -> list:
+    text = advice(sentences)
+    backend = FakeTextToSpeech(latency=latency, per_char=per_char)
+
+    async def whole():
+        async for chunk in backend.synthesize(text, "English"):
+            yield chunk
+
+    async def sequential():
+        for sentence in split_sentences(text):
+            async for chunk in backend.synthesize(sentence, "English"):
+                yield chunk
+
+    concurrent = SpeechSynthesizer(backend, cache=AudioCache())
+    cases = [("whole text, one call", whole()),
+             ("sentences, one at a time", sequential()),
+             (f"sentences, {concurrent.concurrency} at once", concurrent.stream(text, "English")),
+             ("sentences, cached", concurrent.stream(text, "English"))]
+    rows = []
+    for label, chunks in cases:
+        first, total = await timed(chunks)
+        row = {"case": label, "sentences": sentences,
+               "first_audio_ms": round(first * 1000, 1), "total_ms": round(total * 1000, 1)}
+        print(f"{label:<28} first audio {row['first_audio_ms']:>8.1f} ms   all audio {row['total_ms']:>8.1f} ms")
+        rows.append(row)
+    return rows
+
+
+def main(sentences: int = 6, latency: float = 0.1) -> list:
+    print(f"{sentences} sentences, {latency * 1000:.0f} ms per synthesis call + 2 ms per character\n")
+    return asyncio.run(run(sentences, latency))
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(int(sys.argv[1]) if len(sys.argv) > 1 else 6,
+                          float(sys.argv[2]) if len(sys.argv) > 2 else 0.1), indent=2))
@@ -0,0 +1,98 @@
+"""
+Query latency of the local vector index (app/core/vector_index.py) over a synthetic corpus,
+with the hashing embedder standing in for an embedding model (no network):
+- embedding and indexing the corpus, saving it, and mapping it back from disk
+- top-5 queries against the in-memory and the memory-mapped matrix, and with a kind filter
+- /action/suggest's template ranking over app/templates
+
+    python benchmarks/bench_vector_index.py             # 100000 documents
+    python benchmarks/bench_vector_index.py 20000
+"""
+import sys
+import os
+import json
+import time
+import random
+import itertools
+import tempfile
+import statistics
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.vector_index import VectorIndex, Retriever, TemplateCorpus, HashingEmbedder
+
+QUERIES = 200
+
+
+def vocabulary(size: int, rng: random.Random) -> list:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(size)]
+
+
+def corpus(count: int, words: int = 40, seed: int = 0) -> list:
+    # Zipf-like word choice, as in real text: a few words everywhere, most of them rare
+    rng = random.Random(seed)
+    vocab = vocabulary(20000, rng)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocab))))
+    return [{"id": f"doc-{i}", "kind": "precedent" if i % 10 else "guide", "version": 1,
+             "text": " ".join(rng.choices(vocab, cum_weights=cum_weights, k=words))} for i in range(count)]
+
+
+def queries(documents: list, count: int = QUERIES) -> list:
+    # A dozen words picked from a document, like a short description of a case
+    rng = random.Random(1)
+    return [" ".join(rng.choice(d["text"].split()) for _ in range(12)) for d in rng.sample(documents, count)]
+
+
+def latency(label: str, documents: int, queries: list, search) -> dict:
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    row = {"case": label, "documents": documents, "p50_ms": round(statistics.median(times) * 1000, 3),
+           "p95_ms": round(times[int(len(times) * 0.95) - 1] * 1000, 3), "queries_per_s": round(len(times) / sum(times), 1)}
+    print(f"{label:<38} p50 {row['p50_ms']:>8.3f} ms  p95 {row['p95_ms']:>8.3f} ms  {row['queries_per_s']:>9.1f} queries/s")
+    return row
+
+
+def timed(label: str, documents: int, func) -> dict:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    row = {"case": label, "documents": documents, "seconds": round(elapsed, 3),
+           "documents_per_s": round(documents / elapsed, 1)}
+    print(f"{label:<38} {row['seconds']:>8.3f} s   {row['documents_per_s']:>12.1f} documents/s")
+    return row
+
+
+def main(documents: int = 100000) -> list:
+    embedder = HashingEmbedder()
+    documents_list = corpus(documents)
+    questions = queries(documents_list)
+    print(f"{documents} synthetic documents, {embedder.name} embeddings\n")
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index")
+        index = VectorIndex(embedder, path=path)
+        rows.append(timed("embed + index", documents, lambda: index.upsert(documents_list)))
+        rows.append(timed("save", documents, index.save))
+
+        rows.append(latency("top-5 query, in memory", documents, questions, lambda q: index.search(q, 5)))
+        rows.append(latency("top-5 query, one kind (10%)", documents, questions,
+                            lambda q: index.search(q, 5, kind="guide")))
+        mapped = {}
+        rows.append(timed("load, memory-mapped", documents, lambda: mapped.setdefault("index", VectorIndex(embedder, path=path))))
+        rows.append(latency("top-5 query, memory-mapped", documents, questions, lambda q: mapped["index"].search(q, 5)))
+        del mapped
+
+    templates = Retriever(VectorIndex(embedder), [TemplateCorpus()])
+    templates.sync()
+    rows.append(latency("suggest template (13 templates)", len(templates.index), questions, templates.suggest_templates))
+    return rows
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000), indent=2))
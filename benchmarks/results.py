@@ -0,0 +1,83 @@
+"""
+Benchmark result files. Each benchmark's main() returns rows like
+{"case": "single-pass alternation", "seconds": 0.41, "mb_per_s": 48.7}; run_suite.py saves
+them as JSON together with the environment they ran in, and compares a run with a stored
+baseline (e.g. a run of the main branch on the same machine).
+"""
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Metric name suffixes and which direction is an improvement; other fields (counts, sizes) are not compared
+HIGHER_IS_BETTER = ("per_s", "per_min")
+LOWER_IS_BETTER = ("_s", "_ms", "_mb")
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+
+
+def save(path: str, benchmarks: dict, options: dict = None) -> dict:
+    run = {"environment": environment(), "options": options or {}, "benchmarks": benchmarks}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(run, f, indent=2)
+    return run
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def direction(metric: str) -> int:
+    """
+    +1 if a larger value is better, -1 if a smaller one is, 0 if the field is not a performance metric.
+    """
+    if metric.endswith(HIGHER_IS_BETTER):
+        return 1
+    if metric.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def compare(current: dict, baseline: dict, tolerance: float = 0.25) -> list:
+    """
+    Compares two runs case by case. Returns one row per metric present in both, with
+    `change` as a fraction (positive = better) and `regression` set when the change is
+    worse than `tolerance`.
+    """
+    rows = []
+    for bench, cases in current["benchmarks"].items():
+        previous = {row["case"]: row for row in baseline["benchmarks"].get(bench, [])}
+        for row in cases:
+            before = previous.get(row["case"])
+            if before is None:
+                continue
+            for metric, value in row.items():
+                sign = direction(metric)
+                old = before.get(metric)
+                if not sign or not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                    continue
+                change = sign * (value - old) / old
+                rows.append({"benchmark": bench, "case": row["case"], "metric": metric, "baseline": old,
+                             "current": value, "change": round(change, 4), "regression": change < -tolerance})
+    return rows
+
+
+def print_comparison(rows: list, out=sys.stdout):
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(f"{row['benchmark']:<12} {row['case'][:40]:<40} {row['metric']:<14} {row['baseline']:>10} -> "
+              f"{row['current']:>10}  {row['change'] * 100:+6.1f}%  {flag}", file=out)
@@ -0,0 +1,78 @@
+"""
+Runs the offline benchmark suite (no network, no API key) and writes every result to one
+JSON file. With --baseline, compares the run with an earlier one case by case and exits
+with status 1 if any throughput, latency or memory metric is worse than --tolerance.
+
+    python benchmarks/run_suite.py                                # full sizes -> benchmarks/results/latest.json
+    python benchmarks/run_suite.py --quick --baseline benchmarks/results/main.json
+    python benchmarks/run_suite.py --only redaction,templates --out /tmp/run.json
+
+Store a run of the main branch as the baseline and compare on the same machine: absolute
+numbers vary a lot between hosts.
+"""
+import sys
+import os
+import asyncio
+import argparse
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks import results
+
+# name -> (quick sizes, full sizes, runner)
+SUITE = {
+    "endpoints": ((100, 25, 0.02), (300, 50, 0.05),
+                  lambda count, concurrency, latency: _bench("bench_endpoints").benchmark(count, concurrency, latency)),
+    "batch": ((100, 0.05), (500, 0.2),
+              lambda count, latency: asyncio.run(_bench("bench_batch").run(count, latency))),
+    "extraction": (([10, 100],), ([10, 100, 1000],), lambda sizes: _bench("bench_extraction").main(sizes)),
+    "images": ((2,), (5,), lambda runs: _bench("bench_images").main(runs)),
+    "redaction": ((2,), (20,), lambda size_mb: _bench("bench_redaction").main(size_mb)),
+    "templates": ((1000,), (5000,), lambda count: _bench("bench_templates").benchmark(count)),
+    "tts": ((6, 0.05), (12, 0.1), lambda sentences, latency: _bench("bench_tts").main(sentences, latency)),
+    "vector_index": ((20000,), (100000,), lambda documents: _bench("bench_vector_index").main(documents)),
+}
+
+
+def _bench(name: str):
+    # Imported on demand: bench_endpoints loads the whole app
+    import importlib
+    return importlib.import_module(f"benchmarks.{name}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for CI")
+    parser.add_argument("--only", help="comma-separated benchmarks: " + ",".join(SUITE))
+    parser.add_argument("--out", default=os.path.join(results.ROOT, "benchmarks", "results", "latest.json"))
+    parser.add_argument("--baseline", help="earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed fraction a metric may get worse before it counts as a regression")
+    args = parser.parse_args(argv)
+
+    selected = args.only.split(",") if args.only else list(SUITE)
+    unknown = [name for name in selected if name not in SUITE]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    benchmarks = {}
+    for name in selected:
+        quick, full, runner = SUITE[name]
+        print(f"\n=== {name} ===")
+        benchmarks[name] = runner(*(quick if args.quick else full))
+    run = results.save(args.out, benchmarks, {"quick": args.quick})
+    print(f"\nResults written to {args.out}")
+
+    if not args.baseline:
+        return 0
+    rows = results.compare(run, results.load(args.baseline), args.tolerance)
+    print(f"\nCompared with {args.baseline} (tolerance {args.tolerance:.0%}):")
+    results.print_comparison(rows)
+    regressions = [row for row in rows if row["regression"]]
+    print(f"\n{len(regressions)} regression(s) in {len(rows)} metrics")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import sys
+import os
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+@pytest.fixture
+def fake_engines(monkeypatch):
+    """
+    Points app.main's engines at a fake model, each with a fresh response cache (and a fresh
+    translation memory for voice), for one test; the originals are restored afterwards.
+
+        client = fake_engines(FakeModel(...), "detector", "simplifier")
+
+    Takes a FakeModel (wrapped in a plain ModelClient) or a ready ModelClient, and the names of
+    the engines to swap ("detector" if none are given). Returns the client.
+    """
+    from app import main
+    from app.core.cache import ResponseCache
+    from app.core.model_client import ModelClient
+
+    def swap(model, *engines):
+        client = model if isinstance(model, ModelClient) else ModelClient("fake-model", model=model)
+        for name in engines or ("detector",):
+            engine = getattr(main, name)
+            monkeypatch.setattr(engine, "client", client)
+            monkeypatch.setattr(engine, "cache", ResponseCache())
+            if hasattr(engine, "memory"):
+                monkeypatch.setattr(engine, "memory", ResponseCache())
+        return client
+
+    return swap
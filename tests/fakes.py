@@ -0,0 +1,38 @@
+# The fake model and speech backends live in the app, so a server can run offline without importing tests
+from app.core.fakes import (FakeFeedback, FakeResponse, FakeAPIError, FakeStream, FakeModel, FakeSpeechToText,
+                            FakeTextToSpeech, lognormal_latency, digest_reply, load_test_model)
+
+
+class FakeCachedContent:
+    def __init__(self, model_name: str, contents: list, ttl: float):
+        self.model_name = model_name
+        self.contents = contents
+        self.ttl = ttl
+        self.deleted = False
+
+
+class FakeContextBackend:
+    """
+    Offline stand-in for Gemini cached content (the ContextCache backend API).
+    Every cache is bound to `model`, so tests can check what the calls still send.
+    With `fail=True` creating a cache raises, like a model that does not support caching.
+    """
+    def __init__(self, model=None, fail: bool = False):
+        self.bound_model = model or FakeModel()
+        self.fail = fail
+        self.created = []
+        self.deleted = []
+
+    def create(self, model_name: str, contents: list, ttl: float):
+        if self.fail:
+            raise RuntimeError("caching not supported for this model")
+        handle = FakeCachedContent(model_name, contents, ttl)
+        self.created.append(handle)
+        return handle
+
+    def model(self, handle):
+        return self.bound_model
+
+    def delete(self, handle):
+        handle.deleted = True
+        self.deleted.append(handle)
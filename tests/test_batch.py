@@ -0,0 +1,90 @@
+import sys
+import os
+import io
+import json
+import asyncio
+import zipfile
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from app import main
+from app.core.batch import BatchItem, run_batch
+from app.core.model_client import RateLimited
+from tests.fakes import FakeModel
+
+
+def test_run_batch_completion_order_and_failures():
+    running = {"now": 0, "peak": 0}
+
+    def item(name, delay, error=None):
+        async def load():
+            return {"name": name, "delay": delay, "error": error}
+        return BatchItem(name, load)
+
+    async def process(payload):
+        running["now"] += 1
+        running["peak"] = max(running["peak"], running["now"])
+        try:
+            await asyncio.sleep(payload["delay"])
+            if payload["error"]:
+                raise payload["error"]
+            return payload["name"].upper()
+        finally:
+            running["now"] -= 1
+
+    items = [item("slow", 0.2), item("quota", 0.0, RateLimited("quota")), item("fast", 0.05), item("last", 0.0)]
+
+    async def collect():
+        return [out async for out in run_batch(items, process, concurrency=2)]
+
+    results = asyncio.run(collect())
+    assert [r["id"] for r in results] == ["quota", "fast", "last", "slow"]
+    assert running["peak"] == 2
+    assert results[0]["ok"] is False and results[0]["error"]["status"] == 429
+    assert results[-1] == {"index": 0, "id": "slow", "ok": True, "result": "SLOW", "seconds": results[-1]["seconds"]}
+
+
+def test_batch_endpoints(fake_engines):
+    def reply(content):
+        if "unreadable" in str(content):
+            raise ValueError("model refused")
+        return "- Red flag"
+
+    fake_engines(FakeModel(reply=reply))
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("leases/a.txt", "Deposit is non-refundable.")
+        z.writestr("leases/b.txt", "Tenant pays all repairs.")
+        z.writestr("leases/", "")
+        z.writestr("notes.docx", "not supported")
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            texts = await http.post("/batch/analyze", json={"texts": ["Deposit kept.", "unreadable", "Late fee 50%."],
+                                                            "ids": ["a", "b", "c"]})
+            files = [("files", ("leases.zip", archive.getvalue(), "application/zip")),
+                     ("files", ("extra.txt", b"Landlord may enter anytime.", "text/plain"))]
+            uploaded = await http.post("/batch/analyze", files=files)
+            empty = await http.post("/batch/analyze", json={"texts": []})
+            return texts, uploaded, empty
+
+    texts, uploaded, empty = asyncio.run(run())
+
+    assert texts.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in texts.text.splitlines()]
+    by_id = {line["id"]: line for line in lines[:-1]}
+    assert by_id["a"]["result"] == by_id["c"]["result"] == "- Red flag"
+    assert by_id["b"]["ok"] is False and by_id["b"]["error"]["status"] == 502
+    assert lines[-1]["summary"]["items"] == 3 and lines[-1]["summary"]["failed"] == 1
+
+    lines = [json.loads(line) for line in uploaded.text.splitlines()]
+    by_id = {line["id"]: line for line in lines[:-1]}
+    assert set(by_id) == {"leases.zip/leases/a.txt", "leases.zip/leases/b.txt", "leases.zip/notes.docx", "extra.txt"}
+    assert by_id["leases.zip/notes.docx"]["error"]["status"] == 400
+    assert lines[-1]["summary"]["failed"] == 1
+
+    assert empty.status_code == 400
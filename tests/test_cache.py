@@ -0,0 +1,168 @@
+import sys
+import os
+import asyncio
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.cache import ResponseCache, make_cache_key
+from app.core.risk_detector import RiskDetector
+from app.core.model_client import ModelClient, ModelError
+from google.api_core import exceptions as google_exceptions
+from tests.fakes import FakeModel
+
+
+def test_cache_keys():
+    key = make_cache_key("analyze", "m", "v1", text="Late fee:  $50\n per day")
+    assert key == make_cache_key("analyze", "m", "v1", text="Late fee: $50 per day")
+    assert key != make_cache_key("simplify", "m", "v1", text="Late fee: $50 per day")
+    assert key != make_cache_key("analyze", "m", "v2", text="Late fee: $50 per day")
+    assert make_cache_key("translate", "m", "v1", text="Hi", target_language="Hindi") != \
+        make_cache_key("translate", "m", "v1", text="Hi", target_language="Tamil")
+    assert make_cache_key("analyze", "m", "v1", image_data=b"a") != make_cache_key("analyze", "m", "v1", image_data=b"b")
+
+
+def test_cache_lru_and_empty_answers():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    cache.get("a")
+    cache.set("c", "C")  # evicts "b", the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    cache.set("empty", "")
+    assert cache.get("empty") is None
+    # Failures raise instead of returning error strings, so any answer is cached, whatever it says
+    cache.set("c", "Errors in clause 4: the fee is not disclosed.")
+    assert cache.get("c") == "Errors in clause 4: the fee is not disclosed."
+    stats = cache.stats()
+    assert stats["hits"] == 3 and stats["misses"] == 2 and stats["skipped"] == 1
+
+
+def test_cache_ttl_and_disk_tier():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "cache.db")
+        ResponseCache(db_path=db_path).set("k", "cached answer")
+        # A fresh instance (another worker, or after a restart) sees the entry
+        other = ResponseCache(db_path=db_path)
+        assert other.get("k") == "cached answer"
+        assert other.stats()["disk_hits"] == 1
+
+        expired = ResponseCache(ttl_seconds=-1)
+        expired.set("k", "stale")
+        assert expired.get("k") is None
+
+
+def test_disk_tier_off_the_event_loop_and_expired_rows_purged():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "cache.db")
+        stale = ResponseCache(ttl_seconds=-1, db_path=db_path)
+        stale.set("old", "stale answer")
+
+        async def run():
+            await ResponseCache(db_path=db_path).set_async("k", "cached answer")
+            other = ResponseCache(db_path=db_path)
+            return other, await other.get_async("k"), await other.get_async("missing")
+
+        other, found, missing = asyncio.run(run())
+        assert found == "cached answer" and missing is None
+        assert other.stats()["disk_hits"] == 1 and other.stats()["misses"] == 1
+        # A new instance deletes the expired row instead of keeping it forever
+        rows = other._connection().execute("SELECT key FROM responses").fetchall()
+        assert rows == [("k",)]
+
+
+def test_detector_uses_cache():
+    fake = FakeModel(reply="- Red flag: 50% fee increase")
+    detector = RiskDetector(cache=ResponseCache())
+    detector.model = fake
+    detector.client = ModelClient("fake-model", model=fake)
+
+    first = detector.analyze_document("Fees may rise 50% without notice.")
+    second = detector.analyze_document("Fees may  rise 50% without notice.\n")
+    assert first == second
+    assert fake.calls == 1
+
+    # A failed call is not cached
+    fake.faults = [RuntimeError("upstream failure")]
+    assert detector.analyze_document("Another document").startswith("Error during analysis")
+    assert detector.analyze_document("Another document") == "- Red flag: 50% fee increase"
+    assert fake.calls == 3
+    print(detector.cache.stats())
+
+
+def _fake_detector(fake):
+    detector = RiskDetector(cache=ResponseCache())
+    detector.model = fake
+    detector.client = ModelClient("fake-model", model=fake)
+    return detector
+
+
+def test_identical_requests_are_coalesced():
+    fake = FakeModel(latency=0.2, reply="- Red flag: rent up 40%")
+    detector = _fake_detector(fake)
+
+    async def burst():
+        return await asyncio.gather(*[detector.analyze_document_async("Your rent will rise 40% on May 1.")
+                                      for _ in range(50)])
+
+    results = asyncio.run(burst())
+    assert set(results) == {"- Red flag: rent up 40%"}
+    assert fake.calls == 1
+    stats = detector.cache.stats()
+    assert stats["upstream_calls"] == 1 and stats["coalesced"] == 49 and stats["in_flight"] == 0
+
+    # Failures are shared by the waiters but never cached
+    fake = FakeModel(latency=0.05, faults=[google_exceptions.InvalidArgument("bad request")])
+    detector = _fake_detector(fake)
+
+    async def failing_burst():
+        return await asyncio.gather(*[detector.analyze_document_async("Same notice") for _ in range(5)],
+                                    return_exceptions=True)
+
+    assert all(isinstance(r, ModelError) for r in asyncio.run(failing_burst()))
+    assert fake.calls == 1
+    assert asyncio.run(detector.analyze_document_async("Same notice")) == "Fake analysis"
+    assert fake.calls == 2
+
+
+def test_coalesced_call_survives_requester_cancellation():
+    fake = FakeModel(latency=0.2, reply="shared answer")
+    detector = _fake_detector(fake)
+
+    async def run():
+        first = asyncio.ensure_future(detector.analyze_document_async("Viral notice"))
+        await asyncio.sleep(0.05)
+        second = asyncio.ensure_future(detector.analyze_document_async("Viral notice"))
+        await asyncio.sleep(0.05)
+        first.cancel()  # the original requester disconnects
+        return await second, first.cancelled()
+
+    result, first_cancelled = asyncio.run(run())
+    assert result == "shared answer" and first_cancelled
+    assert fake.calls == 1
+
+    # When every requester is gone, the upstream call is cancelled too
+    fake = FakeModel(latency=5.0)
+    detector = _fake_detector(fake)
+
+    async def abandon():
+        waiters = [asyncio.ensure_future(detector.analyze_document_async("Abandoned")) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(abandon())
+    assert fake.in_flight == 0
+    assert detector.cache.flights.cancelled == 1
+
+
+if __name__ == "__main__":
+    test_cache_keys()
+    test_cache_lru_and_empty_answers()
+    test_cache_ttl_and_disk_tier()
+    test_detector_uses_cache()
+    test_identical_requests_are_coalesced()
+    test_coalesced_call_survives_requester_cancellation()
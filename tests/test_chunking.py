@@ -0,0 +1,101 @@
+import sys
+import os
+import re
+import time
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.chunking import chunk_pages, estimate_tokens, split_sections, needs_chunking
+from app.core.cache import ResponseCache
+from app.core.model_client import ModelClient, ModelError, ConcurrencyLimiter
+from app.core.risk_detector import RiskDetector
+from app.core.simplifier import DocumentSimplifier
+from tests.fakes import FakeModel
+
+
+def make_policy(pages: int) -> list:
+    return [f"Section {i}. The insurer may change premiums on page {i}. " * 40 for i in range(1, pages + 1)]
+
+
+def test_chunk_pages_respects_budget():
+    pages = make_policy(50)
+    chunks = chunk_pages(pages, max_tokens=2000)
+    assert all(c.tokens <= 2000 for c in chunks)
+    assert chunks[0].first_page == 1 and chunks[-1].last_page == 50
+    # Nothing dropped or duplicated
+    assert "\n".join(c.text for c in chunks) == "\n".join(pages)
+
+    # A single huge page is split on its section boundaries
+    huge = "".join(f"ARTICLE {i}\nThe tenant shall pay a fee of ${i}.\n" * 30 for i in range(1, 40))
+    pieces = chunk_pages([huge], max_tokens=500)
+    assert len(pieces) > 1 and all(p.tokens <= 500 for p in pieces)
+    assert split_sections("Intro\n1. First\n2. Second")[1].startswith("1. First")
+    assert not needs_chunking(["short"]) and needs_chunking(pages, 2000)
+
+
+def test_long_document_map_reduce():
+    pages = make_policy(200)
+    chunks = chunk_pages(pages, 2000)
+    bad_chunk = chunks[5].page_label
+
+    def reply(content):
+        label = re.search(r'reviewing (pages? [\d-]+) of', content[0]).group(1)
+        if label == bad_chunk:
+            raise RuntimeError("503 overloaded")
+        return ("- [LOW] Premium changes: The insurer can change your price.\n"
+                f"- [HIGH] Premium changes without notice: They can raise it any time ({label}).")
+
+    fake = FakeModel(latency=0.2, reply=reply)
+    detector = RiskDetector(cache=ResponseCache())
+    detector.client = ModelClient("fake-model", model=fake, limiter=ConcurrencyLimiter(100))
+
+    start = time.perf_counter()
+    report = asyncio.run(detector.analyze_long_document_async(pages, max_chunk_tokens=2000, max_concurrency=64))
+    elapsed = time.perf_counter() - start
+    print(f"{len(chunks)} chunks in {elapsed:.2f}s")
+    print(report[:400])
+
+    assert fake.calls == len(chunks) and len(chunks) > 20
+    # Latency tracks the slowest chunk, not the number of chunks
+    assert elapsed < 1.5
+    # Duplicates merged into one ranked entry with the highest severity first
+    assert report.count("**Premium changes without notice**") == 1
+    assert report.index("High Risk") < report.index("Unfair or Ambiguous")
+    # The failing chunk is reported, not fatal
+    assert f"{bad_chunk} could not be analyzed (503 overloaded)" in report
+    assert "(pages 1-15, 19-200)" in report
+
+
+def test_long_document_simplify_keeps_order():
+    fake = FakeModel(reply=lambda content: "Simple: " + re.search(r'page (\d+)', content[1]).group(1))
+    simplifier = DocumentSimplifier(cache=ResponseCache())
+    simplifier.client = ModelClient("fake-model", model=fake, limiter=ConcurrencyLimiter(100))
+    result = asyncio.run(simplifier.simplify_long_document_async(make_policy(30), max_chunk_tokens=2000))
+    numbers = [int(n) for n in re.findall(r'Simple: (\d+)', result)]
+    assert numbers == sorted(numbers) and len(numbers) > 1
+
+
+def test_long_document_fails_with_a_model_error_when_every_chunk_fails():
+    def reply(content):
+        raise RuntimeError("parser crashed")
+
+    for engine in (RiskDetector(cache=ResponseCache()), DocumentSimplifier(cache=ResponseCache())):
+        engine.client = ModelClient("fake-model", model=FakeModel(reply=reply))
+        run = (engine.analyze_long_document_async if isinstance(engine, RiskDetector)
+               else engine.simplify_long_document_async)
+        try:
+            asyncio.run(run(make_policy(30), max_chunk_tokens=2000))
+        except ModelError as e:
+            assert e.status_code == 502 and "parser crashed" in str(e)
+        else:
+            raise AssertionError("expected a ModelError")
+        assert engine.cache.stats()["entries"] == 0
+
+
+if __name__ == "__main__":
+    test_chunk_pages_respects_budget()
+    test_long_document_map_reduce()
+    test_long_document_simplify_keeps_order()
+    test_long_document_fails_with_a_model_error_when_every_chunk_fails()
@@ -0,0 +1,103 @@
+import sys
+import os
+import re
+import json
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from app import main
+from app.core.clauses import segment_clauses, diff_clauses
+from app.core.cache import ResponseCache
+from app.core.model_client import ModelClient
+from app.core.risk_detector import RiskDetector
+from tests.fakes import FakeModel
+
+LEASE_V1 = """Section 1. The tenant pays rent of $1,200 on the first of each month.
+
+Section 2. The security deposit of $2,400 is non-refundable.
+
+Section 3. The landlord may enter the unit with 24 hours notice.
+
+Section 4. Either party may end this lease with 60 days notice."""
+
+LEASE_V2 = """Section 1. The tenant pays rent of $1,200 on the first of each month.
+
+Section 2. The security deposit of $2,400 is refundable within 30 days.
+
+Section 4. Either party may end this lease with 60 days notice.
+
+Section 5. A cleaning fee of $500 is non-refundable."""
+
+
+def clause_reply(sent: list):
+    # Answers the structured prompt: one HIGH risk for every clause mentioning "non-refundable"
+    def reply(content):
+        clauses = re.findall(r'\[Clause (\d+)\]\n(.*?)(?=\n\n\[Clause |\Z)', content[-1], re.S)
+        sent.append([text for _, text in clauses])
+        return json.dumps([{"clause": int(number), "risks": [
+            {"severity": "high", "title": "Non-refundable money", "explanation": "You never get it back."}
+        ] if "non-refundable" in text else []} for number, text in clauses])
+    return reply
+
+
+def test_segment_and_diff_revisions():
+    v1, v2 = segment_clauses(LEASE_V1), segment_clauses(LEASE_V2)
+    assert [c.label for c in v1] == ["Section 1", "Section 2", "Section 3", "Section 4"]
+    # Whitespace-only edits keep the fingerprint
+    assert segment_clauses(LEASE_V1.replace(" of each", "  of\neach"))[0].fingerprint == v1[0].fingerprint
+
+    statuses, removed = diff_clauses([c.entry() for c in v1], v2)
+    assert statuses == ["unchanged", "changed", "unchanged", "added"]
+    assert [r["label"] for r in removed] == ["Section 3"]
+
+
+def test_revision_only_sends_changed_clauses():
+    sent = []
+    detector = RiskDetector(cache=ResponseCache())
+    detector.client = ModelClient("fake-model", model=FakeModel(reply=clause_reply(sent)))
+
+    async def run():
+        first = await detector.analyze_clauses_async(LEASE_V1)
+        second = await detector.analyze_clauses_async(LEASE_V2, detector.load_clause_report(first["report_id"]))
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first["summary"]["analyzed"] == 4 and first["summary"]["model_calls"] == 1
+    assert first["clauses"][1]["risks"][0]["severity"] == "HIGH"
+
+    # Only the changed and the new clause go to the model; the rest comes from the clause cache
+    assert [len(batch) for batch in sent] == [4, 2]
+    assert all("Section 2" in t or "Section 5" in t for t in sent[1])
+    assert second["summary"]["cached"] == 2 and second["summary"]["tokens_sent"] < first["summary"]["tokens_sent"]
+    assert [c["status"] for c in second["clauses"]] == ["unchanged", "changed", "unchanged", "added"]
+    assert second["clauses"][1]["risks"] == [] and second["clauses"][3]["risks"][0]["title"] == "Non-refundable money"
+    assert [r["label"] for r in second["removed"]] == ["Section 3"]
+    assert "Section 5 (added)" in second["report"] and "Section 3 (removed)" in second["report"]
+
+
+def test_malformed_output_marks_clauses_without_failing():
+    detector = RiskDetector(cache=ResponseCache())
+    detector.client = ModelClient("fake-model", model=FakeModel(reply="Here are the risks: none"))
+    result = asyncio.run(detector.analyze_clauses_async(LEASE_V1, max_batch_tokens=30))
+    assert result["summary"]["failed"] == 4 and all(c["error"] for c in result["clauses"])
+    # Nothing malformed was cached
+    assert result["summary"]["cached"] == 0 and detector.cache.stats()["entries"] == 1  # only the report
+
+
+def test_clause_endpoint_with_previous_text(fake_engines):
+    sent = []
+    fake_engines(FakeModel(reply=clause_reply(sent)))
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await http.post("/analyze/clauses", json={"text": LEASE_V2, "previous_text": LEASE_V1})
+
+    response = asyncio.run(run())
+    body = response.json()
+    assert response.status_code == 200
+    assert [c["status"] for c in body["clauses"]] == ["unchanged", "changed", "unchanged", "added"]
+    assert body["summary"]["high"] == 1
@@ -0,0 +1,144 @@
+import sys
+import os
+import re
+import json
+import random
+import asyncio
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import fitz  # PyMuPDF
+import httpx
+import pytest
+from app import main
+from app.core.compliance import ComplianceManager, load_known_terms
+from app.core.extraction import PdfExtraction, shutdown_extraction_pool
+from tests.fakes import FakeModel
+
+SAMPLE = ("Call John Doe at 555-123-4567 or john.doe@example.com (SSN 123-45-6789). "
+          "Jane Q. Public lives at 221b Baker Street. Doeville is a town, not a person. ")
+
+
+def legacy_redact(compliance, text):
+    # The original one-re.sub-per-pattern implementation
+    for pii_type, pattern in compliance.patterns.items():
+        text = re.sub(pattern, f"[REDACTED {pii_type.upper()}]", text)
+    return text
+
+
+def test_single_pass_matches_legacy():
+    compliance = ComplianceManager()
+    text = SAMPLE * 50
+    assert compliance.redact_pii(text) == legacy_redact(compliance, text)
+
+
+def test_dictionary_terms():
+    compliance = ComplianceManager(known_terms={"name": ["John Doe", "Jane Q. Public", "Doe"],
+                                                "address": ["221B Baker Street"]})
+    redacted = compliance.redact_pii(SAMPLE)
+    assert "John" not in redacted and "Jane" not in redacted and "Baker" not in redacted
+    assert redacted.count("[REDACTED NAME]") == 2
+    assert "[REDACTED ADDRESS]" in redacted
+    # Whole words only
+    assert "Doeville" in redacted
+
+
+def test_streaming_handles_chunk_boundaries():
+    compliance = ComplianceManager(known_terms={"name": ["John Doe", "Jane Q. Public"]})
+    text = SAMPLE * 40
+    expected = compliance.redact_pii(text)
+    rng = random.Random(7)
+    for _ in range(30):
+        redactor = compliance.redactor(window=64)
+        out, i = [], 0
+        while i < len(text):
+            n = rng.randint(1, 200)
+            out.append(redactor.feed(text[i:i + n]))
+            i += n
+        out.append(redactor.finish())
+        assert "".join(out) == expected
+
+    # An email address longer than the window is still held back whole
+    text = "Write to " + "a" * 300 + "@" + "b" * 300 + ".com today. " + SAMPLE
+    redactor = compliance.redactor(window=64)
+    out = "".join(redactor.feed(text[i:i + 50]) for i in range(0, len(text), 50)) + redactor.finish()
+    assert out == compliance.redact_pii(text) and out.startswith("Write to [REDACTED EMAIL] today.")
+
+
+def test_pdf_pages_are_redacted_across_page_breaks():
+    compliance = ComplianceManager(known_terms={"name": ["John Doe"]})
+    doc = fitz.open()
+    for line in ("Call John", "Doe at 555-123-4567.", "No PII here."):
+        doc.new_page().insert_text((72, 72), line)
+    pdf = doc.tobytes()
+    doc.close()
+
+    async def run():
+        extraction = PdfExtraction(pdf, redactor=compliance.redactor())
+        try:
+            return [text async for text in extraction.pages()], await extraction.text()
+        finally:
+            extraction.close()
+
+    try:
+        pages, text = asyncio.run(run())
+    finally:
+        shutdown_extraction_pool()
+    # One text per page, each page's own; the name split over the break is redacted as a whole
+    assert len(pages) == 3 and text == "".join(pages)
+    assert pages[0].startswith("Call ") and "John" not in pages[0]
+    assert pages[1].startswith("[REDACTED NAME]") and "[REDACTED PHONE]" in pages[1]
+    assert pages[2].startswith("No PII here.")
+
+
+def test_batch_endpoint_and_inline_redaction(fake_engines):
+    sent = []
+    fake_engines(FakeModel(reply=lambda content: sent.append(content) or "- No risks"))
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            batch = await http.post("/compliance/redact/batch", json={"texts": ["Mail a@b.com", "Call 555-123-4567"]})
+            analysis = await http.post("/analyze", json={"text": "Tenant phone: 555-123-4567"})
+            return batch, analysis
+
+    batch, analysis = asyncio.run(run())
+
+    assert batch.json()["redacted"] == ["Mail [REDACTED EMAIL]", "Call [REDACTED PHONE]"]
+    assert analysis.status_code == 200
+    # The model never sees the raw number
+    assert "555-123-4567" not in sent[0][1] and "[REDACTED PHONE]" in sent[0][1]
+
+
+def test_every_document_endpoint_redacts_and_terms_load_from_a_file(fake_engines):
+    sent = []
+    fake_engines(FakeModel(reply=lambda content: sent.append(str(content)) or "- No risks"), "detector", "simplifier")
+    upload = {"file": ("lease.txt", b"Landlord email: owner@example.com", "text/plain")}
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            await http.post("/simplify", json={"text": "Tenant phone: 555-123-4567"})
+            await http.post("/analyze/file", files=upload)
+            doc = (await http.post("/documents", files=upload)).json()
+            await http.post("/simplify", json={"doc_id": doc["doc_id"]})
+
+    asyncio.run(run())
+    assert len(sent) == 3
+    assert all("555-123-4567" not in prompt and "owner@example.com" not in prompt for prompt in sent)
+    assert "[REDACTED PHONE]" in sent[0] and "[REDACTED EMAIL]" in sent[1] and "[REDACTED EMAIL]" in sent[2]
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump({"name": ["John Doe"]}, f)
+    try:
+        assert ComplianceManager(load_known_terms(f.name)).redact_pii("Ask John Doe") == "Ask [REDACTED NAME]"
+    finally:
+        os.remove(f.name)
+    assert load_known_terms(None) == {}
+
+
+if __name__ == "__main__":
+    # The endpoint tests take the fake_engines fixture from conftest.py
+    sys.exit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,84 @@
+import sys
+import os
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import fitz  # PyMuPDF
+import httpx
+import pytest
+from app import main
+from app.core.extraction import PdfExtraction, shutdown_extraction_pool
+from tests.fakes import FakeModel
+
+# Small solid-colour PNG
+_pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 8, 8), False)
+_pixmap.set_rect(_pixmap.irect, (200, 30, 30))
+PNG = _pixmap.tobytes("png")
+
+
+def make_pdf(pages: int, image_every: int = 0) -> bytes:
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {i + 1}: the tenant pays a late fee of ${i}.")
+        if image_every and i % image_every == 0:
+            # Same picture on many pages: PyMuPDF reuses one xref
+            page.insert_image(fitz.Rect(72, 100, 144, 172), stream=PNG)
+    data = doc.tobytes(garbage=4, deflate=True)
+    doc.close()
+    return data
+
+
+def test_extraction_pages_and_images():
+    pdf = make_pdf(60, image_every=5)
+
+    async def run():
+        extraction = PdfExtraction(pdf)
+        try:
+            texts = [t async for t in extraction.pages()]
+            images = await extraction.images(limit=10)
+            return extraction, texts, images
+        finally:
+            extraction.close()
+
+    try:
+        extraction, texts, images = asyncio.run(run())
+    finally:
+        shutdown_extraction_pool()
+
+    assert len(texts) == 60 and extraction.page_count == 60
+    assert texts[0].startswith("Page 1:") and texts[59].startswith("Page 60:")
+    # Twelve placements of the same picture are decoded once
+    assert len(extraction.image_xrefs) == 1 and len(images) == 1
+    assert images[0]["mime_type"] == "image/png"
+    assert not os.path.exists(extraction.source)
+
+
+def test_analyze_pdf_upload(fake_engines):
+    sent = []
+    fake_engines(FakeModel(reply=lambda content: sent.append(content) or "- Late fee risk"))
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            files = {"file": ("lease.pdf", make_pdf(3, image_every=1), "application/pdf")}
+            return await http.post("/analyze/file", files=files)
+
+    try:
+        response = asyncio.run(run())
+    finally:
+        shutdown_extraction_pool()
+
+    assert response.status_code == 200
+    assert response.json()["analysis"] == "- Late fee risk"
+    # One call with the whole text and the single embedded image
+    assert len(sent) == 1
+    assert "Page 3:" in sent[0][1]
+    assert sent[0][2]["mime_type"] == "image/png"
+
+
+if __name__ == "__main__":
+    # The endpoint tests take the fake_engines fixture from conftest.py
+    sys.exit(pytest.main([__file__, "-s"]))
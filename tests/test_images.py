@@ -0,0 +1,111 @@
+import sys
+import os
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import fitz  # PyMuPDF
+import httpx
+from app import main
+from app.core import images
+from app.core.extraction import PdfExtraction, shutdown_extraction_pool
+from tests.fakes import FakeModel
+
+LEASE = "The tenant pays a late fee of $75 for any rent received after the fifth day of the month. " * 30
+
+
+def photo_of_document(orientation: int = 6) -> bytes:
+    # A page "photographed" at 300 dpi, with an EXIF orientation and a metadata comment
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(40, 40, 560, 800), LEASE, fontsize=10)
+    jpeg = page.get_pixmap(dpi=300).tobytes("jpeg", jpg_quality=95)
+    doc.close()
+    comment = b"GPS 37.7749,-122.4194 Pixel 8"
+    return (jpeg[:2] + images._orientation_segment(orientation)
+            + b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment + jpeg[2:])
+
+
+def color_photo() -> bytes:
+    doc = fitz.open()
+    page = doc.new_page(width=600, height=450)
+    for i, colour in enumerate([(0.9, 0.15, 0.15), (0.15, 0.7, 0.25), (0.1, 0.25, 0.8)]):
+        page.draw_rect(fitz.Rect(i * 200, 0, (i + 1) * 200, 450), color=None, fill=colour)
+    jpeg = page.get_pixmap(dpi=288).tobytes("jpeg", jpg_quality=95)  # 2400 x 1800
+    doc.close()
+    return jpeg
+
+
+def test_optimize_photo_of_document():
+    original = photo_of_document()
+    image = images.optimize_image(original, "image/jpeg")
+    pixmap = fitz.Pixmap(image["data"])
+
+    assert image["mime_type"] == "image/jpeg"
+    assert max(pixmap.width, pixmap.height) == images.IMAGE_MAX_SIDE
+    assert pixmap.n == 1  # a page of text goes out in grayscale
+    assert len(image["data"]) < len(original) / 3
+    # Metadata is gone, only the orientation survives
+    assert b"GPS" not in image["data"] and images.exif_orientation(image["data"]) == 6
+
+
+def test_color_photos_and_unsupported_formats():
+    image = images.optimize_image(color_photo(), "image/jpeg")
+    assert fitz.Pixmap(image["data"]).n == 3
+
+    webp = b"RIFF\x00\x00\x00\x00WEBPVP8 " + bytes(64)
+    assert images.optimize_image(webp, "image/webp") == {"mime_type": "image/webp", "data": webp}
+    # Already small and without metadata: sent as it is
+    png = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 8, 8), False).tobytes("png")
+    assert images.optimize_image(png, "image/png")["data"] == png
+
+
+def test_pdf_images_only_from_pages_without_text():
+    scan = photo_of_document(orientation=1)
+    doc = fitz.open()
+    text_page = doc.new_page()
+    text_page.insert_textbox(fitz.Rect(40, 40, 560, 800), LEASE, fontsize=10)
+    text_page.insert_image(fitz.Rect(40, 700, 140, 800), stream=color_photo())  # decoration on a text page
+    for _ in range(2):
+        # Two scanned pages from separate files: byte-identical images under separate xrefs
+        scanned = fitz.open()
+        scanned.new_page().insert_image(fitz.Rect(0, 0, 595, 842), stream=scan)
+        doc.insert_pdf(scanned)
+        scanned.close()
+    pdf = doc.tobytes()
+    doc.close()
+
+    async def run():
+        extraction = PdfExtraction(pdf)
+        try:
+            [t async for t in extraction.pages()]
+            return extraction, await extraction.images(limit=10)
+        finally:
+            extraction.close()
+
+    try:
+        extraction, found = asyncio.run(run())
+    finally:
+        shutdown_extraction_pool()
+    assert extraction.skipped_images == 1 and len(extraction.image_xrefs) == 2
+    assert len(found) == 1 and len(found[0]["data"]) < len(scan) / 3
+
+
+def test_image_upload_is_optimized_before_the_model_call(fake_engines):
+    sent = []
+    fake_engines(FakeModel(reply=lambda content: sent.append(content) or "- Late fee risk"))
+    photo = photo_of_document()
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await http.post("/analyze/file", files={"file": ("lease.jpg", photo, "image/jpeg")})
+
+    try:
+        response = asyncio.run(run())
+    finally:
+        shutdown_extraction_pool()
+    assert response.status_code == 200
+    image = next(part for part in sent[0] if isinstance(part, dict))
+    assert image["mime_type"] == "image/jpeg" and len(image["data"]) < len(photo) / 3
@@ -0,0 +1,201 @@
+import sys
+import os
+import time
+import json
+import asyncio
+import sqlite3
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from app import main
+from app.core.jobs import JobStore, JobWorker, JobInputError, check_callback_url, INTERACTIVE, BULK
+from app.core.model_client import RateLimited, RetryPolicy
+from tests.fakes import FakeModel
+
+NO_WAIT = RetryPolicy(max_retries=3, base_delay=0.0, max_delay=0.0)
+
+
+def test_queue_order_idempotency_and_leases():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JobStore(tmp)
+        bulk = store.submit("analyze", {"n": 1}, lane=BULK)
+        interactive = store.submit("analyze", {"n": 2}, lane=INTERACTIVE)
+        again = store.submit("analyze", {"n": 3}, lane=BULK, idempotency_key="upload-42")
+        assert store.submit("analyze", {"n": 4}, lane=BULK, idempotency_key="upload-42").id == again.id
+        # Keys are per kind: the same key on another kind of job is another job
+        other = store.submit("simplify", {"n": 5}, lane=BULK, idempotency_key="upload-42")
+        assert other.id != again.id and other.kind == "simplify"
+        assert store.submit("simplify", {"n": 6}, lane=BULK, idempotency_key="upload-42").id == other.id
+
+        # Interactive jobs jump the bulk queue; interactive-only slots never take bulk work
+        assert store.claim().id == interactive.id
+        assert store.claim(lanes=(INTERACTIVE,)) is None
+        claimed = store.claim(lease_seconds=0)
+        assert claimed.id == bulk.id and claimed.attempts == 1
+
+        # "Restart": a new store on the same directory reclaims the job whose lease expired
+        restarted = JobStore(tmp)
+        time.sleep(0.01)
+        reclaimed = restarted.claim()
+        assert reclaimed.id == bulk.id and reclaimed.attempts == 2
+        # The stale attempt can no longer record a result
+        assert not store.complete(claimed, "stale result")
+        assert restarted.complete(reclaimed, "fresh result")
+        assert restarted.get(bulk.id).result == "fresh result"
+
+
+def test_old_job_files_get_keys_per_kind():
+    with tempfile.TemporaryDirectory() as tmp:
+        # A file created while keys were unique across kinds
+        conn = sqlite3.connect(os.path.join(tmp, "jobs.db"))
+        conn.execute("""CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, lane TEXT NOT NULL,
+            status TEXT NOT NULL, params TEXT NOT NULL, input_path TEXT, callback_url TEXT,
+            idempotency_key TEXT UNIQUE, attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL,
+            progress TEXT NOT NULL DEFAULT '{}', result TEXT, error TEXT, error_status INTEGER,
+            callback_status TEXT, lease_until REAL, not_before REAL NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL, updated_at REAL NOT NULL)""")
+        conn.execute("INSERT INTO jobs (id, kind, lane, status, params, idempotency_key, max_attempts, created_at,"
+                     " updated_at) VALUES ('old', 'analyze', 'bulk', 'queued', '{}', 'k', 3, 0, 0)")
+        conn.commit()
+        conn.close()
+
+        store = JobStore(tmp)
+        assert store.get("old").idempotency_key == "k"
+        assert store.submit("analyze", {}, idempotency_key="k").id == "old"
+        assert store.submit("batch", {}, idempotency_key="k").id != "old"
+
+
+def test_worker_retries_and_calls_back():
+    callbacks = []
+
+    def handler(request):
+        callbacks.append(json.loads(request.content))
+        return httpx.Response(204)
+
+    attempts = []
+
+    async def flaky(job, progress):
+        attempts.append(job.attempts)
+        await progress(stage="working")
+        if len(attempts) < 3:
+            raise RateLimited("quota")
+        return "report"
+
+    async def broken(job, progress):
+        raise ValueError("unreadable input")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JobStore(tmp)
+        worker = JobWorker(store, {"analyze": flaky}, workers=1, interactive_workers=0, poll_interval=0.01,
+                           retry=NO_WAIT, callback_transport=httpx.MockTransport(handler), callback_hosts=("client.test",))
+        job = store.submit("analyze", {}, callback_url="http://client.test/hook")
+
+        async def run():
+            worker.start()
+            for _ in range(500):
+                if store.get(job.id).callback_status:
+                    break
+                await asyncio.sleep(0.01)
+            await worker.stop()
+
+        asyncio.run(run())
+        done = store.get(job.id)
+        assert done.status == "done" and done.result == "report"
+        assert attempts == [1, 2, 3]
+        assert done.progress == {"stage": "working"}
+        assert done.callback_status == "delivered"
+        assert callbacks[0]["job_id"] == job.id and callbacks[0]["result"] == "report"
+
+        # Retries stop at max_attempts
+        worker.runners["analyze"] = broken
+        job = store.submit("analyze", {}, max_attempts=2)
+
+        async def run_twice():
+            for _ in range(2):
+                await worker.run(store.claim())
+
+        asyncio.run(run_twice())
+        failed = store.get(job.id)
+        assert failed.status == "failed" and failed.attempts == 2
+        assert failed.to_dict()["error"] == {"message": "unreadable input", "status": 500}
+
+
+def test_job_endpoints(fake_engines, monkeypatch):
+    fake_engines(FakeModel(reply="- Red flag: deposit is non-refundable"))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JobStore(tmp)
+        monkeypatch.setattr(main, "job_store", store)
+        monkeypatch.setattr(main.job_worker, "store", store)
+
+        async def run():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                files = {"file": ("lease.txt", b"The deposit is non-refundable.", "text/plain")}
+                submitted = await http.post("/jobs/analyze", files=files, headers={"Idempotency-Key": "lease-1"})
+                duplicate = await http.post("/jobs/analyze", files=files, headers={"Idempotency-Key": "lease-1"})
+                queued = await http.get(submitted.json()["status_url"])
+
+                # Run the queued job here instead of in the lifespan-started pool
+                await main.job_worker.run(main.job_store.claim())
+                finished = await http.get(submitted.json()["status_url"])
+                events = await http.get(submitted.json()["status_url"] + "/events")
+                missing = await http.get("/jobs/does-not-exist")
+                return submitted, duplicate, queued, finished, events, missing
+
+        submitted, duplicate, queued, finished, events, missing = asyncio.run(run())
+        leftovers = os.listdir(os.path.join(tmp, "inputs"))
+
+    assert submitted.status_code == 202 and submitted.json()["lane"] == INTERACTIVE
+    assert duplicate.json()["job_id"] == submitted.json()["job_id"]
+    assert queued.json()["status"] == "queued"
+    assert finished.json()["status"] == "done"
+    assert finished.json()["result"] == "- Red flag: deposit is non-refundable"
+    assert finished.json()["progress"]["stage"] == "done"
+    assert "event: done" in events.text
+    assert missing.status_code == 404
+    assert leftovers == []  # the input file is removed once the job has finished
+
+
+def test_callbacks_only_go_to_public_or_allowed_hosts():
+    for url in ("http://localhost:8000/hook", "http://127.0.0.1/hook", "http://169.254.169.254/latest/meta-data",
+                "http://10.0.0.5/hook", "http://[::1]/hook", "http://[fe80::1]/hook", "file:///etc/passwd"):
+        try:
+            check_callback_url(url)
+            raise AssertionError(f"{url} accepted")
+        except ValueError:
+            pass
+    check_callback_url("https://93.184.216.34/hook")
+    check_callback_url("https://hooks.example.com/job", allowed_hosts=("*.example.com",))
+    try:
+        check_callback_url("https://8.8.8.8/hook", allowed_hosts=("*.example.com",))
+        raise AssertionError("host outside the allow-list accepted")
+    except ValueError:
+        pass
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await http.post("/jobs/generate", json={
+                "template_name": "parking_appeal_template.txt", "region": "California", "case_details": {},
+                "callback_url": "http://169.254.169.254/latest/meta-data"})
+
+    rejected = asyncio.run(run())
+    assert rejected.status_code == 400 and "private" in rejected.json()["detail"]
+
+
+def test_input_errors_fail_the_job_without_retries():
+    async def missing_template(job, progress):
+        raise JobInputError("Template not found", status_code=404)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JobStore(tmp)
+        worker = JobWorker(store, {"generate": missing_template}, workers=0, interactive_workers=0, retry=NO_WAIT)
+        job = store.submit("generate", {})
+        asyncio.run(worker.run(store.claim()))
+        failed = store.get(job.id)
+    assert failed.status == "failed" and failed.attempts == 1
+    assert failed.to_dict()["error"] == {"message": "Template not found", "status": 404}
@@ -0,0 +1,68 @@
+import sys
+import os
+import asyncio
+import statistics
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core import settings
+from app.core.model_client import ModelClient, RetryPolicy
+from benchmarks import results, bench_endpoints
+from tests.fakes import FakeModel, FakeAPIError, lognormal_latency, digest_reply, load_test_model
+
+
+def test_fake_latency_and_replies_are_deterministic():
+    latency, again = lognormal_latency(0.1, 0.4, seed=7), lognormal_latency(0.1, 0.4, seed=7)
+    draws = [latency(n) for n in range(2000)]
+    assert draws[:50] == [again(n) for n in range(50)]
+    assert abs(statistics.median(draws) - 0.1) < 0.01
+    assert 0.3 < sorted(draws)[int(len(draws) * 0.99)] < 0.55
+
+    reply = digest_reply(30)
+    assert reply("lease A") == reply("lease A") != reply("lease B")
+    assert len(reply("lease A").split()) == 30
+
+
+def test_injected_errors_are_retried_and_streams_chunked():
+    fake = FakeModel(reply="one two three four five", error_rate=0.5, chunk_words=2, seed=3)
+    client = ModelClient("fake-model", model=fake, retry=RetryPolicy(max_retries=10, base_delay=0.0, max_delay=0.0))
+
+    async def run():
+        texts = [(await client.generate(f"prompt {i}")).text for i in range(20)]
+        chunks = [chunk async for chunk in client.generate_stream("prompt")]
+        return texts, chunks
+
+    texts, chunks = asyncio.run(run())
+    assert texts == ["one two three four five"] * 20
+    # Roughly half of the calls failed with a 429/503 and were retried
+    assert 10 <= client.retries <= 40 and fake.calls == 21 + client.retries
+    assert "".join(chunks).split() == "one two three four five".split() and len(chunks) == 3
+
+
+def test_model_factory_setting():
+    original = settings.MODEL_FACTORY
+    settings.MODEL_FACTORY = "app.core.fakes:load_test_model"
+    try:
+        model = settings.create_model("gemini-test")
+    finally:
+        settings.MODEL_FACTORY = original
+    assert isinstance(model, FakeModel) and isinstance(load_test_model("x"), FakeModel)
+    assert FakeAPIError(429).code == 429
+
+
+def test_compare_flags_regressions_by_metric_direction():
+    baseline = {"benchmarks": {"endpoints": [{"case": "POST /analyze", "requests_per_s": 100.0, "p99_ms": 50.0,
+                                              "requests": 200}]}}
+    current = {"benchmarks": {"endpoints": [{"case": "POST /analyze", "requests_per_s": 60.0, "p99_ms": 40.0,
+                                             "requests": 100}]}}
+    rows = {row["metric"]: row for row in results.compare(current, baseline, tolerance=0.25)}
+    assert set(rows) == {"requests_per_s", "p99_ms"}  # counts are not compared
+    assert rows["requests_per_s"]["regression"] and rows["requests_per_s"]["change"] == -0.4
+    assert not rows["p99_ms"]["regression"] and rows["p99_ms"]["change"] == 0.2
+
+
+def test_endpoint_benchmark_smoke():
+    rows = bench_endpoints.benchmark(count=6, concurrency=3, latency=0.0, only="POST /simplify/stream")
+    assert [row["case"] for row in rows] == ["POST /simplify/stream"]
+    assert rows[0]["failed"] == 0 and rows[0]["model_calls"] == 6 and rows[0]["ttfb_p50_ms"] >= 0
@@ -0,0 +1,69 @@
+import sys
+import os
+import json
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from app import main
+from app.core import metrics
+from app.core.model_client import ModelClient, RateLimited, RetryPolicy
+from tests.fakes import FakeModel
+
+
+def test_registry_renders_prometheus_text():
+    registry = metrics.Registry()
+    calls = registry.counter("demo_calls_total", "Calls", ("route",))
+    latency = registry.histogram("demo_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    registry.gauge("demo_depth", "Queue depth", collect=lambda: {(): 7})
+    original = metrics.registry
+    metrics.registry = registry  # instruments check the module-level registry
+    try:
+        calls.inc(route='/a"b')
+        latency.observe(0.05, route="/a")
+        latency.observe(5.0, route="/a")
+        text = registry.render()
+        registry.enabled = False
+        calls.inc(route="/ignored")
+    finally:
+        metrics.registry = original
+
+    assert "# TYPE demo_calls_total counter" in text
+    assert 'demo_calls_total{route="/a\\"b"} 1' in text
+    assert 'demo_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{route="/a",le="1"} 1' in text
+    assert 'demo_seconds_bucket{route="/a",le="+Inf"} 2' in text
+    assert 'demo_seconds_count{route="/a"} 2' in text
+    assert "demo_depth 7" in text
+    assert "/ignored" not in registry.render()
+
+
+def test_metrics_endpoint_and_trace_spans(fake_engines, monkeypatch, caplog):
+    fake = FakeModel(reply="Risky clause found", faults=[RateLimited("quota")])
+    fake_engines(ModelClient("metrics-model", model=fake, retry=RetryPolicy(max_retries=2, base_delay=0.0, max_delay=0.0)))
+    monkeypatch.setattr(metrics.registry, "trace", True)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as http:
+            analyzed = await http.post("/analyze", json={"text": "Call me at 555-123-4567."})
+            await http.post("/analyze/stream", json={"text": "Another contract."})
+            scraped = await http.get("/metrics")
+            return analyzed, scraped
+
+    with caplog.at_level("INFO", logger="app.core.metrics"):
+        analyzed, scraped = asyncio.run(run())
+
+    text = scraped.text
+    assert 'equalizer_http_requests_total{method="POST",route="/analyze",status="200"}' in text
+    assert 'equalizer_model_retries_total{model="metrics-model"} 1' in text
+    assert 'equalizer_model_call_seconds_count{model="metrics-model",outcome="rate_limited"} 1' in text
+    assert 'equalizer_model_stream_ttfb_seconds_count{model="metrics-model"} 1' in text
+    assert 'equalizer_prompt_tokens_count{model="metrics-model"}' in text
+    assert 'equalizer_stage_seconds_count{stage="redaction"}' in text
+    # The traced request reports where its time went
+    timing = analyzed.headers["server-timing"]
+    assert "redaction;dur=" in timing and "model;dur=" in timing
+    traced = [json.loads(r.getMessage())["trace"] for r in caplog.records if r.name == "app.core.metrics"]
+    assert {"route": "/analyze", "status": 200} == {k: traced[0][k] for k in ("route", "status")}
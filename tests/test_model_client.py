@@ -0,0 +1,171 @@
+import sys
+import os
+import time
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from google.api_core import exceptions as google_exceptions
+from app import main
+from app.core.model_client import (ModelClient, ConcurrencyLimiter, TokenBucket, RetryPolicy, LatencyTracker,
+                                   ModelError, RateLimited, DeadlineExceeded, deadline_after)
+from tests.fakes import FakeModel
+
+FAST_RETRY = RetryPolicy(max_retries=3, base_delay=0.01, max_delay=0.05)
+
+
+def _client(fake, **kwargs):
+    kwargs.setdefault("retry", FAST_RETRY)
+    kwargs.setdefault("limiter", ConcurrencyLimiter(16))
+    return ModelClient("fake-model", model=fake, rate_limiter=TokenBucket(0), **kwargs)
+
+
+def test_retries_transient_errors():
+    fake = FakeModel(reply="ok", faults=[google_exceptions.ResourceExhausted("quota"),
+                                         google_exceptions.ServiceUnavailable("overloaded"), None])
+    client = _client(fake)
+    response = asyncio.run(client.generate("prompt"))
+    assert response.text == "ok"
+    assert fake.calls == 3 and client.retries == 2
+    # The 429 halved the concurrency limit (the 503 came within the backoff interval)
+    assert client.limiter.current_limit == 8
+
+    # Streams are retried too, as long as nothing was sent yet
+    fake = FakeModel(reply="streamed ok", faults=[google_exceptions.ServiceUnavailable("overloaded")])
+    client = _client(fake)
+
+    async def collect():
+        return "".join([text async for text in client.generate_stream("prompt")])
+
+    assert asyncio.run(collect()).strip() == "streamed ok"
+    assert fake.calls == 2
+
+
+def test_structured_errors_after_retries():
+    fake = FakeModel(faults=[google_exceptions.ResourceExhausted("quota")] * 10)
+    client = _client(fake, retry=RetryPolicy(max_retries=2, base_delay=0.01))
+    try:
+        asyncio.run(client.generate("prompt"))
+        assert False, "expected RateLimited"
+    except RateLimited as e:
+        assert e.status_code == 429
+    assert fake.calls == 3
+
+    # Client errors are not retried
+    fake = FakeModel(faults=[google_exceptions.InvalidArgument("bad request")])
+    try:
+        asyncio.run(_client(fake).generate("prompt"))
+        assert False, "expected ModelError"
+    except ModelError as e:
+        assert e.status_code == 502 and not e.retryable
+    assert fake.calls == 1
+
+
+def test_adaptive_concurrency():
+    limiter = ConcurrencyLimiter(16, backoff_interval=0)
+    limiter.on_overload()
+    limiter.on_overload()
+    assert limiter.current_limit == 4
+    for _ in range(100):
+        limiter.on_success()
+    assert 4 < limiter.current_limit <= 16
+
+    # Concurrent 429s within one interval only halve the limit once
+    limiter = ConcurrencyLimiter(16, backoff_interval=60)
+    for _ in range(5):
+        limiter.on_overload()
+    assert limiter.current_limit == 8
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate_per_minute=600, burst=1)  # 10 per second
+
+    async def take(n):
+        for _ in range(n):
+            await bucket.acquire()
+
+    start = time.perf_counter()
+    asyncio.run(take(5))
+    elapsed = time.perf_counter() - start
+    assert 0.35 < elapsed < 1.0
+
+    try:
+        asyncio.run(bucket.acquire(deadline=time.monotonic() + 0.01))
+        assert False, "expected RateLimited"
+    except RateLimited:
+        pass
+
+
+def test_hedged_request_beats_slow_primary():
+    # First call stalls, the duplicate answers quickly
+    fake = FakeModel(reply="ok", latency=lambda call: 2.0 if call == 1 else 0.05)
+    latency = LatencyTracker(percentile=95, min_delay=0.0, budget=1.0, min_samples=5)
+    for _ in range(5):
+        latency.record(0.05)
+    client = _client(fake, latency=latency)
+
+    start = time.perf_counter()
+    response = asyncio.run(client.generate("prompt"))
+    elapsed = time.perf_counter() - start
+    assert response.text == "ok"
+    assert fake.calls == 2 and latency.hedges == 1
+    assert elapsed < 1.0
+
+
+def test_deadline_propagates():
+    fake = FakeModel(latency=2.0)
+    client = _client(fake)
+
+    async def run():
+        with deadline_after(0.1):
+            return await client.generate("prompt")
+
+    start = time.perf_counter()
+    try:
+        asyncio.run(run())
+        assert False, "expected DeadlineExceeded"
+    except DeadlineExceeded as e:
+        assert e.status_code == 504
+    assert time.perf_counter() - start < 1.0
+
+
+def test_http_status_codes(fake_engines):
+    fake = FakeModel(latency=0.0, faults=[google_exceptions.ResourceExhausted("quota")] * 10)
+    fake_engines(_client(fake, retry=RetryPolicy(max_retries=1, base_delay=0.01)))
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            limited = await http.post("/analyze", json={"text": "Late fees apply."})
+            fake.faults.clear()
+            fake.latency = 2.0
+            timed_out = await http.post("/analyze", json={"text": "Late fees apply."},
+                                        headers={"X-Request-Timeout": "0.1"})
+            return limited, timed_out
+
+    limited, timed_out = asyncio.run(run())
+
+    assert limited.status_code == 429 and limited.json()["error"] == "rate_limited"
+    assert timed_out.status_code == 504 and timed_out.json()["error"] == "deadline_exceeded"
+
+
+def test_blocked_and_stopped_responses_return_422(fake_engines):
+    async def run(fake):
+        fake_engines(_client(fake), "detector", "action_engine")
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            analyzed = await http.post("/analyze", json={"text": "Late fees apply."})
+            generated = await http.post("/action/generate", json={
+                "template_name": "parking_appeal_template.txt", "region": "California",
+                "case_details": {"Story": "The sign was hidden by a tree"}})
+            return analyzed, generated
+
+    # A blocked prompt, and an answer stopped by the safety filters (.text raises ValueError)
+    blocked = asyncio.run(run(FakeModel(block_reason="SAFETY")))
+    stopped = asyncio.run(run(FakeModel(finish_reason="RECITATION")))
+
+    for response in blocked + stopped:
+        assert response.status_code == 422 and response.json()["error"] == "blocked"
+    assert "SAFETY" in blocked[0].json()["detail"]
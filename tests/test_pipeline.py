@@ -0,0 +1,178 @@
+import sys
+import os
+import time
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from app import main
+from app.core.pipeline import DocumentPipeline, tee_pages
+from app.core.risk_detector import RiskDetector
+from app.core.simplifier import DocumentSimplifier
+from app.core.voice_interface import VoiceInterface
+from app.core.cache import ResponseCache
+from app.core.model_client import ModelClient
+from tests.fakes import FakeModel
+
+
+def _reply(prompt) -> str:
+    text = prompt if isinstance(prompt, str) else " ".join(p for p in prompt if isinstance(p, str))
+    if "Translate" in text:
+        return "translated"
+    if "simplif" in text.lower():
+        return "simple version"
+    return "risk report"
+
+
+def _components(fake):
+    client = ModelClient("fake-model", model=fake)
+    parts = (RiskDetector(cache=ResponseCache()), DocumentSimplifier(cache=ResponseCache()),
+             VoiceInterface(cache=ResponseCache()))
+    for part in parts:
+        part.model = fake
+        part.client = client
+    return parts
+
+
+def test_tee_pages_reads_source_once():
+    pulled = []
+
+    async def pages():
+        for i in range(5):
+            pulled.append(i)
+            await asyncio.sleep(0)
+            yield f"page {i}"
+
+    async def consume(source):
+        return [page async for page in source]
+
+    async def run():
+        (a, b), _ = tee_pages(pages(), 2)
+        return await asyncio.gather(consume(a), consume(b))
+
+    first, second = asyncio.run(run())
+    assert first == second == [f"page {i}" for i in range(5)]
+    assert pulled == list(range(5))
+
+
+def test_closing_a_tee_stops_reading_the_source():
+    pulled, closed = [], []
+
+    async def pages():
+        try:
+            for i in range(1000):
+                pulled.append(i)
+                await asyncio.sleep(0.001)
+                yield f"page {i}"
+        finally:
+            closed.append(True)
+
+    async def run():
+        (a, b), close = tee_pages(pages(), 2)
+        first = await a.__anext__()
+        await close()
+        read = len(pulled)
+        await asyncio.sleep(0.05)
+        return first, read
+
+    first, read = asyncio.run(run())
+    assert first == "page 0" and closed == [True]
+    assert len(pulled) == read < 1000
+
+
+def test_pipeline_runs_stages_concurrently():
+    latency = 0.3
+    fake = FakeModel(latency=latency, reply=_reply)
+    pipeline = DocumentPipeline(*_components(fake))
+
+    start = time.perf_counter()
+    result = asyncio.run(pipeline.run(["Hindi", "Tamil", "Spanish", "Hindi"],
+                                      text_content="Tenant pays all repairs."))
+    elapsed = time.perf_counter() - start
+    print(f"Pipeline with 3 languages took {elapsed:.2f}s (one call = {latency}s)")
+
+    assert result["analysis"] == "risk report"
+    assert result["simplified"] == "simple version"
+    assert result["translations"] == {"Hindi": "translated", "Tamil": "translated", "Spanish": "translated"}
+    assert fake.calls == 5
+    # max(analyze, simplify) + translate, not the sum of all five calls
+    assert elapsed < 3 * latency
+
+
+def test_pipeline_endpoint():
+    fake = FakeModel(reply=_reply)
+    originals = (main.pipeline.detector, main.pipeline.simplifier, main.pipeline.voice)
+    main.pipeline.detector, main.pipeline.simplifier, main.pipeline.voice = _components(fake)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            files = {"file": ("lease.txt", b"Tenant pays all repairs.", "text/plain")}
+            plain = await client.post("/pipeline", files=files, data={"languages": "Hindi, Tamil"})
+            streamed = await client.post("/pipeline/stream", files=files, data={"languages": "Hindi"})
+            too_many = await client.post("/pipeline", files=files, data={"languages": ",".join(str(i) for i in range(20))})
+            return plain, streamed, too_many
+
+    try:
+        plain, streamed, too_many = asyncio.run(run())
+    finally:
+        main.pipeline.detector, main.pipeline.simplifier, main.pipeline.voice = originals
+
+    assert plain.status_code == 200
+    assert plain.json() == {"analysis": "risk report", "simplified": "simple version",
+                            "translations": {"Hindi": "translated", "Tamil": "translated"}, "errors": []}
+    assert streamed.text.count("event: section") == 3 and streamed.text.rstrip().endswith("data: {}")
+    assert too_many.status_code == 400
+
+
+def test_failed_stage_is_an_error_event_and_the_rest_carries_on():
+    fake = FakeModel(reply=_reply)
+    detector, simplifier, voice = _components(fake)
+    detector.client = ModelClient("fake-model", model=FakeModel(block_reason="SAFETY"))
+    pipeline = DocumentPipeline(detector, simplifier, voice)
+
+    async def collect():
+        return [part async for part in pipeline.stream(["Hindi"], text_content="Tenant pays all repairs.")]
+
+    parts = asyncio.run(collect())
+    failed = [part for part in parts if "error" in part]
+    assert [part["section"] for part in failed] == ["analysis"] and failed[0]["error"].status_code == 422
+    assert {"section": "simplified", "text": "simple version"} in parts
+    assert {"section": "translation", "language": "Hindi", "text": "translated"} in parts
+
+    # run() keeps what succeeded and reports the failed stage; it raises only if nothing succeeded
+    result = asyncio.run(pipeline.run(["Hindi"], text_content="Tenant pays all repairs."))
+    assert result["analysis"] is None and result["simplified"] == "simple version"
+    assert result["translations"] == {"Hindi": "translated"}
+    assert [part["section"] for part in result["errors"]] == ["analysis"]
+    simplifier.client = detector.client
+    try:
+        asyncio.run(pipeline.run([], text_content="Another lease."))
+    except Exception as e:
+        assert e.status_code == 422
+    else:
+        raise AssertionError("expected the stage error")
+
+    originals = (main.pipeline.detector, main.pipeline.simplifier, main.pipeline.voice)
+    main.pipeline.detector, main.pipeline.simplifier, main.pipeline.voice = detector, simplifier, voice
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            files = {"file": ("lease.txt", b"Tenant pays all repairs.", "text/plain")}
+            streamed = await client.post("/pipeline/stream", files=files, data={"languages": "Hindi"})
+            return streamed, await client.post("/pipeline", files=files, data={"languages": "Hindi"})
+
+    simplifier.client = ModelClient("fake-model", model=fake)
+    try:
+        streamed, plain = asyncio.run(run())
+    finally:
+        main.pipeline.detector, main.pipeline.simplifier, main.pipeline.voice = originals
+    assert streamed.text.count("event: section") == 2 and streamed.text.count("event: error") == 1
+    assert '"section": "analysis"' in streamed.text and '"error": "blocked"' in streamed.text
+    assert streamed.text.rstrip().endswith("data: {}")
+    assert plain.status_code == 200 and plain.json()["simplified"] == "simple version"
+    assert plain.json()["errors"] == [{"section": "analysis", "message": plain.json()["errors"][0]["message"],
+                                       "status": 422, "error": "blocked"}]
@@ -0,0 +1,193 @@
+import sys
+import os
+import time
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from app import main
+from app.core import model_client
+from app.core.cache import ResponseCache
+from app.core.model_client import ModelClient, ConcurrencyLimiter, TokenBucket, RetryPolicy, RateLimited
+from app.core.routing import ModelRouter, RoutingPolicy
+from app.core.risk_detector import RiskDetector
+from app.core.voice_interface import VoiceInterface
+from tests.fakes import FakeModel, FakeAPIError
+
+NO_RETRY = RetryPolicy(max_retries=0)
+
+POLICY = {
+    "tiers": {"small": ["small", "standard"], "standard": ["standard", "large"], "large": ["large"]},
+    "routes": [
+        {"name": "short-translate", "operations": ["translate"], "max_tokens": 500, "tier": "small"},
+        {"name": "images", "image": True, "tier": "standard"},
+        {"name": "long", "min_tokens": 2000, "tier": "large"},
+    ],
+    "prices": {"small": [0.1, 0.4], "standard": [0.5, 3.0], "large": [2.0, 12.0]},
+}
+
+
+def _register(**fakes):
+    # Shared clients for fake models; returns the previous registry to restore
+    original = dict(model_client._clients)
+    for name, fake in fakes.items():
+        model_client.set_model_client(name, ModelClient(name, model=fake, retry=NO_RETRY,
+                                                        limiter=ConcurrencyLimiter(16), rate_limiter=TokenBucket(0)))
+    return original
+
+
+def test_routes_by_operation_size_and_modality_and_falls_back_on_overload():
+    small = FakeModel(reply="short", faults=[None, FakeAPIError(429)])
+    standard, large = FakeModel(reply="standard"), FakeModel(reply="- [LOW] Fine: nothing")
+    original = _register(small=small, standard=standard, large=large)
+    router = ModelRouter(RoutingPolicy.from_dict(POLICY))
+    voice = VoiceInterface("standard", cache=ResponseCache(), router=router)
+    detector = RiskDetector("standard", cache=ResponseCache(), router=router)
+
+    async def run():
+        answers = [await voice.translate_to_mother_tongue_async("Pay rent by Friday.", "Spanish")]
+        answers.append(await detector.analyze_document_async("Late fee: $75.", b"\xff\xd8jpeg", "image/jpeg"))
+        answers.append(await detector.analyze_document_async("The tenant shall pay. " * 800))
+        # The small model answers 429: the call falls back, and the next one skips it while it cools down
+        answers.append(await voice.translate_to_mother_tongue_async("Call the landlord.", "French"))
+        answers.append(await voice.translate_to_mother_tongue_async("Keep your receipts.", "French"))
+        return answers
+
+    try:
+        answers = asyncio.run(run())
+    finally:
+        model_client._clients.clear()
+        model_client._clients.update(original)
+    assert answers == ["short", "standard", "- [LOW] Fine: nothing", "standard", "standard"]
+    assert (small.calls, standard.calls, large.calls) == (2, 3, 1)
+
+    stats = router.stats()
+    translate = stats["routes"]["short-translate"]
+    assert translate["calls"] == 3 and translate["fallbacks"] == 1 and translate["failures"] == 0
+    assert translate["models"]["small"]["errors"] == {RateLimited.kind: 1}
+    assert stats["routes"]["images"]["models"]["standard"]["ok"] == 1
+    assert stats["routes"]["long"]["models"]["large"]["cost_usd"] > translate["models"]["small"]["cost_usd"] > 0
+    assert "small" in stats["cooling_down"]
+
+
+def test_falls_back_on_block_timeout_and_before_the_first_streamed_chunk():
+    policy = RoutingPolicy.from_dict({
+        "tiers": {"pair": ["a", "b"]},
+        "routes": [{"name": "pair", "tier": "pair", "attempt_timeout": 0.05, "max_latency": 0.1}],
+        "min_samples": 3,
+    })
+    blocking, slow, failing = FakeModel(block_reason="SAFETY"), FakeModel(latency=0.5), FakeModel(faults=[FakeAPIError(503)])
+    b = FakeModel(reply="from b")
+
+    async def run(model_a):
+        original = _register(a=model_a, b=b)
+        router = ModelRouter(policy)
+        client = model_client.get_model_client("a")
+        try:
+            start = time.monotonic()
+            response = await router.generate("analyze", "prompt", client)
+            elapsed = time.monotonic() - start
+            streamed = [text async for text in router.generate_stream("analyze", "prompt", client)]
+            return router, response.text, elapsed, "".join(streamed)
+        finally:
+            model_client._clients.clear()
+            model_client._clients.update(original)
+
+    router, text, _, streamed = asyncio.run(run(blocking))
+    assert text == "from b" and streamed == "from b "  # streams are blocked before the first chunk too
+    assert router.stats()["routes"]["pair"]["models"]["a"]["errors"] == {"blocked": 2}
+
+    router, text, elapsed, _ = asyncio.run(run(slow))
+    assert text == "from b" and elapsed < 0.4
+    assert router.stats()["routes"]["pair"]["models"]["a"]["errors"] == {"deadline_exceeded": 2}
+
+    router, text, _, streamed = asyncio.run(run(failing))
+    assert text == "from b" and streamed == "from b "
+    # 503 from "a": it cools down, so the stream already started on "b"
+    assert router.stats()["routes"]["pair"]["fallbacks"] == 1
+
+    # Observed latency: once "a" has been slower than max_latency, "b" is tried first
+    router = ModelRouter(policy)
+    assert router.route("analyze", "a", "prompt").models == ["a", "b"]
+    for _ in range(3):
+        router._latency["a"].append((time.monotonic(), 0.3))
+    assert router.route("analyze", "a", "prompt").models == ["b", "a"]
+
+
+def test_tiered_policy_sends_short_translations_to_the_fast_tier_with_fallbacks():
+    lite = FakeModel(reply="fast", faults=[None, FakeAPIError(503)])
+    flash, engine = FakeModel(reply="fallback"), FakeModel(reply="engine", faults=[None, FakeAPIError(503)])
+    original = _register(**{"gemini-2.5-flash-lite": lite, "gemini-2.5-flash": flash, "engine": engine})
+    router = ModelRouter(RoutingPolicy.load("tiered"))
+    voice = VoiceInterface("engine", cache=ResponseCache(), router=router)
+    detector = RiskDetector("engine", cache=ResponseCache(), router=router)
+
+    async def run():
+        return [await voice.translate_to_mother_tongue_async("Pay rent by Friday.", "Spanish"),
+                await voice.translate_to_mother_tongue_async("Call the landlord.", "Spanish"),
+                await detector.analyze_document_async("Late fee: $75.")]
+
+    try:
+        answers = asyncio.run(run())
+    finally:
+        model_client._clients.clear()
+        model_client._clients.update(original)
+    # The fast model, then the engine's own when it is overloaded; analysis falls back to gemini-2.5-flash
+    assert answers == ["fast", "engine", "fallback"]
+    routes = router.stats()["routes"]
+    assert routes["short-text"]["fallbacks"] == 1 and routes["default"]["fallbacks"] == 1
+
+    # Cache keys name the routing policy, so they differ from single-model keys (the default)
+    single = ModelRouter(RoutingPolicy.load(None))
+    assert single.cache_scope("engine") == "engine" and router.cache_scope("engine").startswith("engine@")
+    assert voice._cache_key("Hi", "Spanish") != VoiceInterface("engine", router=single)._cache_key("Hi", "Spanish")
+
+
+def test_tiered_policy_through_the_endpoints(fake_engines, monkeypatch):
+    lite = FakeModel(reply="Rapido", faults=[None, FakeAPIError(503)])
+    flash = FakeModel(reply="- Fallback report")
+    for name, fake in {"gemini-2.5-flash-lite": lite, "gemini-2.5-flash": flash}.items():
+        monkeypatch.setitem(model_client._clients, name, ModelClient(name, model=fake, retry=NO_RETRY,
+                                                                     limiter=ConcurrencyLimiter(16)))
+    own = FakeModel(reply="Propio")
+    fake_engines(ModelClient("fake-model", model=own, retry=NO_RETRY), "voice")
+    fake_engines(ModelClient("fake-model", model=FakeModel(faults=[FakeAPIError(503)]), retry=NO_RETRY))
+    router = ModelRouter(RoutingPolicy.load("tiered"))
+    for name in ("voice", "detector"):
+        monkeypatch.setattr(getattr(main, name), "router", router)
+    monkeypatch.setattr(main, "model_router", router)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            fast = await http.post("/voice/translate", json={"text": "Pay rent by Friday.", "target_language": "Spanish"})
+            overloaded = await http.post("/voice/translate", json={"text": "Call the landlord.", "target_language": "Spanish"})
+            analyzed = await http.post("/analyze", json={"text": "Late fee: $75."})
+            return fast, overloaded, analyzed, await http.get("/routing/stats")
+
+    fast, overloaded, analyzed, stats = asyncio.run(run())
+    # Short translation on the fast model, then on the engine's own one while the fast model is
+    # overloaded; analysis falls back from the engine's model to gemini-2.5-flash
+    assert fast.json()["analysis"] == "Rapido" and overloaded.json()["analysis"] == "Propio"
+    assert analyzed.json()["analysis"] == "- Fallback report"
+    assert lite.calls == 2 and own.calls == 1 and flash.calls == 1
+    routes = stats.json()["routes"]
+    assert routes["short-text"]["fallbacks"] == 1 and routes["default"]["fallbacks"] == 1
+
+
+def test_single_model_policy_keeps_each_engine_on_its_model_and_reports_stats(fake_engines):
+    fake = FakeModel(reply="Traducido")
+    fake_engines(fake, "voice")
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            translated = await http.post("/voice/translate", json={"text": "Pay rent", "target_language": "Spanish"})
+            return translated, await http.get("/routing/stats")
+
+    translated, stats = asyncio.run(run())
+    assert translated.json()["analysis"] == "Traducido" and fake.calls == 1
+    route = stats.json()["routes"]["default"]
+    assert route["models"]["fake-model"]["ok"] >= 1 and route["fallbacks"] == 0
@@ -0,0 +1,104 @@
+import sys
+import os
+import time
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from app import main
+from app.core.cache import ResponseCache
+from app.core.model_client import ModelClient
+from app.core.sessions import SessionStore, ContextCache
+from tests.fakes import FakeModel, FakeContextBackend
+
+
+def test_session_store_ttl_and_memory_eviction():
+    evicted = []
+    store = SessionStore(max_bytes=100, ttl=60, on_evict=lambda s: evicted.append(s.id))
+    first = store.create(["a" * 40])
+    second = store.create(["b" * 40])
+    assert store.get(first.id) is first  # now the most recently used
+    third = store.create(["c" * 40])
+    assert evicted == [second.id] and store.get(second.id) is None
+    assert store.stats()["bytes"] == 80 and store.stats()["evictions"] == 1
+
+    store.ttl = 0.01
+    store.get(third.id)  # sets a short expiry
+    time.sleep(0.02)
+    assert store.get(third.id) is None and evicted[-1] == third.id
+
+    try:
+        store.create(["x" * 200])
+        assert False, "a document larger than the store must be refused"
+    except ValueError:
+        pass
+
+
+def test_document_sessions_reuse_cached_context():
+    prompts = []
+    inline = FakeModel(reply=lambda content: prompts.append(("inline", str(content))) or "- inline answer")
+    bound = FakeModel(reply=lambda content: prompts.append(("context", str(content))) or "- context answer")
+    backend = FakeContextBackend(model=bound)
+    cores = (main.detector, main.simplifier, main.voice, main.action_engine)
+    originals = [(core.client, core.cache) for core in cores] + [(main.session_store, main.context_cache)]
+    for core in cores:
+        core.client = ModelClient("fake-model", model=inline)
+        core.cache = ResponseCache()
+    main.context_cache = ContextCache(backend=backend, min_tokens=100)
+    main.session_store = SessionStore(on_evict=main.context_cache.release)
+
+    policy = "Clause 7. The insurer may cancel this policy at any time without refund. " * 20
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            long_doc = (await http.post("/documents", files={"file": ("policy.txt", policy.encode(), "text/plain")})).json()
+            short_doc = (await http.post("/documents", files={"file": ("note.txt", b"Rent is due.", "text/plain")})).json()
+            doc_id = long_doc["doc_id"]
+            responses = [
+                await http.post("/analyze", json={"doc_id": doc_id}),
+                await http.post("/simplify", json={"doc_id": doc_id}),
+                await http.post("/voice/translate", json={"doc_id": doc_id, "target_language": "Spanish"}),
+                await http.post("/analyze", json={"doc_id": short_doc["doc_id"]}),
+            ]
+            described = await http.get(f"/documents/{doc_id}")
+            deleted = await http.delete(f"/documents/{doc_id}")
+            gone = await http.post("/analyze", json={"doc_id": doc_id})
+            return responses, described, deleted, gone
+
+    try:
+        responses, described, deleted, gone = asyncio.run(run())
+        for _ in range(100):
+            if backend.deleted:
+                break
+            time.sleep(0.01)
+    finally:
+        for core, (client, cache) in zip(cores, originals):
+            core.client, core.cache = client, cache
+        main.session_store, main.context_cache = originals[-1]
+
+    assert [r.status_code for r in responses] == [200, 200, 200, 200]
+    # One cached context for the long document, created once and used by every operation
+    assert len(backend.created) == 1 and "Clause 7" in str(backend.created[0].contents)
+    context_prompts = [p for kind, p in prompts if kind == "context"]
+    assert len(context_prompts) == 3 and not any("Clause 7" in p for p in context_prompts)
+    # The short document is below the threshold and goes inline
+    assert [p for kind, p in prompts if kind == "inline"] and "Rent is due." in prompts[-1][1]
+    assert described.json()["context_cached"] == [main.detector.model_name]
+    assert deleted.status_code == 204 and backend.deleted == backend.created
+    assert gone.status_code == 404
+
+
+def test_context_cache_failure_falls_back_to_inline(caplog):
+    session = SessionStore().create(["Long clause text. " * 100])
+    cache = ContextCache(backend=FakeContextBackend(fail=True), min_tokens=10)
+
+    async def run():
+        return await cache.model_for(session, "fake-model"), await cache.model_for(session, "fake-model")
+
+    with caplog.at_level("WARNING", logger="app.core.sessions"):
+        assert asyncio.run(run()) == (None, None)
+    assert cache.stats()["failed"] == 1  # not retried on every call
+    assert "sending text inline" in caplog.text
@@ -0,0 +1,88 @@
+import sys
+import os
+import time
+import asyncio
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from app import main
+from app.core.cache import AudioCache
+from app.core.speech import SpeechSynthesizer, GTTSBackend, split_sentences
+from tests.fakes import FakeTextToSpeech
+
+ADVICE = ("You have the right to dispute this fee within 30 days. Ask for the charge in writing. "
+          "Do not pay until you get it. Keep a copy of every letter.")
+
+
+def test_sentences_are_synthesized_concurrently_streamed_in_order_and_cached():
+    tts = FakeTextToSpeech(latency=0.05, chunk_bytes=8)
+    speech = SpeechSynthesizer(tts, cache=AudioCache(), concurrency=4)
+
+    async def run(text, language="English"):
+        start = time.monotonic()
+        chunks, first = [], None
+        async for chunk in speech.stream(text, language):
+            first = first if first is not None else time.monotonic() - start
+            chunks.append(chunk)
+        return chunks, first, time.monotonic() - start
+
+    chunks, first, total = asyncio.run(run(ADVICE))
+    assert [c.decode() for c in chunks] == split_sentences(ADVICE) and len(chunks) == 4
+    assert total < 0.15  # four sentences at once, not 4 x 50 ms
+
+    # Same advice again, with different spacing: nothing is synthesized
+    chunks, first, _ = asyncio.run(run(ADVICE.replace(". ", ".   ")))
+    assert len(tts.sentences) == 4 and first < 0.02
+    # Another language is another recording
+    asyncio.run(run("Ask for the charge in writing.", "Spanish"))
+    assert len(tts.sentences) == 5
+    assert speech.cache.stats()["hits"] == 4
+
+
+def test_audio_cache_is_bounded_and_has_a_disk_tier():
+    cache = AudioCache(max_bytes=100)
+    for i in range(5):
+        cache.set(f"k{i}", bytes(40))
+    assert cache.stats()["entries"] == 2 and cache.stats()["bytes"] == 80
+    assert cache.get("k0") is None and cache.get("k4") == bytes(40)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "audio.db")
+        writer = AudioCache(db_path=path, max_disk_bytes=250)
+        for i in range(4):
+            writer.set(f"sentence-{i}", bytes([i]) * 100)
+        # Another worker (or a restart) reads it from disk; the oldest entries were evicted
+        reader = AudioCache(db_path=path)
+        assert reader.get("sentence-3") == bytes([3]) * 100
+        assert reader.stats()["disk_hits"] == 1
+        assert reader.get("sentence-0") is None and reader.get("sentence-1") is None
+
+
+def test_speak_endpoint_streams_audio_and_reports_a_missing_backend():
+    tts = FakeTextToSpeech()
+    original = main.voice._speech
+    main.voice.speech = SpeechSynthesizer(tts, cache=AudioCache())
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            spoken = await http.post("/voice/speak", json={"text": ADVICE, "language": "Spanish"})
+            empty = await http.post("/voice/speak", json={"text": "  "})
+            main.voice.speech = SpeechSynthesizer(GTTSBackend(), cache=AudioCache())
+            unavailable = await http.post("/voice/speak", json={"text": ADVICE})
+            return spoken, empty, unavailable
+
+    try:
+        spoken, empty, unavailable = asyncio.run(run())
+    finally:
+        main.voice.speech = original
+    assert spoken.status_code == 200 and spoken.headers["content-type"] == "application/octet-stream"
+    assert spoken.content == "".join(split_sentences(ADVICE)).encode()
+    assert empty.status_code == 400
+    try:
+        import gtts  # noqa: F401
+    except ImportError:
+        assert unavailable.status_code == 503 and unavailable.json()["error"] == "tts_unavailable"
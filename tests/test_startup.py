@@ -0,0 +1,34 @@
+import sys
+import os
+import subprocess
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def test_import_defers_heavy_modules():
+    # A fresh interpreter, like a new uvicorn worker
+    code = ("import sys, app.main; "
+            "print(sorted(m for m in ('google.generativeai', 'fitz', 'numpy') if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_model_created_on_first_use():
+    from app.core.model_client import ModelClient
+    from tests.fakes import FakeModel
+
+    created = []
+    client = ModelClient("lazy-model")
+    import app.core.model_client as model_client
+    original = model_client.create_model
+    model_client.create_model = lambda name: created.append(name) or FakeModel()
+    try:
+        assert created == []
+        assert isinstance(client.model, FakeModel)
+        client.model
+        assert created == ["lazy-model"]
+    finally:
+        model_client.create_model = original
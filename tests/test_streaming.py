@@ -0,0 +1,87 @@
+import sys
+import os
+import time
+import json
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from app import main
+from tests.fakes import FakeModel
+
+
+def parse_sse(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def stream_request(url, payload):
+    """
+    Posts to a /stream endpoint. Returns (events, seconds to first chunk, total seconds).
+    """
+    async def run():
+        # Drive the ASGI app directly: httpx's ASGITransport buffers the whole body,
+        # which would hide the time to first byte.
+        body = json.dumps(payload).encode()
+        scope = {"type": "http", "method": "POST", "path": url, "raw_path": url.encode(),
+                 "query_string": b"", "headers": [(b"content-type", b"application/json")],
+                 "http_version": "1.1", "scheme": "http", "server": ("test", 80), "client": ("test", 1)}
+        received = []
+        start = time.perf_counter()
+        first_chunk = None
+        headers = {}
+
+        async def receive():
+            if not received:
+                received.append(True)
+                return {"type": "http.request", "body": body, "more_body": False}
+            await asyncio.sleep(3600)
+
+        chunks = []
+        async def send(message):
+            nonlocal first_chunk
+            if message["type"] == "http.response.start":
+                headers.update({k.decode(): v.decode() for k, v in message["headers"]})
+            elif message["type"] == "http.response.body":
+                text = message.get("body", b"").decode()
+                if first_chunk is None and "event: chunk" in text:
+                    first_chunk = time.perf_counter() - start
+                chunks.append(text)
+
+        await main.app(scope, receive, send)
+        assert headers["content-type"].startswith("text/event-stream")
+        return parse_sse("".join(chunks)), first_chunk, time.perf_counter() - start
+
+    return asyncio.run(run())
+
+
+def test_stream_ttfb(fake_engines):
+    fake_engines(FakeModel(reply=" ".join(["word"] * 40), chunk_delay=0.02))
+    events, ttfb, total = stream_request("/analyze/stream", {"text": "Clause 1"})
+    print(f"TTFB {ttfb:.3f}s, total {total:.3f}s")
+    assert [e for e, _ in events].count("chunk") == 40
+    assert events[-1] == ("done", {})
+    assert "".join(d["text"] for e, d in events if e == "chunk").split() == ["word"] * 40
+    # First byte arrives after one chunk, not after the whole generation
+    assert ttfb < total / 4
+
+
+def test_stream_terminal_events(fake_engines):
+    fake_engines(FakeModel(block_reason="SAFETY"), "simplifier")
+    events, _, _ = stream_request("/simplify/stream", {"text": "x"})
+    assert events == [("blocked", {"reason": "SAFETY"})]
+
+    fake_engines(FakeModel(reply="a b c d", fail_after=2))
+    events, _, _ = stream_request("/analyze/stream", {"text": "y"})
+    assert [e for e, _ in events] == ["chunk", "chunk", "error"]
+    assert events[-1][1]["message"] == "stream interrupted"
+
+
+if __name__ == "__main__":
+    # The endpoint tests take the fake_engines fixture from conftest.py
+    sys.exit(pytest.main([__file__, "-s"]))
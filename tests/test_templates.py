@@ -0,0 +1,131 @@
+import sys
+import os
+import asyncio
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.templates import TemplateRegistry, PLACEHOLDER_RE, parse_placeholders, normalize_key
+from app.core.action_engine import ActionEngine
+from app.core.cache import ResponseCache
+from app.core.model_client import ModelClient
+from tests.fakes import FakeModel
+
+LETTER = """[Date]
+
+To [Landlord Name],
+
+Re: deposit for [Property Address]
+
+[Explanation of what went wrong]
+
+Sincerely,
+[Your Name]
+"""
+
+
+def _engine(directory, fake):
+    engine = ActionEngine(cache=ResponseCache(), templates=TemplateRegistry(directory))
+    engine.model = fake
+    engine.client = ModelClient("fake-model", model=fake)
+    return engine
+
+
+def _write(directory, name, content):
+    with open(os.path.join(directory, name), "w") as f:
+        f.write(content)
+
+
+def _repeated_placeholders(content: str) -> list:
+    # Placeholders that occur more than once
+    found = PLACEHOLDER_RE.findall(content)
+    return [p for p in dict.fromkeys(found) if found.count(p) > 1]
+
+
+def test_placeholder_parsing():
+    assert parse_placeholders(LETTER) == ["Date", "Landlord Name", "Property Address",
+                                          "Explanation of what went wrong", "Your Name"]
+    assert normalize_key("Your-Name:") == normalize_key("your name")
+    with tempfile.TemporaryDirectory() as tmp:
+        _write(tmp, "deposit.txt", LETTER)
+        described = TemplateRegistry(tmp).get("deposit.txt").describe()
+        assert described["required_fields"] == ["Landlord Name", "Property Address", "Your Name"]
+        assert described["optional_fields"] == ["Date"]
+        assert described["narrative_fields"] == ["Explanation of what went wrong"]
+
+
+def test_registry_reloads_changed_files():
+    with tempfile.TemporaryDirectory() as tmp:
+        _write(tmp, "deposit.txt", LETTER)
+        registry = TemplateRegistry(tmp, check_interval=0)
+        first = registry.get("deposit.txt")
+        assert registry.get("deposit.txt") is first  # unchanged file: same parsed object
+        assert registry.get("../deposit.txt") is first
+        assert registry.get("missing.txt") is None
+
+        _write(tmp, "deposit.txt", "Dear [Landlord Name],")
+        os.utime(os.path.join(tmp, "deposit.txt"), (first.mtime + 10, first.mtime + 10))
+        assert registry.get("deposit.txt").placeholders == ["Landlord Name"]
+
+
+def test_local_fill_makes_no_model_calls():
+    fake = FakeModel(reply="should not be used")
+    with tempfile.TemporaryDirectory() as tmp:
+        _write(tmp, "deposit.txt", LETTER)
+        engine = _engine(tmp, fake)
+        template = engine.templates.get("deposit.txt")
+        details = {"landlord_name": "Acme Rentals", "Property Address": "12 Elm St", "your name": "Jo Smith",
+                   "Explanation of what went wrong": "The deposit was not returned within 30 days."}
+        letter = asyncio.run(engine.generate_from_template_async(template, details, rewrite=False))
+        assert fake.calls == 0
+        assert "To Acme Rentals," in letter and "Jo Smith" in letter
+        assert "The deposit was not returned within 30 days." in letter
+        assert "[" not in letter
+
+
+def test_only_narratives_go_to_the_model():
+    prompts = []
+
+    def reply(prompt):
+        prompts.append(prompt)
+        return "  I moved out on June 1 and left the unit clean.  "
+
+    fake = FakeModel(reply=reply)
+    with tempfile.TemporaryDirectory() as tmp:
+        _write(tmp, "deposit.txt", LETTER)
+        engine = _engine(tmp, fake)
+        template = engine.templates.get("deposit.txt")
+        details = {"Landlord Name": "Acme Rentals", "Property Address": "12 Elm St", "Your Name": "Jo Smith",
+                   "User's Story": "Moved out June 1, unit was clean."}
+        letter = asyncio.run(engine.generate_from_template_async(template, details))
+        assert fake.calls == 1
+        assert "[Explanation of what went wrong]" in prompts[0]
+        assert "\nI moved out on June 1 and left the unit clean.\n" in letter
+        assert "To Acme Rentals," in letter
+
+        # Missing fields: the whole template goes to the model as before
+        fake.reply = "Full letter"
+        assert asyncio.run(engine.generate_from_template_async(template, {"User's Story": "..."})) == "Full letter"
+        assert fake.calls == 2
+
+
+def test_repeated_placeholders_are_one_field_and_address_blocks_are_separate():
+    registry = TemplateRegistry()
+    parking = registry.get("parking_appeal_template.txt")
+    values = parking.resolve({"Your Name": "Jo Smith", "City, State, Zip Code": "Springfield, IL 62701",
+                              "Citation Number": "A-123"})
+    letter = parking.fill(values)
+    # The same placeholder twice is the same value: the name in the header and the signature
+    assert letter.count("Jo Smith") == 2 and letter.count("A-123") == 2
+    # The parking authority's address block is its own field, not the sender's
+    assert letter.count("Springfield, IL 62701") == 1
+    assert "[Parking Authority City, State, Zip Code]" in letter
+    assert "Parking Authority City, State, Zip Code" in parking.required_fields
+
+    # No bundled template reuses a generic address or date placeholder for two different things
+    generic = {"address", "date", "city state zip code"}
+    for template in registry.list():
+        repeated = {normalize_key(p) for p in _repeated_placeholders(template.content)}
+        assert not repeated & generic, template.name
+
@@ -0,0 +1,130 @@
+import sys
+import os
+import re
+import json
+import time
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from app import main
+from app.core.cache import ResponseCache
+from app.core.chunking import estimate_tokens
+from app.core.model_client import ModelClient
+from app.core.voice_interface import VoiceInterface, segment_text
+from tests.fakes import FakeModel
+
+ADVICE = ("You have the right to dispute this fee within 30 days. Ask for the charge in writing.\n"
+          "- Keep a copy of every letter.\n\nThis is not legal advice.")
+
+
+def _translator(prompts: list):
+    # Batched prompts get JSON, a lone segment gets plain text: "<language>: <segment>"
+    def reply(prompt) -> str:
+        prompts.append(prompt)
+        language = re.search(r'into (\w+)', prompt).group(1)
+        numbered = re.findall(r'^\s*\[(\d+)\] (.+)$', prompt, re.MULTILINE)
+        if numbered:
+            return json.dumps([{"segment": int(n), "translation": f"{language}: {text}"} for n, text in numbered])
+        return f"{language}: " + prompt.split("Advice to Translate:")[1].strip()
+    return reply
+
+
+def _voice(fake) -> VoiceInterface:
+    voice = VoiceInterface("fake-model", cache=ResponseCache(), memory=ResponseCache())
+    voice.client = ModelClient("fake-model", model=fake)
+    return voice
+
+
+def test_only_sentences_missing_from_memory_go_to_the_model():
+    segments, separators = segment_text(ADVICE)
+    assert segments == ["You have the right to dispute this fee within 30 days.", "Ask for the charge in writing.",
+                        "- Keep a copy of every letter.", "This is not legal advice."]
+    assert separators == [" ", "\n", "\n\n", ""]
+
+    prompts = []
+    fake = FakeModel(reply=_translator(prompts))
+    voice = _voice(fake)
+
+    async def run():
+        first = await voice.translate_many_async(ADVICE, ["Spanish"])
+        # Same advice, re-spaced, with one new sentence: only that sentence is sent, without JSON
+        second = await voice.translate_many_async(ADVICE.replace("days. ", "days.  ") + "\nCall us today.", ["Spanish"])
+        again = await voice.translate_to_mother_tongue_async("Ask for the charge   in writing.", "Spanish")
+        return first, second, again
+
+    first, second, again = asyncio.run(run())
+    assert first["translations"]["Spanish"] == (
+        "Spanish: You have the right to dispute this fee within 30 days. Spanish: Ask for the charge in writing.\n"
+        "Spanish: - Keep a copy of every letter.\n\nSpanish: This is not legal advice.")
+    assert first["memory"] == {"segments": 4, "from_memory": 0, "translated": 4, "model_calls": 1,
+                               "tokens_sent": first["memory"]["tokens_sent"]}
+    assert second["memory"]["from_memory"] == 4 and second["memory"]["translated"] == 1
+    assert second["memory"]["tokens_sent"] < first["memory"]["tokens_sent"]
+    assert second["translations"]["Spanish"].endswith("advice.\nSpanish: Call us today.")
+    assert "Call us today." in prompts[1] and "dispute" not in prompts[1]
+    assert again == "Spanish: Ask for the charge in writing." and fake.calls == 2
+    assert voice.memory.stats()["hits"] == 5
+
+
+def test_languages_are_translated_concurrently_and_malformed_batches_fall_back():
+    prompts = []
+    fake = FakeModel(reply=_translator(prompts), latency=0.05)
+    voice = _voice(fake)
+
+    async def run():
+        start = time.monotonic()
+        result = await voice.translate_many_async(ADVICE, ["Hindi", "Tamil", "Hindi"])
+        return result, time.monotonic() - start
+
+    result, elapsed = asyncio.run(run())
+    assert list(result["translations"]) == ["Hindi", "Tamil"]
+    assert result["translations"]["Tamil"].startswith("Tamil: You have the right")
+    assert fake.calls == 2 and elapsed < 0.09  # one call per language, at the same time
+    assert result["memory"]["model_calls"] == 2 and result["memory"]["segments"] == 8
+
+    # A batch reply that is not the JSON asked for: the whole text is translated the usual way
+    fake = FakeModel(reply="Traduccion completa")
+    voice = _voice(fake)
+    result = asyncio.run(voice.translate_many_async(ADVICE, ["Spanish"]))
+    assert result["translations"]["Spanish"] == "Traduccion completa" and fake.calls == 2
+    assert voice.memory.stats()["entries"] == 0
+
+
+def test_requests_sharing_a_call_do_not_each_count_it():
+    prompts = []
+    fake = FakeModel(reply=_translator(prompts), latency=0.05)
+    voice = _voice(fake)
+
+    async def run():
+        return await asyncio.gather(voice.translate_many_async(ADVICE, ["Spanish"]),
+                                    voice.translate_many_async(ADVICE, ["Spanish"]))
+
+    first, second = asyncio.run(run())
+    assert fake.calls == 1 and voice.memory.flights.coalesced == 1
+    assert first["translations"] == second["translations"]
+    assert first["memory"]["model_calls"] + second["memory"]["model_calls"] == 1
+    assert first["memory"]["tokens_sent"] + second["memory"]["tokens_sent"] == estimate_tokens(prompts[0])
+
+
+def test_translate_endpoint_fans_out_and_reports_memory_use(fake_engines):
+    prompts = []
+    fake = FakeModel(reply=_translator(prompts))
+    fake_engines(fake, "voice")
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            single = await http.post("/voice/translate", json={"text": ADVICE, "target_language": "Spanish"})
+            several = await http.post("/voice/translate", json={"text": ADVICE, "target_languages": ["Spanish", "French"]})
+            missing = await http.post("/voice/translate", json={"text": ADVICE})
+            return single, several, missing
+
+    single, several, missing = asyncio.run(run())
+    assert single.json()["analysis"].startswith("Spanish: You have") and "translations" not in single.json()
+    body = several.json()
+    assert set(body["translations"]) == {"Spanish", "French"} and body["analysis"] == body["translations"]["Spanish"]
+    assert body["memory"]["from_memory"] == 4 and body["memory"]["model_calls"] == 1
+    assert fake.calls == 2 and missing.status_code == 400
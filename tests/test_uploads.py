@@ -0,0 +1,105 @@
+import sys
+import os
+import asyncio
+import tempfile
+import tracemalloc
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi import UploadFile
+from app import main
+from app.core.uploads import spool_upload, UploadTooLarge, SPOOL_CHUNK_BYTES
+
+
+def make_upload(size: int, filename: str = "scan.pdf", block: bytes = b"%PDF") -> UploadFile:
+    # Starlette hands handlers an UploadFile backed by a spooled temp file like this one
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    chunk = (block * (SPOOL_CHUNK_BYTES // len(block) + 1))[:SPOOL_CHUNK_BYTES]
+    written = 0
+    while written < size:
+        spooled.write(chunk[:size - written])
+        written += min(len(chunk), size - written)
+    spooled.seek(0)
+    return UploadFile(spooled, size=size, filename=filename)
+
+
+def test_spooled_upload_memory_is_bounded():
+    size = 40 * 1024 * 1024
+
+    async def run():
+        tracemalloc.start()
+        upload = await spool_upload(make_upload(size), max_bytes=size)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return upload, peak
+
+    upload, peak = asyncio.run(run())
+    try:
+        print(f"Spooled {upload.size / 1e6:.0f} MB with peak Python allocation {peak / 1e6:.2f} MB")
+        assert upload.size == size and os.path.getsize(upload.path) == size
+        # A couple of copy buffers, never the whole file
+        assert peak < 4 * SPOOL_CHUNK_BYTES
+    finally:
+        upload.close()
+    assert not os.path.exists(upload.path)
+
+
+def test_spooled_upload_limit():
+    async def run():
+        return await spool_upload(make_upload(3 * SPOOL_CHUNK_BYTES), max_bytes=2 * SPOOL_CHUNK_BYTES)
+
+    before = set(os.listdir(tempfile.gettempdir()))
+    try:
+        asyncio.run(run())
+        assert False, "expected 413"
+    except UploadTooLarge as e:
+        assert e.status_code == 413
+    leftovers = [f for f in set(os.listdir(tempfile.gettempdir())) - before if f.startswith("equalizer-upload-")]
+    assert not leftovers
+
+
+def test_incremental_text_decoding():
+    # "é" is two bytes; make one straddle the copy/decode chunk boundary
+    text = "a" * (SPOOL_CHUNK_BYTES - 1) + "é" + " late fee"
+
+    async def run():
+        spooled = tempfile.SpooledTemporaryFile()
+        spooled.write(text.encode("utf-8"))
+        spooled.seek(0)
+        return await spool_upload(UploadFile(spooled, filename="notice.txt"))
+
+    upload = asyncio.run(run())
+    try:
+        assert upload.read_text() == text
+    finally:
+        upload.close()
+
+
+def test_oversized_request_rejected_before_body_is_read():
+    sent = []
+    body_read = []
+
+    async def receive():
+        body_read.append(True)
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/analyze/file", "raw_path": b"/analyze/file",
+             "query_string": b"", "http_version": "1.1", "scheme": "http",
+             "server": ("test", 80), "client": ("test", 1),
+             "headers": [(b"content-type", b"multipart/form-data; boundary=x"),
+                         (b"content-length", str(10 * 1024 ** 3).encode())]}
+    asyncio.run(main.app(scope, receive, send))
+    assert sent[0]["status"] == 413
+    assert b"Upload too large" in sent[1]["body"]
+    assert not body_read
+
+
+if __name__ == "__main__":
+    test_spooled_upload_memory_is_bounded()
+    test_spooled_upload_limit()
+    test_incremental_text_decoding()
+    test_oversized_request_rejected_before_body_is_read()
@@ -0,0 +1,98 @@
+import sys
+import os
+import asyncio
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from app import main
+from app.core.vector_index import VectorIndex, Retriever, TemplateCorpus, DirectoryCorpus, HashingEmbedder
+from app.core.templates import TemplateRegistry
+from app.core.action_engine import ActionEngine
+from app.core.cache import ResponseCache
+from app.core.model_client import ModelClient
+from tests.fakes import FakeModel
+
+DEPOSIT = "My landlord kept my security deposit after I moved out and says I owe cleaning fees."
+PARKING = "I got a parking ticket, but the no parking sign was covered by a tree."
+
+
+def _write(directory, name, content):
+    with open(os.path.join(directory, name), "w") as f:
+        f.write(content)
+
+
+def test_templates_are_ranked_locally_and_changed_files_are_reembedded():
+    retriever = Retriever(VectorIndex(HashingEmbedder()), [TemplateCorpus(TemplateRegistry(check_interval=0))])
+    assert retriever.sync() == {"added": 13, "updated": 0, "removed": 0}
+    assert retriever.suggest_templates(DEPOSIT)[0]["template"] == "security_deposit_refund.txt"
+    assert [hit["template"] for hit in retriever.suggest_templates(PARKING, k=1)] == ["parking_appeal_template.txt"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _write(tmp, "deposit.txt", "Dear [Landlord], return my security deposit for [Property Address].")
+        _write(tmp, "parking.txt", "Appeal of parking citation [Citation Number].")
+        index = VectorIndex(HashingEmbedder())
+        retriever = Retriever(index, [TemplateCorpus(TemplateRegistry(tmp, check_interval=0))], check_interval=0)
+        assert retriever.suggest_templates(DEPOSIT)[0]["template"] == "deposit.txt"
+        # A new file is embedded on its own; a removed one leaves the index
+        _write(tmp, "wages.txt", "Demand for unpaid wages and final paycheck from [Employer].")
+        os.remove(os.path.join(tmp, "parking.txt"))
+        assert retriever.sync() == {"added": 1, "updated": 0, "removed": 1}
+        assert retriever.suggest_templates("My employer never paid my final paycheck")[0]["template"] == "wages.txt"
+        assert len(index) == 2 and retriever.sync() == {"added": 0, "updated": 0, "removed": 0}
+
+
+def test_index_is_saved_and_memory_mapped_on_the_next_start():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index")
+        precedents = os.path.join(tmp, "precedents")
+        os.mkdir(precedents)
+        _write(precedents, "deposits.md", "Smith v. Jones (2019): a landlord who kept a security deposit for "
+                                          "ordinary cleaning had to return it twice over.\n\n"
+                                          "Parking: a ticket is void when the sign was not visible.")
+        corpora = lambda: [TemplateCorpus(), DirectoryCorpus(precedents)]
+        first = Retriever(VectorIndex(HashingEmbedder(), path=path), corpora())
+        assert first.sync()["added"] == 15
+        hits = first.precedents(DEPOSIT, k=1)
+        assert hits[0]["source"] == "deposits.md" and hits[0]["snippet"].startswith("Smith v. Jones")
+
+        # A restart maps the saved matrix and embeds nothing
+        index = VectorIndex(HashingEmbedder(), path=path)
+        assert index.mapped and len(index) == 15
+        second = Retriever(index, corpora())
+        assert second.sync() == {"added": 0, "updated": 0, "removed": 0}
+        assert second.precedents(DEPOSIT, k=1) == hits and index.mapped
+        # Another embedder cannot use it
+        assert len(VectorIndex(HashingEmbedder(dim=64), path=path)) == 0
+
+
+def test_suggest_endpoint_and_precedents_in_generation_prompts():
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            suggested = await http.post("/action/suggest", json={"text": DEPOSIT, "k": 2})
+            empty = await http.post("/action/suggest", json={"text": " "})
+            return suggested, empty
+
+    suggested, empty = asyncio.run(run())
+    body = suggested.json()
+    assert [t["name"] for t in body["templates"]][0] == "security_deposit_refund.txt" and len(body["templates"]) == 2
+    assert "required_fields" in body["templates"][0] and body["query_ms"] < 50
+    assert empty.status_code == 400
+
+    prompts = []
+    fake = FakeModel(reply=lambda content: prompts.append(content) or "Letter")
+    with tempfile.TemporaryDirectory() as tmp:
+        _write(tmp, "deposit.md", "Smith v. Jones (2019): a landlord who kept a security deposit for cleaning "
+                                  "had to return it twice over.")
+        retriever = Retriever(VectorIndex(HashingEmbedder()), [TemplateCorpus(), DirectoryCorpus(tmp)])
+        engine = ActionEngine(cache=ResponseCache(), retriever=retriever)
+        engine.client = ModelClient("fake-model", model=fake)
+        template = engine.templates.get("security_deposit_refund.txt")
+        asyncio.run(engine.generate_from_template_async(template, {"Issue": "security deposit kept for cleaning"}))
+        parking = engine.templates.get("parking_appeal_template.txt")
+        asyncio.run(engine.generate_from_template_async(parking, {"Story": "The sign was hidden by a tree"}))
+    assert "Relevant Precedents" in prompts[0] and "Smith v. Jones" in prompts[0]
+    assert "Relevant Precedents" not in prompts[1]  # nothing similar enough
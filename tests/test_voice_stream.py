@@ -0,0 +1,133 @@
+import sys
+import os
+import time
+import asyncio
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+from app import main
+from app.core.cache import ResponseCache
+from app.core.model_client import ModelClient
+from app.core.voice_interface import VoiceInterface
+from app.core.voice_stream import VoiceSession, SentenceBuffer
+from tests.fakes import FakeModel, FakeSpeechToText, FakeTextToSpeech
+
+ADVICE = "You do not have to pay today. Ask them to send the debt notice in writing. You can hang up now."
+
+
+def _voice(fake) -> VoiceInterface:
+    voice = VoiceInterface("fake-model", cache=ResponseCache())
+    voice.client = ModelClient("fake-model", model=fake)
+    return voice
+
+
+def _run(session, script: list) -> list:
+    # script: frames to receive, with floats for pauses; returns (time, item) for everything sent
+    sent = []
+
+    async def run():
+        frames = list(script)
+
+        async def receive():
+            while frames:
+                frame = frames.pop(0)
+                if isinstance(frame, float):
+                    await asyncio.sleep(frame)
+                    continue
+                return frame
+            return {"type": "end"}
+
+        async def send(item):
+            sent.append((time.monotonic(), item))
+
+        await session.run(receive, send)
+
+    asyncio.run(run())
+    return sent
+
+
+def _words(text: str) -> list:
+    return [word.encode() for word in text.split()] + [b""]
+
+
+def _events(sent: list, kind: str) -> list:
+    return [item for _, item in sent if isinstance(item, dict) and item["type"] == kind]
+
+
+def test_sentence_buffer_cuts_speakable_pieces():
+    buffer = SentenceBuffer(max_chars=40)
+    assert buffer.feed("You do not have to ") == []
+    assert buffer.feed("pay today. Ask for") == ["You do not have to pay today."]
+    assert buffer.feed(" it in writing, with the amount, the creditor and") == ["Ask for it in writing,", "with the amount,"]
+    assert buffer.flush() == "the creditor and"
+
+
+def test_first_audio_goes_out_while_the_reply_is_still_generating():
+    fake = FakeModel(reply=ADVICE, chunk_delay=0.02, chunk_words=2)
+    tts = FakeTextToSpeech(latency=0.01)
+    session = VoiceSession(_voice(fake), "English", stt=FakeSpeechToText(), tts=tts, speculate_after=0)
+    sent = _run(session, _words("They say I must pay 500 dollars today"))
+
+    transcripts = _events(sent, "transcript")
+    assert transcripts[-1] == {"type": "transcript", "text": "They say I must pay 500 dollars today", "final": True}
+    assert len(transcripts) == 9  # a partial per word, then the final one
+    first_audio = next(t for t, item in sent if isinstance(item, bytes))
+    last_text = max(t for t, item in sent if isinstance(item, dict) and item["type"] == "reply")
+    assert first_audio < last_text
+    assert b"".join(item for _, item in sent if isinstance(item, bytes)).decode() == "".join(tts.sentences)
+    assert [s["text"] for s in _events(sent, "sentence")] == tts.sentences
+    assert tts.sentences[0] == "You do not have to pay today."
+
+    timing = _events(sent, "turn_done")[0]["metrics"]
+    assert timing["speculative"] is False
+    assert 0 <= timing["first_text_ms"] <= timing["first_audio_ms"] < timing["turn_ms"]
+    assert _events(sent, "done") == [{"type": "done", "turns": 1}]
+    assert session.history == [("They say I must pay 500 dollars today", ADVICE)]
+
+
+def test_partial_transcripts_start_the_reply_and_new_speech_interrupts_it():
+    fake = FakeModel(reply=ADVICE, latency=0.05)
+    session = VoiceSession(_voice(fake), "English", stt=FakeSpeechToText(), tts=FakeTextToSpeech(),
+                           speculate_after=0.02)
+    script = ([b"Pay", b"now", 0.1, b"", 0.05]       # a pause: the reply starts before the final transcript
+              + [b"Or", b"else", 0.1, b"what", b""])  # the speculative reply ("Or else") is dropped
+    sent = _run(session, script)
+    first, second = [event["metrics"] for event in _events(sent, "turn_done")]
+    assert first["speculative"] is True and second["speculative"] is False
+    assert fake.calls == 3 and session.speculation_hits == 1
+    # The speculative call finished during the pause: no wait for the model's 50 ms
+    assert first["first_text_ms"] < 50
+
+    # A new utterance while the reply is still playing cuts it off
+    fake = FakeModel(reply=ADVICE, chunk_delay=0.05, chunk_words=2)
+    session = VoiceSession(_voice(fake), "English", stt=FakeSpeechToText(), tts=FakeTextToSpeech(), speculate_after=0)
+    sent = _run(session, [b"Hello", b"", 0.1, b"Wait", b""])
+    assert len(_events(sent, "interrupted")) == 1
+    assert len(_events(sent, "turn_done")) == 1 and session.history[0][0] == "Wait"
+
+
+def test_voice_websocket_with_browser_transcripts(fake_engines):
+    prompts = []
+    fake = FakeModel(reply=lambda content: prompts.append(content) or "Do not sign anything today. Ask for a copy first.")
+    fake_engines(fake, "voice")
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/voice/ws?language=Spanish") as socket:
+            assert socket.receive_json() == {"type": "ready", "language": "Spanish"}
+            socket.send_json({"type": "transcript", "text": "sign this lease now", "final": False})
+            socket.send_json({"type": "transcript", "text": "Sign this lease now.", "final": True})
+            socket.send_json({"type": "end"})
+            events = []
+            while not events or events[-1]["type"] != "done":
+                events.append(socket.receive_json())
+        # Audio frames need a speech-to-text backend; the default one says so
+        with client.websocket_connect("/voice/ws") as audio:
+            audio.receive_json()
+            audio.send_bytes(b"\x00\x01")
+            error = audio.receive_json()
+    sentences = [event["text"] for event in events if event["type"] == "sentence"]
+    assert sentences == ["Do not sign anything today.", "Ask for a copy first."]
+    assert "Answer in Spanish" in prompts[0] and "Sign this lease now." in prompts[0]
+    assert events[-1] == {"type": "done", "turns": 1}
+    assert error["type"] == "error" and "speech-to-text" in error["message"]